@@ -0,0 +1,69 @@
+"""Benchmark for offset-based deserialization of blocks and transactions.
+
+Builds synthetic blocks of increasing size and times Block.from_bytes on
+each. Since parsing advances a BytesReader rather than re-slicing the
+remaining stream for every field, the time per byte should stay roughly
+constant as blocks grow.
+
+Usage:
+    python tests/bitcoin/bench_deserialization.py [--repeat N]
+"""
+import argparse
+import time
+
+from two1.bitcoin.block import Block
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import CoinbaseInput
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionInput
+from two1.bitcoin.txn import TransactionOutput
+from two1.bitcoin.utils import rand_bytes
+
+BLOCK_SIZES = [100, 400, 1600, 6400]
+
+
+def make_txn(num_inputs=2, num_outputs=2):
+    inputs = []
+    for i in range(num_inputs):
+        # Looks like a P2PKH signature script: <sig> <pubkey>
+        script = Script([rand_bytes(72, False), rand_bytes(33, False)])
+        inputs.append(TransactionInput(Hash(rand_bytes(32, False)), i, script, 0xffffffff))
+
+    outputs = [TransactionOutput(100000 * (o + 1), Script.build_p2pkh(rand_bytes(20, False)))
+               for o in range(num_outputs)]
+
+    return Transaction(Transaction.DEFAULT_TRANSACTION_VERSION, inputs, outputs, 0)
+
+
+def make_block(num_txns):
+    cb_txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                         [CoinbaseInput(400000, b'/two1/')],
+                         [TransactionOutput(2500000000, Script.build_p2pkh(bytes(20)))],
+                         0)
+    txns = [cb_txn] + [make_txn() for i in range(num_txns - 1)]
+
+    return Block(400000, 4, Hash(bytes(32)), int(time.time()), 0x1d00ffff, 0, txns)
+
+
+def bench(block_bytes, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        Block.from_bytes(block_bytes)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("%8s %12s %12s %14s" % ("txns", "bytes", "parse (s)", "ns/byte"))
+    for n in BLOCK_SIZES:
+        b = bytes(make_block(n))
+        t = bench(b, args.repeat)
+        print("%8d %12d %12.4f %14.1f" % (n, len(b), t, t * 1e9 / len(b)))
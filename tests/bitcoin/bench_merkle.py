@@ -0,0 +1,54 @@
+"""Benchmark for incremental merkle tree updates on block templates.
+
+Builds blocks of a few thousand synthetic transactions and times, per
+operation, replacing the coinbase, replacing a transaction, appending a
+transaction and extracting the merkle edge, against a full invalidate().
+
+Usage:
+    python tests/bitcoin/bench_merkle.py [--repeat N]
+"""
+import argparse
+import time
+
+from two1.bitcoin.block import Block
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import CoinbaseInput
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionOutput
+
+
+def make_txn(i):
+    return Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                       [CoinbaseInput(400000, b'/two1/' + i.to_bytes(4, 'big'))],
+                       [TransactionOutput(2500000000, Script.build_p2pkh(bytes(20)))],
+                       0)
+
+
+def timeit(f, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        f(i)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    spare = [make_txn(10 ** 6 + i) for i in range(args.repeat)]
+
+    print("%6s %14s %14s %14s %14s %14s" % ("txns", "invalidate", "coinbase", "set_txn", "add_txn", "edge"))
+    for num_txns in (1000, 2000, 5000):
+        block = Block(400000, 4, Hash(bytes(32)), 1455000000, 0x1d00ffff, 0,
+                      [make_txn(i) for i in range(num_txns)])
+
+        full = timeit(lambda i: block.invalidate(), max(1, args.repeat // 20))
+        coinbase = timeit(lambda i: setattr(block, 'coinbase_transaction', spare[i]), args.repeat)
+        set_txn = timeit(lambda i: block.set_transaction(num_txns // 2, spare[i]), args.repeat)
+        add_txn = timeit(lambda i: block.add_transaction(spare[i]), args.repeat)
+        edge = timeit(lambda i: block.get_merkle_edge(), args.repeat)
+
+        print("%6d %12.1fus %12.1fus %12.1fus %12.1fus %12.1fus" %
+              (num_txns, full, coinbase, set_txn, add_txn, edge))
@@ -0,0 +1,77 @@
+"""Benchmark for the script interpreter.
+
+Runs every test in tests/bitcoin/test_script_interpreter.py repeatedly and
+reports how many scripts per second ScriptInterpreter.run_script()
+evaluates, then does the same for a P2PKH input verified against a
+cached scriptPubKey.
+
+Usage:
+    python tests/bitcoin/bench_script_interpreter.py [--repeat N]
+"""
+import argparse
+import inspect
+import os
+import sys
+import time
+
+from two1.bitcoin.script import Script
+from two1.bitcoin.script_interpreter import ScriptInterpreter
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin import utils
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import test_script_interpreter  # noqa: E402
+
+
+def count_scripts(f):
+    count = [0]
+    run_script = ScriptInterpreter.run_script
+
+    def counting_run_script(self, script):
+        count[0] += 1
+        return run_script(self, script)
+
+    ScriptInterpreter.run_script = counting_run_script
+    try:
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+    finally:
+        ScriptInterpreter.run_script = run_script
+
+    return count[0], elapsed
+
+
+def run_vectors(repeat):
+    tests = [f for name, f in inspect.getmembers(test_script_interpreter, inspect.isfunction)
+             if name.startswith("test_")]
+    for i in range(repeat):
+        for t in tests:
+            t()
+
+
+def run_p2pkh(repeat):
+    txn = Transaction.from_hex(test_signing_txn)
+    sub_script = Script.build_p2pkh(utils.address_to_key_hash("1NKxQnbtKDdL6BY1UaKdrzCxQHfn3TQnqZ")[1])
+    sig_script = Script(test_signing_sig_script)
+    for i in range(repeat):
+        si = ScriptInterpreter(txn=txn, input_index=0, sub_script=sub_script)
+        si.run_script(sig_script)
+        si.run_script(sub_script)
+        assert si.valid
+
+
+# The signed transaction from test_op_checksig
+test_signing_txn = "0100000001205607fb482a03600b736fb0c257dfd4faa49e45db3990e2c4994796031eae6e000000001976a914e9f061ff2c9885c7b137de35e416cbd5d3e1087c88acffffffff0128230000000000001976a914f1fd1dc65af03c30fe743ac63cef3a120ffab57d88ac00000000"  # nopep8
+test_signing_sig_script = "0x3045022100ed84be709227397fb1bc13b749f235e1f98f07ef8216f15da79e926b99d2bdeb02206ff39819d91bc81fecd74e59a721a38b00725389abb9cbecb42ad1c939fd826201 0x04e674caf81eb3bb4a97f2acf81b54dc930d9db6a6805fd46ca74ac3ab212c0bbf62164a11e7edaf31fbf24a878087d925303079f2556664f3b32d125f2138cbef"  # nopep8
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, f in (("test vectors", lambda: run_vectors(args.repeat)),
+                    ("p2pkh verification", lambda: run_p2pkh(args.repeat * 10))):
+        scripts, elapsed = count_scripts(f)
+        print("%24s: %6d scripts in %6.2fs, %10.1f scripts/s" % (name, scripts, elapsed, scripts / elapsed))
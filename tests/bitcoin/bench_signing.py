@@ -0,0 +1,72 @@
+"""Benchmark for signing a transaction with many inputs.
+
+Builds a sweep-like transaction spending N P2PKH UTXOs held by a
+handful of keys and reports how long it takes to sign it input by input
+with sign_input(), with sign_inputs() and with sign_inputs() in a
+process pool, checking that all three produce the same transaction.
+
+Usage:
+    python tests/bitcoin/bench_signing.py [--inputs N] [--keys N] [--processes N]
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+
+from two1.bitcoin.crypto import PrivateKey
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionInput
+from two1.bitcoin.txn import TransactionOutput
+
+
+def make_txn(num_inputs):
+    inputs = [TransactionInput(outpoint=Hash(i.to_bytes(32, 'big')),
+                               outpoint_index=i % 4,
+                               script=Script(""),
+                               sequence_num=0xffffffff)
+              for i in range(num_inputs)]
+    outputs = [TransactionOutput(value=num_inputs * 10000,
+                                 script=Script.build_p2pkh(bytes(20)))]
+
+    return Transaction(Transaction.DEFAULT_TRANSACTION_VERSION, inputs, outputs, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--inputs", type=int, default=500)
+    parser.add_argument("--keys", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    private_keys = [PrivateKey(k + 1000) for k in range(args.keys)]
+    sub_scripts = [Script.build_p2pkh(k.public_key.hash160()) for k in private_keys]
+    to_sign = [(i, private_keys[i % args.keys], sub_scripts[i % args.keys])
+               for i in range(args.inputs)]
+
+    txn = make_txn(args.inputs)
+    start = time.perf_counter()
+    for i, private_key, sub_script in to_sign:
+        txn.sign_input(i, Transaction.SIG_HASH_ALL, private_key, sub_script)
+    elapsed = time.perf_counter() - start
+    serial = bytes(txn)
+    print("sign_input:                  %6.2fs" % elapsed)
+
+    txn = make_txn(args.inputs)
+    start = time.perf_counter()
+    txn.sign_inputs(to_sign, Transaction.SIG_HASH_ALL)
+    elapsed = time.perf_counter() - start
+    assert bytes(txn) == serial
+    print("sign_inputs:                 %6.2fs" % elapsed)
+
+    with concurrent.futures.ProcessPoolExecutor(args.processes) as executor:
+        # Start the workers before timing
+        list(executor.map(abs, range(args.processes)))
+
+        txn = make_txn(args.inputs)
+        start = time.perf_counter()
+        txn.sign_inputs(to_sign, Transaction.SIG_HASH_ALL, executor)
+        elapsed = time.perf_counter() - start
+        assert bytes(txn) == serial
+        print("sign_inputs (%2d processes): %6.2fs" % (args.processes, elapsed))
@@ -1,20 +1,32 @@
 import arrow
+import copy
+import pickle
+import pytest
 from calendar import timegm
 from two1.bitcoin.block import Block
+from two1.bitcoin.block import CompactBlock
+from two1.bitcoin.block import MerkleTree
 from two1.bitcoin.crypto import HDKey
 from two1.bitcoin.crypto import HDPrivateKey
 from two1.bitcoin.crypto import HDPublicKey
 from two1.bitcoin.crypto import PrivateKey
 from two1.bitcoin.crypto import PublicKey
+from two1.bitcoin.exceptions import DeserializationError
 from two1.bitcoin.hash import Hash
 from two1.bitcoin.script import Script
 from two1.bitcoin.txn import CoinbaseInput
 from two1.bitcoin.txn import Transaction
 from two1.bitcoin.txn import TransactionInput
 from two1.bitcoin.txn import TransactionOutput
+from two1.bitcoin.txn import serialization_stats
+from two1.bitcoin.utils import BytesReader
 from two1.bitcoin.utils import bytes_to_str
 from two1.bitcoin.utils import difficulty_to_target
+from two1.bitcoin.utils import pack_u32
+from two1.bitcoin.utils import pack_var_str
 from two1.bitcoin.utils import target_to_bits
+from two1.bitcoin.utils import unpack_compact_int
+from two1.bitcoin.utils import unpack_var_str
 
 
 def txn_from_json(txn_json):
@@ -167,6 +179,16 @@ def test_crypto():
     assert isinstance(hd_pub2, HDPublicKey)
     assert hd_pub2._key.point.x == hd_pub._key.point.x
     assert hd_pub2._key.point.y == hd_pub._key.point.y
+
+    indices = [0, 1, 2, 19, 1000, 0x7fffffff]
+    batch = HDPublicKey.from_parent_batch(hd_pub, indices)
+    for i, k in zip(indices, batch):
+        assert k.to_b58check() == HDPublicKey.from_parent(hd_pub, i).to_b58check()
+    assert [k.to_b58check() for k in HDPublicKey.from_parent_batch(hd_priv, indices)] == \
+        [k.to_b58check() for k in batch]
+
+    with pytest.raises(ValueError):
+        HDPublicKey.from_parent_batch(hd_pub, [0x80000000])
     assert hd_pub2.chain_code == hd_pub.chain_code
 
 
@@ -208,3 +230,217 @@ def test_txn():
                                ["18HMSYbh3PbXfxL6f6Cy9FjCK7AC4tB2ZX"]]
     assert addrs['outputs'] == [["19mkZEZinQ77SrXbzxd5QJksikQFmfUNfo"],
                                 ["3PWbQBs5YDbmFCe5RdDjzqApJxs25Apvnd"]]
+
+
+def test_bytes_reader():
+    b = bytes([0x05]) + pack_u32(0xdeadbeef) + bytes([0xfd, 0x00, 0x01]) + b'\xaa' * 3
+    r = BytesReader(b)
+    assert r.read_u8() == 5
+    assert r.read_u32() == 0xdeadbeef
+    assert r.read_compact_int() == 0x100
+    assert len(r) == 3
+    assert r.remainder() == b'\xaa' * 3
+
+    with pytest.raises(DeserializationError):
+        r.read(4)
+
+    assert unpack_compact_int(bytes([0xfe]) + pack_u32(70000) + b'xy') == (70000, b'xy')
+    assert unpack_var_str(pack_var_str(b'abc') + b'def') == (b'abc', b'def')
+
+
+def test_hash():
+    hex_str = "3779f27a81cdbc435ac258ce5076c211e7a953027aab42573b1b7ce9e50abe8e"
+    h = Hash(hex_str)
+    raw = bytes(h)
+    assert raw == bytes.fromhex(hex_str)[::-1]
+    assert str(h) == hex_str
+    assert str(Hash(raw)) == hex_str
+
+    assert h == raw
+    assert h == Hash(raw)
+    assert h == hex_str.upper()
+    assert h != Hash.dhash(raw)
+    assert h != 5
+
+    # Hashes are interchangeable with their digest as keys
+    d = {raw: 1}
+    assert d[h] == 1
+    assert Hash(hex_str) in {h}
+    assert len({h, Hash(raw), Hash(hex_str)}) == 1
+
+    # ...but not with their hex string, which only compares equal
+    assert hash(h) == hash(raw)
+    assert hex_str not in {h: 1}
+    assert Hash(hex_str) in {h: 1}
+
+    with pytest.raises(AttributeError):
+        h._bytes = bytes(32)
+    with pytest.raises(AttributeError):
+        h.foo = 1
+
+    assert copy.copy(h) is h
+    assert copy.deepcopy({'h': h})['h'] is h
+    assert pickle.loads(pickle.dumps(h)) == h
+
+    i = Hash.intern(hex_str)
+    assert i == h
+    assert Hash.intern(raw) is i
+    assert Hash.intern(Hash(raw)) is i
+
+
+def test_from_bytes_remainder():
+    txn_str = "0100000002cb246d110b6087cd3b5e3d3b7a74505ea995721208ddfc15b6b3b718271e0b41010000006b48304502201f2cf747f9f8e3f770bef848e6787c9fca31e3086c390e505c1339936a15a78f022100a9e5f761162b8a4387c4009ce9469e92302fda68afe85371181b6e13b84f052d01210339e1274cd66db3dbe23e4def7ae9eb81644c15347cf0b39c741fb947c8ef1f12ffffffffb828405fca4f578073fe02bb00e999407bbaa3f5556f4c3571fd5fef28e47de8010000006a47304402206b7a8851fb2284201f31854bc857a8e1a1c4d5dbd19efe76d89d2c02083ff397022029a231c2750005b5ec4c437a8fa7163eaffe02e5fb51d9b8bb5edc5bb88040720121036744acff73b223a6f04190b60a980f8de1ed0271bba92144850e90c1af489fb3ffffffff0232530000000000001976a9146037aac7480f0fa0c7740560a7bf2f37ec17597988acb0ad01000000000017a914ef5a22f491632b2f18c59352dd64fa4ec346a8118700000000"  # nopep8
+    txn_bytes = bytes.fromhex(txn_str)
+
+    tx, rest = Transaction.from_bytes(txn_bytes + b'extra')
+    assert rest == b'extra'
+    assert bytes(tx) == txn_bytes
+
+    # Parsing from a bytearray goes through the same memoryview path.
+    tx2, rest = Transaction.from_bytes(bytearray(txn_bytes))
+    assert rest == b''
+    assert tx2.hash == tx.hash
+
+    cb_txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                         [CoinbaseInput(400000, b'/two1/')],
+                         [TransactionOutput(2500000000, Script.build_p2pkh(bytes(20)))],
+                         0)
+    block = Block(400000, 4, Hash(bytes(32)), 1455000000, 0x1d00ffff, 0, [cb_txn, tx, tx2])
+    block_bytes = bytes(block)
+
+    block2, rest = Block.from_bytes(block_bytes + b'extra')
+    assert rest == b'extra'
+    assert bytes(block2) == block_bytes
+    assert block2.block_header.merkle_root_hash == block.block_header.merkle_root_hash
+    assert len(block2.txns) == 3
+
+    with pytest.raises(DeserializationError):
+        Transaction.from_bytes(txn_bytes[:-10])
+
+
+def naive_merkle_root(leaves):
+    level = [bytes(h) for h in leaves]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [bytes(Hash.dhash(level[i] + level[i + 1])) for i in range(0, len(level), 2)]
+    return Hash(level[0])
+
+
+def test_merkle_tree():
+    leaves = [bytes(Hash.dhash(pack_u32(i))) for i in range(40)]
+
+    for n in range(1, 20):
+        tree = MerkleTree(leaves[:n])
+        assert len(tree) == n
+        assert tree.root == naive_merkle_root(leaves[:n])
+        for i in range(n):
+            assert MerkleTree.root_from_proof(leaves[i], tree.proof(i), i) == tree.root
+
+    tree = MerkleTree()
+    assert tree.root is None
+    for n in range(1, 40):
+        tree.append(leaves[n - 1])
+        assert tree.root == naive_merkle_root(leaves[:n])
+
+    current = list(leaves[:39])
+    for i in (0, 7, 38, -1):
+        tree[i] = leaves[39]
+        current[i] = leaves[39]
+        assert tree[i] == leaves[39]
+        assert tree.root == naive_merkle_root(current)
+
+    for i in (38, 10, 0, 17, -1):
+        del tree[i]
+        del current[i]
+        assert tree.root == naive_merkle_root(current)
+
+    tree.insert(3, leaves[0])
+    current.insert(3, leaves[0])
+    assert tree.root == naive_merkle_root(current)
+
+    while len(current) > 1:
+        assert tree.pop() == current.pop()
+        assert tree.root == naive_merkle_root(current)
+
+    with pytest.raises(IndexError):
+        tree[1] = leaves[0]
+    with pytest.raises(ValueError):
+        tree.append(b'\x00')
+
+
+def test_block_merkle_updates():
+    def make_cb(tag):
+        return Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                           [CoinbaseInput(400000, tag)],
+                           [TransactionOutput(2500000000, Script.build_p2pkh(bytes(20)))],
+                           0)
+
+    txns = [make_cb(b'/two1/%d' % i) for i in range(12)]
+    block = Block(400000, 4, Hash(bytes(32)), 1455000000, 0x1d00ffff, 0, list(txns[:9]))
+
+    def check():
+        assert block.block_header.merkle_root_hash == naive_merkle_root([t.hash for t in block.txns])
+
+    check()
+    block.coinbase_transaction = txns[9]
+    check()
+    block.add_transaction(txns[10])
+    check()
+    block.set_transaction(4, txns[11])
+    check()
+    assert block.remove_transaction(2) is txns[2]
+    check()
+    with pytest.raises(ValueError):
+        block.remove_transaction(0)
+
+    # A CompactBlock built from the edge must agree with the full block
+    edge = block.get_merkle_edge()
+    cb = CompactBlock(400000, 4, Hash(bytes(32)), 1455000000, 0x1d00ffff, edge, make_cb(b'/new/'))
+    block.coinbase_transaction = cb.coinbase_transaction
+    assert cb.block_header.merkle_root_hash == block.block_header.merkle_root_hash
+
+
+def test_txn_memoization():
+    txn_str = "0100000001205607fb482a03600b736fb0c257dfd4faa49e45db3990e2c4994796031eae6e000000001976a914e9f061ff2c9885c7b137de35e416cbd5d3e1087c88acffffffff0128230000000000001976a914f1fd1dc65af03c30fe743ac63cef3a120ffab57d88ac00000000"  # nopep8
+    txn = Transaction.from_hex(txn_str)
+
+    # The raw bytes from parsing are kept
+    serialization_stats.clear()
+    b = bytes(txn)
+    assert b.hex() == txn_str
+    assert bytes(txn) is b
+    assert txn.hash is txn.hash
+    assert txn.to_hex() == txn_str
+    assert serialization_stats['serialized'] == 0
+    assert serialization_stats['hashed'] == 1
+    assert serialization_stats['hash_reused'] == 1
+
+    def check(txn):
+        serialized = serialization_stats['serialized']
+        h = txn.hash
+        assert bytes(txn) is bytes(txn)
+        assert serialization_stats['serialized'] == serialized + 1
+
+        expected = Transaction(txn.version, list(txn.inputs), list(txn.outputs), txn.lock_time)
+        # Rebuild every part of the copy from scratch
+        for o in expected.inputs + expected.outputs:
+            o._serialized = None
+        assert bytes(txn) == bytes(expected)
+        assert h == Hash.dhash(bytes(expected))
+        assert txn.to_hex() == bytes_to_str(bytes(expected))
+
+    # Setting a field on the txn, an input, an output or a script, or
+    # changing the lists of inputs/outputs, invalidates the memo.
+    txn.lock_time = 5
+    check(txn)
+    txn.inputs[0].sequence_num = 7
+    check(txn)
+    txn.outputs[0].value = 1000
+    check(txn)
+    txn.outputs[0].script[2] = bytes(20)
+    check(txn)
+    txn.inputs[0].script = Script("OP_1")
+    check(txn)
+    txn.outputs.append(TransactionOutput(5, Script.build_p2sh(bytes(20))))
+    check(txn)
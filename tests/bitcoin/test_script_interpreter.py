@@ -952,3 +952,41 @@ def test_stack_overflow():
     si = ScriptInterpreter()
     with pytest.raises(ScriptInterpreterError):
         si.run_script(s)
+
+
+def test_compile():
+    s = Script("OP_1 OP_2 OP_ADD")
+    code = ScriptInterpreter.compile(s)
+    assert ScriptInterpreter.compile(s) is code
+
+    # Modifying the script invalidates the compiled code
+    s.append("OP_5")
+    assert ScriptInterpreter.compile(s) is not code
+
+    si = ScriptInterpreter()
+    si.run_script(s)
+    assert list(si.stack) == [3, 5]
+
+    # Standard templates compile to a single step
+    h160 = utils.hash160(b'\x02' * 33)
+    p2pkh = Script.build_p2pkh(h160)
+    p2sh = Script.build_p2sh(h160)
+    assert len(ScriptInterpreter.compile(p2pkh)) == 1
+    assert len(ScriptInterpreter.compile(p2sh)) == 1
+
+    si = ScriptInterpreter()
+    si.run_script(Script("0x" + "02" * 33))
+    si.run_script(p2sh)
+    assert list(si.stack) == [True]
+
+    si = ScriptInterpreter()
+    si.run_script(Script("0x" + "03" * 33))
+    si.run_script(p2sh)
+    assert list(si.stack) == [False]
+
+    # A hash mismatch fails OP_EQUALVERIFY before any signature check
+    si = ScriptInterpreter()
+    si.run_script(Script("0x3045 0x" + "03" * 33))
+    si.run_script(p2pkh)
+    assert si.stop
+    assert not si.valid
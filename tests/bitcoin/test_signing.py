@@ -1,3 +1,5 @@
+import concurrent.futures
+
 import pytest
 from two1.bitcoin import crypto, hash, script, txn, utils
 
@@ -186,3 +188,112 @@ def test_multisig_sign():
     assert not tx.verify_input_signature(0, script_pub_key)
 
     assert tx.verify_partial_multisig(0, script_pub_key)
+
+
+@pytest.mark.parametrize("hash_type", [txn.Transaction.SIG_HASH_ALL,
+                                       txn.Transaction.SIG_HASH_NONE,
+                                       txn.Transaction.SIG_HASH_SINGLE,
+                                       txn.Transaction.SIG_HASH_ANY,
+                                       txn.Transaction.SIG_HASH_ALL | txn.Transaction.SIG_HASH_ANY])
+def test_sighash_matches_copy_for_sig(hash_type):
+    sub_script = script.Script.build_p2pkh(keys[0][1].hash160())
+    inputs = [txn.TransactionInput(hash.Hash(bytes([i]) * 32), i, script.Script(""), 0xfffffffe - i)
+              for i in range(4)]
+    outputs = [txn.TransactionOutput(1000 * (i + 1), script.Script.build_p2pkh(keys[1][1].hash160()))
+               for i in range(3)]
+    transaction = txn.Transaction(txn.Transaction.DEFAULT_TRANSACTION_VERSION, inputs, outputs, 0)
+
+    def expected(i):
+        txn_copy = transaction._copy_for_sig(i, hash_type, sub_script)
+        return bytes(hash.Hash.dhash(bytes(txn_copy) + utils.pack_u32(hash_type)))
+
+    for i in range(len(inputs)):
+        assert transaction.get_sighash(i, hash_type, sub_script) == expected(i)
+
+    # Mutating inputs or outputs must invalidate the cached parts.
+    transaction.inputs[1].sequence_num = 7
+    transaction.outputs[0].value = 1234
+    transaction.outputs.append(txn.TransactionOutput(5, sub_script))
+    for i in range(len(inputs)):
+        assert transaction.get_sighash(i, hash_type, sub_script) == expected(i)
+
+    # So must replacing an output script (whose id may be reused) or
+    # editing one in place.
+    for n in range(10):
+        transaction.outputs[0].script = script.Script.build_p2pkh(keys[n % 2][1].hash160())
+        assert transaction.get_sighash(0, hash_type, sub_script) == expected(0)
+    transaction.outputs[0].script[2] = bytes(20)
+    assert transaction.get_sighash(0, hash_type, sub_script) == expected(0)
+    transaction.outputs[0].script.append('OP_NOP')
+    assert transaction.get_sighash(0, hash_type, sub_script) == expected(0)
+    del transaction.outputs[0].script[-1]
+    assert transaction.get_sighash(0, hash_type, sub_script) == expected(0)
+
+
+def test_verify_batch():
+    items = []
+    for i, (private_key, public_key) in enumerate(keys):
+        for j in range(3):
+            message = bytes([i, j]) * 16
+            items.append((public_key, message, private_key.sign(message)))
+
+    # Swap the messages of the last two items so they don't verify,
+    # and check a signature against the wrong key.
+    (pk1, m1, s1), (pk2, m2, s2) = items[-2:]
+    items[-2:] = [(pk1, m2, s1), (pk2, m1, s2)]
+    items.append((keys[1][1], items[0][1], items[0][2]))
+
+    expected = [pk.verify(m, s) for pk, m, s in items]
+    assert expected == [True] * 4 + [False] * 3
+    assert crypto.PublicKey.verify_batch(items) == expected
+    assert crypto.PublicKey.verify_batch([]) == []
+
+
+def test_verify_input_signatures():
+    sub_scripts = [script.Script.build_p2pkh(public_key.hash160(compressed=False))
+                   for private_key, public_key in keys]
+    inputs = [txn.TransactionInput(hash.Hash(bytes([i + 1]) * 32), i, script.Script(""), 0xffffffff)
+              for i in range(len(keys))]
+    outputs = [txn.TransactionOutput(9000, sub_scripts[0])]
+    transaction = txn.Transaction(txn.Transaction.DEFAULT_TRANSACTION_VERSION, inputs, outputs, 0)
+    for i, (private_key, public_key) in enumerate(keys):
+        transaction.sign_input(i, txn.Transaction.SIG_HASH_ALL, private_key, sub_scripts[i])
+
+    assert transaction.verify_input_signatures(sub_scripts) == [True, True]
+    assert transaction.verify_input_signatures(sub_scripts[::-1]) == [False, False]
+    assert transaction.verify_input_signatures(sub_scripts) == \
+        [transaction.verify_input_signature(i, s) for i, s in enumerate(sub_scripts)]
+
+    with pytest.raises(ValueError):
+        transaction.verify_input_signatures(sub_scripts[:1])
+
+
+def test_sign_inputs():
+    sub_scripts = [script.Script.build_p2pkh(public_key.hash160(compressed=False))
+                   for private_key, public_key in keys]
+    outputs = [txn.TransactionOutput(9000, sub_scripts[0])]
+
+    def make_txn():
+        inputs = [txn.TransactionInput(hash.Hash(bytes([i + 1]) * 32), i, script.Script(""), 0xffffffff)
+                  for i in range(6)]
+        return txn.Transaction(txn.Transaction.DEFAULT_TRANSACTION_VERSION, inputs, outputs, 0)
+
+    to_sign = [(i, keys[i % 2][0], sub_scripts[i % 2]) for i in range(6)]
+
+    serial = make_txn()
+    for i, private_key, sub_script in to_sign:
+        serial.sign_input(i, txn.Transaction.SIG_HASH_ALL, private_key, sub_script)
+
+    batch = make_txn()
+    assert batch.sign_inputs(to_sign, txn.Transaction.SIG_HASH_ALL)
+    assert bytes(batch) == bytes(serial)
+
+    # Signing in a pool gives the same transaction
+    with concurrent.futures.ProcessPoolExecutor(2) as executor:
+        pooled = make_txn()
+        assert pooled.sign_inputs(to_sign, txn.Transaction.SIG_HASH_ALL, executor)
+    assert bytes(pooled) == bytes(serial)
+    assert pooled.verify_input_signatures([s for _, _, s in to_sign]) == [True] * 6
+
+    with pytest.raises(ValueError):
+        make_txn().sign_inputs([(0, keys[1][0], sub_scripts[0])], txn.Transaction.SIG_HASH_ALL)
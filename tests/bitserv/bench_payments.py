@@ -0,0 +1,138 @@
+"""Load test for payments made in many payment channels at once.
+
+Opens a number of channels with a payment server, then has client
+threads make payments in them: each client takes its share of the
+channels and makes a payment in each of them in turn, which the server
+receives and redeems. Unless --zeroconf is given, a channel's first
+payment checks that its deposit is confirmed, with a mock blockchain
+that takes --latency seconds to answer. Reports the throughput and the
+latency of receiving and redeeming a payment.
+
+Usage:
+    python tests/bitserv/bench_payments.py [--clients N] [--channels N] [--payments N]
+                                           [--latency SECONDS] [--zeroconf]
+"""
+import argparse
+import tempfile
+import threading
+import time
+
+import two1.bitcoin.utils as utils
+from two1.bitcoin import Hash
+from two1.bitcoin import PrivateKey
+from two1.bitcoin import Script
+from two1.bitcoin import Transaction
+from two1.bitcoin import TransactionInput
+from two1.bitcoin import TransactionOutput
+from two1.bitserv.models import DatabaseSQLite3
+from two1.bitserv.payment_server import PaymentServer
+from two1.channels.statemachine import PaymentChannelRedeemScript
+
+
+DEPOSIT_AMOUNT = 1000000
+PAYMENT_AMOUNT = 5000
+FEE_AMOUNT = 10000
+
+
+class MockWallet:
+
+    def __init__(self):
+        self.private_key = PrivateKey.from_random()
+        self.testnet = False
+
+    def get_payout_public_key(self, account='default'):
+        return self.private_key.public_key
+
+    def get_private_for_public(self, public_key):
+        if public_key.to_hex() == self.private_key.public_key.to_hex():
+            return self.private_key
+
+
+class MockBlockchain:
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def check_confirmed(self, txid, num_confirmations=1):
+        time.sleep(self.latency)
+        return True
+
+    def lookup_spend_txid(self, txid, output_index):
+        return None
+
+    def broadcast_tx(self, tx):
+        pass
+
+
+class Client:
+
+    def __init__(self, merchant_public_key, n):
+        self.private_key = PrivateKey.from_random()
+        self.redeem_script = PaymentChannelRedeemScript(
+            merchant_public_key, self.private_key.public_key, int(time.time()) + 86400)
+
+        script = Script.build_p2pkh(self.private_key.public_key.hash160())
+        inp = TransactionInput(Hash(n.to_bytes(32, 'big')), 0, script, 0xffffffff)
+        out = TransactionOutput(DEPOSIT_AMOUNT, Script.build_p2sh(self.redeem_script.hash160()))
+        self.deposit_tx = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION, [inp], [out], 0)
+        self.deposit_tx.sign_input(0, Transaction.SIG_HASH_ALL, self.private_key, script)
+
+    def payment_tx(self, amount):
+        inp = TransactionInput(self.deposit_tx.hash, 0, Script(), 0xffffffff)
+        outs = [TransactionOutput(amount, Script.build_p2pkh(self.redeem_script.merchant_public_key.hash160())),
+                TransactionOutput(DEPOSIT_AMOUNT - FEE_AMOUNT - amount,
+                                  Script.build_p2pkh(self.private_key.public_key.hash160()))]
+        payment_tx = Transaction(1, [inp], outs, 0)
+        sig = payment_tx.get_signature_for_input(0, Transaction.SIG_HASH_ALL, self.private_key, self.redeem_script)[0]
+        payment_tx.inputs[0].script = Script(
+            [sig.to_der() + utils.pack_compact_int(Transaction.SIG_HASH_ALL), 'OP_1', bytes(self.redeem_script)])
+        return payment_tx.to_hex()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--payments", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--zeroconf", action="store_true")
+    args = parser.parse_args()
+
+    wallet = MockWallet()
+    server = PaymentServer(wallet, db=DatabaseSQLite3(db_dir=tempfile.mkdtemp()),
+                           blockchain=MockBlockchain(args.latency), zeroconf=args.zeroconf)
+
+    # Open the channels and sign the payments ahead of time
+    clients = [Client(wallet.get_payout_public_key(), n) for n in range(args.channels)]
+    channels = []
+    for client in clients:
+        deposit_txid = server.open(client.deposit_tx.to_hex(), client.redeem_script.to_hex())
+        channels.append((deposit_txid, [client.payment_tx(PAYMENT_AMOUNT * (i + 1))
+                                        for i in range(args.payments)]))
+
+    latencies = []
+    lock = threading.Lock()
+
+    def run(channels):
+        for i in range(args.payments):
+            for deposit_txid, payment_txs in channels:
+                start = time.perf_counter()
+                payment_txid = server.receive_payment(deposit_txid, payment_txs[i])
+                server.redeem(payment_txid)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=run, args=(channels[i::args.clients],)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    assert len(latencies) == args.channels * args.payments
+    print("%d clients, %d channels, %d payments each" % (args.clients, args.channels, args.payments))
+    print("throughput:  %7.1f payments/s" % (len(latencies) / elapsed))
+    print("p50 latency: %7.1fms" % (latencies[len(latencies) // 2] * 1000))
+    print("p99 latency: %7.1fms" % (latencies[int(len(latencies) * 0.99)] * 1000))
@@ -2,6 +2,7 @@
 import time
 import codecs
 import pytest
+import threading
 import collections
 import multiprocessing
 
@@ -92,6 +93,24 @@ class MockBlockchain:
 def mock_lookup_spent_txid(self, txid, output_index):
     return txid
 
+
+class MockBatchBlockchain(MockBlockchain):
+
+    def __init__(self):
+        self.calls = []
+        self.spent = set()
+
+    def check_confirmed_many(self, txids, num_confirmations=1):
+        assert not any(tlock.locked() for tlock in PaymentServer.lock.tlocks)
+        self.calls.append(('check_confirmed_many', sorted(txids)))
+        return dict.fromkeys(txids, True)
+
+    def lookup_spend_txids(self, outpoints):
+        assert not any(tlock.locked() for tlock in PaymentServer.lock.tlocks)
+        self.calls.append(('lookup_spend_txids', sorted(txid for txid, _ in outpoints)))
+        return {(txid, index): txid if txid in self.spent else None for txid, index in outpoints}
+
+
 ###############################################################################
 
 ClientVals = collections.namedtuple('ClientVals', ['deposit_tx', 'payment_tx', 'redeem_script'])
@@ -311,6 +330,78 @@ def test_channel_sync(monkeypatch):
     assert test_state == ChannelSQLite3.CLOSED, 'Channel should be CLOSED'
 
 
+def test_channel_sync_batched(monkeypatch):
+    """Test that a sync looks up all open channels at once, without the lock."""
+    channel_server._db = DatabaseSQLite3(':memory:', db_dir='')
+    blockchain = MockBatchBlockchain()
+    monkeypatch.setattr(channel_server, '_blockchain', blockchain)
+
+    # Open three channels with a payment each, and close one of them
+    deposit_txids = []
+    for _ in range(3):
+        cust_wallet._private_key = PrivateKey.from_random()
+        test_client = _create_client_txs()
+        deposit_txid = channel_server.open(test_client.deposit_tx, test_client.redeem_script)
+        channel_server.receive_payment(deposit_txid, test_client.payment_tx)
+        deposit_txids.append(deposit_txid)
+    open_a, open_b, closed = deposit_txids
+    channel_server._db.pc.update_state(open_a, ChannelSQLite3.CONFIRMING)
+    channel_server._db.pc.update_state(closed, ChannelSQLite3.CLOSED)
+    assert sorted(pc.deposit_txid for pc in channel_server._db.pc.lookup_open()) == sorted([open_a, open_b])
+
+    # Closed channels are skipped, and open ones checked in one call each
+    channel_server.sync()
+    assert blockchain.calls == [('check_confirmed_many', [open_a]),
+                                ('lookup_spend_txids', sorted([open_a, open_b]))]
+    assert channel_server._db.pc.lookup(open_a).state == ChannelSQLite3.READY
+    assert channel_server._db.pc.lookup(open_b).state == ChannelSQLite3.READY
+
+    # Channels whose deposit was spent get closed
+    blockchain.calls = []
+    blockchain.spent.add(open_b)
+    channel_server.sync()
+    assert blockchain.calls == [('lookup_spend_txids', sorted([open_a, open_b]))]
+    assert channel_server._db.pc.lookup(open_a).state == ChannelSQLite3.READY
+    assert channel_server._db.pc.lookup(open_b).state == ChannelSQLite3.CLOSED
+
+    # A channel closed while a sync was running stays closed
+    channel_server._db.pc.update_states({open_a: ChannelSQLite3.CLOSED, open_b: ChannelSQLite3.READY})
+    assert channel_server._db.pc.lookup(open_b).state == ChannelSQLite3.CLOSED
+    assert channel_server._db.pc.lookup_open() == []
+
+
+def test_channel_locks():
+    """Test that payments in different channels don't wait for each other."""
+    channel_server._db = DatabaseSQLite3(':memory:', db_dir='')
+
+    # Open two channels that use different locks
+    clients = {}
+    while len(clients) < 2:
+        cust_wallet._private_key = PrivateKey.from_random()
+        test_client = _create_client_txs()
+        deposit_txid = channel_server.open(test_client.deposit_tx, test_client.redeem_script)
+        clients.setdefault(PaymentServer.lock.index(deposit_txid), (deposit_txid, test_client))
+    (deposit_txid_a, client_a), (deposit_txid_b, client_b) = clients.values()
+
+    # Payments in channel B go through while channel A is busy
+    done = threading.Event()
+
+    def receive_payment_a():
+        channel_server.receive_payment(deposit_txid_a, client_a.payment_tx)
+        done.set()
+
+    with PaymentServer.lock(deposit_txid_a):
+        t = threading.Thread(target=receive_payment_a)
+        t.start()
+        payment_txid = channel_server.receive_payment(deposit_txid_b, client_b.payment_tx)
+        assert channel_server.redeem(payment_txid) == TEST_PMT_AMOUNT
+
+        # ... while those in channel A wait for it
+        assert not done.wait(0.1)
+    t.join()
+    assert channel_server.status(deposit_txid_a)['balance'] == TEST_PMT_AMOUNT
+
+
 def test_channel_low_balance_message():
     """Test that the channel server returns a useful error when the balance is low."""
     channel_server._db = DatabaseSQLite3(':memory:', db_dir='')
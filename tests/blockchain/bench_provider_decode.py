@@ -0,0 +1,115 @@
+"""Benchmark for decoding large TwentyOneProvider transaction responses.
+
+Serves a synthetic response from a local HTTP server: N transactions,
+each sending from an address in one 199-address chunk to an address in
+another, so that every transaction is returned twice. Reports how long
+get_transactions() takes, with a fresh provider each time, and its peak
+memory use measured with tracemalloc.
+
+Usage:
+    python tests/blockchain/bench_provider_decode.py [--txns N] [--runs N]
+"""
+import argparse
+import http.server
+import json
+import threading
+import time
+import tracemalloc
+
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionInput
+from two1.bitcoin.txn import TransactionOutput
+from two1.bitcoin.utils import bytes_to_str
+from two1.blockchain.twentyone_provider import TwentyOneProvider
+
+
+CHUNK_SIZE = 199
+
+
+def txn_json(n, from_address, to_address):
+    inp = TransactionInput(outpoint=Hash(n.to_bytes(32, 'big')),
+                           outpoint_index=0,
+                           script=Script(bytes(range(107))),
+                           sequence_num=0xffffffff)
+    outs = [TransactionOutput(value=n * 1000 + i,
+                              script=Script.build_p2pkh((n * 2 + i).to_bytes(20, 'big')))
+            for i in range(2)]
+    txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION, [inp], outs, 0)
+
+    return dict(hash=str(txn.hash),
+                block_hash="00" * 32,
+                block_height=400000 + n % 1000,
+                chain_received_at="2016-03-%02dT10:52:21.718Z" % (n % 28 + 1),
+                confirmations=1000 - n % 1000,
+                lock_time=0,
+                inputs=[dict(output_hash=str(inp.outpoint),
+                             output_index=0,
+                             script_signature_hex=bytes_to_str(bytes(inp.script)),
+                             sequence=inp.sequence_num,
+                             addresses=[from_address])],
+                outputs=[dict(value=o.value,
+                              script_hex=bytes_to_str(bytes(o.script)),
+                              addresses=[to_address if i == 0 else "change%d" % n])
+                         for i, o in enumerate(outs)])
+
+
+def make_responses(num_txns, addresses):
+    chunks = [addresses[i:i + CHUNK_SIZE] for i in range(0, len(addresses), CHUNK_SIZE)]
+    items = [[] for _ in chunks]
+    for n in range(num_txns):
+        a = n % CHUNK_SIZE
+        j = txn_json(n, chunks[0][a], chunks[1][a])
+        items[0].append(j)
+        items[1].append(j)
+
+    return {chunk[0]: json.dumps(i).encode() for chunk, i in zip(chunks, items)}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        first_address = self.path.split("/")[4].split(",")[0]
+        body = self.server.responses[first_address]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--txns", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    addresses = ["addr%04d" % i for i in range(2 * CHUNK_SIZE)]
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.responses = make_responses(args.txns, addresses)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d/" % server.server_port
+    print("%d transactions, %d bytes of JSON" % (
+        args.txns, sum(len(r) for r in server.responses.values())))
+
+    elapsed = []
+    for _ in range(args.runs):
+        provider = TwentyOneProvider(url)
+        start = time.perf_counter()
+        ret = provider.get_transactions(addresses, limit=10000)
+        elapsed.append(time.perf_counter() - start)
+    assert sum(len(t) for t in ret.values()) == 2 * args.txns
+    print("get_transactions: %6.2fs (best of %d)" % (min(elapsed), args.runs))
+
+    provider = TwentyOneProvider(url)
+    tracemalloc.start()
+    ret = provider.get_transactions(addresses, limit=10000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("peak memory:      %6.1fMB" % (peak / 1e6))
+
+    server.shutdown()
@@ -0,0 +1,185 @@
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionInput
+from two1.bitcoin.txn import TransactionOutput
+from two1.bitcoin.utils import bytes_to_str
+from two1.blockchain.concurrent_fetcher import ConcurrentFetcher
+from two1.blockchain.exceptions import DataProviderError
+from two1.blockchain.exceptions import DataProviderUnavailableError
+from two1.blockchain.twentyone_provider import TwentyOneProvider
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """ Answers GETs with server.responses[path] after server.latency
+        seconds, or drops the connection for paths in server.drop.
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.paths.append(self.path)
+            drop = server.drop.get(self.path, 0)
+            if drop:
+                server.drop[self.path] = drop - 1
+
+        try:
+            time.sleep(server.latency)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+        if drop:
+            return
+
+        body = json.dumps(server.responses(self.path)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.latency = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.paths = []
+    server.drop = {}
+
+    t = threading.Thread(target=server.serve_forever)
+    t.start()
+    yield server
+    server.shutdown()
+    t.join()
+    server.server_close()
+
+
+def make_txn(n):
+    inp = TransactionInput(outpoint=Hash(n.to_bytes(32, 'big')),
+                           outpoint_index=0,
+                           script=Script.build_push_int(n),
+                           sequence_num=0xffffffff)
+    out = TransactionOutput(value=n * 1000,
+                            script=Script.build_p2pkh(n.to_bytes(20, 'big')))
+    return Transaction(Transaction.DEFAULT_TRANSACTION_VERSION, [inp], [out], 0)
+
+
+def txn_to_json(txn, address):
+    return dict(hash=str(txn.hash),
+                block_hash=None,
+                block_height=None,
+                chain_received_at="2016-01-01T00:00:00Z",
+                confirmations=0,
+                lock_time=txn.lock_time,
+                inputs=[dict(output_hash=str(i.outpoint),
+                             output_index=i.outpoint_index,
+                             script_signature_hex=bytes_to_str(bytes(i.script)),
+                             sequence=i.sequence_num)
+                        for i in txn.inputs],
+                outputs=[dict(value=o.value,
+                              script_hex=bytes_to_str(bytes(o.script)),
+                              addresses=[address])
+                         for o in txn.outputs])
+
+
+def test_concurrent_fetcher():
+    fetcher = ConcurrentFetcher(max_in_flight=4, retries=2, backoff=0.01)
+    lock = threading.Lock()
+    state = dict(in_flight=0, max_in_flight=0)
+    attempts = {}
+
+    def f(i):
+        with lock:
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            attempts[i] = attempts.get(i, 0) + 1
+        # Later calls finish first
+        time.sleep(0.01 * (20 - i))
+        with lock:
+            state['in_flight'] -= 1
+
+        if i % 5 == 0 and attempts[i] < 3:
+            raise DataProviderUnavailableError("Could not connect to service.")
+        return i * i
+
+    # Results come back in order, with unavailable errors retried
+    assert fetcher.map(f, range(20)) == [i * i for i in range(20)]
+    assert state['max_in_flight'] == 4
+    assert attempts[5] == 3 and attempts[6] == 1
+
+    # ... until the retries run out
+    attempts.clear()
+    fetcher.retries = 1
+    with pytest.raises(DataProviderUnavailableError):
+        fetcher.map(lambda i: f(i * 5), range(2))
+    assert attempts[0] == 2
+
+    # Other errors aren't retried
+    def g(i):
+        attempts[i] = attempts.get(i, 0) + 1
+        raise DataProviderError("bad request")
+
+    attempts.clear()
+    with pytest.raises(DataProviderError):
+        fetcher.map(g, [7])
+    assert attempts == {7: 1}
+
+
+def test_twentyone_provider_fan_out(stub_server):
+    addresses = ["addr%04d" % i for i in range(4 * 199)]
+    txns = {a: make_txn(i) for i, a in enumerate(addresses) if i % 50 == 0}
+
+    def responses(path):
+        if path.startswith("/blockchain/bitcoin/addresses/"):
+            requested = path.split("/")[4].split(",")
+            return [txn_to_json(txns[a], a) for a in requested if a in txns]
+        else:
+            txid = path.split("/")[-1]
+            for a, txn in txns.items():
+                if str(txn.hash) == txid:
+                    return txn_to_json(txn, a)
+
+    stub_server.responses = responses
+    stub_server.latency = 0.2
+    provider = TwentyOneProvider("http://127.0.0.1:%d/" % stub_server.server_port,
+                                 connection_pool_size=4)
+
+    # The 199-address chunks are fetched at once
+    start = time.time()
+    ret = provider.get_transactions(addresses, min_block=100)
+    assert time.time() - start < 0.6
+    assert stub_server.max_in_flight == 4
+    assert list(ret.keys()) == sorted(txns.keys())
+    for a, t in ret.items():
+        assert len(t) == 1
+        assert t[0]['transaction'].hash == txns[a].hash
+        assert t[0]['metadata']['confirmations'] == 0
+
+    # Transactions by id, with a dropped connection being retried
+    txids = [str(txn.hash) for txn in txns.values()]
+    stub_server.drop["/blockchain/bitcoin/transactions/%s" % txids[3]] = 1
+    stub_server.paths = []
+    provider._fetcher.backoff = 0.01
+    start = time.time()
+    ret = provider.get_transactions_by_id(txids)
+    assert time.time() - start < 0.2 * len(txids) / 2
+    assert list(ret.keys()) == txids
+    assert all(ret[str(txn.hash)]['transaction'].hash == txn.hash for txn in txns.values())
+    assert len(stub_server.paths) == len(txids) + 1
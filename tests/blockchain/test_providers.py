@@ -1,9 +1,17 @@
+from calendar import timegm
+import json
+import random
 import pytest
 from unittest.mock import MagicMock
+
+import arrow
+
 from two1.bitcoin.crypto import HDPublicKey
 from two1.bitcoin.txn import Transaction
 from two1.blockchain.insight_provider import InsightProvider
 from two1.blockchain.twentyone_provider import TwentyOneProvider
+from two1.blockchain.twentyone_provider import _iter_json_array
+from two1.blockchain.twentyone_provider import _timestamp
 from two1.blockchain.exceptions import DataProviderError
 
 
@@ -96,3 +104,71 @@ def test_transaction_send(provider, testnet):
     cp.testnet = testnet
     with pytest.raises(DataProviderError):
         cp.broadcast_transaction(tx)
+
+
+def test_json_stream():
+    items = [dict(n=i, s="\u00e9" * i, l=[1.5, None, True, "]"]) for i in range(30)]
+    text = json.dumps(items, ensure_ascii=False).encode()
+    for size in [1, 7, 100, len(text)]:
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert list(_iter_json_array(chunks)) == items
+
+    # Numbers split across chunks aren't cut short
+    assert list(_iter_json_array([b" [ 1", b"23, 4", b"5 ] "])) == [123, 45]
+    assert list(_iter_json_array([b"[0.", b"5, 1", b"e", b"3, -", b"2.5E-1 ]"])) == [0.5, 1000.0, -0.25]
+    rand = random.Random(0)
+    numbers = [rand.choice([rand.randint(-10 ** 6, 10 ** 6), rand.uniform(-1e3, 1e3), rand.random() * 1e-20])
+               for _ in range(200)]
+    text = json.dumps(numbers).encode()
+    for _ in range(200):
+        cuts = sorted(rand.sample(range(1, len(text)), 40))
+        chunks = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        assert list(_iter_json_array(chunks)) == numbers
+    assert list(_iter_json_array([b"[", b"]"])) == []
+
+    with pytest.raises(ValueError):
+        list(_iter_json_array([b'[{"a": 1}']))
+    with pytest.raises(ValueError):
+        list(_iter_json_array([b'{"a": 1}']))
+
+
+def test_timestamp():
+    for t in ["2015-08-13T10:52:21.718Z", "2015-08-13T10:52:21Z", "2016-02-29T23:59:59.999999Z",
+              "2015-08-13T12:52:21.718+02:00"]:
+        assert _timestamp(t) == timegm(arrow.get(t).datetime.timetuple())
+
+    assert _timestamp("1970-01-01T00:00:00Z") == 0
+
+
+def test_txn_memo():
+    txn_json = {"hash": None,
+                "block_hash": None,
+                "block_height": None,
+                "chain_received_at": "2015-08-13T10:52:21.718Z",
+                "confirmations": 0,
+                "lock_time": 0,
+                "inputs": [{"output_hash": "ab" * 32,
+                            "output_index": 1,
+                            "script_signature_hex": "0151",
+                            "sequence": 4294967295,
+                            "addresses": ["1K4nPxBMy6sv7jssTvDLJWk1ADHBZEoUVb"]}],
+                "outputs": [{"value": 290000,
+                             "script_hex": "76a914c629680b8d13ca7a4b7d196360186d05658da6db88ac",
+                             "addresses": ["1K4nPxBMy6sv7jssTvDLJWk1ADHBZEoUVb"]}]}
+    txn, _ = TwentyOneProvider.txn_from_json(txn_json)
+    txn_json["hash"] = str(txn.hash)
+    assert bytes(txn.inputs[0].script) == bytes.fromhex("0151")
+
+    provider = TwentyOneProvider()
+    provider.txn_from_json = MagicMock(side_effect=TwentyOneProvider.txn_from_json)
+    provider.TXN_MEMO_SIZE = 1
+
+    # A transaction is only parsed once ...
+    assert provider._parse_txn(txn_json) is provider._parse_txn(txn_json)
+    assert provider.txn_from_json.call_count == 1
+
+    # ... until it falls out of the memo
+    other_json = dict(txn_json, hash="other", lock_time=1)
+    provider._parse_txn(other_json)
+    provider._parse_txn(txn_json)
+    assert provider.txn_from_json.call_count == 3
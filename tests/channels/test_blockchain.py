@@ -1,5 +1,11 @@
+import http.server
+import json
+import threading
+import time
+
 import pytest
 
+import two1.bitcoin as bitcoin
 import two1.channels.blockchain as blockchain
 
 
@@ -32,3 +38,153 @@ def test_blockchain(bc):
     # Check broadcast_tx()
     # Broadcast existing transaction
     assert bc.broadcast_tx("0100000001d1e245f26f2354672d653122893d8e7a84f77515bbc6c29c457711f3b67fe90e010000006a47304402204fee33aed5c30e2546b0c3e211a99aeadae75c5cb8d2257eceabef6b190a6ed002205023d17c28c81db58c44213cf6687a4790528c4d123f8c13d6395f0c5ab9c1b20121039176bfb795e10d793dbfd68a11e5577296ad591154e15d9a39b26f5dca84ed69ffffffff02b0ad01000000000017a914d7b04112a5e0314ae378c8038205edf1fa98a76087952d8400000000001976a91473170178389cf8ce3570a7a4624a96ac924b999588ac00000000") == "25e0f083c7508d8f52a12f80669a54007dc989a752974c6660f09dac7017d810"  # nopep8
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.docs[path] after server.latency seconds, or 404."""
+
+    def _respond(self, status, doc):
+        body = json.dumps(doc).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        time.sleep(self.server.latency)
+        if self.path in self.server.docs:
+            self._respond(200, self.server.docs[self.path])
+        else:
+            self._respond(404, {"message": "Not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        txid = str(bitcoin.Transaction.from_hex(body['signed_hex']).hash)
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        self._respond(200, {"transaction_hash": txid})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.docs = {}
+    server.latency = 0
+
+    t = threading.Thread(target=server.serve_forever)
+    t.start()
+    yield server
+    server.shutdown()
+    t.join()
+    server.server_close()
+
+
+def test_blockchain_cache(stub_server):
+    bc = blockchain.TwentyOneBlockchain("http://127.0.0.1:%d" % stub_server.server_port)
+    deposit_txid = "aa" * 32
+    stub_server.docs["/transactions/" + deposit_txid] = {
+        "hash": deposit_txid, "confirmations": 0, "hex": "00",
+        "outputs": [{"value": 1}, {"value": 2}]}
+
+    # Channel syncs look up the same transaction several times in a row
+    assert bc.check_confirmed(deposit_txid) is False
+    assert bc.lookup_spend_txid(deposit_txid, 0) is None
+    assert bc.lookup_tx(deposit_txid) == "00"
+    with pytest.raises(IndexError):
+        bc.lookup_spend_txid(deposit_txid, 2)
+    assert len(stub_server.requests) == 1
+    assert (bc.cache_hits, bc.cache_misses) == (3, 1)
+
+    # Mempool transactions are looked up again soon
+    bc.MEMPOOL_TTL = 0.1
+    time.sleep(0.2)
+    stub_server.docs["/transactions/" + deposit_txid]["confirmations"] = 10
+    assert bc.check_confirmed(deposit_txid, num_confirmations=10) is True
+    assert len(stub_server.requests) == 2
+
+    # Deeply confirmed transactions are kept, but their spends are checked
+    time.sleep(0.2)
+    assert bc.check_confirmed(deposit_txid) is True
+    assert len(stub_server.requests) == 2
+    stub_server.docs["/transactions/" + deposit_txid]["outputs"][0]["spending_transaction"] = "bb" * 32
+    assert bc.lookup_spend_txid(deposit_txid, 0) == "bb" * 32
+    assert len(stub_server.requests) == 3
+
+    # Transactions not found aren't cached
+    assert bc.lookup_tx("cc" * 32) is None
+    assert bc.lookup_tx("cc" * 32) is None
+    assert len(stub_server.requests) == 5
+
+    # Concurrent lookups of a transaction share one request
+    stub_server.requests = []
+    stub_server.latency = 0.3
+    stub_server.docs["/transactions/" + "dd" * 32] = {"hash": "dd" * 32, "confirmations": 1, "hex": "01"}
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(bc.lookup_tx("dd" * 32))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["01"] * 5
+    assert stub_server.requests == ["/transactions/" + "dd" * 32]
+
+    # The cache is bounded
+    bc.CACHE_SIZE = 2
+    stub_server.latency = 0
+    stub_server.docs["/transactions/" + "ee" * 32] = {"hash": "ee" * 32, "confirmations": 1, "hex": "02"}
+    assert bc.lookup_tx(deposit_txid) == "00"
+    assert bc.lookup_tx("ee" * 32) == "02"
+    assert list(bc._tx_cache.keys()) == [deposit_txid, "ee" * 32]
+
+
+def test_blockchain_broadcast_invalidates_spent(stub_server):
+    bc = blockchain.TwentyOneBlockchain("http://127.0.0.1:%d" % stub_server.server_port)
+    tx = bitcoin.Transaction.from_hex("0100000001d1e245f26f2354672d653122893d8e7a84f77515bbc6c29c457711f3b67fe90e010000006a47304402204fee33aed5c30e2546b0c3e211a99aeadae75c5cb8d2257eceabef6b190a6ed002205023d17c28c81db58c44213cf6687a4790528c4d123f8c13d6395f0c5ab9c1b20121039176bfb795e10d793dbfd68a11e5577296ad591154e15d9a39b26f5dca84ed69ffffffff02b0ad01000000000017a914d7b04112a5e0314ae378c8038205edf1fa98a76087952d8400000000001976a91473170178389cf8ce3570a7a4624a96ac924b999588ac00000000")  # nopep8
+    spent_txid = str(tx.inputs[0].outpoint)
+    stub_server.docs["/transactions/" + spent_txid] = {"hash": spent_txid, "confirmations": 100, "hex": "00"}
+
+    assert bc.check_confirmed(spent_txid) is True
+    assert bc.broadcast_tx(tx.to_hex()) == str(tx.hash)
+    assert spent_txid not in bc._tx_cache
+
+
+def test_blockchain_batch(stub_server):
+    url = "http://127.0.0.1:%d" % stub_server.server_port
+    txids = ["aa" * 32, "bb" * 32, "cc" * 32]
+
+    # BlockCypher returns several transactions in one request
+    bc = blockchain.BlockCypherBlockchain(url)
+    stub_server.docs["/txs/" + ";".join(txids) + "?includeHex=true"] = [
+        {"hash": txids[0], "confirmations": 0, "outputs": [{"value": 1}]},
+        {"hash": txids[1], "confirmations": 3, "outputs": [{"value": 1, "spent_by": "dd" * 32}]},
+        {"error": "Transaction %s not found." % txids[2]}]
+    assert bc.check_confirmed_many(txids) == {txids[0]: False, txids[1]: True, txids[2]: False}
+    assert bc.lookup_spend_txids([(txids[0], 0), (txids[1], 0)]) == {
+        (txids[0], 0): None, (txids[1], 0): "dd" * 32}
+    assert len(stub_server.requests) == 1
+
+    # Only transactions that aren't cached are fetched
+    stub_server.docs["/txs/" + txids[2] + "?includeHex=true"] = {
+        "hash": txids[2], "confirmations": 1, "outputs": []}
+    assert bc.check_confirmed_many(txids) == {txids[0]: False, txids[1]: True, txids[2]: True}
+    assert stub_server.requests[1:] == ["/txs/" + txids[2] + "?includeHex=true"]
+
+    # Other servers are sent concurrent requests
+    bc = blockchain.TwentyOneBlockchain(url)
+    stub_server.requests = []
+    stub_server.latency = 0.2
+    for i, txid in enumerate(txids):
+        stub_server.docs["/transactions/" + txid] = {"hash": txid, "confirmations": i, "outputs": []}
+    start = time.time()
+    assert bc.check_confirmed_many(txids) == {txids[0]: False, txids[1]: True, txids[2]: True}
+    assert time.time() - start < 0.4
+    assert sorted(stub_server.requests) == ["/transactions/" + txid for txid in txids]
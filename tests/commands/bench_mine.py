@@ -0,0 +1,82 @@
+"""Benchmark for the CPU miner used by `21 mine`.
+
+Builds a fake work notification and reports the hashrate of:
+  * the old loop, which set block_header.nonce and computed
+    block_header.hash for every nonce,
+  * CompactBlock.search_nonce() in a single process, and
+  * miner.mine() across a pool of worker processes, with a pool target
+    that takes a few million hashes to hit.
+
+Usage:
+    python tests/commands/bench_mine.py [--nonces N] [--processes N] [--difficulty-bits N]
+"""
+import argparse
+import multiprocessing
+import time
+
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import CoinbaseInput
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionOutput
+import two1.bitcoin.utils as utils
+from two1.commands.util import miner
+
+
+class FakeWork(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+ENONCE1 = b'\x01\x02\x03\x04'
+ENONCE2_SIZE = 4
+
+
+def make_work(bits_pool):
+    marker = b'\xee' * (len(ENONCE1) + ENONCE2_SIZE)
+    cb_txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                         [CoinbaseInput(400000, b'/two1/' + marker)],
+                         [TransactionOutput(2500000000, Script.build_p2pkh(bytes(20)))],
+                         0)
+    coinb1, coinb2 = bytes(cb_txn).split(marker)
+
+    return FakeWork(work_id=1, version=4, prev_block_hash=bytes(range(32)), height=400000,
+                    nbits=0x1d00ffff, ntime=int(time.time()), coinb1=coinb1, coinb2=coinb2,
+                    merkle_edge=[bytes([i]) * 32 for i in range(11)], bits_pool=bits_pool)
+
+
+def old_loop(cb, target, nonces):
+    for nonce in range(nonces):
+        cb.block_header.nonce = nonce
+        if cb.block_header.hash.to_int('little') < target:
+            return nonce
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--nonces", type=int, default=200000)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--difficulty-bits", type=int, default=22,
+                        help="log2 of the expected number of hashes for the pool benchmark")
+    args = parser.parse_args()
+
+    params = miner.work_params(make_work(0x1d00ffff))
+    cb = miner.build_block(params, ENONCE1, bytes(ENONCE2_SIZE))
+
+    start = time.perf_counter()
+    old_loop(cb, 0, args.nonces)
+    old_rate = args.nonces / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cb.search_nonce(0, 0, args.nonces)
+    midstate_rate = args.nonces / (time.perf_counter() - start)
+
+    bits = utils.target_to_bits(2 ** (256 - args.difficulty_bits))
+    params = miner.work_params(make_work(bits))
+    result = miner.mine(params, ENONCE1, ENONCE2_SIZE, processes=args.processes)
+    pool_rate = result.hashes / result.elapsed
+
+    print("%36s %12s" % ("", "kH/s"))
+    print("%36s %12.1f" % ("old loop (1 process)", old_rate / 1e3))
+    print("%36s %12.1f" % ("search_nonce (1 process)", midstate_rate / 1e3))
+    print("%36s %12.1f" % ("miner.mine (%d processes)" % args.processes, pool_rate / 1e3))
+    print("pool found nonce %d after %d hashes in %.2fs" % (result.nonce, result.hashes, result.elapsed))
@@ -0,0 +1,69 @@
+"""Mine command unit tests. """
+from collections import namedtuple
+
+import pytest
+
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import CoinbaseInput
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionOutput
+import two1.bitcoin.utils as utils
+from two1.commands import mine
+from two1.commands.util import miner
+
+FakeWork = namedtuple('FakeWork', ['work_id', 'version', 'prev_block_hash', 'height', 'nbits', 'ntime',
+                                   'coinb1', 'coinb2', 'merkle_edge', 'bits_pool'])
+
+ENONCE1 = b'\x01\x02\x03\x04'
+ENONCE2_SIZE = 4
+
+
+def make_work(bits_pool):
+    """Builds a work notification whose coinbase is split around the enonces."""
+    marker = b'\xee' * (len(ENONCE1) + ENONCE2_SIZE)
+    cb_txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                         [CoinbaseInput(400000, b'/two1/' + marker)],
+                         [TransactionOutput(2500000000, Script.build_p2pkh(bytes(20)))],
+                         0)
+    coinb1, coinb2 = bytes(cb_txn).split(marker)
+
+    return FakeWork(work_id=1, version=4, prev_block_hash=bytes(range(32)), height=400000,
+                    nbits=0x1d00ffff, ntime=1450000000, coinb1=coinb1, coinb2=coinb2,
+                    merkle_edge=[bytes([i]) * 32 for i in range(3)], bits_pool=bits_pool)
+
+
+def test_search_nonce():
+    params = miner.work_params(make_work(0x1f00ffff))
+    cb = miner.build_block(params, ENONCE1, bytes(ENONCE2_SIZE))
+
+    expected = None
+    for nonce in range(50000):
+        cb.block_header.nonce = nonce
+        if cb.block_header.hash.to_int('little') < params.target:
+            expected = nonce
+            break
+
+    assert expected is not None
+    assert cb.search_nonce(params.target, 0, 50000) == expected
+    assert cb.block_header.nonce == expected
+    assert cb.search_nonce(params.target, expected + 1, expected + 1) is None
+
+    # Changing the coinbase must change the midstate
+    cb.coinbase_transaction = miner.build_block(params, ENONCE1, b'\x00\x00\x00\x01').coinbase_transaction
+    nonce = cb.search_nonce(params.target, 0, 50000)
+    assert Hash.dhash(bytes(cb.block_header)).to_int('little') < params.target
+    assert cb.block_header.nonce == nonce
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_mine_work(processes):
+    work = make_work(0x1f00ffff)
+    share = mine.mine_work(work, ENONCE1, ENONCE2_SIZE, processes=processes)
+
+    assert share.work_id == work.work_id
+    assert len(share.enonce2) == ENONCE2_SIZE
+
+    cb = miner.build_block(miner.work_params(work), ENONCE1, share.enonce2)
+    cb.block_header.nonce = share.nonce
+    assert cb.block_header.hash.to_int('little') < utils.bits_to_target(work.bits_pool)
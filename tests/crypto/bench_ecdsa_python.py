@@ -0,0 +1,102 @@
+"""Microbenchmark for the pure-Python secp256k1 implementation.
+
+Compares the Montgomery-ladder-only scalar multiplication (the "old"
+path) against the precomputed base point table and windowed-NAF paths
+for key generation, signing, verification and BIP32 child derivation.
+Signing multiplies by a secret nonce and so uses the ladder in both.
+
+Usage:
+    python tests/crypto/bench_ecdsa_python.py [--count N]
+"""
+import argparse
+import os
+import time
+
+from two1.bitcoin import crypto
+from two1.crypto.ecdsa_python import ECPointJacobian
+from two1.crypto.ecdsa_python import secp256k1
+
+
+def ladder_public_key(curve, private_key):
+    return (curve.base_point * private_key).to_affine()
+
+
+def ladder_verify(curve, message, signature, public_key, do_hash=True):
+    hashed = curve.hash_function(message).digest() if do_hash else message
+    z = int.from_bytes(hashed, 'big')
+    w = curve.modinv(signature.y, curve.n)
+    u = (z * w) % curve.n
+    v = (signature.x * w) % curve.n
+    pt = (curve.base_point * u + ECPointJacobian.from_affine(public_key) * v).to_affine()
+
+    return signature.x == (pt.x % curve.n)
+
+
+def rate(f, args):
+    start = time.perf_counter()
+    for a in args:
+        f(*a)
+
+    return len(args) / (time.perf_counter() - start)
+
+
+def bench_curve(curve, count, old):
+    if old:
+        def public_key(k):
+            return ladder_public_key(curve, k)
+
+        def verify(m, s, pk):
+            return ladder_verify(curve, m, s, pk)
+    else:
+        public_key = curve.public_key
+        verify = curve.verify
+
+    private_keys = [int.from_bytes(os.urandom(32), 'big') % curve.n for i in range(count)]
+    messages = [os.urandom(32) for i in range(count)]
+    public_keys = [curve.public_key(k) for k in private_keys]
+    sigs = [curve.sign(m, k)[0] for m, k in zip(messages, private_keys)]
+
+    return [rate(public_key, [(k,) for k in private_keys]),
+            rate(curve.sign, list(zip(messages, private_keys))),
+            rate(verify, list(zip(messages, sigs, public_keys)))]
+
+
+def bench_bip32(count, old):
+    master = crypto.HDPrivateKey.master_key_from_seed(os.urandom(32))
+    xpub = master.public_key
+
+    curve = crypto.bitcoin_curve
+    if old:
+        curve.public_key = lambda k: ladder_public_key(curve, k)
+    try:
+        priv = rate(lambda i: crypto.HDPrivateKey.from_parent(master, i).public_key,
+                    [(i,) for i in range(count)])
+        pub = rate(crypto.HDPublicKey.from_parent, [(xpub, i) for i in range(count)])
+    finally:
+        if old:
+            del curve.public_key
+
+    return [priv, pub]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=50)
+    args = parser.parse_args()
+
+    curve = secp256k1()
+    start = time.perf_counter()
+    curve._base_tables()
+    print("base point tables built in %.3fs" % (time.perf_counter() - start))
+
+    names = ["keygen", "sign", "verify"]
+    results = {old: bench_curve(curve, args.count, old) for old in (True, False)}
+    if type(crypto.bitcoin_curve).__module__ == secp256k1.__module__:
+        names += ["bip32 priv child", "bip32 pub child"]
+        for old in (True, False):
+            results[old] += bench_bip32(args.count, old)
+
+    print("%18s %14s %14s %8s" % ("op", "ladder (/s)", "new (/s)", "speedup"))
+    for i, name in enumerate(names):
+        print("%18s %14.1f %14.1f %7.1fx" % (name, results[True][i], results[False][i],
+                                             results[False][i] / results[True][i]))
@@ -0,0 +1,65 @@
+"""Benchmark for batched ECDSA signature verification.
+
+Signs random digests with a handful of keys and reports verifications
+per second when checking batches of 1, 10 and 1000 signatures one at a
+time with PublicKey.verify and all at once with PublicKey.verify_batch.
+
+Usage:
+    python tests/crypto/bench_verify.py [--keys N] [--repeat N]
+"""
+import argparse
+import os
+import time
+
+from two1.bitcoin.crypto import PrivateKey
+from two1.bitcoin.crypto import PublicKey
+from two1.bitcoin.crypto import bitcoin_curve
+
+BATCH_SIZES = [1, 10, 1000]
+
+
+def make_items(num_sigs, private_keys):
+    items = []
+    for i in range(num_sigs):
+        private_key = private_keys[i % len(private_keys)]
+        digest = os.urandom(32)
+        items.append((private_key.public_key, digest, private_key.sign(digest, False)))
+
+    return items
+
+
+def verify_each(items):
+    return [pub_key.verify(digest, sig, False) for pub_key, digest, sig in items]
+
+
+def verify_batch(items):
+    return PublicKey.verify_batch(items, False)
+
+
+def bench(f, items, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        assert all(f(items))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return len(items) / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--keys", type=int, default=10,
+                        help="number of distinct signing keys")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    private_keys = [PrivateKey.from_random() for i in range(args.keys)]
+
+    print("backend: %s" % type(bitcoin_curve).__module__)
+    print("%8s %16s %16s" % ("sigs", "verify (/s)", "verify_batch (/s)"))
+    for n in BATCH_SIZES:
+        items = make_items(n, private_keys)
+        print("%8d %16.1f %16.1f" % (n,
+                                     bench(verify_each, items, args.repeat),
+                                     bench(verify_batch, items, args.repeat)))
@@ -293,3 +293,69 @@ def test_secp256k1(curve):
     sig_full = (sig_pt.x << curve.nlen) + sig_pt.y
 
     assert sig_full == 0xb552edd27580141f3b2a5463048cb7cd3e047b97c9f98076c32dbdf85a68718b279fa72dd19bfae05577e06c7c0c1900c371fcd5893f7e1d56a37d30174671f6  # nopep8
+
+
+@pytest.mark.parametrize("curve", [
+    ecdsa_python.p256(),
+    ecdsa_python.secp256k1()
+    ])
+def test_wnaf_and_base_table(curve):
+    base_point = curve.base_point
+    Q = base_point * random.randrange(1, curve.n)
+
+    for k in [1, 2, curve.n - 1, random.randrange(1, curve.n)]:
+        for w in [2, 4, 5, 8]:
+            digits = ecdsa_python.wnaf(k, w)
+            assert sum(d << i for i, d in enumerate(digits)) == k
+            assert all(d % 2 == 1 and abs(d) < 2 ** (w - 1) for d in digits if d)
+
+        # The table/wNAF paths must agree with the Montgomery ladder.
+        assert curve.base_point_multiply(k).to_affine() == (base_point * k).to_affine()
+
+        multiples = ecdsa_python.wnaf_precompute(Q, curve.WNAF_WIDTH)
+        res = ecdsa_python.wnaf_multiply([(k, curve.WNAF_WIDTH, multiples)])
+        assert res.to_affine() == (Q * k).to_affine()
+
+    assert curve.base_point_multiply(curve.n).infinity
+
+
+@pytest.mark.parametrize("curve", [
+    ecdsa_python.p256(),
+    ecdsa_python.secp256k1()
+    ])
+def test_add_base_multiples(curve):
+    k = random.randrange(1, curve.n)
+    Q = curve.public_key(k)
+
+    scalars = [0, 1, 2, curve.n - k, curve.n - 1, k] + \
+        [random.randrange(1, curve.n) for i in range(10)]
+    res = curve.add_base_multiples(Q, scalars)
+
+    assert res[0] == Q
+    assert res[3].infinity
+    for s, r in zip(scalars, res):
+        if s != curve.n - k:
+            assert r == (curve.base_point_multiply(s) + Q.to_jacobian()).to_affine()
+
+
+@pytest.mark.parametrize("curve", [
+    ecdsa_python.p256(),
+    ecdsa_python.secp256k1(),
+    ecdsa_openssl.secp256k1()
+    ])
+def test_verify_out_of_range(curve):
+    private_key, public_key = curve.gen_key_pair()
+    message = b"Out of range"
+    sig, _ = curve.sign(message, private_key)
+    assert curve.verify(message, sig, public_key)
+
+    # r and s must be reduced and non-zero: r + n and s + n are
+    # congruent to a valid signature but must not verify.
+    bad_sigs = [Point(sig.x + curve.n, sig.y),
+                Point(sig.x, sig.y + curve.n),
+                Point(0, sig.y),
+                Point(sig.x, 0)]
+    for bad_sig in bad_sigs:
+        assert not curve.verify(message, bad_sig, public_key)
+    items = [(public_key, message, s) for s in [sig] + bad_sigs]
+    assert curve.verify_batch(items) == [True] + [False] * len(bad_sigs)
@@ -0,0 +1,178 @@
+"""Load benchmark for the wallet daemon's JSON-RPC servers.
+
+Runs concurrent clients calling a fast read-only method against a
+server while a background thread keeps "syncing" (a slow network fetch
+followed by a short update), once with the threaded server serializing
+requests behind a single client lock, as the daemon used to, and once
+with the asyncio server and the readers-writer lock, which readers
+share and the sync only takes for the update. Reports throughput and
+read latencies, and for the asyncio server also the throughput of
+clients pipelining requests on one connection. Finally, times fetching
+large replies through UnixSocketServerProxy with newline-delimited
+JSON and with length-prefixed frames.
+
+Usage:
+    python tests/wallet/bench_rpc_server.py [--clients N] [--requests N] [--pipeline N]
+                                            [--reply-size BYTES]
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from jsonrpcserver import Methods
+
+from two1.wallet.rwlock import ReadWriteLock
+from two1.wallet.socket_rpc_server import AsyncUnixSocketJSONRPCServer
+from two1.wallet.socket_rpc_server import FRAMING_LENGTH_PREFIXED
+from two1.wallet.socket_rpc_server import FRAMING_NEWLINE
+from two1.wallet.socket_rpc_server import UnixSocketJSONRPCServer
+from two1.wallet.socket_rpc_server import UnixSocketServerProxy
+
+
+READ_TIME = 0.001  # seconds
+FETCH_TIME = 0.5
+APPLY_TIME = 0.02
+
+
+def make_methods(lock):
+    methods = Methods()
+
+    def confirmed_balance(params):
+        if lock is not None:
+            lock.acquire_read()
+        try:
+            time.sleep(READ_TIME)
+            return 100000
+        finally:
+            if lock is not None:
+                lock.release_read()
+
+    methods.add(confirmed_balance, 'confirmed_balance')
+    methods.add(lambda params: "x" * params['args'][0], 'transaction_history')
+    return methods
+
+
+def syncer(sync_lock, stop):
+    """ Simulates the daemon's data updater. sync_lock is held for the
+        whole sync, or only for the update if it's a ReadWriteLock.
+    """
+    while not stop.is_set():
+        if isinstance(sync_lock, ReadWriteLock):
+            time.sleep(FETCH_TIME)
+            with sync_lock.writing():
+                time.sleep(APPLY_TIME)
+        else:
+            with sync_lock:
+                time.sleep(FETCH_TIME + APPLY_TIME)
+        time.sleep(0.1)
+
+
+def connect(socket_file):
+    for _ in range(50):
+        try:
+            sock = socket.socket(family=socket.AF_UNIX)
+            sock.connect(socket_file)
+            return sock
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.1)
+    raise RuntimeError("Server didn't start")
+
+
+def client(socket_file, num_requests, pipeline, latencies):
+    sock = connect(socket_file)
+    f = sock.makefile('rwb')
+    request = json.dumps(dict(jsonrpc="2.0", method="confirmed_balance",
+                              params=[dict(args=[], kwargs={})], id=1)).encode() + b"\n"
+    for _ in range(num_requests // pipeline):
+        start = time.perf_counter()
+        f.write(request * pipeline)
+        f.flush()
+        for _ in range(pipeline):
+            f.readline()
+        latencies.append(time.perf_counter() - start)
+    sock.close()
+
+
+def run(server, socket_file, sync_lock, clients, num_requests, pipeline):
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    stop = threading.Event()
+    sync_thread = threading.Thread(target=syncer, args=(sync_lock, stop), daemon=True)
+    sync_thread.start()
+
+    latencies = []
+    threads = [threading.Thread(target=client,
+                                args=(socket_file, num_requests, pipeline, latencies))
+               for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    server.shutdown()
+    server_thread.join()
+    server.server_close()
+    sync_thread.join()
+
+    latencies.sort()
+    print("  %7.0f requests/s, latency median %6.1fms, p99 %6.1fms, max %6.1fms" % (
+        clients * (num_requests // pipeline) * pipeline / elapsed,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000,
+        latencies[-1] * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--pipeline", type=int, default=10)
+    parser.add_argument("--reply-size", type=int, default=4000000)
+    args = parser.parse_args()
+
+    socket_file = os.path.join(tempfile.mkdtemp(), "bench.sock")
+    logger = logging.getLogger("bench_rpc_server")
+
+    print("threaded server, single client lock:")
+    # The sync held its own lock, not the one requests were serialized on
+    server = UnixSocketJSONRPCServer(socket_file, make_methods(None), threading.Lock(),
+                                     logger=logger)
+    run(server, socket_file, threading.Lock(), args.clients, args.requests, 1)
+    os.remove(socket_file)
+
+    print("asyncio server, readers-writer lock:")
+    wallet_lock = ReadWriteLock()
+    server = AsyncUnixSocketJSONRPCServer(socket_file, make_methods(wallet_lock),
+                                          logger=logger)
+    run(server, socket_file, wallet_lock, args.clients, args.requests, 1)
+
+    print("asyncio server, readers-writer lock, %d pipelined requests:" % args.pipeline)
+    server = AsyncUnixSocketJSONRPCServer(socket_file, make_methods(wallet_lock),
+                                          logger=logger)
+    run(server, socket_file, wallet_lock, args.clients, args.requests, args.pipeline)
+
+    print("large replies (%d bytes):" % args.reply_size)
+    server = AsyncUnixSocketJSONRPCServer(socket_file, make_methods(None),
+                                          logger=logger)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    connect(socket_file).close()
+    for framing in [FRAMING_NEWLINE, FRAMING_LENGTH_PREFIXED]:
+        proxy = UnixSocketServerProxy(socket_file, framing=framing)
+        start = time.perf_counter()
+        for _ in range(10):
+            proxy.transaction_history(args.reply_size)
+        print("  %15s: %6.1fms per reply" % (framing, (time.perf_counter() - start) * 100))
+        proxy.sock.close()
+    server.shutdown()
+    server_thread.join()
+    server.server_close()
@@ -0,0 +1,52 @@
+"""Benchmark for a wallet account sync.
+
+Discovers an HD account with many used addresses from the mock provider
+and reports how long the sync took, along with how many Transaction
+serializations and hashes were computed versus served from the memo.
+
+Usage:
+    python tests/wallet/bench_sync.py [--payout N] [--change N]
+"""
+import argparse
+import time
+
+from two1.bitcoin.crypto import HDKey, HDPrivateKey
+from two1.bitcoin.txn import serialization_stats
+from two1.blockchain.mock_provider import MockProvider
+from two1.wallet.account_types import account_types
+from two1.wallet.cache_manager import CacheManager
+from two1.wallet.hd_account import HDAccount
+
+
+master_key_mnemonic = 'cage minimum apology region aspect wrist demise gravity another bulb tail invest'
+master_key_passphrase = "test"
+
+account_type = account_types['BIP44BitcoinMainnet']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--payout", type=int, default=55)
+    parser.add_argument("--change", type=int, default=60)
+    args = parser.parse_args()
+
+    master_key = HDPrivateKey.master_key_from_mnemonic(mnemonic=master_key_mnemonic,
+                                                       passphrase=master_key_passphrase)
+    acct0_key = HDKey.from_path(master_key, account_type.account_derivation_prefix + "/0'")[-1]
+
+    m = MockProvider(account_type, master_key)
+    m.set_num_used_addresses(0, args.payout, 0)
+    m.set_num_used_addresses(0, args.change, 1)
+    m.set_num_used_accounts(1)
+    m.set_txn_side_effect_for_hd_discovery()
+
+    serialization_stats.clear()
+    start = time.perf_counter()
+    acct = HDAccount(acct0_key, "default", 0, m, CacheManager())
+    balance = acct.balance
+    elapsed = time.perf_counter() - start
+
+    print("synced %d payout and %d change addresses in %.2fs, balance %r" %
+          (args.payout, args.change, elapsed, balance))
+    for k in ('serialized', 'serialization_reused', 'hashed', 'hash_reused'):
+        print("%24s: %d" % (k, serialization_stats[k]))
@@ -0,0 +1,73 @@
+"""Benchmark for opening a saved wallet.
+
+Saves a passphrase-locked wallet with a number of accounts, each with
+used addresses, and reports how long it takes to open it without the
+passphrase (enough to read it), with the passphrase, and to then get
+the first private key, which decrypts the master key and derives the
+accounts' private keys.
+
+Usage:
+    python tests/wallet/bench_unlock.py [--accounts N] [--addresses N] [--runs N]
+"""
+import argparse
+import collections
+import os
+import tempfile
+import time
+
+from two1.bitcoin.crypto import HDPrivateKey
+from two1.blockchain.mock_provider import MockProvider
+from two1.wallet.two1_wallet import Two1Wallet
+
+
+master_key_mnemonic = 'cage minimum apology region aspect wrist demise gravity another bulb tail invest'
+master_key_passphrase = "test"
+
+
+def timed(f, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        rv = f()
+    return rv, (time.perf_counter() - start) / runs * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--addresses", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    master = HDPrivateKey.master_key_from_mnemonic(master_key_mnemonic, master_key_passphrase)
+    m = MockProvider("BIP44BitcoinMainnet", master)
+    m.set_num_used_accounts(args.accounts + 1)
+    for i in range(args.accounts):
+        m.set_num_used_addresses(account_index=i, n=args.addresses, change=0)
+        m.set_num_used_addresses(account_index=i, n=args.addresses, change=1)
+    m.set_txn_side_effect_for_hd_discovery()
+
+    wallet = Two1Wallet.import_from_mnemonic(data_provider=m,
+                                             mnemonic=master_key_mnemonic,
+                                             passphrase=master_key_passphrase,
+                                             account_type="BIP44BitcoinMainnet")
+    wallet_path = os.path.join(tempfile.mkdtemp(), "wallet.json")
+    wallet.to_file(wallet_path)
+    address = wallet.get_payout_address()
+    print("%d accounts, %d used addresses each" % (len(wallet.accounts), 2 * args.addresses))
+
+    # Opening syncs each account, which the provider answers at once
+    m.get_transactions.side_effect = None
+    m.get_transactions.return_value = collections.defaultdict(list)
+
+    _, elapsed = timed(lambda: Two1Wallet(wallet_path, m), args.runs)
+    print("open without passphrase:          %7.1fms" % elapsed)
+
+    _, elapsed = timed(lambda: Two1Wallet(wallet_path, m, master_key_passphrase), args.runs)
+    print("open with passphrase:             %7.1fms" % elapsed)
+
+    def open_and_sign():
+        w = Two1Wallet(wallet_path, m, master_key_passphrase)
+        w.get_private_key(address)
+
+    _, elapsed = timed(open_and_sign, args.runs)
+    print("open and get the first private key: %5.1fms" % elapsed)
@@ -0,0 +1,71 @@
+"""Benchmark for the UTXO selectors.
+
+Builds a synthetic, fragmented set of UTXOs and reports, for each
+selector, how long selection took, how many inputs were selected and
+what fee the resulting transaction pays.
+
+Usage:
+    python tests/wallet/bench_utxo_selectors.py [--utxos N] [--fee-rate SAT_PER_KB]
+"""
+import argparse
+import random
+import time
+
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import UnspentTransactionOutput
+from two1.wallet import fees
+from two1.wallet import utxo_selectors
+
+
+SELECTORS = [utxo_selectors.utxo_selector_smallest_first,
+             utxo_selectors.utxo_selector_largest_first,
+             utxo_selectors.utxo_selector_branch_and_bound,
+             utxo_selectors.utxo_selector_min_waste]
+
+
+def make_utxos(n, num_addrs):
+    h = Hash("a2972893f1be1f54d68a9228d9706ff8f202bb80f488f4dd46c0fe37c1e42415")
+    scr = Script.build_p2pkh(bytes(20))
+    utxos_by_addr = {}
+    for i in range(n):
+        # Mostly small payments, like a merchant wallet receives
+        value = int(random.lognormvariate(10, 1.5)) + 1000
+        addr = "addr%d" % (i % num_addrs)
+        utxos_by_addr.setdefault(addr, []).append(
+            UnspentTransactionOutput(transaction_hash=h,
+                                     outpoint_index=i,
+                                     value=value,
+                                     scr=scr,
+                                     confirmations=10))
+
+    return utxos_by_addr
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--utxos", type=int, default=10000)
+    parser.add_argument("--addresses", type=int, default=2000)
+    parser.add_argument("--fee-rate", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Don't go to the fee server
+    fees._fetch_fee_per_kb = lambda: args.fee_rate
+
+    utxos_by_addr = make_utxos(args.utxos, args.addresses)
+    total = sum(u.value for utxos in utxos_by_addr.values() for u in utxos)
+    print("%d UTXOs, %d satoshis, %d satoshis/kB" % (args.utxos, total, args.fee_rate))
+
+    for amount in [50000, 1000000, 10000000, total // 2]:
+        print("amount %d:" % amount)
+        for s in SELECTORS:
+            start = time.perf_counter()
+            selected, fee = s(utxos_by_addr, amount, 1)
+            elapsed = time.perf_counter() - start
+
+            num_inputs = sum(len(u) for u in selected.values())
+            change = sum(u.value for utxos in selected.values() for u in utxos) - amount - fee
+            print("%34s: %6.1fms %5d inputs, fee %7d, change %8d" % (
+                s.__name__, elapsed * 1000, num_inputs, fee, change))
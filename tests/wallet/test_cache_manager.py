@@ -1,9 +1,13 @@
 import inspect
+import itertools
 import os.path
 import time
 
+import pytest
+
 from two1.blockchain.twentyone_provider import TwentyOneProvider
 from two1.bitcoin.hash import Hash
+from two1.bitcoin.utils import address_to_key_hash
 from two1.wallet.cache_manager import CacheManager
 from two1.wallet.wallet_txn import WalletTransaction
 
@@ -52,6 +56,10 @@ def test_addresses():
     assert cm.get_chain_indices(0, 0) == [0, 1, 19]
     assert cm.get_chain_indices(0, 1) == list(range(10))
 
+    assert cm.get_address_path("17TNXJSWjBdMpHAkSfuyfVKSvb3rLuWZqQ") == (0, 0, 19)
+    assert cm.get_address_path("1BoatSLRHtKNngkdXEeobR76b53LETtpyT") is None
+    assert cm.get_hash160_path(address_to_key_hash("1FAqCWr2EkAz43JzPRsdqLKBQeLJo4Tc7M")[1]) == (0, 1, 7)
+
 
 def test_txns():
     txn = WalletTransaction.from_hex('01000000029ccb0665ec780f8b05bf2315a48dfb154dc41f91e8046a59f1c75656826dea5d000000006b483045022100f4d2161473f9d0ba4b5cdbc9e5b7b1d8fca32e3b6bede307352bef6aaa3a08cd022023d8444f78f69de6fd0f6cc391a7ca4de3dc4181220932d01511eb1129fee09e01210328bd51733a7d5bee05368680adef9aaa3f9bb716ec716d5896b1d80afb734d6cffffffff2424cb910235b2059d59023aecfebf6fce4eee31c637e9a0b350491849688727020000006a473044022072de3d707f98adfed3266e0261750cd7b5162732e525d7df17f4e55a55e953b902205046b597acf7acf41e725b459ba6cfe8c03a9d877375cdf483cab9620f92961101210291cbb1304614d86b15f4e8f39e9d8299cd0304ff8b81b5bcf6d9a6f32be649bbffffffff0240420f00000000001976a91434fe777d676fceb3509584c1d7b9f13ee56514d488ace05a0000000000001976a9145237ba33122495420711b3f2cc0463dbb24c9d3988ac00000000')  # nopep8
@@ -62,7 +70,7 @@ def test_txns():
 
     cm.insert_txn(txn)
 
-    txid = "3779f27a81cdbc435ac258ce5076c211e7a953027aab42573b1b7ce9e50abe8e"
+    txid = bytes(Hash("3779f27a81cdbc435ac258ce5076c211e7a953027aab42573b1b7ce9e50abe8e"))
     assert txid in cm._txn_cache
 
     in_addrs = ["1DpCouKa2evX3f2aELUy7iNdsrYuLLaqWy",
@@ -90,11 +98,11 @@ def test_txns():
     assert cm._outputs_cache[txid][0]['status'] == CacheManager.UNSPENT
     assert cm._outputs_cache[txid][1]['status'] == CacheManager.UNSPENT
 
-    out_txid1 = "5dea6d825656c7f1596a04e8911fc44d15fb8da41523bf058b0f78ec6506cb9c"
+    out_txid1 = bytes(Hash("5dea6d825656c7f1596a04e8911fc44d15fb8da41523bf058b0f78ec6506cb9c"))
     assert out_txid1 in cm._outputs_cache
     assert cm._outputs_cache[out_txid1][0]['status'] == CacheManager.SPENT
 
-    out_txid2 = "27876849184950b3a0e937c631ee4ece6fbffeec3a02599d05b2350291cb2424"
+    out_txid2 = bytes(Hash("27876849184950b3a0e937c631ee4ece6fbffeec3a02599d05b2350291cb2424"))
     assert out_txid2 in cm._outputs_cache
     assert len(cm._outputs_cache[out_txid2].keys()) == 1
     assert cm._outputs_cache[out_txid2][2]['status'] == CacheManager.SPENT
@@ -104,6 +112,8 @@ def test_txns():
     assert not cm.has_txns(1)
 
     assert cm.have_transaction(txid)
+    assert cm.have_transaction(Hash(txid))
+    assert cm.get_transaction(str(Hash(txid))) == txn
     assert not cm.have_transaction(out_txid1)
     assert not cm.have_transaction(out_txid2)
     assert cm.get_transaction(txid) == txn
@@ -122,7 +132,7 @@ def test_txns():
     txn = WalletTransaction.from_hex(txn_hex)
     cm.insert_txn(txn)
 
-    txid = "d24f3b9f0aa7b6484bcea563f4c254bd24e8163906cbffc727c2b2dad43af61e"
+    txid = bytes(Hash("d24f3b9f0aa7b6484bcea563f4c254bd24e8163906cbffc727c2b2dad43af61e"))
     assert txid in cm._txn_cache
 
     in_addrs = ["1Ezv6YmYsZvALUaRcZRf8hBdxYni6cm78X",
@@ -148,11 +158,11 @@ def test_txns():
     assert cm._outputs_cache[txid][0]['status'] == CacheManager.UNSPENT | CacheManager.UNCONFIRMED
     assert cm._outputs_cache[txid][1]['status'] == CacheManager.UNSPENT | CacheManager.UNCONFIRMED
 
-    out_txid1 = "5fcfa7cf78b53f78cc58a339da3ca4e7fe188cee2e24448e7558215a00cc9a8a"
+    out_txid1 = bytes(Hash("5fcfa7cf78b53f78cc58a339da3ca4e7fe188cee2e24448e7558215a00cc9a8a"))
     assert out_txid1 in cm._outputs_cache
     assert cm._outputs_cache[out_txid1][0]['status'] == CacheManager.SPENT | CacheManager.UNCONFIRMED
 
-    out_txid2 = "305839bd673fbe08a0ee47014a6b9dcb3579bd74ffbc343d608f7758f17e8515"
+    out_txid2 = bytes(Hash("305839bd673fbe08a0ee47014a6b9dcb3579bd74ffbc343d608f7758f17e8515"))
     assert out_txid2 in cm._outputs_cache
     assert len(cm._outputs_cache[out_txid2].keys()) == 1
     assert cm._outputs_cache[out_txid2][2]['status'] == CacheManager.SPENT | CacheManager.UNCONFIRMED
@@ -221,7 +231,7 @@ def test_txns():
     # First test with a very short expiration
     cm.insert_txn(txn, mark_provisional=True, expiration=1)
 
-    txid = "6fd3c96d466cd465b40e59be14d023c27f1d0ca13075119d3d6baeebfc587b8c"
+    txid = bytes(Hash("6fd3c96d466cd465b40e59be14d023c27f1d0ca13075119d3d6baeebfc587b8c"))
     assert txid in cm._txn_cache
     assert cm._txn_cache[txid].provisional
     time.sleep(1.5)
@@ -256,11 +266,11 @@ def test_txns():
     assert cm._outputs_cache[txid][0]['status'] == CacheManager.UNSPENT | CacheManager.PROVISIONAL | CacheManager.UNCONFIRMED  # nopep8
     assert cm._outputs_cache[txid][1]['status'] == CacheManager.UNSPENT | CacheManager.PROVISIONAL | CacheManager.UNCONFIRMED  # nopep8
 
-    out_txid1 = "d24f3b9f0aa7b6484bcea563f4c254bd24e8163906cbffc727c2b2dad43af61e"
+    out_txid1 = bytes(Hash("d24f3b9f0aa7b6484bcea563f4c254bd24e8163906cbffc727c2b2dad43af61e"))
     assert out_txid1 in cm._outputs_cache
     assert cm._outputs_cache[out_txid1][0]['status'] == CacheManager.SPENT | CacheManager.PROVISIONAL | CacheManager.UNCONFIRMED  # nopep8
 
-    out_txid2 = "3779f27a81cdbc435ac258ce5076c211e7a953027aab42573b1b7ce9e50abe8e"
+    out_txid2 = bytes(Hash("3779f27a81cdbc435ac258ce5076c211e7a953027aab42573b1b7ce9e50abe8e"))
     assert out_txid2 in cm._outputs_cache
     assert len(cm._outputs_cache[out_txid2].keys()) == 2
     assert cm._outputs_cache[out_txid2][0]['status'] == CacheManager.SPENT | CacheManager.PROVISIONAL | CacheManager.UNCONFIRMED  # nopep8
@@ -389,3 +399,56 @@ def test_whole(cache, exp_conf_balance, exp_unconf_balance):
 
     assert conf_balance == exp_conf_balance
     assert unconf_balance == exp_unconf_balance
+
+    # The account totals and UTXOs agree with the per-address balances
+    acct_balance = cm.get_account_balance(0x80000000)
+    assert acct_balance == {'confirmed': conf_balance, 'total': unconf_balance}
+
+    utxos = cm.get_utxos(addrs, True)
+    assert sum(u.value for ul in utxos.values() for u in ul) == unconf_balance
+    assert cm.get_address_balances(addrs) == {
+        a: {'confirmed': conf_balances[a], 'total': unconf_balances[a]}
+        for a in addrs}
+
+
+def test_txids_by_time(cache, exp_conf_balance, exp_unconf_balance):
+    cm = CacheManager()
+    cm.load_from_dict(cache, prune_provisional=False)
+
+    txids = list(cm.get_txids_by_time())
+    times = [cm.get_transaction(txid).network_time for txid in txids]
+    assert set(txids) == set(cm._txn_cache)
+    assert times == sorted(times)
+    assert list(cm.get_txids_by_time(reverse=True)) == txids[::-1]
+
+    since = times[len(times) // 2]
+    assert list(cm.get_txids_by_time(since=since)) == \
+        [txid for txid, t in zip(txids, times) if t >= since]
+
+    # Paging with a cursor walks the same transactions
+    for reverse in [False, True]:
+        pages = []
+        cursor = None
+        while True:
+            page = list(itertools.islice(
+                cm.get_txids_by_time(cursor=cursor, reverse=reverse), 5))
+            if not page:
+                break
+            pages += page
+            cursor = page[-1]
+        assert pages == (txids[::-1] if reverse else txids)
+
+    # Re-inserting a transaction with a new time moves it
+    txid = next(t for t in txids
+                if all(cm.have_transaction(bytes(inp.outpoint))
+                       for inp in cm.get_transaction(t).inputs))
+    txn = WalletTransaction.from_hex(cm.get_transaction(txid).to_hex())
+    txn.network_time = times[-1] + 1
+    cm.insert_txn(txn)
+    others = [t for t in txids if t != txid]
+    assert list(cm.get_txids_by_time()) == others + [txid]
+
+    cm._delete_txn(txid)
+    assert list(cm.get_txids_by_time()) == others
+    with pytest.raises(ValueError):
+        cm.get_txids_by_time(cursor=txid)
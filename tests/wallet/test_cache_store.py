@@ -0,0 +1,145 @@
+import json
+import os
+import time
+
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.script import Script
+from two1.bitcoin.utils import key_hash_to_address
+from two1.wallet.cache_manager import CacheManager
+from two1.wallet.cache_store import Sqlite3CacheStore
+from two1.wallet.cache_store import migrate_json_cache
+from two1.wallet.wallet_txn import WalletTransaction
+
+
+txn_hex = "01000000029ccb0665ec780f8b05bf2315a48dfb154dc41f91e8046a59f1c75656826dea5d000000006b483045022100f4d2161473f9d0ba4b5cdbc9e5b7b1d8fca32e3b6bede307352bef6aaa3a08cd022023d8444f78f69de6fd0f6cc391a7ca4de3dc4181220932d01511eb1129fee09e01210328bd51733a7d5bee05368680adef9aaa3f9bb716ec716d5896b1d80afb734d6cffffffff2424cb910235b2059d59023aecfebf6fce4eee31c637e9a0b350491849688727020000006a473044022072de3d707f98adfed3266e0261750cd7b5162732e525d7df17f4e55a55e953b902205046b597acf7acf41e725b459ba6cfe8c03a9d877375cdf483cab9620f92961101210291cbb1304614d86b15f4e8f39e9d8299cd0304ff8b81b5bcf6d9a6f32be649bbffffffff0240420f00000000001976a91434fe777d676fceb3509584c1d7b9f13ee56514d488ace05a0000000000001976a9145237ba33122495420711b3f2cc0463dbb24c9d3988ac00000000"  # nopep8
+
+
+def get_balances(cm):
+    addrs = cm.get_addresses_for_chain(0x80000000, 0) + \
+        cm.get_addresses_for_chain(0x80000000, 1)
+
+    return cm.get_balances(addrs), cm.get_balances(addrs, True)
+
+
+def test_save_and_load(tmpdir):
+    store = Sqlite3CacheStore(str(tmpdir.join("cache.db")))
+    cm = CacheManager()
+    cm.insert_address(0, 0, 0, "15qCydrcqURADXJHrtMW9m6SpPTa3kqkQb")
+    cm.last_block = 374500
+
+    txn = WalletTransaction.from_hex(txn_hex)
+    txn.block = 374440
+    txn.block_hash = Hash('0000000000000000038ee0066680705455d500f287f6c56db7a979c2426a4c02')
+    txn.confirmations = 7533
+    cm.insert_txn(txn)
+    cm.save(store)
+
+    # Nothing changed, so nothing is written
+    written = []
+    store.save = lambda *args, **kwargs: written.append(kwargs)
+    cm.save(store)
+    assert written == []
+
+    # Only the updated transaction is written
+    txn = WalletTransaction.from_hex(txn_hex)
+    txn.block = 374440
+    txn.block_hash = Hash('0000000000000000038ee0066680705455d500f287f6c56db7a979c2426a4c02')
+    txn.confirmations = 7534
+    cm.insert_txn(txn)
+    cm.save(store)
+    assert len(written) == 1
+    assert written[0]['addresses'] == []
+    assert written[0]['txns'] == [(txn, txn.get_addresses())]
+    assert written[0]['deleted_txids'] == []
+
+    del store.save
+    cm.save(store, force=True)
+
+    cm2 = CacheManager()
+    cm2.load_from_store(store)
+    assert cm2.last_block == 374500
+    assert cm2.get_address(0, 0, 0) == "15qCydrcqURADXJHrtMW9m6SpPTa3kqkQb"
+    assert cm2.get_transaction(txn.hash) == txn
+    assert cm2.get_transaction(txn.hash).confirmations == 7534
+    assert not cm2._dirty
+
+    # The database and its WAL files are only readable by the owner
+    for suffix in ["", "-wal", "-shm"]:
+        assert os.stat(str(tmpdir.join("cache.db" + suffix))).st_mode & 0o777 == 0o600
+
+    store.close()
+
+
+def test_prune_provisional(tmpdir):
+    db_file = str(tmpdir.join("cache.db"))
+    store = Sqlite3CacheStore(db_file)
+    cm = CacheManager()
+    cm.insert_address(0, 0, 0, "15qCydrcqURADXJHrtMW9m6SpPTa3kqkQb")
+    txn = WalletTransaction.from_hex(txn_hex)
+    cm.insert_txn(txn, mark_provisional=True, expiration=time.time() + 1)
+    cm.save(store)
+
+    time.sleep(1.5)
+
+    # Expired provisional transactions are removed from the store as well
+    cm = CacheManager()
+    cm.load_from_store(store)
+    assert not cm.has_txns()
+    assert cm._dirty
+    cm.save(store)
+    store.close()
+
+    cm = CacheManager()
+    cm.load_from_store(Sqlite3CacheStore(db_file), prune_provisional=False)
+    assert cm.get_address(0, 0, 0) == "15qCydrcqURADXJHrtMW9m6SpPTa3kqkQb"
+    assert not cm.has_txns()
+
+
+def test_migrate(tmpdir, cache, exp_conf_balance, exp_unconf_balance):
+    json_file = str(tmpdir.join("wallet_cache.json"))
+    with open(json_file, "w") as f:
+        json.dump(cache, f)
+
+    db_file = str(tmpdir.join("wallet_cache.db"))
+    assert migrate_json_cache(json_file, Sqlite3CacheStore(db_file))
+    assert os.path.exists(db_file)
+
+    cm = CacheManager()
+    cm.load_from_store(Sqlite3CacheStore(db_file), prune_provisional=False)
+
+    conf_balances, unconf_balances = get_balances(cm)
+    assert sum(conf_balances.values()) == exp_conf_balance
+    assert sum(unconf_balances.values()) == exp_unconf_balance
+
+    assert cm._address_cache == {int(k1): {int(k2): {int(k3): v3
+                                                     for k3, v3 in v2.items()}
+                                           for k2, v2 in v1.items()}
+                                 for k1, v1 in cache['addresses'].items()}
+
+    cache['version'] = "0.2.0"
+    with open(json_file, "w") as f:
+        json.dump(cache, f)
+    assert not migrate_json_cache(json_file, Sqlite3CacheStore(db_file))
+
+
+def test_migrate_testnet(tmpdir):
+    txn = WalletTransaction.from_hex(txn_hex)
+    txn.block = 374440
+    txn.block_hash = Hash('0000000000000000038ee0066680705455d500f287f6c56db7a979c2426a4c02')
+    txn.confirmations = 7533
+    hash160 = txn.outputs[0].script.get_hash160()
+    address = key_hash_to_address(hash160, Script.P2PKH_TESTNET_VERSION)
+
+    cm = CacheManager(testnet=True)
+    cm.insert_address(0x80000000, 0, 0, address)
+    cm.insert_txn(txn)
+    json_file = str(tmpdir.join("wallet_cache.json"))
+    cm.to_file(json_file)
+
+    db_file = str(tmpdir.join("wallet_cache.db"))
+    assert migrate_json_cache(json_file, Sqlite3CacheStore(db_file), testnet=True)
+
+    cm2 = CacheManager(testnet=True)
+    cm2.load_from_store(Sqlite3CacheStore(db_file))
+    assert cm2.get_txns_for_address(address) == cm.get_txns_for_address(address)
+    assert cm2.get_balances([address]) == {address: 1000000}
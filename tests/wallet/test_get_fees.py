@@ -1,3 +1,5 @@
+import threading
+import time
 from unittest.mock import MagicMock
 
 from two1.wallet import fees
@@ -17,6 +19,56 @@ def test_get_fees():
         return_value=type('obj', (object,), {'status_code': 400,
                                              "json": lambda: "Not Json",
                                              'text': "Error"}))
+    fees.fee_oracle.invalidate()
     f = fees.get_fees()
 
     assert f['per_kb'] == fees.DEFAULT_FEE_PER_KB
+
+
+def test_fee_oracle(monkeypatch):
+    fetched = threading.Event()
+    fetch = MagicMock(return_value=20000)
+    monkeypatch.setattr(fees, '_fetch_fee_per_kb', lambda: fetched.wait(5) and fetch())
+
+    # Getting the rate doesn't wait for the fetch it starts
+    oracle = fees.FeeOracle(ttl=60)
+    assert oracle.get_fee_per_kb() == fees.DEFAULT_FEE_PER_KB
+    oracle.estimator = lambda: 15000
+    assert oracle.get_fee_per_kb() == 15000
+    fetched.set()
+    oracle._refresh_thread.join()
+    assert oracle.get_fee_per_kb() == 20000
+    assert oracle.get_fee_per_kb() == 20000
+    assert fetch.call_count == 1
+
+    # A failed refresh keeps the last rate until it expires, then the
+    # estimator is used.
+    fetch.return_value = None
+    oracle._attempted -= 60
+    assert oracle.get_fee_per_kb() == 20000
+    oracle._refresh_thread.join()
+    assert fetch.call_count == 2
+
+    oracle._updated -= 120
+    assert oracle.get_fee_per_kb() == 15000
+    oracle.estimator = lambda: None
+    assert oracle.get_fee_per_kb() == 20000
+
+    oracle.invalidate()
+    assert oracle.get_fee_per_kb() == fees.DEFAULT_FEE_PER_KB
+    oracle._refresh_thread.join()
+
+    # With a refresher running, getting the rate never fetches, and
+    # the rate doesn't fall back while the next refresh is in flight.
+    fetch.return_value = 30000
+    oracle.estimator = lambda: 15000
+    oracle.start_refresher()
+    while oracle._updated is None:
+        time.sleep(0.01)
+    calls = fetch.call_count
+    oracle._updated -= 60
+    assert oracle.get_fee_per_kb() == 30000
+    assert fetch.call_count == calls
+    oracle._updated -= 60
+    assert oracle.get_fee_per_kb() == 15000
+    oracle.stop_refresher()
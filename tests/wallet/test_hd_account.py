@@ -1,6 +1,11 @@
 import pytest
+from unittest.mock import MagicMock
 
 from two1.bitcoin.crypto import HDKey, HDPrivateKey
+from two1.bitcoin.script import Script
+from two1.bitcoin.txn import Transaction
+from two1.bitcoin.txn import TransactionOutput
+from two1.bitcoin.utils import address_to_key_hash
 from two1.blockchain.mock_provider import MockProvider
 from two1.wallet.account_types import account_types
 from two1.wallet.cache_manager import CacheManager
@@ -79,3 +84,47 @@ def test_all(num_used_payout_addresses, num_used_change_addresses, expected_bala
 
     assert acct.get_next_address(True) == mk0['change_addresses'][change_index]
     assert acct.get_next_address(False) == mk0['payout_addresses'][payout_index]
+
+    # Addresses up to GAP_LIMIT past the last used index are found
+    # through the derivation index.
+    gap_index = acct.last_indices[0] + HDAccount.GAP_LIMIT
+    gap_addr = mk0['payout_addresses'][gap_index]
+    found = acct.find_addresses([gap_addr, mk0['change_addresses'][0], "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"])
+    assert found == {gap_addr: (0, 0, gap_index),
+                     mk0['change_addresses'][0]: (0, 1, 0)}
+
+    pub_key = acct.get_public_key(False, gap_index)
+    assert cm.get_hash160_path(pub_key.hash160()) == (0, 0, gap_index)
+    assert cm.get_address_path(gap_addr) == (0, 0, gap_index)
+
+
+def test_pending_sync_next_address():
+    m = mock_provider
+    m.reset_mocks()
+    m.set_num_used_addresses(0, 1, 0)
+    m.set_num_used_addresses(0, 0, 1)
+    m.set_num_used_accounts(1)
+    m.set_txn_side_effect_for_hd_discovery()
+
+    acct = HDAccount(acct0_key, "default", 0, m, CacheManager())
+    mk0 = m._acct_keys[0]
+    assert acct.last_indices[0] == 0
+
+    # The first address has been paid, so the next one is handed out
+    next_addr = acct.get_next_address(False)
+    assert next_addr == mk0['payout_addresses'][1]
+
+    # An unconfirmed payment to it is seen without a new block
+    out = TransactionOutput(20000, Script.build_p2pkh(address_to_key_hash(next_addr)[1]))
+    txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION, [], [out], 0)
+    metadata = dict(block=None, block_hash=None, confirmations=0)
+    m.get_transactions = MagicMock(
+        side_effect=lambda addresses, **kwargs: {a: [dict(metadata=metadata, transaction=txn)]
+                                                 if a == next_addr else [] for a in addresses})
+
+    acct._apply_txns(acct._fetch_txns(pending_only=True))
+    assert m.get_transactions.call_count == 1
+    assert next_addr in m.get_transactions.call_args[0][0]
+    assert acct._cache_manager.address_has_txns(next_addr)
+    assert acct.last_indices[0] == 1
+    assert acct.get_next_address(False) == mk0['payout_addresses'][2]
@@ -0,0 +1,262 @@
+import json
+import logging
+import socket
+import threading
+import time
+
+import pytest
+from jsonrpcclient.exceptions import ReceivedErrorResponse
+from jsonrpcserver import Methods
+
+from two1.wallet.rwlock import ReadWriteLock
+from two1.wallet.socket_rpc_server import AsyncUnixSocketJSONRPCServer
+from two1.wallet.socket_rpc_server import FRAMING_LENGTH_PREFIXED
+from two1.wallet.socket_rpc_server import FRAMING_NEWLINE
+from two1.wallet.socket_rpc_server import UnixSocketJSONRPCServer
+from two1.wallet.socket_rpc_server import UnixSocketServerProxy
+from two1.wallet.socket_rpc_server import interrupted
+from two1.wallet.sync_scheduler import NotificationFeed
+
+
+def test_read_write_lock():
+    lock = ReadWriteLock()
+
+    # Readers share the lock
+    assert lock.acquire_read(0)
+    assert lock.acquire_read(0)
+    assert not lock.acquire_write(0.1)
+    lock.release_read()
+    lock.release_read()
+
+    # Writers don't
+    assert lock.acquire_write(0)
+    assert not lock.acquire_write(0.1)
+    assert not lock.acquire_read(0.1)
+    lock.release_write()
+
+    # A waiting writer keeps new readers out
+    assert lock.acquire_read(0)
+    acquired = []
+    t = threading.Thread(target=lambda: acquired.append(lock.acquire_write(5)))
+    t.start()
+    time.sleep(0.1)
+    assert not lock.acquire_read(0.1)
+    lock.release_read()
+    t.join()
+    assert acquired == [True]
+    lock.release_write()
+
+    # ... and a writer that gave up doesn't
+    assert lock.acquire_read(0)
+    assert not lock.acquire_write(0.1)
+    assert lock.acquire_read(0)
+    lock.release_read()
+    lock.release_read()
+
+    with lock.reading():
+        assert lock.acquire_read(0)
+        lock.release_read()
+    with lock.writing():
+        assert not lock.acquire_read(0)
+
+
+def test_async_server(tmpdir):
+    methods = Methods()
+    calls = []
+
+    def slow(params):
+        time.sleep(0.5)
+        return params
+
+    methods.add(lambda params: params, 'echo')
+    methods.add(slow, 'slow')
+    methods.add(lambda params: calls.append(params), 'record')
+
+    socket_file = str(tmpdir.join("test.sock"))
+    server = AsyncUnixSocketJSONRPCServer(socket_file, methods)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+
+    def request(method, params, request_id=None):
+        r = dict(jsonrpc="2.0", method=method, params=[params])
+        if request_id is not None:
+            r['id'] = request_id
+        return r
+
+    try:
+        for _ in range(50):
+            try:
+                sock = socket.socket(family=socket.AF_UNIX)
+                sock.connect(socket_file)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                time.sleep(0.1)
+        f = sock.makefile('rwb')
+
+        # Pipelined requests run concurrently but are answered in order
+        start = time.time()
+        lines = [request("slow", 1, 1), request("slow", 2, 2), request("echo", 3, 3)]
+        f.write(b"".join(json.dumps(r).encode() + b"\n" for r in lines))
+        f.flush()
+        responses = [json.loads(f.readline().decode()) for _ in lines]
+        assert [r['id'] for r in responses] == [1, 2, 3]
+        assert [r['result'] for r in responses] == [1, 2, 3]
+        assert time.time() - start < 0.9
+
+        # Notifications get no response, in a batch or on their own
+        batch = [request("echo", "a", 4), request("record", "b"), request("echo", "c", 5)]
+        f.write(json.dumps(batch).encode() + b"\n")
+        f.write(json.dumps(request("record", "d")).encode() + b"\n")
+        f.write(b"not json\n")
+        f.flush()
+        responses = json.loads(f.readline().decode())
+        assert [(r['id'], r['result']) for r in responses] == [(4, "a"), (5, "c")]
+        error = json.loads(f.readline().decode())
+        assert error['error']['code'] == -32700
+        assert sorted(calls) == ["b", "d"]
+
+        # Requests in progress are answered when the server shuts down
+        f.write(json.dumps(request("slow", 6, 6)).encode() + b"\n")
+        f.flush()
+        time.sleep(0.1)
+        server.shutdown()
+        assert json.loads(f.readline().decode())['result'] == 6
+        assert f.readline() == b""
+        sock.close()
+    finally:
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
+
+
+def test_async_methods(tmpdir):
+    methods = Methods()
+    methods.add(lambda params: params['args'][0], 'echo')
+    feed = NotificationFeed()
+
+    async def wait(params):
+        since, timeout = params['args']
+        return await feed.get_async(since, timeout, interrupted.get())
+
+    async def fail(params):
+        raise ValueError("failed")
+
+    socket_file = str(tmpdir.join("test.sock"))
+    server = AsyncUnixSocketJSONRPCServer(socket_file, methods, max_workers=1,
+                                          async_methods=dict(wait=wait, fail=fail))
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+
+    try:
+        for _ in range(50):
+            try:
+                proxy = UnixSocketServerProxy(socket_file)
+                break
+            except Exception:
+                time.sleep(0.1)
+
+        # Waiting clients don't tie up the thread pool
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(proxy.wait(0, 5)))
+                   for _ in range(20)]
+        for t in threads:
+            t.start()
+        time.sleep(0.2)
+        start = time.time()
+        assert proxy.echo("a") == "a"
+        assert time.time() - start < 0.5
+        assert not results
+
+        feed.publish([dict(type='txn', txid="a")])
+        for t in threads:
+            t.join(2)
+        assert len(results) == 20
+        assert all(r['last_seq'] == 1 for r in results)
+
+        with pytest.raises(ReceivedErrorResponse) as e:
+            proxy.fail()
+        assert e.value.data == "failed"
+
+        # On a newline connection, waits end early when they hold up
+        # later requests
+        proxy = UnixSocketServerProxy(socket_file, framing=FRAMING_NEWLINE)
+        f = proxy.sock.makefile('rwb')
+        start = time.time()
+        lines = [dict(jsonrpc="2.0", method="wait", params=[dict(args=[1, 5], kwargs={})], id=1),
+                 dict(jsonrpc="2.0", method="echo", params=[dict(args=["b"], kwargs={})], id=2)]
+        f.write(b"".join(json.dumps(r).encode() + b"\n" for r in lines))
+        f.flush()
+        responses = [json.loads(f.readline().decode()) for _ in lines]
+        assert time.time() - start < 1
+        assert responses[0]['result'] == dict(notifications=[], last_seq=1)
+        assert responses[1]['result'] == "b"
+    finally:
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
+
+
+def test_server_proxy(tmpdir):
+    methods = Methods()
+
+    def slow(params):
+        time.sleep(0.5)
+        return params['args'][0]
+
+    methods.add(lambda params: params['args'][0], 'echo')
+    methods.add(slow, 'slow')
+
+    socket_file = str(tmpdir.join("test.sock"))
+    server = AsyncUnixSocketJSONRPCServer(socket_file, methods)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+
+    try:
+        for _ in range(50):
+            try:
+                proxy = UnixSocketServerProxy(socket_file)
+                break
+            except Exception:
+                time.sleep(0.1)
+        assert proxy.framing == FRAMING_LENGTH_PREFIXED
+
+        big = "x" * 1000000
+        assert proxy.echo(big) == big
+
+        # Threads sharing the proxy each get their own reply
+        results = {}
+
+        def call(i):
+            results[i] = proxy.slow(i) if i % 2 else proxy.echo(i)
+
+        start = time.time()
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == {i: i for i in range(8)}
+        assert time.time() - start < 1.5
+
+        proxy = UnixSocketServerProxy(socket_file, framing=FRAMING_NEWLINE)
+        assert proxy.framing == FRAMING_NEWLINE
+        assert proxy.echo(big) == big
+    finally:
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
+
+    # Servers that don't know about framing keep using newlines
+    server = UnixSocketJSONRPCServer(socket_file, methods, threading.Lock(),
+                                     logger=logging.getLogger(__name__))
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    try:
+        proxy = UnixSocketServerProxy(socket_file)
+        assert proxy.framing == FRAMING_NEWLINE
+        assert proxy.echo("a") == "a"
+        proxy.sock.close()
+    finally:
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
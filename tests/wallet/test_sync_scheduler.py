@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+from two1.wallet.sync_scheduler import NotificationFeed
+from two1.wallet.sync_scheduler import SyncScheduler
+
+
+def test_sync_scheduler():
+    syncs = []
+    started = threading.Event()
+
+    def sync():
+        syncs.append(time.time())
+        started.set()
+        time.sleep(0.3)
+
+    scheduler = SyncScheduler(sync, lambda: 60)
+    t = threading.Thread(target=scheduler.run)
+    t.start()
+
+    try:
+        # The first sync runs right away
+        assert started.wait(1)
+        assert scheduler.syncing
+
+        # Requests made during a sync are served by a single sync after it
+        for _ in range(5):
+            scheduler.request_sync()
+        assert scheduler.request_sync(wait=True, timeout=2)
+        assert len(syncs) == 2
+        assert not scheduler.syncing
+
+        # Waiting for a sync times out if it doesn't finish in time. A
+        # request made while it is still running waits for the next one.
+        assert not scheduler.request_sync(wait=True, timeout=0.1)
+        assert scheduler.request_sync(wait=True, timeout=2)
+        assert len(syncs) == 4
+
+        # Nothing else runs before the interval is up
+        time.sleep(0.5)
+        assert len(syncs) == 4
+    finally:
+        scheduler.stop()
+        t.join()
+
+    # Waiters don't hang once the scheduler is stopped
+    assert scheduler.request_sync(wait=True, timeout=1)
+
+    # A shortened interval takes effect after reschedule()
+    syncs = []
+    interval = [60]
+    scheduler = SyncScheduler(lambda: syncs.append(time.time()), lambda: interval[0])
+    t = threading.Thread(target=scheduler.run)
+    t.start()
+
+    try:
+        time.sleep(0.2)
+        assert len(syncs) == 1
+        interval[0] = 0.1
+        scheduler.reschedule()
+        time.sleep(0.5)
+        assert len(syncs) >= 3
+    finally:
+        scheduler.stop()
+        t.join()
+
+
+def test_notification_feed():
+    feed = NotificationFeed(max_len=3)
+    assert feed.get() == dict(notifications=[], last_seq=0)
+
+    feed.publish([])
+    feed.publish([dict(type='txn', txid="a"), dict(type='txn', txid="b")])
+    r = feed.get()
+    assert [(n['seq'], n['txid']) for n in r['notifications']] == [(1, "a"), (2, "b")]
+    assert r['last_seq'] == 2
+    assert feed.get(since=1)['notifications'] == [dict(type='txn', txid="b", seq=2)]
+
+    # Only the most recent notifications are kept
+    feed.publish([dict(type='txn', txid=c) for c in "cd"])
+    assert [n['seq'] for n in feed.get()['notifications']] == [2, 3, 4]
+
+    # Clients ahead of the feed are told where it is
+    assert feed.get(since=10) == dict(notifications=[], last_seq=4)
+
+    # Long polls return as soon as something is published
+    start = time.time()
+    assert feed.get(since=4, timeout=0.1)['notifications'] == []
+    assert time.time() - start >= 0.1
+
+    threading.Timer(0.1, feed.publish, args=([dict(type='txn', txid="e")],)).start()
+    start = time.time()
+    r = feed.get(since=4, timeout=5)
+    assert time.time() - start < 1
+    assert r == dict(notifications=[dict(type='txn', txid="e", seq=5)], last_seq=5)
+
+
+def test_async_waits():
+    loop = asyncio.new_event_loop()
+    try:
+        # Long polls are woken up by publish() from another thread
+        feed = NotificationFeed()
+        threading.Timer(0.1, feed.publish, args=([dict(type='txn', txid="a")],)).start()
+        start = time.time()
+        r = loop.run_until_complete(feed.get_async(since=0, timeout=5))
+        assert time.time() - start < 1
+        assert r == dict(notifications=[dict(type='txn', txid="a", seq=1)], last_seq=1)
+        assert not feed._waiters
+
+        # ... or time out, or are interrupted
+        assert loop.run_until_complete(feed.get_async(since=1, timeout=0.1))['notifications'] == []
+
+        async def interrupted():
+            interrupt = asyncio.Event()
+            asyncio.get_event_loop().call_later(0.1, interrupt.set)
+            return await feed.get_async(since=1, timeout=5, interrupt=interrupt)
+
+        start = time.time()
+        assert loop.run_until_complete(interrupted())['notifications'] == []
+        assert time.time() - start < 1
+
+        # Waiting for a sync
+        syncs = []
+        scheduler = SyncScheduler(lambda: syncs.append(time.time()), lambda: 60)
+        t = threading.Thread(target=scheduler.run)
+        t.start()
+        try:
+            time.sleep(0.1)
+            assert loop.run_until_complete(scheduler.request_sync_async(timeout=2))
+            assert len(syncs) == 2
+            assert not scheduler._waiters
+        finally:
+            scheduler.stop()
+            t.join()
+    finally:
+        loop.close()
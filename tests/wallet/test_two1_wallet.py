@@ -4,12 +4,14 @@ from pbkdf2 import PBKDF2
 import random
 import string
 import tempfile
+from unittest.mock import patch
 
-from two1.bitcoin.crypto import HDKey, HDPrivateKey
+from two1.bitcoin.crypto import HDKey, HDPrivateKey, HDPublicKey
 from two1.bitcoin.utils import bytes_to_str
 from two1.bitcoin.utils import rand_bytes
 from two1.blockchain.mock_provider import MockProvider
 from two1.wallet import exceptions
+from two1.wallet import fees
 from two1.wallet.two1_wallet import Two1Wallet
 
 enc_key_salt = b'\xaa\xbb\xcc\xdd'
@@ -191,9 +193,28 @@ def test_rest():
     # Check that there's an account name
     assert wallet.get_account_name(0) == "default"
 
+    # The wallet's own fee rates are used while the recommended rate
+    # is being fetched
+    assert fees.fee_oracle.estimator == wallet.estimate_fee_per_kb
+
     # Check the balance
     assert wallet.balances == {'confirmed': 10000, 'total': 20000}
 
+    # The history can be read a page at a time
+    history = wallet.transaction_history()
+    assert len(history) > 1
+    assert wallet.transaction_history(reverse=True) == history[::-1]
+    pages = []
+    cursor = None
+    with patch.object(wallet._cache_manager, 'get_addresses_for_chain', side_effect=AssertionError):
+        while True:
+            page = wallet.transaction_history(limit=1, cursor=cursor)
+            if not page:
+                break
+            pages += page
+            cursor = page[-1]['txid']
+    assert pages == history
+
     # Check that we can get a new payout address
     ext_addr = wallet.get_payout_address("default")
     assert ext_addr == ext_addrs[1]
@@ -306,3 +327,43 @@ def test_rest():
         acct = w2.accounts[0]
         assert acct.last_indices[0] == 0
         assert acct.last_indices[1] == 1
+
+        # Private keys are only decrypted once one is needed, with the
+        # key derived from the passphrase when the wallet was opened
+        assert w2._master_key is None
+        assert w2._key is not None
+        assert passphrase not in vars(w2).values()
+        assert isinstance(acct.key, HDPublicKey)
+        addr = w2.get_payout_address()
+        with patch.object(Two1Wallet, '_derive_key', side_effect=AssertionError):
+            assert w2.get_private_key(addr).public_key.address() == addr
+        assert isinstance(acct.key, HDPrivateKey)
+        assert w2._key is None
+
+        # A locked wallet can be opened without the passphrase to read
+        # it, but its account keys can't be checked, so it neither hands
+        # out addresses nor signs
+        m.set_txn_side_effect_for_hd_discovery()
+        w3 = Two1Wallet(params_or_file=tf.name,
+                        data_provider=m)
+        assert w3.balances == w2.balances
+        with pytest.raises(exceptions.PassphraseError):
+            w3.get_payout_address()
+        with pytest.raises(exceptions.PassphraseError):
+            w3.get_private_key(addr)
+
+    # An account public key that doesn't match the master key is caught
+    # when the wallet is opened, through the MAC in the wallet file or,
+    # for a file without one, against the master key.
+    assert 'accounts_mac' in params and 'accounts_mac' not in config
+    other_master = HDPrivateKey.master_key_from_mnemonic(master_seed, "other")
+    other_acct_key = HDKey.from_path(other_master, "m/44'/0'/0'")[-1]
+    for p in [params, config]:
+        bad_params = dict(p,
+                          accounts=[dict(p['accounts'][0],
+                                         public_key=other_acct_key.public_key.to_b58check())])
+        m.set_txn_side_effect_for_hd_discovery()
+        with pytest.raises(ValueError):
+            Two1Wallet(params_or_file=bad_params,
+                       data_provider=m,
+                       passphrase=passphrase)
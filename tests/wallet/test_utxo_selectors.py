@@ -3,6 +3,8 @@ import random
 from two1.bitcoin.txn import UnspentTransactionOutput
 from two1.bitcoin.hash import Hash
 from two1.bitcoin.script import Script
+from two1.wallet import fees
+from two1.wallet import utxo_selectors
 from two1.wallet.utxo_selectors import utxo_selector_smallest_first
 
 
@@ -53,3 +55,77 @@ def test_smallest_first():
 
     # Make sure that the largest of the selected is <= min(remaining)
     assert largest_selected <= min([u.value for u in remaining])
+
+
+def make_utxos(values, scr=None):
+    h = Hash("a2972893f1be1f54d68a9228d9706ff8f202bb80f488f4dd46c0fe37c1e42415")
+    if scr is None:
+        scr = Script.build_p2pkh(bytes(20))
+    utxos_by_addr = {}
+    for i, v in enumerate(values):
+        utxos_by_addr["addr%d" % i] = [UnspentTransactionOutput(
+            transaction_hash=h,
+            outpoint_index=i,
+            value=v,
+            scr=scr,
+            confirmations=10)]
+
+    return utxos_by_addr
+
+
+def selected_values(selected):
+    return sorted(u.value for utxos in selected.values() for u in utxos)
+
+
+def test_input_size():
+    assert fees.input_size(Script.build_p2pkh(bytes(20))) == 148
+    assert fees.input_size(Script.build_p2pkh(bytes(20)), compressed=False) == 180
+    assert fees.input_size(Script.build_p2sh(bytes(20))) == fees.multisig_input_size(2, 3) == 297
+
+    redeem_script = Script.build_multisig_redeem(1, [bytes([2]) + bytes(32)] * 2)
+    assert fees.input_size(Script.build_p2sh(bytes(20)),
+                           redeem_script=redeem_script) == fees.multisig_input_size(1, 2)
+    assert fees.fee_for_size(226, 10000) == 2260
+    assert fees.fee_for_size(1, 10000) == 10
+
+
+def test_selectors(monkeypatch):
+    monkeypatch.setattr(utxo_selectors, 'get_fees', lambda: dict(per_kb=10000))
+    # Fees at 10000 satoshis/kB: 1480 per P2PKH input, 440 for the
+    # overhead and one output, 340 for a change output
+    input_fee = 1480
+    base_fee = 440
+
+    values = [10000, 20000, 30000, 50000, 500000]
+    utxos_by_addr = make_utxos(values)
+
+    # An exact match doesn't need change
+    amount = 10000 + 50000 - 2 * input_fee - base_fee
+    selected, fee = utxo_selectors.utxo_selector_branch_and_bound(utxos_by_addr, amount, 1)
+    assert selected_values(selected) == [10000, 50000]
+    assert fee == 2 * input_fee + base_fee
+
+    selected, fee = utxo_selectors.utxo_selector_min_waste(utxos_by_addr, amount, 1)
+    assert selected_values(selected) == [10000, 50000]
+
+    # Largest first uses a single input and pays for change
+    selected, fee = utxo_selectors.utxo_selector_largest_first(utxos_by_addr, amount, 1)
+    assert selected_values(selected) == [500000]
+    assert fee == input_fee + base_fee + 340
+
+    # Without an exact match, the least wasteful selection is used
+    selected, fee = utxo_selectors.utxo_selector_branch_and_bound(utxos_by_addr, 70000, 1)
+    assert selected_values(selected) == [500000]
+    assert sum(selected_values(selected)) >= 70000 + fee
+
+    # Not enough money
+    for s in [utxo_selectors.utxo_selector_largest_first,
+              utxo_selectors.utxo_selector_branch_and_bound,
+              utxo_selectors.utxo_selector_min_waste]:
+        selected, fee = s(utxos_by_addr, sum(values), 1)
+        assert not selected
+
+    # Fixed fees
+    selected, fee = utxo_selectors.utxo_selector_branch_and_bound(utxos_by_addr, 59000, 1, fees=1000)
+    assert selected_values(selected) == [10000, 50000]
+    assert fee == 1000
@@ -1,11 +1,16 @@
-"""This submodule provides the MerkleNode, Block, BlockHeader, and CompactBlock
-classes. It allows you to work programmatically with the individual blocks in
-the Bitcoin blockchain."""
+"""This submodule provides the MerkleNode, MerkleTree, Block, BlockHeader, and
+CompactBlock classes. It allows you to work programmatically with the individual
+blocks in the Bitcoin blockchain."""
+import hashlib
+import struct
+
 from sha256 import sha256 as sha256_midstate
 
 from two1.bitcoin.hash import Hash
 from two1.bitcoin.txn import Transaction
-from two1.bitcoin.utils import bytes_to_str, pack_u32, unpack_u32, bits_to_target, pack_compact_int, unpack_compact_int
+from two1.bitcoin.utils import BytesReader, bytes_to_str, pack_u32, bits_to_target, pack_compact_int
+
+_NONCE_STRUCT = struct.Struct('<I')
 
 
 class MerkleNode:
@@ -22,6 +27,203 @@ class MerkleNode:
         self.hash = hash
 
 
+class MerkleTree(object):
+    """ A flat, array-backed Merkle tree.
+
+        Each level of the tree is a bytearray of concatenated 32-byte
+        digests (internal byte order), with the leaves at level 0 and the
+        root alone on the last level. As in Bitcoin, a level with an odd
+        number of nodes has its last node paired with itself.
+
+        Changing, appending or popping a leaf only rehashes the path from
+        that leaf up to the root, so updates cost O(log n) hashes rather
+        than a rebuild of the whole tree.
+
+        Args:
+            leaves (list): 32-byte digests (bytes or Hash), e.g. the
+                hashes of the transactions in a block.
+    """
+
+    def __init__(self, leaves=()):
+        self._levels = [bytearray(b''.join(bytes(h) for h in leaves))]
+        self._rehash_from(0)
+
+    @staticmethod
+    def _dhash(b):
+        return hashlib.sha256(hashlib.sha256(b).digest()).digest()
+
+    @staticmethod
+    def root_from_proof(leaf, proof, index=0):
+        """ Computes the merkle root from a leaf and its merkle proof.
+
+        Args:
+            leaf (bytes or Hash): The digest of the leaf.
+            proof (list): The sibling digests from the leaf level up to
+                (but not including) the root, as returned by proof().
+            index (int): The position of the leaf in the tree.
+
+        Returns:
+            Hash: The merkle root.
+        """
+        h = bytes(leaf)
+        for sibling in proof:
+            if index & 1:
+                h = MerkleTree._dhash(bytes(sibling) + h)
+            else:
+                h = MerkleTree._dhash(h + bytes(sibling))
+            index >>= 1
+
+        return Hash(h)
+
+    def __len__(self):
+        return len(self._levels[0]) // 32
+
+    def __getitem__(self, index):
+        """ Returns the leaf at index as a Hash.
+        """
+        index = self._check_index(index)
+        return Hash(bytes(self._levels[0][index * 32:index * 32 + 32]))
+
+    def __setitem__(self, index, leaf):
+        """ Replaces the leaf at index and rehashes its path to the root.
+        """
+        index = self._check_index(index)
+        self._levels[0][index * 32:index * 32 + 32] = self._check_leaf(leaf)
+        self._rehash_path(index)
+
+    def __delitem__(self, index):
+        """ Removes the leaf at index. Every node to the right of it
+            shifts, so this rehashes O(n - index) nodes.
+        """
+        index = self._check_index(index)
+        del self._levels[0][index * 32:index * 32 + 32]
+        if index == len(self):
+            self._rehash_path(index - 1)
+        else:
+            self._rehash_from(index)
+
+    def append(self, leaf):
+        """ Adds a leaf to the right edge of the tree.
+
+        Args:
+            leaf (bytes or Hash): The digest of the new leaf.
+        """
+        self._levels[0] += self._check_leaf(leaf)
+        self._rehash_path(len(self) - 1)
+
+    def insert(self, index, leaf):
+        """ Inserts a leaf before index. Every node to the right of it
+            shifts, so this rehashes O(n - index) nodes.
+
+        Args:
+            index (int): The position of the new leaf.
+            leaf (bytes or Hash): The digest of the new leaf.
+        """
+        index = max(0, min(len(self), index))
+        self._levels[0][index * 32:index * 32] = self._check_leaf(leaf)
+        self._rehash_from(index)
+
+    def pop(self):
+        """ Removes and returns the right-most leaf.
+
+        Returns:
+            Hash: The removed leaf.
+        """
+        leaf = self[-1]
+        del self[-1]
+        return leaf
+
+    @property
+    def root(self):
+        """ The merkle root, or None if the tree has no leaves.
+
+        Returns:
+            Hash: The merkle root.
+        """
+        top = self._levels[-1]
+        return Hash(bytes(top)) if len(top) == 32 else None
+
+    def proof(self, index):
+        """ Returns the merkle proof for a leaf: the digest paired with
+            the leaf's ancestor at each level, from the leaf level up to
+            the root. The proof of the first leaf is the merkle edge
+            used for mining.
+
+        Args:
+            index (int): The position of the leaf.
+
+        Returns:
+            list: 32-byte digests.
+        """
+        index = self._check_index(index)
+        proof = []
+        for level in self._levels[:-1]:
+            sibling = index ^ 1
+            if sibling * 32 >= len(level):
+                sibling = index
+            proof.append(bytes(level[sibling * 32:sibling * 32 + 32]))
+            index >>= 1
+
+        return proof
+
+    def _check_index(self, index):
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("merkle tree leaf index out of range")
+        return index
+
+    def _check_leaf(self, leaf):
+        leaf = bytes(leaf)
+        if len(leaf) != 32:
+            raise ValueError("leaf must be 32 bytes long")
+        return leaf
+
+    def _pair(self, level, index):
+        # Returns the concatenation of the node at index and its sibling
+        # (or itself if it has none), with index rounded down to even.
+        start = (index & ~1) * 32
+        pair = bytes(level[start:start + 64])
+        if len(pair) == 32:
+            pair += pair
+        return pair
+
+    def _rehash_path(self, index):
+        # Recomputes the ancestors of the leaf at index, growing or
+        # trimming each parent level to fit the level below it.
+        levels = self._levels
+        d = 0
+        while len(levels[d]) > 32:
+            if d + 1 == len(levels):
+                levels.append(bytearray())
+            child, parent = levels[d], levels[d + 1]
+            del parent[(len(child) // 32 + 1) // 2 * 32:]
+
+            h = self._dhash(self._pair(child, index))
+            index >>= 1
+            parent[index * 32:index * 32 + 32] = h
+            d += 1
+        del levels[d + 1:]
+
+    def _rehash_from(self, index):
+        # Recomputes every node whose subtree includes a leaf at or after
+        # index.
+        levels = self._levels
+        dhash = self._dhash
+        d = 0
+        while len(levels[d]) > 32:
+            if d + 1 == len(levels):
+                levels.append(bytearray())
+            child, parent = levels[d], levels[d + 1]
+            index >>= 1
+            del parent[index * 32:]
+            for i in range(index * 2, len(child) // 32, 2):
+                parent += dhash(self._pair(child, i))
+            d += 1
+        del levels[d + 1:]
+
+
 class BlockHeader(object):
     """ A BlockHeader object containing all fields found in a Bitcoin
         block header.
@@ -55,22 +257,33 @@ class BlockHeader(object):
             bh, b (tuple): A tuple containing two elements - a BlockHeader object
             and the remainder of the bytestream after deserialization.
         """
-        version, b = unpack_u32(b)
-        prev_block_hash, b = Hash(b[0:32]), b[32:]
-        merkle_root_hash, b = Hash(b[0:32]), b[32:]
-        time, b = unpack_u32(b)
-        bits, b = unpack_u32(b)
-        nonce, b = unpack_u32(b)
+        r = BytesReader(b)
+        return (BlockHeader.from_reader(r), r.remainder())
 
-        return (
-            BlockHeader(version,
-                        prev_block_hash,
-                        merkle_root_hash,
-                        time,
-                        bits,
-                        nonce),
-            b
-        )
+    @staticmethod
+    def from_reader(r):
+        """ Creates a BlockHeader object from a BytesReader, advancing its
+        offset past the 80 bytes of the header.
+
+        Args:
+            r (BytesReader): A reader positioned at the (4-byte) version.
+
+        Returns:
+            bh (BlockHeader): The deserialized BlockHeader object.
+        """
+        version = r.read_u32()
+        prev_block_hash = Hash(r.read(32))
+        merkle_root_hash = Hash(r.read(32))
+        time = r.read_u32()
+        bits = r.read_u32()
+        nonce = r.read_u32()
+
+        return BlockHeader(version,
+                           prev_block_hash,
+                           merkle_root_hash,
+                           time,
+                           bits,
+                           nonce)
 
     def __init__(self, version, prev_block_hash, merkle_root_hash,
                  time, bits, nonce):
@@ -160,14 +373,25 @@ class Block(object):
             block, b (tuple): A tuple. The first item is the deserialized block
             and the second is the remainder of the byte stream.
         """
-        bh, b = BlockHeader.from_bytes(b)
-        num_txns, b = unpack_compact_int(b)
-        txns = []
-        for i in range(num_txns):
-            t, b = Transaction.from_bytes(b)
-            txns.append(t)
+        r = BytesReader(b)
+        return (Block.from_reader(r), r.remainder())
+
+    @staticmethod
+    def from_reader(r):
+        """ Creates a Block from a BytesReader, advancing its offset past
+        the block header and all transactions.
 
-        return Block.from_blockheader(bh, txns), b
+        Args:
+            r (BytesReader): A reader positioned at the block version.
+
+        Returns:
+            block (Block): The deserialized block.
+        """
+        bh = BlockHeader.from_reader(r)
+        num_txns = r.read_compact_int()
+        txns = [Transaction.from_reader(r) for i in range(num_txns)]
+
+        return Block.from_blockheader(bh, txns)
 
     @classmethod
     def from_blockheader(cls, bh, txns):
@@ -183,7 +407,7 @@ class Block(object):
         """
         self = cls.__new__(cls)
         self.block_header = bh
-        self.transactions = txns
+        self.txns = txns
 
         self.merkle_tree = None
         self.invalidate()
@@ -209,55 +433,61 @@ class Block(object):
             if any changes to the underlying txns were made.
         """
         self._compute_merkle_tree()
-        self.block_header.merkle_root_hash = self.merkle_tree.hash
+        self.block_header.merkle_root_hash = self.merkle_tree.root
 
     def invalidate_coinbase(self):
         """ Optimized update of the merkle tree if only the
             coinbase has been updated/changed. The whole merkle
             tree is not computed. Instead, just the left edge is.
         """
-        self._invalidate_coinbase()
+        self.set_transaction(0, self.coinbase_transaction)
 
-    def _invalidate_coinbase(self, merkle_node=None):
-        if merkle_node is None:
-            merkle_node = self.merkle_tree
+    def set_transaction(self, index, txn):
+        """ Replaces the transaction at index, updating only its path
+            in the merkle tree.
 
-        if(merkle_node.left_child is None and
-           merkle_node.right_child is None):
-            # This is the node corresponding to the coinbase, update hash
-            merkle_node.hash = self.coinbase_transaction.hash
-            return
-        else:
-            self._invalidate_coinbase(merkle_node.left_child)
+        Args:
+            index (int): Position of the transaction in self.txns.
+            txn (Transaction): The new transaction.
+        """
+        self.txns[index] = txn
+        self.merkle_tree[index] = txn.hash
+        self.block_header.merkle_root_hash = self.merkle_tree.root
 
-        merkle_node.hash = Hash.dhash(bytes(merkle_node.left_child.hash) +
-                                      bytes(merkle_node.right_child.hash))
+    def add_transaction(self, txn):
+        """ Appends a transaction to the block, updating only the right
+            edge of the merkle tree.
+
+        Args:
+            txn (Transaction): The transaction to add.
+        """
+        self.txns.append(txn)
+        self.merkle_tree.append(txn.hash)
+        self.block_header.merkle_root_hash = self.merkle_tree.root
+
+    def remove_transaction(self, index):
+        """ Removes the transaction at index. Only the part of the merkle
+            tree to the right of it is recomputed.
+
+        Args:
+            index (int): Position of the transaction in self.txns.
+
+        Returns:
+            txn (Transaction): The removed transaction.
+        """
+        if index == 0 or index == -len(self.txns):
+            raise ValueError("Cannot remove the coinbase transaction!")
 
-        # If we're back at the root, update the blockheader
-        if merkle_node is self.merkle_tree:
-            self.block_header.merkle_root_hash = self.merkle_tree.hash
+        txn = self.txns.pop(index)
+        del self.merkle_tree[index]
+        self.block_header.merkle_root_hash = self.merkle_tree.root
+        return txn
 
     def _compute_merkle_tree(self):
-        """ Computes the merkle tree from the transactions in self.transactions.
-            The merkle root is the top node in the tree and can be accessed as
-            self.merkle_tree.merkle_hash.
+        """ Computes the merkle tree from the transactions in self.txns.
+            The merkle root can be accessed as self.merkle_tree.root.
         """
-        # Tree gets built bottom up
-        level_nodes = [MerkleNode(t.hash, None, None) for t in self.txns]
-        while True:
-            if len(level_nodes) == 1:
-                self.merkle_tree = level_nodes[0]  # This is the root
-                return
-            if len(level_nodes) % 2 != 0:
-                # Make sure there are an even number of nodes
-                level_nodes.append(level_nodes[-1])
-            new_level = []
-            for i in range(0, len(level_nodes), 2):
-                left = level_nodes[i]
-                right = level_nodes[i+1]
-                n = MerkleNode(Hash.dhash(bytes(left.hash) + bytes(right.hash)), left, right)
-                new_level.append(n)
-            level_nodes = new_level
+        self.merkle_tree = MerkleTree([t.hash for t in self.txns])
 
     def get_merkle_edge(self):
         """ This function returns the merkle edge required for mining. Specifically,
@@ -267,21 +497,9 @@ class Block(object):
         Returns:
             edge (list): a list of hashes corresponding to the merkle edge
         """
-        return self._get_merkle_edge()
-
-    def _get_merkle_edge(self, node=None):
-        # Start at root node and head recurse
-        if node is None:
-            if self.merkle_tree is None:
-                self._compute_merkle_tree()
-            node = self.merkle_tree
-
-        r = node.right_child
-        if r.left_child is None and r.right_child is None:
-            # Leaf, so just return right_childs hash
-            return [bytes(node.right_child.hash)]
-        else:
-            return self._get_merkle_edge(node.left_child) + [bytes(node.right_child.hash)]
+        if self.merkle_tree is None:
+            self._compute_merkle_tree()
+        return self.merkle_tree.proof(0)
 
     @property
     def coinbase_transaction(self):
@@ -355,6 +573,7 @@ class CompactBlock(object):
                                         0)                # Fake nonce also
         self.height = height
         self.merkle_edge = merkle_edge
+        self._midstate_prefix = None
 
         if cb_txn is not None:
             self.coinbase_transaction = cb_txn
@@ -383,15 +602,59 @@ class CompactBlock(object):
             # TODO: raise an error?
             return
 
-        cur_hash = self._cb_txn.hash
-
-        for e in self.merkle_edge:
-            cur_hash = Hash.dhash(bytes(cur_hash) + bytes(e))
-
-        self.block_header.merkle_root_hash = cur_hash
+        self.block_header.merkle_root_hash = MerkleTree.root_from_proof(self._cb_txn.hash,
+                                                                        self.merkle_edge)
 
     # Private function to compute midstate.
     def _compute_midstate(self):
         # midstate is taking the first 512-bits of the block header
         # and doing a sha256.update() on just that portion.
-        self._midstate, _ = sha256_midstate(bytes(self.block_header)[0:64]).state
+        self._midstate_prefix = bytes(self.block_header)[0:64]
+        self._midstate, _ = sha256_midstate(self._midstate_prefix).state
+        # The same state as a hashlib object which can be cheaply
+        # copied to hash the remaining 16 bytes for each nonce.
+        self._midstate_sha = hashlib.sha256(self._midstate_prefix)
+
+    def search_nonce(self, target, start=0, stop=0x100000000, cancel=None):
+        """ Searches a range of nonces for a block header whose hash is
+            below target.
+
+            Only the last 16 bytes of the header (the end of the merkle
+            root, time, bits and nonce) are hashed for each nonce, on top
+            of a copy of the midstate. The nonce is packed in place into a
+            preallocated buffer rather than re-serializing the header.
+
+        Args:
+            target (int): The target the header hash must be below.
+            start (int): The first nonce to try.
+            stop (int): One past the last nonce to try.
+            cancel (multiprocessing.Event): If provided, the search is
+                abandoned shortly after this is set.
+
+        Returns:
+            nonce (int): The first nonce in the range that produces a hash
+            below target (block_header.nonce is also set to it), or None if
+            there is none or the search was cancelled.
+        """
+        header = bytes(self.block_header)
+        if header[0:64] != self._midstate_prefix:
+            self._compute_midstate()
+
+        tail = bytearray(header[64:80])
+        pack_nonce = _NONCE_STRUCT.pack_into
+        midstate = self._midstate_sha
+        sha256 = hashlib.sha256
+        from_bytes = int.from_bytes
+
+        for nonce in range(start, stop):
+            if cancel is not None and not nonce & 0xffff and cancel.is_set():
+                return None
+
+            pack_nonce(tail, 12, nonce)
+            h = midstate.copy()
+            h.update(tail)
+            if from_bytes(sha256(h.digest()).digest(), 'little') < target:
+                self.block_header.nonce = nonce
+                return nonce
+
+        return None
@@ -745,6 +745,30 @@ class PublicKey(PublicKeyBase):
         msg = get_bytes(message)
         return bitcoin_curve.verify(msg, signature, self.point, do_hash)
 
+    @staticmethod
+    def verify_batch(items, do_hash=True):
+        """ Verifies a number of signatures at once.
+
+        This is equivalent to calling verify() on each item but allows
+        the underlying curve implementation to share work across the
+        whole batch.
+
+        Args:
+            items (list(tuple)): (public_key, message, signature) tuples
+              where public_key is a PublicKey or HDPublicKey, message is
+              bytes or a hex string and signature is a Signature.
+            do_hash (bool): True if the messages should be hashed prior
+              to verifying, False if not.
+
+        Returns:
+            list(bool): Whether each signature is verified, in the same
+            order as items.
+        """
+        return bitcoin_curve.verify_batch(
+            [(pub_key.point, get_bytes(message), signature)
+             for pub_key, message, signature in items],
+            do_hash)
+
     def to_base64(self):
         """ Hex representation of the serialized byte stream.
 
@@ -1529,6 +1553,61 @@ class HDPublicKey(HDKey, PublicKeyBase):
         else:
             raise TypeError("parent_key must be either a HDPrivateKey or HDPublicKey object")
 
+    @staticmethod
+    def from_parent_batch(parent_key, indices):
+        """ Derives a number of non-hardened child public keys at once.
+
+        This is equivalent to calling from_parent() for each index, but
+        the parent's serialized key, fingerprint and HMAC state are only
+        computed once and the child points are computed together from
+        the parent point.
+
+        Args:
+            parent_key (HDPrivateKey or HDPublicKey): The parent key.
+            indices (list(int)): The (non-hardened) child indices.
+
+        Returns:
+            list(HDPublicKey): The child keys, in the same order as
+                indices. An entry is None if that index does not yield
+                a valid key.
+        """
+        if isinstance(parent_key, HDPrivateKey):
+            parent_key = parent_key.public_key
+        elif not isinstance(parent_key, HDPublicKey):
+            raise TypeError("parent_key must be either a HDPrivateKey or HDPublicKey object")
+
+        if any(i & 0x80000000 for i in indices):
+            raise ValueError("Can't generate a hardened child key from a parent public key.")
+
+        mac = hmac.new(parent_key.chain_code,
+                       parent_key.compressed_bytes,
+                       hashlib.sha512)
+        tweaks = []
+        for i in indices:
+            m = mac.copy()
+            m.update(i.to_bytes(length=4, byteorder='big'))
+            I = m.digest()
+            tweaks.append((int.from_bytes(I[:32], 'big'), I[32:]))
+
+        points = bitcoin_curve.add_base_multiples(
+            parent_key._key.point, [il % bitcoin_curve.n for il, _ in tweaks])
+
+        child_depth = parent_key.depth + 1
+        fingerprint = parent_key.fingerprint
+        rv = []
+        for i, (il, ir), pt in zip(indices, tweaks, points):
+            if il >= bitcoin_curve.n or pt.infinity:
+                rv.append(None)
+            else:
+                rv.append(HDPublicKey(x=pt.x,
+                                      y=pt.y,
+                                      chain_code=ir,
+                                      index=i,
+                                      depth=child_depth,
+                                      parent_fingerprint=fingerprint))
+
+        return rv
+
     def __init__(self, x, y, chain_code, index, depth,
                  parent_fingerprint=b'\x00\x00\x00\x00'):
         key = PublicKey(x, y)
@@ -1595,6 +1674,15 @@ class HDPublicKey(HDKey, PublicKeyBase):
         """
         return self._key.verify(message, signature, do_hash)
 
+    @property
+    def point(self):
+        """ The point on the curve corresponding to this public key.
+
+        Returns:
+            ECPointAffine: The public key point.
+        """
+        return self._key.point
+
     @property
     def compressed_bytes(self):
         """ Byte string corresponding to a compressed representation
@@ -1,6 +1,7 @@
 """this submodule provides a Hash class for interacting with SHA-256 hashes
 in a user-friendly way."""
 import hashlib
+import weakref
 
 from two1.bitcoin.utils import bytes_to_str
 
@@ -15,12 +16,23 @@ class Hash(object):
         assumed to already be in internal order and this function is
         effectively a no-op.
 
+        Hash objects are immutable and hash like the underlying byte
+        string, so they can be used as dict keys or set members
+        interchangeably with the raw 32-byte digest. A Hash also
+        compares equal to its hex string, but doesn't hash like it:
+        only Hash and bytes keys are supported, so look up a hex
+        string with Hash(h) rather than h.
+
     Args:
         h (bytes or str): the hash to convert.
 
     Returns:
         Hash: a Hash object.
     """
+    __slots__ = ('_bytes', '_str', '__weakref__')
+
+    # Pool of interned Hash objects, keyed by digest. See intern().
+    _interned = weakref.WeakValueDictionary()
 
     @staticmethod
     def dhash(b):
@@ -34,35 +46,80 @@ class Hash(object):
         """
         return Hash(hashlib.sha256(hashlib.sha256(b).digest()).digest())
 
+    @staticmethod
+    def intern(h):
+        """ Returns a shared Hash object for h, so that the many
+            references to the same txid or block hash held by a wallet
+            cost a single object.
+
+        Args:
+            h (bytes or str or Hash): the hash to intern.
+
+        Returns:
+            Hash: the interned Hash object.
+        """
+        if not isinstance(h, Hash):
+            h = Hash(h)
+
+        return Hash._interned.setdefault(h._bytes, h)
+
     def __init__(self, h):
         if isinstance(h, bytes):
             if len(h) != 32:
                 raise ValueError("h must be 32 bytes long")
-            self._bytes = h
+            b, s = h, None
         elif isinstance(h, str):
             if len(h) != 64:
                 raise ValueError("h must be 32 bytes (64 hex chars) long")
-            self._bytes = bytes.fromhex(h)[::-1]
+            b, s = bytes.fromhex(h)[::-1], h.lower()
         else:
             raise TypeError("h must be either a str or bytes")
 
+        object.__setattr__(self, '_bytes', b)
+        object.__setattr__(self, '_str', s)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Hash objects are immutable")
+
+    def __reduce__(self):
+        return (Hash, (self._bytes,))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
     def __bytes__(self):
         return self._bytes
 
+    def __hash__(self):
+        return hash(self._bytes)
+
     def __eq__(self, b):
-        if isinstance(b, bytes):
-            return self._bytes == b
-        elif isinstance(b, Hash):
+        # Comparing with a hex string is supported for convenience, but
+        # str keys don't mix with Hash keys in dicts and sets since
+        # __hash__ follows the bytes.
+        if isinstance(b, Hash):
             return self._bytes == b._bytes
+        elif isinstance(b, bytes):
+            return self._bytes == b
         elif isinstance(b, str):
-            return self._bytes == Hash(b)._bytes
+            if len(b) != 64:
+                raise ValueError("h must be 32 bytes (64 hex chars) long")
+            return str(self) == b.lower()
         else:
-            raise TypeError("b must be either a Hash object or bytes")
+            return NotImplemented
 
     def __str__(self):
         """ Returns a hex string in RPC order
         """
-        return bytes_to_str(self._bytes[::-1])
+        if self._str is None:
+            object.__setattr__(self, '_str', bytes_to_str(self._bytes[::-1]))
+        return self._str
+
+    def __repr__(self):
+        return "Hash('%s')" % self
 
     def to_int(self, endianness='big'):
         """ Returns an integer representation of the Hash.
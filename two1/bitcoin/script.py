@@ -10,12 +10,13 @@ import struct
 
 from two1.bitcoin.crypto import PublicKey
 from two1.bitcoin.crypto import Signature
+from two1.bitcoin.exceptions import DeserializationError
 from two1.bitcoin.exceptions import ScriptParsingError
+from two1.bitcoin.utils import BytesReader
 from two1.bitcoin.utils import bytes_to_str
 from two1.bitcoin.utils import hash160
 from two1.bitcoin.utils import key_hash_to_address
 from two1.bitcoin.utils import pack_var_str
-from two1.bitcoin.utils import unpack_var_str
 from two1.bitcoin.utils import render_int
 
 
@@ -89,9 +90,21 @@ class Script(object):
             (scr, b) (tuple): A tuple with the deserialized Script object and
             the remainder of the byte stream.
         """
-        raw_script, b = unpack_var_str(b)
+        r = BytesReader(b)
+        return (Script.from_reader(r), r.remainder())
 
-        return (Script(raw_script), b)
+    @staticmethod
+    def from_reader(r):
+        """ Deserializes a length-prefixed script from a BytesReader,
+        advancing its offset past the script.
+
+        Args:
+            r (BytesReader): A reader positioned at the length of the script.
+
+        Returns:
+            scr (Script): The deserialized Script object.
+        """
+        return Script(r.read_var_str())
 
     @staticmethod
     def from_hex(h, size_prepended=False):
@@ -258,6 +271,10 @@ class Script(object):
         self._ast = []
         self._tokens = []
         self._raw_script = None
+        # Caches for __bytes__() and ScriptInterpreter.compile(), reset
+        # whenever the script is re-parsed.
+        self._bytes = None
+        self._compiled = None
 
         if isinstance(script, bytes):
             self._raw_script = script
@@ -287,9 +304,11 @@ class Script(object):
     def _check_tokenized(self):
         if not self._tokens:
             if self._raw_script:
+                raw_script = self._raw_script
                 self._disassemble()
                 self._parse()
                 self._raw_script = None
+                self._bytes = raw_script
             else:
                 # Empty script, so just set _tokens to empty list
                 self._tokens = []
@@ -466,19 +485,21 @@ class Script(object):
 
         # Now consume all the public keys and make sure those were
         # the only things in.
-        b = scr_bytes[1:]
+        r = BytesReader(scr_bytes, 1)
         public_keys = []
-        for i in range(n):
-            pk, b = unpack_var_str(b)
-            public_keys.append(pk)
-            # May want to do additional checking to make
-            # sure it's a public key in the future.
+        try:
+            for i in range(n):
+                public_keys.append(r.read_var_str())
+                # May want to do additional checking to make
+                # sure it's a public key in the future.
+        except DeserializationError:
+            raise exc
 
         # Should only be 2 bytes left
-        if len(b) != 2:
+        if len(r) != 2:
             raise exc
-        if (b[0] - 0x50) != n or \
-           b[1] != self.BTC_OPCODE_TABLE['OP_CHECKMULTISIG']:
+        if (r.read_u8() - 0x50) != n or \
+           r.read_u8() != self.BTC_OPCODE_TABLE['OP_CHECKMULTISIG']:
             raise exc
 
         return dict(m=m, n=n, public_keys=public_keys)
@@ -685,6 +706,8 @@ class Script(object):
             in ``self._ast``.
         """
         self._check_tokenized()
+        self._bytes = None
+        self._compiled = None
         if self._tokens:
             self._temp_tokens = copy.deepcopy(self._tokens)
             self._ast = self._do_parse()
@@ -761,32 +784,33 @@ class Script(object):
             return
 
         raw = self._raw_script
+        raw_len = len(raw)
+        i = 0
 
         self._tokens = []
-        while raw:
-            op, raw = raw[0], raw[1:]
+        while i < raw_len:
+            op = raw[i]
+            i += 1
             if op == 0x00:
                 self._tokens.append('OP_0')
-            elif op < 0x4b:
-                self._tokens.append(raw[0:op])
-                raw = raw[op:]
+            elif op <= 0x4b:
+                self._tokens.append(raw[i:i + op])
+                i += op
             else:
                 opcode = Script.BTC_OPCODE_REV_TABLE[op]
                 if opcode in ['OP_PUSHDATA1', 'OP_PUSHDATA2', 'OP_PUSHDATA4']:
                     pushlen = int(opcode[-1])
                     datalen = 0
                     if pushlen == 1:
-                        datalen = raw[0]
-                        datalen_bytes, raw = bytes([raw[0]]), raw[1:]
+                        datalen = raw[i]
                     elif pushlen == 2:
-                        datalen_bytes, raw = raw[0:2], raw[2:]
-                        datalen = struct.unpack("<H", datalen_bytes)[0]
+                        datalen = struct.unpack("<H", raw[i:i + 2])[0]
                     elif pushlen == 4:
-                        datalen_bytes, raw = raw[0:4], raw[4:]
-                        datalen = struct.unpack("<I", datalen_bytes)[0]
+                        datalen = struct.unpack("<I", raw[i:i + 4])[0]
+                    i += pushlen
 
-                    self._tokens.append(raw[:datalen])
-                    raw = raw[datalen:]
+                    self._tokens.append(raw[i:i + datalen])
+                    i += datalen
                 else:
                     self._tokens.append(opcode)
 
@@ -815,21 +839,21 @@ class Script(object):
         Returns:
             b (bytes): a serialized byte stream of this Script object.
         """
-        b = b''
-        i = 0
         if self._raw_script is not None:
             return self._raw_script
+        if self._bytes is not None:
+            return self._bytes
 
-        while i < len(self):
-            t = self[i]
+        b = []
+        for t in self:
             if isinstance(t, bytes):
                 l = len(t)
                 if l < 0x01:
                     raise ValueError(
                         "Empty byte string not allowed.")
                 elif l <= 0x4b:
-                    b += bytes([l])
-                    b += t
+                    b.append(bytes([l]))
+                    b.append(t)
                 else:
                     if l <= 0xff:
                         op = 'OP_PUSHDATA1'
@@ -844,15 +868,14 @@ class Script(object):
                         raise ValueError(
                             "op has too much data to push onto stack.")
 
-                    b += bytes([self.BTC_OPCODE_TABLE[op]])
-                    b += pushlen
-                    b += t
+                    b.append(bytes([self.BTC_OPCODE_TABLE[op]]))
+                    b.append(pushlen)
+                    b.append(t)
             else:
-                b += bytes([self.BTC_OPCODE_TABLE[t]])
-
-            i += 1
+                b.append(bytes([self.BTC_OPCODE_TABLE[t]]))
 
-        return b
+        self._bytes = b''.join(b)
+        return self._bytes
 
     def to_hex(self):
         """ Generates a hex encoding of the serialized script.
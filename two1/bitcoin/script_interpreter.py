@@ -33,6 +33,14 @@ class ScriptInterpreter(object):
             signature script when verifying the transaction. In the
             case of a P2PKH UTXO, this will be the UTXO scriptPubKey.
             In the case of a P2SH UTXO, this will be the redeemScript.
+        sig_cache (dict): If provided, the results of signature checks
+            are looked up in and stored into this dict so that they can
+            be shared with (or computed in a batch ahead of) other
+            interpreters. See _verify_sigs().
+        defer_sigs (bool): If True, signature checks not already in
+            sig_cache are recorded there (as the check itself rather than
+            a bool result) and assumed to be valid, so that they can later
+            be verified in a single batch.
     """
     DISABLED_OPS = ['OP_CAT', 'OP_SUBSTR', 'OP_LEFT', 'OP_RIGHT',
                     'OP_INVERT', 'OP_AND', 'OP_OR', 'OP_XOR',
@@ -41,8 +49,10 @@ class ScriptInterpreter(object):
     RESERVED_WORDS = ['OP_RESERVED', 'OP_VER', 'OP_VERIF', 'OP_VERNOTIF'
                       'OP_RESERVED1', 'OP_RESERVED2']
     NOP_WORDS = ['OP_NOP%d' for i in [1] + list(range(3, 11))]
+    _dispatch_table = None
 
-    def __init__(self, txn=None, input_index=-1, sub_script=None):
+    def __init__(self, txn=None, input_index=-1, sub_script=None,
+                 sig_cache=None, defer_sigs=False):
         self._stack = deque()
         self._alt_stack = deque()
         self._stack_copy = None
@@ -50,12 +60,97 @@ class ScriptInterpreter(object):
         self._txn = txn
         self._input_index = input_index
         self._sub_script = sub_script
+        self._sig_cache = sig_cache
+        self._defer_sigs = defer_sigs
         self.stop = False
 
         self._if_else_stack = deque()
 
-    def _walk_ast(self, ast):
+    @classmethod
+    def _get_dispatch_table(cls):
+        """ Builds (once) the table mapping each opcode byte to the
+            (handler, args) tuple that executes it. Opcodes that have no
+            handler and are therefore no-ops map to None.
+        """
+        if cls._dispatch_table is None:
+            table = {}
+            pushnums = range(Script.BTC_OPCODE_TABLE['OP_1'], Script.BTC_OPCODE_TABLE['OP_16'] + 1)
+            for opcode, op in Script.BTC_OPCODE_TABLE.items():
+                if op == Script.BTC_OPCODE_TABLE['OP_0']:
+                    table[op] = (cls._op_0, ())
+                elif op in pushnums:
+                    table[op] = (cls._op_pushnum, (opcode,))
+                else:
+                    table[op] = cls._lookup_handler(opcode)
+            cls._dispatch_table = table
+
+        return cls._dispatch_table
+
+    @classmethod
+    def _lookup_handler(cls, opcode):
+        if opcode in cls.DISABLED_OPS or opcode in cls.RESERVED_WORDS:
+            return (cls._op_disabled, ())
+
+        f = getattr(cls, "_" + opcode.lower(), None)
+        return (f, ()) if f is not None else None
+
+    @classmethod
+    def compile(cls, script):
+        """ Compiles a script into a list of (handler, args) tuples which
+            can be executed without any further opcode lookups. The result
+            is cached on the Script object until it is next modified.
+
+            Standard P2PKH and P2SH scriptPubKeys compile to a single
+            handler that evaluates the whole template at once.
+
+        Args:
+            script (Script): A Script object to compile.
+
+        Returns:
+            list: (handler, args) tuples.
+        """
+        if script._compiled is None:
+            script._compiled = cls._compile_ast(script.ast, True)
+
+        return script._compiled
+
+    @classmethod
+    def _compile_ast(cls, ast, top_level=False):
+        if top_level:
+            if len(ast) == 5 and ast[0] == 'OP_DUP' and ast[1] == 'OP_HASH160' and \
+               isinstance(ast[2], bytes) and len(ast[2]) == 20 and \
+               ast[3] == 'OP_EQUALVERIFY' and ast[4] == 'OP_CHECKSIG':
+                return [(cls._run_p2pkh, (ast[2],))]
+            if len(ast) == 3 and ast[0] == 'OP_HASH160' and \
+               isinstance(ast[1], bytes) and len(ast[1]) == 20 and ast[2] == 'OP_EQUAL':
+                return [(cls._run_p2sh, (ast[1],))]
+
+        table = cls._get_dispatch_table()
+        code = []
         for a in ast:
+            if isinstance(a, bytes):
+                code.append((cls._op_push, (a,)))
+            elif isinstance(a, list):
+                opcode, args = a[0], a[1:]
+                if opcode in ['OP_IF', 'OP_NOTIF']:
+                    args = [cls._compile_ast(c) if isinstance(c, list) else c for c in args]
+                    code.append((cls._op_if, (opcode, args)))
+                else:
+                    code.append((cls._op_pushdata_n, (opcode, args)))
+            else:
+                op = Script.BTC_OPCODE_TABLE.get(a)
+                if op is not None:
+                    handler = table[op]
+                else:
+                    # e.g. OP_CHECKPARTIALMULTISIG, which is internal
+                    handler = cls._lookup_handler(a)
+                if handler is not None:
+                    code.append(handler)
+
+        return code
+
+    def _execute(self, code):
+        for handler, args in code:
             total_stack_size = len(self._stack) + len(self._alt_stack)
             if total_stack_size > 1000:
                 raise ScriptInterpreterError(
@@ -63,50 +158,7 @@ class ScriptInterpreter(object):
             if self.stop:
                 break
 
-            opcode = None
-            args = None
-            if isinstance(a, list):
-                opcode = a[0]
-                args = a[1:]
-            else:
-                opcode = a
-
-            if opcode in self.DISABLED_OPS + self.RESERVED_WORDS:
-                self.stop = True
-                break
-
-            if opcode in Script.BTC_OPCODE_TABLE:
-                op = Script.BTC_OPCODE_TABLE[opcode]
-            else:
-                op = None
-
-            if opcode == "OP_0":
-                self._op_0()
-            elif isinstance(opcode, bytes):
-                self._op_push(opcode)
-            elif opcode in ['OP_PUSHDATA1', 'OP_PUSHDATA2', 'OP_PUSHDATA4']:
-                pushlen = int(opcode[-1])
-                if pushlen == 1:
-                    datalen = args[0][0]
-                elif pushlen == 2:
-                    datalen = struct.unpack("<H", args[0])[0]
-                elif pushlen == 4:
-                    datalen = struct.unpack("<I", args[0])[0]
-                data = args[1]
-                if pushlen != (datalen.bit_length() + 7) // 8:
-                    raise ScriptInterpreterError(
-                        "datalen does not correspond with opcode")
-                if len(data) != datalen:
-                    raise ScriptInterpreterError(
-                        "len(data) != datalen in %s" % opcode)
-                self._op_pushdata(datalen, data)
-            elif op and op >= Script.BTC_OPCODE_TABLE['OP_1'] and op <= Script.BTC_OPCODE_TABLE['OP_16']:
-                self._op_pushnum(opcode)
-            elif opcode in ['OP_IF', 'OP_NOTIF']:
-                self._op_if(opcode, args)
-            elif hasattr(self, "_" + opcode.lower()):
-                f = getattr(self, "_" + opcode.lower())
-                f()
+            handler(self, *args)
 
     def run_script(self, script):
         """ Runs a script
@@ -115,7 +167,7 @@ class ScriptInterpreter(object):
             script (Script): A Script object to evaluate
         """
         if not self.stop:
-            self._walk_ast(script.ast)
+            self._execute(self.compile(script))
 
     @property
     def valid(self):
@@ -270,6 +322,28 @@ class ScriptInterpreter(object):
 
         self._stack.append(data)
 
+    def _op_pushdata_n(self, opcode, args):
+        """ OP_PUSHDATA1, OP_PUSHDATA2, OP_PUSHDATA4
+
+            Checks that the length prefix is minimal and matches the data
+            before pushing it.
+        """
+        pushlen = int(opcode[-1])
+        if pushlen == 1:
+            datalen = args[0][0]
+        elif pushlen == 2:
+            datalen = struct.unpack("<H", args[0])[0]
+        elif pushlen == 4:
+            datalen = struct.unpack("<I", args[0])[0]
+        data = args[1]
+        if pushlen != (datalen.bit_length() + 7) // 8:
+            raise ScriptInterpreterError(
+                "datalen does not correspond with opcode")
+        if len(data) != datalen:
+            raise ScriptInterpreterError(
+                "len(data) != datalen in %s" % opcode)
+        self._op_pushdata(datalen, data)
+
     def _op_1negate(self):
         """ Pushes -1 onto the stack
         """
@@ -300,7 +374,7 @@ class ScriptInterpreter(object):
 
         if do:
             self._if_else_stack.append(do)
-            self._walk_ast(data[0])
+            self._execute(data[0])
         elif len(data) == 3:
             self._if_else_stack.append(do)
             self._op_else(data[1])
@@ -322,7 +396,7 @@ class ScriptInterpreter(object):
             raise ScriptInterpreterError("In OP_ELSE without OP_IF/NOTIF")
 
         if not self._if_else_stack[-1]:
-            self._walk_ast(data)
+            self._execute(data)
 
     def _op_endif(self):
         """ Ends an if/else block. All blocks must end, or the
@@ -335,6 +409,11 @@ class ScriptInterpreter(object):
 
         self._if_else_stack.pop()
 
+    def _op_disabled(self):
+        """ Disabled and reserved words make the script fail.
+        """
+        self.stop = True
+
     def _op_verify(self):
         x = self._get_int()
         if not x:
@@ -713,6 +792,32 @@ class ScriptInterpreter(object):
         """
         pass
 
+    def _verify_sigs(self, checks):
+        """ Verifies a list of signature checks in a single batch.
+
+        Args:
+            checks (list(tuple)): (public_key, digest, signature) tuples.
+
+        Returns:
+            list(bool): Whether each signature is verified.
+        """
+        if self._sig_cache is None:
+            return PublicKey.verify_batch(checks, False)
+
+        keys = [(p.point.x, p.point.y, d, s.r, s.s) for p, d, s in checks]
+        missing = [(k, c) for k, c in zip(keys, checks)
+                   if not isinstance(self._sig_cache.get(k), bool)]
+        if missing:
+            if self._defer_sigs:
+                for k, c in missing:
+                    self._sig_cache[k] = c
+            else:
+                verified = PublicKey.verify_batch([c for k, c in missing], False)
+                for (k, c), v in zip(missing, verified):
+                    self._sig_cache[k] = v
+
+        return [self._sig_cache[k] is not False for k in keys]
+
     def _op_checksig(self):
         """ The entire transaction's outputs, inputs, and script (from
             the most recently-executed OP_CODESEPARATOR to the end) are
@@ -730,13 +835,11 @@ class ScriptInterpreter(object):
         pub_key = PublicKey.from_bytes(pub_key_bytes)
         sig = Signature.from_der(sig_der)
 
-        txn_copy = self._txn._copy_for_sig(input_index=self._input_index,
-                                           hash_type=hash_type,
-                                           sub_script=self._sub_script)
-        msg = bytes(txn_copy) + utils.pack_u32(hash_type)
-        tx_digest = hashlib.sha256(msg).digest()
+        tx_digest = self._txn.get_sighash(input_index=self._input_index,
+                                          hash_type=hash_type,
+                                          sub_script=self._sub_script)
 
-        verified = pub_key.verify(tx_digest, sig)
+        verified = self._verify_sigs([(pub_key, tx_digest, sig)])[0]
 
         self._stack.append(verified)
 
@@ -746,6 +849,23 @@ class ScriptInterpreter(object):
         self._op_checksig()
         self._op_verify()
 
+    def _run_p2pkh(self, hash160):
+        """ OP_DUP OP_HASH160 <hash160> OP_EQUALVERIFY OP_CHECKSIG,
+            evaluated as a single step.
+        """
+        self._check_stack_len(1)
+        if utils.hash160(self._stack[-1]) != hash160:
+            self.stop = True
+            return
+
+        self._op_checksig()
+
+    def _run_p2sh(self, hash160):
+        """ OP_HASH160 <hash160> OP_EQUAL, evaluated as a single step.
+        """
+        self._check_stack_len(1)
+        self._stack.append(utils.hash160(self._stack.pop()) == hash160)
+
     def _op_checkmultisig(self, partial=False):
         """ Compares the first signature against each public key until
             it finds an ECDSA match. Starting with the subsequent public
@@ -802,13 +922,10 @@ class ScriptInterpreter(object):
             raise ScriptInterpreterError("Not all signatures have the same hash type!")
 
         hash_type = hash_types.pop()
-        txn_copy = self._txn._copy_for_sig(input_index=self._input_index,
+        txn_digest = self._txn.get_sighash(input_index=self._input_index,
                                            hash_type=hash_type,
                                            sub_script=self._sub_script)
 
-        msg = bytes(txn_copy) + utils.pack_u32(hash_type)
-        txn_digest = hashlib.sha256(msg).digest()
-
         # Now we verify
         last_match = -1
         rv = True
@@ -817,7 +934,7 @@ class ScriptInterpreter(object):
         for sig in sigs:
             matched_any = False
             for i, pub_key in enumerate(public_keys[last_match+1:]):
-                if pub_key.verify(txn_digest, sig):
+                if self._verify_sigs([(pub_key, txn_digest, sig)])[0]:
                     last_match = i
                     match_count += 1
                     matched_any = True
@@ -1,26 +1,88 @@
 """This submodule provides Transaction, Coinbase, TransactionInput,
 TransactionOutput, and UnspentTransactionOutput classes for building and
 parsing Bitcoin transactions and their constituent inputs and outputs."""
+import collections
 import copy
-import struct
 
 from two1.bitcoin import crypto
 from two1.bitcoin.exceptions import ScriptInterpreterError
 from two1.bitcoin.hash import Hash
 from two1.bitcoin.script import Script
 from two1.bitcoin.script_interpreter import ScriptInterpreter
+from two1.bitcoin.utils import BytesReader
 from two1.bitcoin.utils import address_to_key_hash
 from two1.bitcoin.utils import bytes_to_str
 from two1.bitcoin.utils import pack_compact_int
 from two1.bitcoin.utils import pack_u32
 from two1.bitcoin.utils import pack_u64
 from two1.bitcoin.utils import pack_var_str
-from two1.bitcoin.utils import unpack_compact_int
-from two1.bitcoin.utils import unpack_u32
-from two1.bitcoin.utils import unpack_u64
 
+# Profiling counters for memoized serialization: how many times a
+# Transaction was serialized or hashed, and how many times the memoized
+# bytes or hash were returned instead.
+serialization_stats = collections.Counter()
 
-class TransactionInput(object):
+# Number of inputs handed to each worker at a time by
+# Transaction.sign_inputs()
+SIGNING_CHUNK_SIZE = 16
+
+
+def _private_key_int(private_key):
+    """ Returns the integer of a PrivateKey or HDPrivateKey, which is
+        all a signing worker needs.
+    """
+    if isinstance(private_key, crypto.HDPrivateKey):
+        private_key = private_key._key
+    return private_key.key
+
+
+def _sign_digest(work):
+    """ Signs a digest in a worker of Transaction.sign_inputs().
+
+    Args:
+        work (tuple): The private key integer and the digest to sign.
+
+    Returns:
+        tuple: The r, s and recovery id of the signature.
+    """
+    k, digest = work
+    sig = crypto.PrivateKey(k).sign(digest, False)
+    return sig.r, sig.s, sig.recovery_id
+
+
+class _SerializedObject(object):
+    """ Base class for objects that memoize their serialization.
+
+        The serialized bytes are kept along with the serializations of
+        the child objects (scripts, inputs, outputs) they were built
+        from. They are dropped whenever one of SERIALIZED_FIELDS is set,
+        and rebuilt if any child's serialization has changed since.
+    """
+    SERIALIZED_FIELDS = ()
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in self.SERIALIZED_FIELDS:
+            super().__setattr__('_serialized', None)
+
+    def _memoize(self, parts, build):
+        """ Returns the memoized serialization if it was built from
+            exactly parts, otherwise build(parts).
+        """
+        cached = self.__dict__.get('_serialized')
+        if cached is not None and len(cached[0]) == len(parts) and \
+           all(a is b for a, b in zip(cached[0], parts)):
+            return cached[1]
+
+        b = build(parts)
+        super().__setattr__('_serialized', (parts, b))
+        return b
+
+    def _set_serialized(self, parts, b):
+        super().__setattr__('_serialized', (parts, b))
+
+
+class TransactionInput(_SerializedObject):
     """ See https://bitcoin.org/en/developer-reference#txin
 
     Args:
@@ -31,6 +93,7 @@ class TransactionInput(object):
            a Coinbase input)
         sequence_num (uint): Sequence number. Endianness: host
     """
+    SERIALIZED_FIELDS = ('outpoint', 'outpoint_index', 'script', 'sequence_num')
 
     @staticmethod
     def from_bytes(b):
@@ -44,18 +107,33 @@ class TransactionInput(object):
                  First element of the tuple is the TransactionInput
                  object and the second is the remaining byte stream.
         """
-        outpoint = b[0:32]
-        outpoint_index, b1 = unpack_u32(b[32:])
-        script, b1 = Script.from_bytes(b1)
-        sequence_num, b1 = unpack_u32(b1)
+        r = BytesReader(b)
+        return (TransactionInput.from_reader(r), r.remainder())
 
-        return (
-            TransactionInput(Hash(outpoint),
-                             outpoint_index,
-                             script,
-                             sequence_num),
-            b1
-        )
+    @staticmethod
+    def from_reader(r):
+        """ Deserializes a TransactionInput from a BytesReader, advancing
+        its offset past the input.
+
+        Args:
+            r (BytesReader): A reader positioned at the outpoint.
+
+        Returns:
+            TransactionInput: the deserialized input.
+        """
+        start = r.offset
+        outpoint = r.read(32)
+        outpoint_index = r.read_u32()
+        script = Script.from_reader(r)
+        sequence_num = r.read_u32()
+
+        inp = TransactionInput(Hash(outpoint),
+                               outpoint_index,
+                               script,
+                               sequence_num)
+        inp._set_serialized((bytes(script),), r.slice(start))
+
+        return inp
 
     def __init__(self, outpoint, outpoint_index, script, sequence_num):
         if not isinstance(outpoint, Hash):
@@ -95,10 +173,13 @@ class TransactionInput(object):
         Returns:
             b (bytes): byte stream containing the serialized input.
         """
+        return self._memoize((bytes(self.script),), self._build_bytes)
+
+    def _build_bytes(self, parts):
         return (
             bytes(self.outpoint) +
             pack_u32(self.outpoint_index) +
-            pack_var_str(bytes(self.script)) +
+            pack_var_str(parts[0]) +
             pack_u32(self.sequence_num)
         )
 
@@ -170,21 +251,17 @@ class CoinbaseInput(TransactionInput):
         Returns:
             b (bytes): byte stream containing the serialized coinbase input.
         """
-        return (
-            bytes(self.outpoint) +
-            pack_u32(self.outpoint_index) +
-            pack_var_str(self.script) +
-            pack_u32(self.sequence_num)
-        )
+        return self._memoize((self.script,), self._build_bytes)
 
 
-class TransactionOutput(object):
+class TransactionOutput(_SerializedObject):
     """ See https://bitcoin.org/en/developer-reference#txout
 
     Args:
         value (int): Number of satoshis to be spent. Endianness: host
         script (Script): A pay-out script.
     """
+    SERIALIZED_FIELDS = ('value', 'script')
 
     @staticmethod
     def from_bytes(b):
@@ -198,11 +275,28 @@ class TransactionOutput(object):
                 First element of the tuple is a TransactionOutput,
                 the second is the remainder of the byte stream.
         """
-        value, b0 = unpack_u64(b)
-        script_len, b0 = unpack_compact_int(b0)
+        r = BytesReader(b)
+        return (TransactionOutput.from_reader(r), r.remainder())
+
+    @staticmethod
+    def from_reader(r):
+        """ Deserializes a TransactionOutput from a BytesReader, advancing
+        its offset past the output.
+
+        Args:
+            r (BytesReader): A reader positioned at the value.
+
+        Returns:
+            TransactionOutput: the deserialized output.
+        """
+        start = r.offset
+        value = r.read_u64()
+        script = Script.from_reader(r)
 
-        return (TransactionOutput(value, Script(b0[:script_len])),
-                b0[script_len:])
+        out = TransactionOutput(value, script)
+        out._set_serialized((bytes(script),), r.slice(start))
+
+        return out
 
     def __init__(self, value, script):
         self.value = value
@@ -237,7 +331,10 @@ class TransactionOutput(object):
             b (bytes): byte stream containing the serialized
             transaction output.
         """
-        return pack_u64(self.value) + pack_var_str(bytes(self.script))
+        return self._memoize((bytes(self.script),), self._build_bytes)
+
+    def _build_bytes(self, parts):
+        return pack_u64(self.value) + pack_var_str(parts[0])
 
 
 class UnspentTransactionOutput(object):
@@ -278,7 +375,7 @@ class UnspentTransactionOutput(object):
         return self.num_confirmations >= 6
 
 
-class Transaction(object):
+class Transaction(_SerializedObject):
     """ See https://bitcoin.org/en/developer-reference#raw-transaction-format
 
     Args:
@@ -298,6 +395,8 @@ class Transaction(object):
     SIG_HASH_SINGLE = 0x03
     SIG_HASH_ANY = 0x80
 
+    SERIALIZED_FIELDS = ('version', 'inputs', 'outputs', 'lock_time')
+
     @staticmethod
     def from_bytes(b):
         """ Deserializes a byte stream into a Transaction.
@@ -310,30 +409,40 @@ class Transaction(object):
                 First element of the tuple is the Transaction,
                 second is the remainder of the byte stream.
         """
+        r = BytesReader(b)
+        return (Transaction.from_reader(r), r.remainder())
+
+    @staticmethod
+    def from_reader(r):
+        """ Deserializes a Transaction from a BytesReader, advancing its
+        offset past the transaction.
+
+        Args:
+            r (BytesReader): A reader positioned at the version.
+
+        Returns:
+            Transaction: the deserialized Transaction object.
+        """
+        start = r.offset
+
         # First 4 bytes are version
-        version = struct.unpack('<I', b[:4])[0]
-        b1 = b[4:]
+        version = r.read_u32()
 
         # Work on inputs
-        num_inputs, b1 = unpack_compact_int(b1)
-
-        inputs = []
-        for i in range(num_inputs):
-            inp, b1 = TransactionInput.from_bytes(b1)
-            inputs.append(inp)
+        num_inputs = r.read_compact_int()
+        inputs = [TransactionInput.from_reader(r) for i in range(num_inputs)]
 
         # Work on outputs
-        num_outputs, b1 = unpack_compact_int(b1)
-
-        outputs = []
-        for o in range(num_outputs):
-            out, b1 = TransactionOutput.from_bytes(b1)
-            outputs.append(out)
+        num_outputs = r.read_compact_int()
+        outputs = [TransactionOutput.from_reader(r) for o in range(num_outputs)]
 
         # Lock time
-        lock_time = struct.unpack('<I', b1[:4])[0]
+        lock_time = r.read_u32()
 
-        return (Transaction(version, inputs, outputs, lock_time), b1[4:])
+        txn = Transaction(version, inputs, outputs, lock_time)
+        txn._set_serialized(txn._serialized_parts(), r.slice(start))
+
+        return txn
 
     @staticmethod
     def from_hex(h):
@@ -354,6 +463,10 @@ class Transaction(object):
         self.outputs = outputs
         self.lock_time = lock_time
 
+        self._sighash_cache = None
+        self._hash = None
+        self._hex = None
+
     @property
     def num_inputs(self):
         """ The number of inputs in the transaction.
@@ -404,6 +517,139 @@ class Transaction(object):
 
         return new_txn
 
+    def _sighash_key(self):
+        """ Returns the values of every field that feeds the parts of
+            the signature preimage shared between inputs. Input scripts
+            are deliberately excluded since they are blanked out when
+            computing the signature hash. Outputs are keyed on their
+            (memoized) serialization, so replacing or editing a script
+            in place is picked up.
+        """
+        return (self.version,
+                self.lock_time,
+                tuple((bytes(i.outpoint), i.outpoint_index, i.sequence_num)
+                      for i in self.inputs),
+                tuple(bytes(o) for o in self.outputs))
+
+    def _sighash_parts(self):
+        """ Returns the serialized pieces of the transaction that are
+            shared by the signature preimages of all inputs, computing
+            them if the inputs or outputs have changed since the last call.
+
+            Blanked inputs (outpoint, empty script, sequence) are stored
+            as one contiguous byte string with an offset table so that
+            the preimage for a given input can be spliced together
+            without re-serializing the others.
+        """
+        key = self._sighash_key()
+        if self._sighash_cache is not None and self._sighash_cache[0] == key:
+            return self._sighash_cache[1]
+
+        outpoints = [bytes(i.outpoint) + pack_u32(i.outpoint_index)
+                     for i in self.inputs]
+        sequences = [pack_u32(i.sequence_num) for i in self.inputs]
+        outputs = list(key[3])
+
+        def blanked(seqs):
+            offsets = [0]
+            blobs = []
+            for op, seq in zip(outpoints, seqs):
+                blob = op + b'\x00' + seq
+                blobs.append(blob)
+                offsets.append(offsets[-1] + len(blob))
+            return b''.join(blobs), offsets
+
+        zero_seq = pack_u32(0)
+        parts = dict(
+            version=pack_u32(self.version),
+            num_inputs=pack_compact_int(len(self.inputs)),
+            outpoints=outpoints,
+            sequences=sequences,
+            outputs=outputs,
+            all_outputs=pack_compact_int(len(outputs)) + b''.join(outputs),
+            lock_time=pack_u32(self.lock_time),
+            # Blanked inputs keeping their sequence numbers (SIG_HASH_ALL)
+            # and with sequence numbers zeroed (SIG_HASH_NONE/SINGLE).
+            inputs=blanked(sequences),
+            inputs_zero_seq=blanked([zero_seq] * len(sequences)))
+
+        self._sighash_cache = (key, parts)
+        return parts
+
+    def _sighash_preimage(self, input_index, hash_type, sub_script):
+        """ Builds the byte string that is double-SHA256'd to produce the
+            signature hash for an input. This is byte-for-byte identical
+            to serializing the copy returned by _copy_for_sig(), but
+            without copying the transaction.
+        """
+        parts = self._sighash_parts()
+        base_type = hash_type & 0x1f
+        ht = pack_u32(hash_type)
+
+        if hash_type == self.SIG_HASH_ANY:
+            # Only the input being signed is kept, as-is.
+            return (parts['version'] +
+                    pack_compact_int(1) +
+                    bytes(self.inputs[input_index]) +
+                    parts['all_outputs'] +
+                    parts['lock_time'] +
+                    ht)
+
+        if base_type in [self.SIG_HASH_NONE, self.SIG_HASH_SINGLE]:
+            blob, offsets = parts['inputs_zero_seq']
+        else:
+            blob, offsets = parts['inputs']
+
+        inp = (parts['outpoints'][input_index] +
+               pack_var_str(bytes(sub_script)) +
+               parts['sequences'][input_index])
+
+        if base_type == self.SIG_HASH_NONE:
+            outputs = pack_compact_int(0)
+        elif base_type == self.SIG_HASH_SINGLE:
+            num_outputs = min(input_index + 1, len(parts['outputs']))
+            blank_output = pack_u64(0xffffffff) + b'\x00'
+            outputs = pack_compact_int(num_outputs) + blank_output * min(input_index, num_outputs)
+            if input_index < num_outputs:
+                outputs += parts['outputs'][input_index]
+        else:
+            outputs = parts['all_outputs']
+
+        return (parts['version'] +
+                parts['num_inputs'] +
+                blob[:offsets[input_index]] +
+                inp +
+                blob[offsets[input_index + 1]:] +
+                outputs +
+                parts['lock_time'] +
+                ht)
+
+    def get_sighash(self, input_index, hash_type, sub_script):
+        """ Computes the signature hash for an input.
+
+        The parts of the preimage that are shared between inputs are
+        serialized once per set of inputs/outputs and cached, so signing
+        or verifying every input of an N-input transaction does not
+        require N copies of the transaction. The cache is rebuilt
+        automatically if inputs or outputs change.
+
+        Args:
+            input_index (int): The index of the input being signed.
+            hash_type (int): What kind of signature hash to do.
+            sub_script (Script): The script that replaces the input's
+                signature script: the scriptPubKey of the UTXO being spent
+                for P2PKH, or the redeem script for P2SH.
+
+        Returns:
+            bytes: The double SHA-256 hash to sign or verify against.
+        """
+        if input_index < 0 or input_index >= len(self.inputs):
+            raise ValueError("Invalid input index.")
+
+        return bytes(Hash.dhash(self._sighash_preimage(input_index,
+                                                       hash_type,
+                                                       sub_script)))
+
     def _get_public_key_bytes(self, private_key, compressed=True):
         # In the case of extended keys (HDPublicKey), need to get
         # the underlying key and serialize that.
@@ -492,20 +738,20 @@ class Transaction(object):
             raise ValueError("Invalid input index.")
 
         tmp_script = sub_script.remove_op("OP_CODESEPARATOR")
+        msg_to_sign = self._get_message_to_sign(input_index, hash_type, tmp_script)
+
+        sig = private_key.sign(msg_to_sign, False)
+
+        return sig, msg_to_sign
+
+    def _get_message_to_sign(self, input_index, hash_type, tmp_script):
         if hash_type & 0x1f == self.SIG_HASH_SINGLE and len(self.inputs) > len(self.outputs):
             # This is to deal with the bug where specifying an index
             # that is out of range (wrt outputs) results in a
             # signature hash of 0x1 (little-endian)
-            msg_to_sign = 0x1.to_bytes(32, 'little')
-        else:
-            txn_copy = self._copy_for_sig(input_index, hash_type, tmp_script)
-
-            msg_to_sign = bytes(Hash.dhash(bytes(txn_copy) +
-                                           pack_u32(hash_type)))
+            return 0x1.to_bytes(32, 'little')
 
-        sig = private_key.sign(msg_to_sign, False)
-
-        return sig, msg_to_sign
+        return self.get_sighash(input_index, hash_type, tmp_script)
 
     def sign_input(self, input_index, hash_type, private_key, sub_script):
         """ Signs an input.
@@ -519,47 +765,89 @@ class Transaction(object):
                 utxo being spent if the outpoint is P2PKH or the redeem
                 script if the outpoint is P2SH.
         """
-        if input_index < 0 or input_index >= len(self.inputs):
-            raise ValueError("Invalid input index.")
+        return self.sign_inputs([(input_index, private_key, sub_script)],
+                                hash_type)
 
-        inp = self.inputs[input_index]
+    def sign_inputs(self, inputs, hash_type, executor=None):
+        """ Signs several inputs.
 
-        multisig = False
-        if sub_script.is_multisig_redeem():
-            multisig = True
-        elif not sub_script.is_p2pkh():
-            raise TypeError("Signing arbitrary redeem scripts is not currently supported.")
+        The signature hashes of all the inputs are computed before any
+        input script is changed, so the shared parts of the preimage are
+        only serialized once. The signatures themselves can then be
+        computed in parallel. Since nonces are derived deterministically
+        (RFC6979), the result is the same as calling sign_input() for
+        each input.
 
-        tmp_script = sub_script.remove_op("OP_CODESEPARATOR")
+        Args:
+            inputs (list(tuple)): (input_index, private_key, sub_script)
+                tuples, with the same meaning as the arguments of
+                sign_input().
+            hash_type (int): What kind of signature hash to do.
+            executor (concurrent.futures.Executor): If given, signatures
+                are computed in it. Signing is CPU bound, so this should
+                be a ProcessPoolExecutor.
 
-        # Before signing we should verify that the address in the
-        # sub_script corresponds to that of the private key
-        m = self._match_public_key(private_key, tmp_script)
-        if not m['match']:
-            if multisig:
-                msg = "Public key derived from private key does not match any of the public keys in redeem script."
-            else:
-                msg = "Address derived from private key does not match sub_script!"
-            raise ValueError(msg)
+        Returns:
+            bool: True if all the inputs were signed.
+        """
+        to_sign = []
+        matches = {}
+        for input_index, private_key, sub_script in inputs:
+            if input_index < 0 or input_index >= len(self.inputs):
+                raise ValueError("Invalid input index.")
+
+            multisig = False
+            if sub_script.is_multisig_redeem():
+                multisig = True
+            elif not sub_script.is_p2pkh():
+                raise TypeError("Signing arbitrary redeem scripts is not currently supported.")
+
+            tmp_script = sub_script.remove_op("OP_CODESEPARATOR")
+
+            # Before signing we should verify that the address in the
+            # sub_script corresponds to that of the private key
+            match_key = (id(private_key), bytes(tmp_script))
+            m = matches.get(match_key)
+            if m is None:
+                m = self._match_public_key(private_key, tmp_script)
+                matches[match_key] = m
+            if not m['match']:
+                if multisig:
+                    msg = "Public key derived from private key does not match any of the public keys in redeem script."
+                else:
+                    msg = "Address derived from private key does not match sub_script!"
+                raise ValueError(msg)
 
-        sig, signed_message = self.get_signature_for_input(
-            input_index, hash_type, private_key, sub_script)
+            to_sign.append((input_index, private_key, tmp_script, multisig, m,
+                            self._get_message_to_sign(input_index, hash_type, tmp_script)))
 
-        if multisig:
-            # For multisig, we need to determine if there are already
-            # signatures and if so, where we insert this signature
-            inp.script = self._do_multisig_script(
-                [dict(index=m['info']['multisig_key_index'],
-                      signature=sig)],
-                signed_message,
-                inp.script,
-                tmp_script,
-                hash_type)
+        if executor is None:
+            sigs = [private_key.sign(msg, False)
+                    for _, private_key, _, _, _, msg in to_sign]
         else:
-            pub_key_bytes = self._get_public_key_bytes(private_key,
-                                                       m['info']['compressed'])
-            inp.script = Script([sig.to_der() + pack_compact_int(hash_type),
-                                 pub_key_bytes])
+            work = [(_private_key_int(private_key), msg)
+                    for _, private_key, _, _, _, msg in to_sign]
+            sigs = [crypto.Signature(*rv)
+                    for rv in executor.map(_sign_digest, work,
+                                           chunksize=SIGNING_CHUNK_SIZE)]
+
+        for (input_index, private_key, tmp_script, multisig, m, msg), sig in zip(to_sign, sigs):
+            inp = self.inputs[input_index]
+            if multisig:
+                # For multisig, we need to determine if there are already
+                # signatures and if so, where we insert this signature
+                inp.script = self._do_multisig_script(
+                    [dict(index=m['info']['multisig_key_index'],
+                          signature=sig)],
+                    msg,
+                    inp.script,
+                    tmp_script,
+                    hash_type)
+            else:
+                pub_key_bytes = self._get_public_key_bytes(private_key,
+                                                           m['info']['compressed'])
+                inp.script = Script([sig.to_der() + pack_compact_int(hash_type),
+                                     pub_key_bytes])
 
         return True
 
@@ -632,11 +920,13 @@ class Transaction(object):
     def _match_sigs_to_pub_keys(self, sigs, pub_keys, message):
         sig_indices = {}
         for sig in sigs:
-            for i, pub_key in enumerate(pub_keys):
-                if i in sig_indices:
-                    continue
+            # Check the sig against all unmatched keys in one batch
+            unmatched = [i for i in range(len(pub_keys)) if i not in sig_indices]
+            verified = crypto.PublicKey.verify_batch(
+                [(pub_keys[i], message, sig) for i in unmatched], False)
 
-                if pub_key.verify(message, sig, False):
+            for i, v in zip(unmatched, verified):
+                if v:
                     sig_indices[i] = sig
 
         return sig_indices
@@ -671,14 +961,54 @@ class Transaction(object):
         """
         return self._verify_input(input_index, sub_script, True)
 
-    def _verify_input(self, input_index, sub_script, partial_multisig=False):
+    def verify_input_signatures(self, sub_scripts):
+        """ Verifies the signatures for all inputs.
+
+        This is equivalent to calling verify_input_signature() for each
+        input, except that the signature checks for all inputs are
+        first collected and verified in a single batch.
+
+        Args:
+            sub_scripts (list(Script)): The scripts in the corresponding
+                outpoints, one per input.
+
+        Returns:
+            list(bool): Whether each input's sigScript is verified.
+        """
+        if len(sub_scripts) != len(self.inputs):
+            raise ValueError("There must be exactly one sub_script per input.")
+
+        # Run every input with signature checks deferred to collect
+        # them, verify them all at once and then run the inputs for
+        # real against the results. Any check that wasn't collected
+        # up front (e.g. because a deferred check would have failed
+        # and changed the flow of a script) is verified as it comes.
+        sig_cache = {}
+        for i, sub_script in enumerate(sub_scripts):
+            self._verify_input(i, sub_script,
+                               sig_cache=sig_cache, defer_sigs=True)
+
+        pending = [(k, v) for k, v in sig_cache.items()
+                   if not isinstance(v, bool)]
+        verified = crypto.PublicKey.verify_batch([c for k, c in pending],
+                                                 False)
+        for (k, c), v in zip(pending, verified):
+            sig_cache[k] = v
+
+        return [self._verify_input(i, sub_script, sig_cache=sig_cache)
+                for i, sub_script in enumerate(sub_scripts)]
+
+    def _verify_input(self, input_index, sub_script, partial_multisig=False,
+                      sig_cache=None, defer_sigs=False):
         p2sh = sub_script.is_p2sh()
 
         sig_script = self.inputs[input_index].script
 
         si = ScriptInterpreter(txn=self,
                                input_index=input_index,
-                               sub_script=sub_script)
+                               sub_script=sub_script,
+                               sig_cache=sig_cache,
+                               defer_sigs=defer_sigs)
         try:
             si.run_script(sig_script)
         except ScriptInterpreterError:
@@ -770,23 +1100,46 @@ class Transaction(object):
         Returns:
             b (bytes): The serialized transaction.
         """
+        cached = self.__dict__.get('_serialized')
+        b = self._memoize(self._serialized_parts(), self._build_bytes)
+        if cached is not None and cached[1] is b:
+            serialization_stats['serialization_reused'] += 1
+        else:
+            serialization_stats['serialized'] += 1
+
+        return b
+
+    def _serialized_parts(self):
+        return tuple(bytes(i) for i in self.inputs) + tuple(bytes(o) for o in self.outputs)
+
+    def _build_bytes(self, parts):
         return (
             pack_u32(self.version) +                      # Version
             pack_compact_int(self.num_inputs) +           # Input count
-            b''.join([bytes(i) for i in self.inputs]) +   # Inputs
+            b''.join(parts[:self.num_inputs]) +           # Inputs
             pack_compact_int(self.num_outputs) +          # Output count
-            b''.join([bytes(o) for o in self.outputs]) +  # Outputs
+            b''.join(parts[self.num_inputs:]) +           # Outputs
             pack_u32(self.lock_time)                      # Lock time
         )
 
     @property
     def hash(self):
-        """ Computes the hash of the transaction.
+        """ Computes the hash of the transaction. The hash is memoized
+        along with the serialization it was computed from.
 
         Returns:
             dhash (bytes): Double SHA-256 hash of the serialized transaction.
         """
-        return Hash.dhash(bytes(self))
+        b = bytes(self)
+        cached = self.__dict__.get('_hash')
+        if cached is not None and cached[0] is b:
+            serialization_stats['hash_reused'] += 1
+            return cached[1]
+
+        serialization_stats['hashed'] += 1
+        h = Hash.dhash(b)
+        self._hash = (b, h)
+        return h
 
     def to_hex(self):
         """ Generates a hex encoding of the serialized transaction.
@@ -794,7 +1147,12 @@ class Transaction(object):
         Returns:
             str: Hex-encoded serialization.
         """
-        return bytes_to_str(bytes(self))
+        b = bytes(self)
+        cached = self.__dict__.get('_hex')
+        if cached is None or cached[0] is not b:
+            cached = self._hex = (b, bytes_to_str(b))
+
+        return cached[1]
 
     def get_addresses(self, testnet=False):
         """ Returns all addresses associated with this transaction.
@@ -8,6 +8,8 @@ import random
 import struct
 import os
 
+from two1.bitcoin.exceptions import DeserializationError
+
 MAX_TARGET = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
 
 
@@ -87,6 +89,122 @@ def render_int(n):
     return bytes(r)
 
 
+class BytesReader(object):
+    """ Cursor over a byte stream used for deserializing Bitcoin objects.
+
+    Rather than slicing off the consumed portion of the stream after every
+    field (which copies the remainder each time and makes parsing quadratic
+    in the size of the input), a BytesReader wraps the stream in a
+    memoryview and advances a read offset. Only the fields themselves are
+    copied out.
+
+    Args:
+        b (bytes or bytearray or memoryview): The byte stream to read from.
+        offset (int): Position in b at which to start reading.
+    """
+
+    def __init__(self, b, offset=0):
+        self._view = memoryview(b)
+        self._len = len(self._view)
+        self.offset = offset
+
+    def __len__(self):
+        """ Returns the number of bytes remaining in the stream.
+        """
+        return self._len - self.offset
+
+    def _advance(self, n):
+        start = self.offset
+        end = start + n
+        if n < 0 or end > self._len:
+            raise DeserializationError(
+                "Attempted to read %d bytes with only %d remaining." %
+                (n, self._len - start))
+        self.offset = end
+        return start
+
+    def read(self, n):
+        """ Reads n bytes from the stream.
+
+        Args:
+            n (int): Number of bytes to read.
+
+        Returns:
+            b (bytes): The n bytes following the current offset.
+        """
+        start = self._advance(n)
+        return self._view[start:self.offset].tobytes()
+
+    def read_u8(self):
+        """ Reads a single unsigned byte from the stream.
+
+        Returns:
+            i (int): The deserialized integer.
+        """
+        return self._view[self._advance(1)]
+
+    def read_u32(self):
+        """ Reads a 32-bit little-endian integer from the stream.
+
+        Returns:
+            i (int): The deserialized integer.
+        """
+        return struct.unpack_from('<I', self._view, self._advance(4))[0]
+
+    def read_u64(self):
+        """ Reads a 64-bit little-endian integer from the stream.
+
+        Returns:
+            i (int): The deserialized integer.
+        """
+        return struct.unpack_from('<Q', self._view, self._advance(8))[0]
+
+    def read_compact_int(self):
+        """ Reads a compact-size unsigned integer from the stream. See
+        https://bitcoin.org/en/developer-reference#compactsize-unsigned-integers
+
+        Returns:
+            i (int): The deserialized integer.
+        """
+        b0 = self.read_u8()
+        if b0 < 0xfd:
+            return b0
+        elif b0 == 0xfd:
+            return struct.unpack_from('<H', self._view, self._advance(2))[0]
+        elif b0 == 0xfe:
+            return struct.unpack_from('<I', self._view, self._advance(4))[0]
+        else:
+            return struct.unpack_from('<Q', self._view, self._advance(8))[0]
+
+    def read_var_str(self):
+        """ Reads a variable length byte stream (length-prefixed with a
+        compact int) from the stream.
+
+        Returns:
+            s (bytes): The variable length byte stream.
+        """
+        return self.read(self.read_compact_int())
+
+    def slice(self, start):
+        """ Returns the bytes read since a previous offset.
+
+        Args:
+            start (int): An earlier value of self.offset.
+
+        Returns:
+            b (bytes): All bytes from start up to the current offset.
+        """
+        return self._view[start:self.offset].tobytes()
+
+    def remainder(self):
+        """ Returns the unread portion of the stream.
+
+        Returns:
+            b (bytes): All bytes following the current offset.
+        """
+        return self._view[self.offset:].tobytes()
+
+
 def pack_compact_int(i):
     """ See
     https://bitcoin.org/en/developer-reference#compactsize-unsigned-integers
@@ -118,18 +236,8 @@ def unpack_compact_int(bytestr):
     Returns:
         n (int): deserialized integer.
     """
-
-    b0 = bytestr[0]
-    if b0 < 0xfd:
-        return (b0, bytestr[1:])
-    elif b0 == 0xfd:
-        return (struct.unpack('<H', bytestr[1:3])[0], bytestr[3:])
-    elif b0 == 0xfe:
-        return (struct.unpack('<I', bytestr[1:5])[0], bytestr[5:])
-    elif b0 == 0xff:
-        return (struct.unpack('<Q', bytestr[1:9])[0], bytestr[9:])
-    else:
-        return None
+    r = BytesReader(bytestr)
+    return (r.read_compact_int(), r.remainder())
 
 
 def pack_u32(i):
@@ -154,8 +262,8 @@ def unpack_u32(b):
         (i, b) (tuple): A tuple containing the deserialized integer and the
         remainder of the byte stream.
     """
-    u32 = struct.unpack('<I', b[0:4])
-    return (u32[0], b[4:])
+    r = BytesReader(b)
+    return (r.read_u32(), r.remainder())
 
 
 def pack_u64(i):
@@ -180,8 +288,8 @@ def unpack_u64(b):
         (i, b) (tuple): A tuple containing the deserialized integer and the
         remainder of the byte stream.
     """
-    u64 = struct.unpack('<Q', b[0:8])
-    return (u64[0], b[8:])
+    r = BytesReader(b)
+    return (r.read_u64(), r.remainder())
 
 
 def pack_var_str(s):
@@ -207,8 +315,8 @@ def unpack_var_str(b):
         (s, b) (tuple): A tuple containing the variable length byte stream
         and the remainder of the input byte stream.
     """
-    strlen, b0 = unpack_compact_int(b)
-    return (b0[:strlen], b0[strlen:])
+    r = BytesReader(b)
+    return (r.read_var_str(), r.remainder())
 
 
 def bits_to_target(bits):
@@ -2,6 +2,7 @@
 import os
 import time
 import sqlite3
+import threading
 import collections
 from two1.bitcoin import Transaction
 
@@ -64,6 +65,22 @@ class ChannelDatabase:
         """
         raise NotImplementedError()
 
+    def lookup_open(self):
+        """Look up all payment channels that aren't closed.
+
+        The default implementation filters the result of lookup().
+
+        Returns:
+            list: Channel named tuples, with `deposit_tx` and `payment_tx`
+                as Transaction objects.
+        """
+        channels = self.lookup()
+        if channels is None:
+            return []
+        elif isinstance(channels, Channel):
+            channels = [channels]
+        return [ch for ch in channels if ch.state != 'closed']
+
     def update_payment(self, deposit_txid, payment_tx, payment_amount):
         """Update a payment channel with a new payment transaction.
 
@@ -84,6 +101,19 @@ class ChannelDatabase:
         """
         raise NotImplementedError()
 
+    def update_states(self, new_states):
+        """Update the state of a number of payment channels at once.
+
+        Channels that have been closed in the meantime keep their state.
+        The default implementation calls update_state() for each channel.
+
+        Args:
+            new_states (dict): new state for each channel, keyed by
+                deposit txid.
+        """
+        for deposit_txid, new_state in new_states.items():
+            self.update_state(deposit_txid, new_state)
+
 
 class PaymentDatabase:
 
@@ -182,6 +212,14 @@ class ChannelDjango(ChannelDatabase):
         # Return a single record or list of records
         return records if len(records) > 1 else records[0]
 
+    def lookup_open(self):
+        """Look up all payment channels that aren't closed."""
+        return [Channel(rec.deposit_txid, rec.state, Transaction.from_hex(rec.deposit_tx),
+                        Transaction.from_hex(rec.payment_tx) if rec.payment_tx else None,
+                        rec.merchant_pubkey, rec.created_at, rec.expires_at,
+                        rec.amount, rec.last_payment_amount)
+                for rec in self.Channel.objects.exclude(state=ChannelDjango.CLOSED)]
+
     def update_payment(self, deposit_txid, payment_tx, payment_amount):
         """Update a payment channel with a new payment transaction."""
         self.Channel.objects.filter(deposit_txid=deposit_txid).update(
@@ -191,6 +229,14 @@ class ChannelDjango(ChannelDatabase):
         """Update payment channel state."""
         self.Channel.objects.filter(deposit_txid=deposit_txid).update(state=new_state)
 
+    def update_states(self, new_states):
+        """Update the state of a number of payment channels at once."""
+        from django.db import transaction
+        with transaction.atomic():
+            for deposit_txid, new_state in new_states.items():
+                self.Channel.objects.filter(deposit_txid=deposit_txid).exclude(
+                    state=ChannelDjango.CLOSED).update(state=new_state)
+
 
 class PaymentDjango(ChannelDatabase):
 
@@ -227,7 +273,12 @@ class PaymentDjango(ChannelDatabase):
 
 class DatabaseSQLite3(ChannelDataManager):
 
-    """Default payment channel data bindings when no data service is provided."""
+    """Default payment channel data bindings when no data service is provided.
+
+    The bindings share one connection and cursor, which `lock` guards
+    for the duration of each query, as the payment server runs requests
+    on different channels concurrently.
+    """
 
     DEFAULT_PAYMENT_DB_DIR = os.path.expanduser('~/.two1/payment/')
     DEFAULT_PAYMENT_DB_PATH = 'payment.sqlite3'
@@ -241,6 +292,7 @@ class DatabaseSQLite3(ChannelDataManager):
             os.makedirs(db_dir)
         self.connection = sqlite3.connect(os.path.join(db_dir, db), check_same_thread=False)
         self.c = self.connection.cursor()
+        self.lock = threading.Lock()
         self.pc = ChannelSQLite3(self)
         self.pmt = PaymentSQLite3(self)
 
@@ -257,6 +309,7 @@ class ChannelSQLite3(ChannelDatabase):
         """Instantiate SQLite3 for storing channel transaction data."""
         self.c = db.c
         self.connection = db.connection
+        self.lock = db.lock
         self.c.execute("CREATE TABLE IF NOT EXISTS 'payment_channel' "
                        "(deposit_txid text unique, state text, "
                        "deposit_tx text, payment_tx text, "
@@ -267,21 +320,23 @@ class ChannelSQLite3(ChannelDatabase):
     def create(self, deposit_tx, merch_pubkey, amount, expiration):
         """Create a payment channel entry."""
         insert = 'INSERT INTO payment_channel VALUES (?' + ',?' * 8 + ')'
-        self.c.execute(insert, (str(deposit_tx.hash), ChannelSQLite3.CONFIRMING,
-                                deposit_tx.to_hex(), None, merch_pubkey,
-                                time.time(), expiration, amount, 0))
-        self.connection.commit()
+        with self.lock:
+            self.c.execute(insert, (str(deposit_tx.hash), ChannelSQLite3.CONFIRMING,
+                                    deposit_tx.to_hex(), None, merch_pubkey,
+                                    time.time(), expiration, amount, 0))
+            self.connection.commit()
 
     def lookup(self, deposit_txid=None):
         """Look up a payment channel entry by deposit txid."""
         # Check whether to query a single channel or all
-        if not deposit_txid:
-            self.c.execute('SELECT * FROM payment_channel')
-            query = self.c.fetchall()
-        else:
-            select = 'SELECT * FROM payment_channel WHERE deposit_txid=?'
-            self.c.execute(select, (deposit_txid,))
-            query = [self.c.fetchone()]
+        with self.lock:
+            if not deposit_txid:
+                self.c.execute('SELECT * FROM payment_channel')
+                query = self.c.fetchall()
+            else:
+                select = 'SELECT * FROM payment_channel WHERE deposit_txid=?'
+                self.c.execute(select, (deposit_txid,))
+                query = [self.c.fetchone()]
         if not len(query) or not query[0]:
             return None
 
@@ -296,18 +351,43 @@ class ChannelSQLite3(ChannelDatabase):
         # Return a single record or list of records
         return records if len(records) > 1 else records[0]
 
+    def lookup_open(self):
+        """Look up all payment channels that aren't closed."""
+        select = 'SELECT * FROM payment_channel WHERE state!=?'
+        with self.lock:
+            self.c.execute(select, (ChannelSQLite3.CLOSED,))
+            query = self.c.fetchall()
+
+        records = []
+        for rec in query:
+            record = list(rec)
+            record[2] = Transaction.from_hex(record[2])
+            record[3] = Transaction.from_hex(record[3]) if record[3] else None
+            records.append(Channel(*record))
+        return records
+
     def update_payment(self, deposit_txid, payment_tx, payment_amount):
         """Update a payment channel with a new payment transaction."""
         update = ('UPDATE payment_channel SET payment_tx=?,'
                   'last_payment_amount=? WHERE deposit_txid=?')
-        self.c.execute(update, (payment_tx.to_hex(), payment_amount, deposit_txid))
-        self.connection.commit()
+        with self.lock:
+            self.c.execute(update, (payment_tx.to_hex(), payment_amount, deposit_txid))
+            self.connection.commit()
 
     def update_state(self, deposit_txid, new_state):
         """Update payment channel state."""
         update = 'UPDATE payment_channel SET state=? WHERE deposit_txid=?'
-        self.c.execute(update, (new_state, deposit_txid))
-        self.connection.commit()
+        with self.lock:
+            self.c.execute(update, (new_state, deposit_txid))
+            self.connection.commit()
+
+    def update_states(self, new_states):
+        """Update the state of a number of payment channels at once."""
+        update = 'UPDATE payment_channel SET state=? WHERE deposit_txid=? AND state!=?'
+        with self.lock:
+            self.c.executemany(update, [(new_state, deposit_txid, ChannelSQLite3.CLOSED)
+                                        for deposit_txid, new_state in new_states.items()])
+            self.connection.commit()
 
 
 class PaymentSQLite3(PaymentDatabase):
@@ -321,6 +401,7 @@ class PaymentSQLite3(PaymentDatabase):
         """Instantiate SQLite3 for storing channel payment data."""
         self.c = db.c
         self.connection = db.connection
+        self.lock = db.lock
         self.c.execute("CREATE TABLE IF NOT EXISTS 'payment_channel_spend' "
                        "(payment_txid text unique, payment_tx text, "
                        "amount integer, is_redeemed integer, "
@@ -329,15 +410,17 @@ class PaymentSQLite3(PaymentDatabase):
     def create(self, deposit_txid, payment_tx, amount):
         """Create a payment entry."""
         insert = 'INSERT INTO payment_channel_spend VALUES (?,?,?,?,?)'
-        self.c.execute(insert, (str(payment_tx.hash), payment_tx.to_hex(), amount,
-                                PaymentSQLite3.NOT_REDEEMED, deposit_txid))
-        self.connection.commit()
+        with self.lock:
+            self.c.execute(insert, (str(payment_tx.hash), payment_tx.to_hex(), amount,
+                                    PaymentSQLite3.NOT_REDEEMED, deposit_txid))
+            self.connection.commit()
 
     def lookup(self, payment_txid):
         """Look up a payment entry by deposit txid."""
         select = 'SELECT * FROM payment_channel_spend WHERE payment_txid=?'
-        self.c.execute(select, (payment_txid,))
-        rv = self.c.fetchone()
+        with self.lock:
+            self.c.execute(select, (payment_txid,))
+            rv = self.c.fetchone()
         if rv is None:
             return rv
         channel = list(rv)
@@ -349,10 +432,11 @@ class PaymentSQLite3(PaymentDatabase):
         """Update payment entry to be redeemed."""
         update = ('UPDATE payment_channel_spend SET is_redeemed=? '
                   'WHERE payment_txid=? AND is_redeemed=0')
-        self.c.execute(update, (PaymentSQLite3.WAS_REDEEMED, payment_txid))
-        self.connection.commit()
-        # Return whether or not we successfully redeemed the payment
-        return True if self.c.rowcount == 1 else False
+        with self.lock:
+            self.c.execute(update, (PaymentSQLite3.WAS_REDEEMED, payment_txid))
+            self.connection.commit()
+            # Return whether or not we successfully redeemed the payment
+            return True if self.c.rowcount == 1 else False
 
 
 ##############################################################################
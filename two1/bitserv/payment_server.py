@@ -3,15 +3,15 @@ import os
 import time
 import codecs
 import threading
-import contextlib
+import collections
 
-from two1.bitcoin.utils import pack_u32
-from two1.bitcoin import Transaction, Hash, Signature, Script
+from two1.bitcoin import Transaction, Signature, Script
+from two1.blockchain.concurrent_fetcher import ConcurrentFetcher
 from two1.channels.statemachine import PaymentChannelRedeemScript
 from two1.channels.blockchain import TwentyOneBlockchain
 
 from .wallet import Two1WalletWrapper
-from .models import DatabaseSQLite3, ChannelSQLite3, Channel
+from .models import DatabaseSQLite3, ChannelSQLite3
 
 
 class PaymentServerError(Exception):
@@ -44,19 +44,28 @@ class TransactionVerificationError(PaymentServerError):
     pass
 
 
-class Lock(contextlib.ContextDecorator):
+class ChannelLock:
 
-    """An inter-thread lock decorator."""
+    """Striped inter-thread locks for payment channels.
 
-    def __init__(self):
-        """Return a new Lock instance."""
-        self.tlock = threading.Lock()
+    Each channel maps to one of a fixed number of locks by its deposit
+    txid, so that operations on the same channel are serialized while
+    those on different channels can run in parallel.
+    """
+
+    STRIPES = 64
+
+    def __init__(self, stripes=STRIPES):
+        """Return a new ChannelLock instance."""
+        self.tlocks = [threading.Lock() for _ in range(stripes)]
 
-    def __enter__(self):
-        self.tlock.acquire()
+    def index(self, deposit_txid):
+        """Return the index of the lock for a channel."""
+        return hash(deposit_txid) % len(self.tlocks)
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.tlock.release()
+    def __call__(self, deposit_txid):
+        """Return the lock for a channel."""
+        return self.tlocks[self.index(deposit_txid)]
 
 
 class PaymentServer:
@@ -91,8 +100,8 @@ class PaymentServer:
     PROTOCOL_VERSION = 2
     """Payment channel protocol version."""
 
-    lock = Lock()
-    """Thread and process lock for database access."""
+    lock = ChannelLock()
+    """Per-channel thread locks for database access."""
 
     def __init__(self, wallet, db=None, account='default', testnet=False,
                  blockchain=None, zeroconf=False, sync_period=600, db_dir=None):
@@ -124,6 +133,7 @@ class PaymentServer:
             self._blockchain = TwentyOneBlockchain(
                 PaymentServer.DEFAULT_TWENTYONE_BLOCKCHAIN_URL if not self._wallet._wallet.testnet else
                 PaymentServer.DEFAULT_TWENTYONE_TESTNET_BLOCKCHAIN_URL)
+        self._fetcher = ConcurrentFetcher()
         self._sync_stop = threading.Event()
         self._sync_thread = threading.Thread(target=self._auto_sync, args=(sync_period, self._sync_stop), daemon=True)
         self._sync_thread.start()
@@ -138,7 +148,6 @@ class PaymentServer:
                     version=self.PROTOCOL_VERSION,
                     zeroconf=self.zeroconf)
 
-    @lock
     def open(self, deposit_tx, redeem_script):
         """Open a payment channel.
 
@@ -169,25 +178,25 @@ class PaymentServer:
         if not valid_merchant_public_key:
             raise BadTransactionError('Public key does not belong to the merchant.')
 
-        # Verify that the deposit is not already part of a payment channel
-        if self._db.pc.lookup(deposit_txid):
-            raise BadTransactionError('That deposit has already been used to create a channel.')
+        with self.lock(deposit_txid):
+            # Verify that the deposit is not already part of a payment channel
+            if self._db.pc.lookup(deposit_txid):
+                raise BadTransactionError('That deposit has already been used to create a channel.')
 
-        # Verify that the lock time is an allowable amount in the future
-        minimum_locktime = int(time.time()) + self.MIN_EXP_TIME
-        if redeem_script.expiration_time < minimum_locktime:
-            raise TransactionVerificationError('Transaction locktime must be further in the future.')
+            # Verify that the lock time is an allowable amount in the future
+            minimum_locktime = int(time.time()) + self.MIN_EXP_TIME
+            if redeem_script.expiration_time < minimum_locktime:
+                raise TransactionVerificationError('Transaction locktime must be further in the future.')
 
-        # Open and save the payment channel
-        self._db.pc.create(deposit_tx, merch_pubkey, amount, redeem_script.expiration_time)
+            # Open and save the payment channel
+            self._db.pc.create(deposit_tx, merch_pubkey, amount, redeem_script.expiration_time)
 
-        # Set the channel to `ready` if zeroconf is enabled
-        if self.zeroconf:
-            self._db.pc.update_state(deposit_txid, ChannelSQLite3.READY)
+            # Set the channel to `ready` if zeroconf is enabled
+            if self.zeroconf:
+                self._db.pc.update_state(deposit_txid, ChannelSQLite3.READY)
 
         return str(deposit_tx.hash)
 
-    @lock
     def receive_payment(self, deposit_txid, payment_tx):
         """Receive and process a payment within the channel.
 
@@ -208,6 +217,11 @@ class PaymentServer:
         # Parse payment channel `payment` parameters
         payment_tx = Transaction.from_hex(payment_tx)
 
+        with self.lock(deposit_txid):
+            return self._receive_payment(deposit_txid, payment_tx)
+
+    def _receive_payment(self, deposit_txid, payment_tx):
+        """Process a payment, holding the channel's lock."""
         # Get channel and addresses related to the deposit
         channel = self._db.pc.lookup(deposit_txid)
 
@@ -219,8 +233,7 @@ class PaymentServer:
         merch_pubkey = redeem_script.merchant_public_key
 
         # Verify that the payment has a valid signature from the customer
-        txn_copy = payment_tx._copy_for_sig(0, Transaction.SIG_HASH_ALL, redeem_script)
-        msg_to_sign = bytes(Hash.dhash(bytes(txn_copy) + pack_u32(Transaction.SIG_HASH_ALL)))
+        msg_to_sign = payment_tx.get_sighash(0, Transaction.SIG_HASH_ALL, redeem_script)
         sig = Signature.from_der(payment_tx.inputs[0].script[0][:-1])
         if not redeem_script.customer_public_key.verify(msg_to_sign, sig, False):
             raise BadTransactionError('Invalid payment signature.')
@@ -294,7 +307,6 @@ class PaymentServer:
                     balance=channel.last_payment_amount,
                     time_left=channel.expires_at)
 
-    @lock
     def close(self, deposit_txid, deposit_txid_signature):
         """Close a payment channel.
 
@@ -305,6 +317,11 @@ class PaymentServer:
                 consisting solely of the deposit_txid to verify the
                 authenticity of the close request.
         """
+        with self.lock(deposit_txid):
+            return self._close(deposit_txid, deposit_txid_signature)
+
+    def _close(self, deposit_txid, deposit_txid_signature):
+        """Close a payment channel, holding its lock."""
         channel = self._db.pc.lookup(deposit_txid)
 
         # Verify that the requested channel exists
@@ -341,7 +358,6 @@ class PaymentServer:
 
         return str(payment_tx.hash)
 
-    @lock
     def redeem(self, payment_txid):
         """Determine the validity and amount of a payment.
 
@@ -360,67 +376,105 @@ class PaymentServer:
         if not payment:
             raise PaymentChannelNotFoundError('Payment not found.')
 
-        # Verify that this payment exists within a channel
-        channel = self._db.pc.lookup(payment.deposit_txid)
-        if not channel:
-            raise PaymentChannelNotFoundError('Channel not found.')
+        with self.lock(payment.deposit_txid):
+            # Verify that this payment exists within a channel
+            channel = self._db.pc.lookup(payment.deposit_txid)
+            if not channel:
+                raise PaymentChannelNotFoundError('Channel not found.')
 
-        # Verify that the payment channel is ready
-        if channel.state == ChannelSQLite3.CONFIRMING:
-            raise ChannelClosedError('Payment channel not ready.')
-        elif channel.state == ChannelSQLite3.CLOSED:
-            raise ChannelClosedError('Payment channel closed.')
+            # Verify that the payment channel is ready
+            if channel.state == ChannelSQLite3.CONFIRMING:
+                raise ChannelClosedError('Payment channel not ready.')
+            elif channel.state == ChannelSQLite3.CLOSED:
+                raise ChannelClosedError('Payment channel closed.')
 
-        # Calculate and redeem the current payment
-        redeem_success = self._db.pmt.redeem(payment_txid)
+            # Calculate and redeem the current payment
+            redeem_success = self._db.pmt.redeem(payment_txid)
 
         # Verify that the payment has not already been redeemed
         if not redeem_success:
             raise RedeemPaymentError('Payment already redeemed.')
         return payment.amount
 
-    @lock
     def sync(self):
-        """Sync the state of all payment channels."""
-        # Look up all channels
-        channel_query = self._db.pc.lookup()
+        """Sync the state of all payment channels.
 
-        # Check whether the return result is a single Channel or list
-        if isinstance(channel_query, Channel):
-            payment_channels = [channel_query]
-        else:
-            payment_channels = channel_query
+        Open channels are read and their deposits looked up on the
+        blockchain, all at once, without holding any channel locks. The
+        new states are then written with one transaction per lock, taking
+        the locks one at a time, and channels about to expire are closed
+        holding their own lock.
+        """
+        # Look up all open channels
+        payment_channels = self._db.pc.lookup_open()
 
         # Return if there are no payment channels to sync
         if not payment_channels:
             return
 
-        for pc in payment_channels:
-
-            # Skip sync if channel is closed
-            if pc.state == ChannelSQLite3.CLOSED:
-                continue
-
-            # Check for deposit confirmation
-            if pc.state == ChannelSQLite3.CONFIRMING and self._blockchain.check_confirmed(pc.deposit_txid):
-                self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.READY)
+        # Check for deposit confirmations
+        confirming = [pc.deposit_txid for pc in payment_channels if pc.state == ChannelSQLite3.CONFIRMING]
+        confirmed = self._check_confirmed(confirming)
 
-            # Check if channel got closed
-            if pc.state in (ChannelSQLite3.CONFIRMING, ChannelSQLite3.READY) and pc.payment_tx:
+        # Check if channels got closed, by their deposit being spent
+        outpoints = {}
+        for pc in payment_channels:
+            if pc.payment_tx:
                 redeem_script = PaymentChannelRedeemScript.from_bytes(pc.payment_tx.inputs[0].script[-1])
                 deposit_tx_utxo_index = pc.deposit_tx.output_index_for_address(redeem_script.hash160())
-                spend_txid = self._blockchain.lookup_spend_txid(pc.deposit_txid, deposit_tx_utxo_index)
-                if spend_txid:
-                    self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.CLOSED)
+                outpoints[pc.deposit_txid] = (pc.deposit_txid, deposit_tx_utxo_index)
+        spend_txids = self._lookup_spend_txids(list(outpoints.values()))
+
+        new_states = {}
+        expiring = []
+        for pc in payment_channels:
+            if pc.deposit_txid in outpoints and spend_txids[outpoints[pc.deposit_txid]]:
+                new_states[pc.deposit_txid] = ChannelSQLite3.CLOSED
+                continue
+            elif confirmed.get(pc.deposit_txid):
+                new_states[pc.deposit_txid] = ChannelSQLite3.READY
 
             # Check for channel expiration
-            if pc.state != ChannelSQLite3.CLOSED:
-                if time.time() + PaymentServer.EXP_TIME_BUFFER > pc.expires_at and pc.payment_tx:
-                    redeem_script = PaymentChannelRedeemScript.from_bytes(pc.payment_tx.inputs[0].script[-1])
-                    self._wallet.sign_half_signed_payment(pc.payment_tx, redeem_script)
-                    self._blockchain.broadcast_tx(pc.payment_tx.to_hex())
-                    self._db.pc.update_payment(pc.deposit_txid, pc.payment_tx, pc.last_payment_amount)
-                    self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.CLOSED)
+            if time.time() + PaymentServer.EXP_TIME_BUFFER > pc.expires_at and pc.payment_tx:
+                expiring.append(pc.deposit_txid)
+
+        new_states_by_lock = collections.defaultdict(dict)
+        for deposit_txid, new_state in new_states.items():
+            new_states_by_lock[self.lock.index(deposit_txid)][deposit_txid] = new_state
+        for index, states in new_states_by_lock.items():
+            with self.lock.tlocks[index]:
+                self._db.pc.update_states(states)
+
+        # Close expiring channels with their latest payment, which may
+        # have been made since they were read
+        for deposit_txid in expiring:
+            with self.lock(deposit_txid):
+                pc = self._db.pc.lookup(deposit_txid)
+                if pc.state == ChannelSQLite3.CLOSED:
+                    continue
+                redeem_script = PaymentChannelRedeemScript.from_bytes(pc.payment_tx.inputs[0].script[-1])
+                self._wallet.sign_half_signed_payment(pc.payment_tx, redeem_script)
+                self._blockchain.broadcast_tx(pc.payment_tx.to_hex())
+                self._db.pc.update_payment(pc.deposit_txid, pc.payment_tx, pc.last_payment_amount)
+                self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.CLOSED)
+
+    def _check_confirmed(self, txids):
+        """Check which deposits are confirmed, in one batch if the
+        blockchain supports it or concurrently otherwise."""
+        if not txids:
+            return {}
+        elif hasattr(self._blockchain, 'check_confirmed_many'):
+            return self._blockchain.check_confirmed_many(txids)
+        return dict(zip(txids, self._fetcher.map(self._blockchain.check_confirmed, txids)))
+
+    def _lookup_spend_txids(self, outpoints):
+        """Look up the transactions spending deposits, in one batch if
+        the blockchain supports it or concurrently otherwise."""
+        if not outpoints:
+            return {}
+        elif hasattr(self._blockchain, 'lookup_spend_txids'):
+            return self._blockchain.lookup_spend_txids(outpoints)
+        return dict(zip(outpoints, self._fetcher.map(lambda o: self._blockchain.lookup_spend_txid(*o), outpoints)))
 
     def _auto_sync(self, timeout, stop_event):
         """Lightweight thread for automatic channel syncs."""
@@ -0,0 +1,74 @@
+"""This submodule provides a `ConcurrentFetcher` class that providers use to
+make many requests to their server at once, such as fetching the transactions
+of a long list of addresses in chunks."""
+import concurrent.futures
+import threading
+import time
+
+from two1.blockchain import exceptions
+
+
+class ConcurrentFetcher(object):
+    """ Runs a provider's requests on a pool of threads.
+
+        Requests that fail because the server couldn't be reached
+        (DataProviderUnavailableError) are retried, waiting backoff
+        seconds before the first retry and twice as long before each
+        following one. Other errors are raised right away.
+
+    Args:
+        max_in_flight (int): Maximum number of requests running at
+            once. It should be no larger than the provider's connection
+            pool, or requests end up waiting for connections.
+        retries (int): Number of times a request is retried.
+        backoff (float): Seconds to wait before the first retry.
+    """
+    DEFAULT_MAX_IN_FLIGHT = 8
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, retries=3, backoff=0.5):
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _call(self, f, arg):
+        for attempt in range(self.retries + 1):
+            try:
+                return f(arg)
+            except exceptions.DataProviderUnavailableError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def map(self, f, args):
+        """ Calls f once for each item in args, concurrently.
+
+        Args:
+            f (function): Function making a request, taking a single
+                argument.
+            args (list): Argument for each call.
+
+        Returns:
+            list: The results of the calls, in the same order as args.
+
+        Raises:
+            Exception: The first error, in the order of args, raised by
+                a call after retrying. Calls not yet started are
+                cancelled.
+        """
+        args = list(args)
+        if len(args) <= 1 or self.max_in_flight <= 1:
+            return [self._call(f, a) for a in args]
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self.max_in_flight)
+
+        futures = [self._executor.submit(self._call, f, a) for a in args]
+        try:
+            return [fut.result() for fut in futures]
+        finally:
+            for fut in futures:
+                fut.cancel()
@@ -1,12 +1,14 @@
 """This submodule provides a concrete `InsightProvider` class that provides
 information about a blockchain by contacting a server."""
 import decimal
+import threading
 
 from urllib.parse import urljoin
 
 from collections import defaultdict
 from two1.blockchain import exceptions
 from two1.blockchain.base_provider import BaseProvider
+from two1.blockchain.concurrent_fetcher import ConcurrentFetcher
 from two1.bitcoin.txn import CoinbaseInput
 from two1.bitcoin.txn import TransactionInput
 from two1.bitcoin.txn import TransactionOutput
@@ -40,7 +42,9 @@ class InsightProvider(BaseProvider):
         self.testnet = testnet
         self.auth = None
         self._session = None
+        self._session_lock = threading.Lock()
         self._pool_size = connection_pool_size
+        self._fetcher = ConcurrentFetcher(connection_pool_size or ConcurrentFetcher.DEFAULT_MAX_IN_FLIGHT)
         self.can_limit_by_height = True
 
     @property
@@ -134,7 +138,7 @@ class InsightProvider(BaseProvider):
                                             block_version=1))
             else:
                 script = Script.from_hex(i["scriptSig"]["hex"])
-                inputs.append(TransactionInput(Hash(i["txid"]),
+                inputs.append(TransactionInput(Hash.intern(i["txid"]),
                                                i["vout"],
                                                script,
                                                i["sequence"]))
@@ -159,6 +163,19 @@ class InsightProvider(BaseProvider):
 
         return txn, addr_keys
 
+    @staticmethod
+    def _metadata_from_json(txn_json, last_block_index):
+        block_hash = None
+        block = None
+        if txn_json['confirmations'] > 0:
+            block = last_block_index - txn_json['confirmations'] + 1
+            block_hash = Hash.intern(txn_json['blockhash'])
+
+        return dict(block=block,
+                    block_hash=block_hash,
+                    network_time=txn_json.get("time", None),
+                    confirmations=txn_json['confirmations'])
+
     @staticmethod
     def _list_chunks(lst, chunk_size):
         for i in range(0, len(lst), chunk_size):
@@ -167,7 +184,9 @@ class InsightProvider(BaseProvider):
     def _request(self, method, path, **kwargs):
         import requests
         if self._session is None:
-            self._create_session()
+            with self._session_lock:
+                if self._session is None:
+                    self._create_session()
 
         url = self.server_url + path
         result = None
@@ -222,9 +241,10 @@ class InsightProvider(BaseProvider):
             Transaction objects.
         """
         last_block_index = self.get_block_height()
-        ret = defaultdict(list)
-        total_items = limit
-        for addresses in self._list_chunks(address_list, 199):
+
+        def fetch(addresses):
+            items = []
+            total_items = limit
             fr = 0
             to = min(100, limit)
 
@@ -240,30 +260,29 @@ class InsightProvider(BaseProvider):
 
                 fr = txn_data["to"]
                 to = fr + 100
+                items += txn_data['items']
+
+            return items
+
+        # The chunks are fetched concurrently, the pages of each chunk
+        # one after the other.
+        chunks = list(self._list_chunks(address_list, 199))
+        ret = defaultdict(list)
+        for addresses, items in zip(chunks, self._fetcher.map(fetch, chunks)):
+            for data in items:
+                if "vin" not in data or "vout" not in data:
+                    continue
+                metadata = self._metadata_from_json(data, last_block_index)
 
-                for data in txn_data['items']:
-                    if "vin" not in data or "vout" not in data:
+                if min_block and metadata['block']:
+                    if metadata['block'] < min_block:
                         continue
-                    block_hash = None
-                    block = None
-                    if data['confirmations'] > 0:
-                        block = last_block_index - data['confirmations'] + 1
-                        block_hash = Hash(data['blockhash'])
-
-                    metadata = dict(block=block,
-                                    block_hash=block_hash,
-                                    network_time=data.get("time", None),
-                                    confirmations=data['confirmations'])
-
-                    if min_block and block:
-                        if block < min_block:
-                            continue
-
-                    txn, addr_keys = self.txn_from_json(data)
-                    for addr in addr_keys:
-                        if addr in addresses:
-                            ret[addr].append(dict(metadata=metadata,
-                                                  transaction=txn))
+
+                txn, addr_keys = self.txn_from_json(data)
+                for addr in addr_keys:
+                    if addr in addresses:
+                        ret[addr].append(dict(metadata=metadata,
+                                              transaction=txn))
 
         return ret
 
@@ -277,29 +296,22 @@ class InsightProvider(BaseProvider):
             dict: A dict keyed by TXID of Transaction objects.
         """
         last_block_index = self.get_block_height()
+        ids = list(ids)
+        responses = self._fetcher.map(
+            lambda txid: self._request("GET", "tx/%s" % txid), ids)
+
         ret = {}
-        for txid in ids:
-            r = self._request("GET", "tx/%s" % txid)
+        for txid, r in zip(ids, responses):
             data = r.json()
 
             if r.status_code == 200:
                 if "vin" not in data or "vout" not in data:
                     continue
-                block_hash = None
-                block = None
-                if data['confirmations'] > 0:
-                    block = last_block_index - data['confirmations'] + 1
-                    block_hash = Hash(data['blockhash'])
-
-                metadata = dict(block=block,
-                                block_hash=block_hash,
-                                network_time=data['time'],
-                                confirmations=data['confirmations'])
 
                 txn, _ = self.txn_from_json(data)
-                assert str(txn.hash) == txid
+                assert txn.hash == txid
 
-                ret[txid] = dict(metadata=metadata,
+                ret[txid] = dict(metadata=self._metadata_from_json(data, last_block_index),
                                  transaction=txn)
 
         return ret
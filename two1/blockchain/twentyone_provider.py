@@ -2,27 +2,109 @@
 information about a blockchain by contacting a server."""
 from calendar import timegm
 from collections import defaultdict
+from collections import OrderedDict
+import codecs
+import json
 import os
+import threading
 import arrow
 
 from urllib.parse import urljoin
 
 from two1.blockchain import exceptions
 from two1.blockchain.base_provider import BaseProvider
+from two1.blockchain.concurrent_fetcher import ConcurrentFetcher
 from two1.bitcoin.hash import Hash
 from two1.bitcoin.txn import CoinbaseInput
 from two1.bitcoin.txn import TransactionInput
 from two1.bitcoin.txn import TransactionOutput
 from two1.bitcoin.txn import Transaction
 from two1.bitcoin.utils import bytes_to_str
-from two1.bitcoin.utils import pack_var_str
 from two1.bitcoin.script import Script
 
 
+def _iter_json_array(chunks):
+    """ Yields the items of a JSON array as its text arrives, so that
+    they can be used before the whole array has been received.
+
+    Args:
+        chunks (iterable(bytes)): The UTF-8 encoded array, in pieces.
+
+    Returns:
+        generator: The decoded items.
+
+    Raises:
+        ValueError: If the text isn't a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buf = buf[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buf):
+                break
+
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array.")
+                started = True
+                pos += 1
+                continue
+
+            if buf[pos] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Wait for the rest of the item
+                break
+
+            # An item is only complete once the "," or "]" after it has
+            # been seen: a number may continue in the next chunk, e.g.
+            # "0." followed by "5" decodes as 0 on its own.
+            nxt = end
+            while nxt < len(buf) and buf[nxt] in " \t\r\n":
+                nxt += 1
+            if nxt == len(buf) or buf[nxt] not in ",]":
+                break
+            yield item
+            pos = end
+
+    raise ValueError("Truncated JSON array.")
+
+
+def _timestamp(iso_time):
+    """ Converts a UTC time in ISO 8601 format, as returned by the
+    server, e.g. "2015-08-13T10:52:21.718Z", to a Unix timestamp in
+    seconds.
+    """
+    t = iso_time
+    if isinstance(t, str) and len(t) >= 20 and t[-1] == "Z" and \
+       t[4] == "-" and t[7] == "-" and t[10] == "T" and t[13] == ":" and t[16] == ":":
+        return timegm((int(t[0:4]), int(t[5:7]), int(t[8:10]),
+                       int(t[11:13]), int(t[14:16]), int(t[17:19])))
+
+    return timegm(arrow.get(t).datetime.timetuple())
+
+
 class TwentyOneProvider(BaseProvider):
     """ Transaction data provider using the TwentyOne API
+
+        Parsed transactions are kept in a memo keyed by txid, so a
+        transaction returned for several addresses, chunks or calls is
+        only parsed once. The Transaction objects returned may
+        therefore be shared between calls and must not be modified.
     """
     DEFAULT_HOST = os.environ.get("TWO1_PROVIDER_HOST", "https://blockchain.21.co")
+    STREAM_CHUNK_SIZE = 65536
+    TXN_MEMO_SIZE = 20000
 
     def __init__(self, twentyone_host_name=DEFAULT_HOST, testnet=False,
                  connection_pool_size=0):
@@ -33,7 +115,11 @@ class TwentyOneProvider(BaseProvider):
         self.auth = None
         self._set_url()
         self._session = None
+        self._session_lock = threading.Lock()
         self._pool_size = connection_pool_size
+        self._fetcher = ConcurrentFetcher(connection_pool_size or ConcurrentFetcher.DEFAULT_MAX_IN_FLIGHT)
+        self._txn_memo = OrderedDict()
+        self._txn_memo_lock = threading.Lock()
         self.can_limit_by_height = True
 
     @property
@@ -131,11 +217,8 @@ class TwentyOneProvider(BaseProvider):
                         sequence=i['sequence'],
                         block_version=1))
             else:
-                # Script length etc. are not returned so we need to
-                # prepend that.
-                script, _ = Script.from_bytes(
-                    pack_var_str(bytes.fromhex(i["script_signature_hex"])))
-                inputs.append(TransactionInput(Hash(i["output_hash"]),
+                script = Script(bytes.fromhex(i["script_signature_hex"]))
+                inputs.append(TransactionInput(Hash.intern(i["output_hash"]),
                                                i["output_index"],
                                                script,
                                                i["sequence"]))
@@ -143,10 +226,8 @@ class TwentyOneProvider(BaseProvider):
                 addr_keys.add(i["addresses"][0])
 
         for i in txn_json["outputs"]:
-            script, _ = Script.from_bytes(
-                pack_var_str(bytes.fromhex(i["script_hex"])))
             outputs.append(TransactionOutput(i["value"],
-                                             script))
+                                             Script(bytes.fromhex(i["script_hex"]))))
             if "addresses" in i:
                 addr_keys.add(i["addresses"][0])
 
@@ -157,6 +238,37 @@ class TwentyOneProvider(BaseProvider):
 
         return txn, addr_keys
 
+    def _parse_txn(self, txn_json):
+        """ Returns txn_from_json(txn_json), from the memo if the
+        transaction was parsed before.
+        """
+        txid = txn_json.get("hash")
+        with self._txn_memo_lock:
+            parsed = self._txn_memo.get(txid)
+            if parsed is not None:
+                self._txn_memo.move_to_end(txid)
+                return parsed
+
+        parsed = self.txn_from_json(txn_json)
+        if txid is not None:
+            with self._txn_memo_lock:
+                self._txn_memo[txid] = parsed
+                if len(self._txn_memo) > self.TXN_MEMO_SIZE:
+                    self._txn_memo.popitem(last=False)
+
+        return parsed
+
+    @staticmethod
+    def _metadata_from_json(txn_json):
+        block_hash = None
+        if txn_json['block_hash']:
+            block_hash = Hash.intern(txn_json['block_hash'])
+
+        return dict(block=txn_json['block_height'],
+                    block_hash=block_hash,
+                    network_time=_timestamp(txn_json['chain_received_at']),
+                    confirmations=txn_json['confirmations'])
+
     @staticmethod
     def _list_chunks(lst, chunk_size):
         for i in range(0, len(lst), chunk_size):
@@ -165,7 +277,9 @@ class TwentyOneProvider(BaseProvider):
     def _request(self, method, path, **kwargs):
         import requests
         if self._session is None:
-            self._create_session()
+            with self._session_lock:
+                if self._session is None:
+                    self._create_session()
 
         url = self.server_url + path
         result = None
@@ -213,27 +327,27 @@ class TwentyOneProvider(BaseProvider):
             dict: A dict keyed by address with each value being a list of
             Transaction objects.
         """
-        ret = defaultdict(list)
-        for addresses in self._list_chunks(address_list, 199):
+        def fetch(addresses):
             path = "addresses/" + ",".join(addresses) \
                    + "/transactions?limit={}".format(limit)
             if min_block:
                 path += "&min_block={}".format(min_block)
 
-            r = self._request("GET", path)
-            txn_data = r.json()
-
-            for data in txn_data:
-                block_hash = None
-                if data['block_hash']:
-                    block_hash = Hash(data['block_hash'])
-                metadata = dict(block=data['block_height'],
-                                block_hash=block_hash,
-                                network_time=timegm(arrow.get(
-                                    data['chain_received_at']).datetime.timetuple()),
-                                confirmations=data['confirmations'])
-
-                txn, addr_keys = self.txn_from_json(data)
+            # Transactions are parsed as the response arrives rather
+            # than after loading all of it.
+            r = self._request("GET", path, stream=True)
+            try:
+                return [self._parse_txn(data) + (self._metadata_from_json(data),)
+                        for data in _iter_json_array(r.iter_content(self.STREAM_CHUNK_SIZE))]
+            finally:
+                r.close()
+
+        # The chunks are fetched concurrently
+        chunks = list(self._list_chunks(address_list, 199))
+        ret = defaultdict(list)
+        for addresses, txns in zip(chunks, self._fetcher.map(fetch, chunks)):
+            addresses = set(addresses)
+            for txn, addr_keys, metadata in txns:
                 for addr in addr_keys:
                     if addr in addresses:
                         ret[addr].append(dict(metadata=metadata,
@@ -250,24 +364,19 @@ class TwentyOneProvider(BaseProvider):
         Returns:
             dict: A dict keyed by TXID of Transaction objects.
         """
+        ids = list(ids)
+        responses = self._fetcher.map(
+            lambda txid: self._request("GET", "transactions/%s" % txid), ids)
+
         ret = {}
-        for txid in ids:
-            r = self._request("GET", "transactions/%s" % txid)
+        for txid, r in zip(ids, responses):
             data = r.json()
 
             if r.status_code == 200:
-                block_hash = None
-                if data['block_hash']:
-                    block_hash = Hash(data['block_hash'])
-                metadata = dict(block=data['block_height'],
-                                block_hash=block_hash,
-                                network_time=timegm(arrow.get(
-                                    data['chain_received_at']).datetime.timetuple()),
-                                confirmations=data['confirmations'])
-                txn, _ = self.txn_from_json(data)
-                assert str(txn.hash) == txid
-
-                ret[txid] = dict(metadata=metadata,
+                txn, _ = self._parse_txn(data)
+                assert txn.hash == txid
+
+                ret[txid] = dict(metadata=self._metadata_from_json(data),
                                  transaction=txn)
 
         return ret
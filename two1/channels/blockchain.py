@@ -1,8 +1,13 @@
 """Wraps various blockchain data sources to provide convenience methods for
 payment channel management."""
+import collections
+import threading
+import time
+
 import requests
 
 import two1.bitcoin as bitcoin
+from two1.blockchain.concurrent_fetcher import ConcurrentFetcher
 
 
 class BlockchainError(Exception):
@@ -15,11 +20,250 @@ class BlockchainServerError(BlockchainError):
     pass
 
 
+class _PendingLookup:
+    """A transaction lookup in progress, shared by concurrent callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.tx_info = None
+        self.error = None
+
+
 class BlockchainBase:
-    """Base class for a Blockchain interface."""
+    """Base class for a Blockchain interface.
+
+    Subclasses fetch transaction documents from their server with
+    _fetch_tx_info() and read them with _tx_info(), which keeps them in
+    an LRU cache. How long a document is kept depends on its number of
+    confirmations: a mempool transaction can change at any time, while a
+    deeply confirmed one only changes when its outputs are spent.
+    Concurrent lookups of the same transaction share a single request.
+
+    check_confirmed_many() and lookup_spend_txids() look up a number of
+    transactions at once, with one request for all of those that aren't
+    cached if the server supports it (see _fetch_tx_infos()), or with
+    concurrent requests otherwise.
+    """
+
+    CACHE_SIZE = 1000
+    MEMPOOL_TTL = 15  # seconds
+    CONFIRMED_TTL = 60
+    DEEP_CONFIRMED_TTL = 3600
+    DEEP_CONFIRMATIONS = 6
 
     def __init__(self):
-        pass
+        self._session = requests.Session()
+        self._tx_cache = collections.OrderedDict()
+        self._pending = {}
+        self._cache_lock = threading.Lock()
+        self._fetcher = ConcurrentFetcher()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _fetch_tx_info(self, txid):
+        """Fetch the document describing transaction txid from the server.
+
+        Args:
+            txid (str): Transaction ID (RPC byte order).
+
+        Returns:
+            dict: The decoded document, or None if the transaction was
+                not found.
+
+        Raises:
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        raise NotImplementedError()
+
+    def _fetch_tx_infos(self, txids):
+        """Fetch the documents describing a number of transactions from
+        the server.
+
+        The default implementation calls _fetch_tx_info() for each
+        transaction concurrently. Subclasses for servers that can
+        return several transactions in one request override it.
+
+        Args:
+            txids (list): Transaction IDs (RPC byte order).
+
+        Returns:
+            dict: The decoded document of each transaction, keyed by
+                txid, or None for transactions that were not found.
+
+        Raises:
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        return dict(zip(txids, self._fetcher.map(self._fetch_tx_info, txids)))
+
+    def _tx_info_ttl(self, tx_info):
+        confirmations = tx_info.get("confirmations") or 0
+        if confirmations >= self.DEEP_CONFIRMATIONS:
+            return self.DEEP_CONFIRMED_TTL
+        elif confirmations > 0:
+            return self.CONFIRMED_TTL
+        return self.MEMPOOL_TTL
+
+    def _tx_infos(self, txids, max_age=None):
+        """Look up the documents describing a number of transactions,
+        from the cache for those it holds that haven't expired. The
+        others are fetched together.
+
+        Args:
+            txids (list): Transaction IDs (RPC byte order).
+            max_age (float): If given, cached documents older than this
+                many seconds aren't used.
+
+        Returns:
+            dict: The decoded document of each transaction, keyed by
+                txid, or None for transactions that were not found. Not
+                found transactions aren't cached.
+
+        Raises:
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        tx_infos = {}
+        fetching = {}
+        waiting = {}
+        with self._cache_lock:
+            now = time.time()
+            for txid in txids:
+                if txid in tx_infos or txid in fetching or txid in waiting:
+                    continue
+
+                entry = self._tx_cache.get(txid)
+                if entry is not None:
+                    tx_info, fetched_at = entry
+                    age = now - fetched_at
+                    if age < self._tx_info_ttl(tx_info) and (max_age is None or age <= max_age):
+                        self._tx_cache.move_to_end(txid)
+                        self.cache_hits += 1
+                        tx_infos[txid] = tx_info
+                        continue
+
+                pending = self._pending.get(txid)
+                if pending is None:
+                    fetching[txid] = self._pending[txid] = _PendingLookup()
+                    self.cache_misses += 1
+                else:
+                    waiting[txid] = pending
+                    self.cache_hits += 1
+
+        if fetching:
+            try:
+                fetched_at = time.time()
+                fetched = self._fetch_tx_infos(list(fetching))
+                for txid, pending in fetching.items():
+                    pending.tx_info = fetched.get(txid)
+            except Exception as e:
+                for pending in fetching.values():
+                    pending.error = e
+                raise
+            finally:
+                with self._cache_lock:
+                    for txid, pending in fetching.items():
+                        del self._pending[txid]
+                        if pending.tx_info is not None:
+                            self._tx_cache[txid] = (pending.tx_info, fetched_at)
+                            self._tx_cache.move_to_end(txid)
+                    while len(self._tx_cache) > self.CACHE_SIZE:
+                        self._tx_cache.popitem(last=False)
+                for pending in fetching.values():
+                    pending.done.set()
+
+            tx_infos.update((txid, pending.tx_info) for txid, pending in fetching.items())
+
+        for txid, pending in waiting.items():
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            tx_infos[txid] = pending.tx_info
+
+        return tx_infos
+
+    def _tx_info(self, txid, max_age=None):
+        """Look up the document describing transaction txid, from the cache
+        if it holds one that hasn't expired.
+
+        Args:
+            txid (str): Transaction ID (RPC byte order).
+            max_age (float): If given, cached documents older than this
+                many seconds aren't used.
+
+        Returns:
+            dict: The decoded document, or None if the transaction was
+                not found. Not found transactions aren't cached.
+
+        Raises:
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        return self._tx_infos([txid], max_age)[txid]
+
+    def _invalidate_tx_info(self, txid):
+        """Drop transaction txid's document from the cache."""
+        with self._cache_lock:
+            self._tx_cache.pop(txid, None)
+
+    def _spend_txid(self, tx_info, output_index):
+        """Get the transaction that spent an output from the document
+        describing the transaction it belongs to.
+
+        Args:
+            tx_info (dict): The transaction's document.
+            output_index (int): Output index (0-based).
+
+        Returns:
+            str: Transaction ID (RPC byte order) or None.
+
+        Raises:
+            IndexError: if output_index is out of bounds.
+
+        """
+        raise NotImplementedError()
+
+    def check_confirmed_many(self, txids, num_confirmations=1):
+        """Check which of a number of transactions have num_confirmations
+        confirmations.
+
+        Args:
+            txids (list): Transaction IDs (RPC byte order).
+            num_confirmations (int): Number of confirmations.
+
+        Returns:
+            dict: True for each txid that is confirmed, False for those
+                that aren't.
+
+        Raises:
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        tx_infos = self._tx_infos(txids)
+        return {txid: tx_info is not None and (tx_info.get("confirmations") or 0) >= num_confirmations
+                for txid, tx_info in tx_infos.items()}
+
+    def lookup_spend_txids(self, outpoints):
+        """Look up the transactions that spent a number of outputs.
+
+        Args:
+            outpoints (list): (txid, output_index) tuples.
+
+        Returns:
+            dict: The spending transaction ID (RPC byte order) or None
+                for each outpoint.
+
+        Raises:
+            IndexError: if an output_index is out of bounds.
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        # Outputs can be spent at any time, so only recent documents will do
+        tx_infos = self._tx_infos([txid for txid, _ in outpoints], max_age=self.MEMPOOL_TTL)
+        return {(txid, output_index): None if tx_infos[txid] is None else
+                self._spend_txid(tx_infos[txid], output_index)
+                for txid, output_index in outpoints}
 
     def check_confirmed(self, txid, num_confirmations=1):
         """Check that transaction txid has num_confirmations confirmations.
@@ -102,28 +346,35 @@ class InsightBlockchain(BlockchainBase):
         super().__init__()
         self._base_url = base_url
 
-    def check_confirmed(self, txid, num_confirmations=1):
-        # Get transaction info
-        r = requests.get(self._base_url + "/tx/" + txid)
+    def _fetch_tx_info(self, txid):
+        r = self._session.get(self._base_url + "/tx/" + txid)
         if r.status_code == 404:
-            return False
+            return None
         elif r.status_code != 200:
             raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
 
+        return r.json()
+
+    def check_confirmed(self, txid, num_confirmations=1):
+        # Get transaction info
+        tx_info = self._tx_info(txid)
+        if tx_info is None:
+            return False
+
         # Check confirmation
-        tx_info = r.json()
         return "confirmations" in tx_info and tx_info["confirmations"] >= num_confirmations
 
     def lookup_spend_txid(self, txid, output_index):
-        # Get transaction info
-        r = requests.get(self._base_url + "/tx/" + txid)
-        if r.status_code == 404:
+        # Get transaction info. Outputs can be spent at any time, so only
+        # a recent one will do.
+        tx_info = self._tx_info(txid, max_age=self.MEMPOOL_TTL)
+        if tx_info is None:
             return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
 
+        return self._spend_txid(tx_info, output_index)
+
+    def _spend_txid(self, tx_info, output_index):
         # Validate utxo index is in bounds
-        tx_info = r.json()
         if len(tx_info['vout']) <= output_index:
             raise IndexError("Output index out of bounds.")
 
@@ -135,7 +386,7 @@ class InsightBlockchain(BlockchainBase):
 
     def lookup_tx(self, txid):
         # Get raw transaction
-        r = requests.get(self._base_url + "/rawtx/" + txid)
+        r = self._session.get(self._base_url + "/rawtx/" + txid)
         if r.status_code == 404:
             return None
         elif r.status_code != 200:
@@ -148,21 +399,28 @@ class InsightBlockchain(BlockchainBase):
         # already been broadcast, so we check if it exists first.
 
         # Get transaction info
-        r = requests.get(self._base_url + "/tx/" + str(bitcoin.Transaction.from_hex(tx).hash))
-        if r.status_code == 200:
-            return r.json()['txid']
+        transaction = bitcoin.Transaction.from_hex(tx)
+        tx_info = self._tx_info(str(transaction.hash))
+        if tx_info is not None:
+            return tx_info['txid']
 
         # Broadcast transaction
-        r = requests.post(self._base_url + "/tx/send", data={'rawtx': tx})
+        r = self._session.post(self._base_url + "/tx/send", data={'rawtx': tx})
         if r.status_code != 200:
             raise BlockchainServerError("Broadcasting transaction: Status Code {}, {}".format(r.status_code, r.text))
 
+        # The outputs it spends have changed
+        for inp in transaction.inputs:
+            self._invalidate_tx_info(str(inp.outpoint))
+
         return r.json()['txid']
 
 
 class BlockCypherBlockchain(BlockchainBase):
     """Blockchain interface to a BlockCypher API."""
 
+    BATCH_SIZE = 100
+
     def __init__(self, base_url):
         """Instantiate a BlockCypher blockchain interface with specified URL.
 
@@ -176,28 +434,61 @@ class BlockCypherBlockchain(BlockchainBase):
         super().__init__()
         self._base_url = base_url
 
-    def check_confirmed(self, txid, num_confirmations=1):
-        # Get transaction info
-        r = requests.get(self._base_url + "/txs/" + txid)
+    def _fetch_tx_info(self, txid):
+        # Include the raw transaction so that lookup_tx() can use the
+        # same document
+        r = self._session.get(self._base_url + "/txs/" + txid, params={'includeHex': 'true'})
         if r.status_code == 404:
-            return False
+            return None
         elif r.status_code != 200:
             raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
 
+        return r.json()
+
+    def _fetch_tx_infos(self, txids):
+        # Transactions are fetched BATCH_SIZE at a time, with their IDs
+        # separated by semicolons. Transactions that weren't found are
+        # returned as errors in the list.
+        if len(txids) == 1:
+            return {txids[0]: self._fetch_tx_info(txids[0])}
+
+        def fetch_batch(batch):
+            r = self._session.get(self._base_url + "/txs/" + ";".join(batch), params={'includeHex': 'true'})
+            if r.status_code == 404:
+                return []
+            elif r.status_code != 200:
+                raise BlockchainServerError(
+                    "Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
+
+            return r.json()
+
+        batches = [txids[i:i + self.BATCH_SIZE] for i in range(0, len(txids), self.BATCH_SIZE)]
+        tx_infos = dict.fromkeys(txids)
+        for batch in self._fetcher.map(fetch_batch, batches):
+            tx_infos.update((tx_info['hash'], tx_info) for tx_info in batch if 'hash' in tx_info)
+
+        return tx_infos
+
+    def check_confirmed(self, txid, num_confirmations=1):
+        # Get transaction info
+        tx_info = self._tx_info(txid)
+        if tx_info is None:
+            return False
+
         # Check confirmation
-        tx_info = r.json()
         return "confirmations" in tx_info and tx_info["confirmations"] >= num_confirmations
 
     def lookup_spend_txid(self, txid, output_index):
-        # Get transaction info
-        r = requests.get(self._base_url + "/txs/" + txid)
-        if r.status_code == 404:
+        # Get transaction info. Outputs can be spent at any time, so only
+        # a recent one will do.
+        tx_info = self._tx_info(txid, max_age=self.MEMPOOL_TTL)
+        if tx_info is None:
             return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
 
+        return self._spend_txid(tx_info, output_index)
+
+    def _spend_txid(self, tx_info, output_index):
         # Validate utxo index is in bounds
-        tx_info = r.json()
         if len(tx_info['outputs']) <= output_index:
             raise IndexError("Output index out of bounds.")
 
@@ -209,28 +500,31 @@ class BlockCypherBlockchain(BlockchainBase):
 
     def lookup_tx(self, txid):
         # Get raw transaction
-        r = requests.get(self._base_url + "/txs/" + txid, params={'includeHex': 'true'})
-        if r.status_code == 404:
+        tx_info = self._tx_info(txid)
+        if tx_info is None:
             return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting raw transaction: Status Code {}, {}".format(r.status_code, r.text))
 
-        return r.json()['hex']
+        return tx_info['hex']
 
     def broadcast_tx(self, tx):
         # BlockCypher returns 400 on broadcast if the transaction has already
         # been broadcast, so we check if it exists first.
 
         # Get transaction info
-        r = requests.get(self._base_url + "/txs/" + str(bitcoin.Transaction.from_hex(tx).hash))
-        if r.status_code == 200:
-            return r.json()['hash']
+        transaction = bitcoin.Transaction.from_hex(tx)
+        tx_info = self._tx_info(str(transaction.hash))
+        if tx_info is not None:
+            return tx_info['hash']
 
         # Broadcast transaction
-        r = requests.post(self._base_url + "/txs/push", json={'tx': tx})
+        r = self._session.post(self._base_url + "/txs/push", json={'tx': tx})
         if r.status_code != 201:
             raise BlockchainServerError("Broadcasting transaction: Status Code {}, {}".format(r.status_code, r.text))
 
+        # The outputs it spends have changed
+        for inp in transaction.inputs:
+            self._invalidate_tx_info(str(inp.outpoint))
+
         return r.json()['tx']['hash']
 
 
@@ -250,28 +544,35 @@ class TwentyOneBlockchain(BlockchainBase):
         super().__init__()
         self._base_url = base_url
 
-    def check_confirmed(self, txid, num_confirmations=1):
-        # Get transaction info
-        r = requests.get(self._base_url + "/transactions/" + txid)
+    def _fetch_tx_info(self, txid):
+        r = self._session.get(self._base_url + "/transactions/" + txid)
         if r.status_code == 404:
-            return False
+            return None
         elif r.status_code != 200:
             raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
 
+        return r.json()
+
+    def check_confirmed(self, txid, num_confirmations=1):
+        # Get transaction info
+        tx_info = self._tx_info(txid)
+        if tx_info is None:
+            return False
+
         # Check confirmation
-        tx_info = r.json()
         return "confirmations" in tx_info and tx_info["confirmations"] >= num_confirmations
 
     def lookup_spend_txid(self, txid, output_index):
-        # Get transaction info
-        r = requests.get(self._base_url + "/transactions/" + txid)
-        if r.status_code == 404:
+        # Get transaction info. Outputs can be spent at any time, so only
+        # a recent one will do.
+        tx_info = self._tx_info(txid, max_age=self.MEMPOOL_TTL)
+        if tx_info is None:
             return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
 
+        return self._spend_txid(tx_info, output_index)
+
+    def _spend_txid(self, tx_info, output_index):
         # Validate utxo index is in bounds
-        tx_info = r.json()
         if len(tx_info['outputs']) <= output_index:
             raise IndexError("Output index out of bounds.")
 
@@ -282,27 +583,30 @@ class TwentyOneBlockchain(BlockchainBase):
         return None
 
     def lookup_tx(self, txid):
-        # Get raw transaction
-        r = requests.get(self._base_url + "/transactions/" + txid)
-        if r.status_code == 404:
+        # Get raw transaction, which is part of the transaction info
+        tx_info = self._tx_info(txid)
+        if tx_info is None:
             return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting raw transaction: Status Code {}, {}".format(r.status_code, r.text))
 
-        return r.json()['hex']
+        return tx_info['hex']
 
     def broadcast_tx(self, tx):
         # TwentyOne returns 400 on broadcast if the transaction has already
         # been broadcast, so we check if it exists first.
 
         # Get transaction info
-        r = requests.get(self._base_url + "/transactions/" + str(bitcoin.Transaction.from_hex(tx).hash))
-        if r.status_code == 200:
-            return r.json()['hash']
+        transaction = bitcoin.Transaction.from_hex(tx)
+        tx_info = self._tx_info(str(transaction.hash))
+        if tx_info is not None:
+            return tx_info['hash']
 
         # Broadcast transaction
-        r = requests.post(self._base_url + "/transactions/send", json={'signed_hex': tx})
+        r = self._session.post(self._base_url + "/transactions/send", json={'signed_hex': tx})
         if r.status_code != 200:
             raise BlockchainServerError("Broadcasting transaction: Status Code {}, {}".format(r.status_code, r.text))
 
+        # The outputs it spends have changed
+        for inp in transaction.inputs:
+            self._invalidate_tx_info(str(inp.outpoint))
+
         return r.json()['transaction_hash']
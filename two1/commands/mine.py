@@ -17,17 +17,14 @@ import click
 
 # two1 imports
 import two1
-from two1.bitcoin.block import CompactBlock
-from two1.bitcoin.txn import Transaction
 from two1.server import message_factory
 from two1.commands.util import decorators
 from two1.commands import status
 from two1.commands.util import bitcoin_computer
-from two1.bitcoin.hash import Hash
 from two1.commands.util import exceptions
+from two1.commands.util import miner
 from two1.commands.util import uxstring
 from two1.commands.util.uxstring import ux
-import two1.bitcoin.utils as utils
 
 
 # Creates a ClickLogger
@@ -307,7 +304,7 @@ Share = namedtuple('Share', ['enonce2', 'nonce', 'otime', 'work_id'])
 Work = namedtuple('Work', ['work_id', 'enonce2', 'cb'])
 
 
-def mine_work(work_msg, enonce1, enonce2_size):
+def mine_work(work_msg, enonce1, enonce2_size, processes=None):
     """ Mine the work using a CPU to find a valid solution.
 
     Loop until the CPU finds a valid solution of the given work.
@@ -319,44 +316,33 @@ def mine_work(work_msg, enonce1, enonce2_size):
         work_msg (WorkNotification): the work given by the pool API
         enonce1 (bytes): extra nonce required to make the coinbase transaction
         enonce2_size (int): size of the extra nonce 2 in bytes
+        processes (int): number of mining processes, defaults to one per CPU
     """
-    pool_target = utils.bits_to_target(work_msg.bits_pool)
-    for enonce2_num in range(0, 2 ** (enonce2_size * 8)):
-        enonce2 = enonce2_num.to_bytes(enonce2_size, byteorder="big")
-
-        cb_txn, _ = Transaction.from_bytes(
-            work_msg.coinb1 + enonce1 + enonce2 + work_msg.coinb2)
-        cb = CompactBlock(work_msg.height,
-                          work_msg.version,
-                          Hash(work_msg.prev_block_hash),
-                          work_msg.ntime,
-                          work_msg.nbits,  # lower difficulty work for testing
-                          work_msg.merkle_edge,
-                          cb_txn)
-
-        row_counter = 0
-        for nonce in range(0xffffffff):
-
-            if nonce % 6e3 == 0:
-                logger.info(click.style(u'█', fg='green'), nl=False)
-                row_counter += 1
-            if row_counter > 40:
-                row_counter = 0
-                logger.info("")
-
-            cb.block_header.nonce = nonce
-            h = cb.block_header.hash.to_int('little')
-            if h < pool_target:
-                share = Share(
-                    enonce2=enonce2,
-                    nonce=nonce,
-                    work_id=work_msg.work_id,
-                    otime=int(time.time()))
-                # adds a new line at the end of progress bar
-                logger.info("")
-                return share
-
-        logger.info("Exhausted enonce1 space. Changing enonce2")
+    row_counter = 0
+
+    def progress(hashes):
+        nonlocal row_counter
+        logger.info(click.style(u'█', fg='green'), nl=False)
+        row_counter += 1
+        if row_counter > 40:
+            row_counter = 0
+            logger.info("")
+
+    result = miner.mine(miner.work_params(work_msg), enonce1, enonce2_size,
+                        processes=processes, progress=progress)
+
+    # adds a new line at the end of progress bar
+    logger.info("")
+    ux('mining_hashrate', result.hashes, result.hashes / max(result.elapsed, 1e-9) / 1e3)
+
+    if result.nonce is None:
+        return None
+
+    return Share(
+        enonce2=result.enonce2,
+        nonce=result.nonce,
+        work_id=work_msg.work_id,
+        otime=int(time.time()))
 
 
 def save_work(client, share):
@@ -0,0 +1,175 @@
+""" Multi-process CPU mining engine used by `21 mine`.
+
+The nonce (and, once that is exhausted, enonce2) space is split into
+fixed-size chunks that are handed out to a pool of worker processes.
+Each worker builds the CompactBlock for its enonce2 once and searches its
+chunk with CompactBlock.search_nonce(), which only hashes the last 16
+bytes of the header on top of the midstate. As soon as any worker finds
+a share, all the others are cancelled.
+"""
+import logging
+import multiprocessing
+import queue
+import time
+from collections import namedtuple
+
+from two1.bitcoin.block import CompactBlock
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.txn import Transaction
+import two1.bitcoin.utils as utils
+
+logger = logging.getLogger(__name__)
+
+NONCE_SPACE = 0x100000000
+CHUNK_SIZE = 2 ** 17
+
+MiningResult = namedtuple('MiningResult', ['enonce2', 'nonce', 'hashes', 'elapsed'])
+WorkParams = namedtuple('WorkParams', ['coinb1', 'coinb2', 'height', 'version', 'prev_block_hash',
+                                       'ntime', 'nbits', 'merkle_edge', 'target'])
+
+# Per-process state of a pool worker, set up by _init_worker().
+_worker = {}
+
+
+def work_params(work_msg):
+    """ Extracts the fields needed for mining from a work notification
+    into a plain (picklable) tuple.
+
+    Args:
+        work_msg (WorkNotification): the work given by the pool API
+
+    Returns:
+        WorkParams: the fields needed to build and hash blocks.
+    """
+    return WorkParams(coinb1=bytes(work_msg.coinb1),
+                      coinb2=bytes(work_msg.coinb2),
+                      height=work_msg.height,
+                      version=work_msg.version,
+                      prev_block_hash=bytes(work_msg.prev_block_hash),
+                      ntime=work_msg.ntime,
+                      nbits=work_msg.nbits,
+                      merkle_edge=[bytes(e) for e in work_msg.merkle_edge],
+                      target=utils.bits_to_target(work_msg.bits_pool))
+
+
+def build_block(params, enonce1, enonce2):
+    """ Builds the CompactBlock for a given enonce2.
+
+    Args:
+        params (WorkParams): the work to build the block for.
+        enonce1 (bytes): extra nonce 1, assigned by the pool.
+        enonce2 (bytes): extra nonce 2, chosen by the miner.
+
+    Returns:
+        CompactBlock: the block whose header is to be hashed.
+    """
+    cb_txn, _ = Transaction.from_bytes(params.coinb1 + enonce1 + enonce2 + params.coinb2)
+    return CompactBlock(params.height,
+                        params.version,
+                        Hash(params.prev_block_hash),
+                        params.ntime,
+                        params.nbits,  # lower difficulty work for testing
+                        params.merkle_edge,
+                        cb_txn)
+
+
+def _jobs(enonce2_size, chunk_size):
+    for enonce2_num in range(0, 2 ** (enonce2_size * 8)):
+        for start in range(0, NONCE_SPACE, chunk_size):
+            yield enonce2_num, start, min(start + chunk_size, NONCE_SPACE)
+
+
+def _init_worker(params, enonce1, enonce2_size, cancel):
+    _worker.clear()
+    _worker.update(params=params, enonce1=enonce1, enonce2_size=enonce2_size,
+                   cancel=cancel, enonce2_num=None, block=None)
+
+
+def _scan(job):
+    enonce2_num, start, stop = job
+    if _worker['enonce2_num'] != enonce2_num:
+        enonce2 = enonce2_num.to_bytes(_worker['enonce2_size'], byteorder="big")
+        _worker['block'] = build_block(_worker['params'], _worker['enonce1'], enonce2)
+        _worker['enonce2_num'] = enonce2_num
+
+    nonce = _worker['block'].search_nonce(_worker['params'].target, start, stop, _worker['cancel'])
+    return job, nonce
+
+
+def mine(params, enonce1, enonce2_size, processes=None, chunk_size=CHUNK_SIZE, progress=None):
+    """ Searches for a share on all CPUs.
+
+    Args:
+        params (WorkParams): the work to mine, see work_params().
+        enonce1 (bytes): extra nonce 1, assigned by the pool.
+        enonce2_size (int): size of the extra nonce 2 in bytes.
+        processes (int): number of worker processes. Defaults to the
+            number of CPUs. If 1, mining is done in this process.
+        chunk_size (int): number of nonces handed to a worker at a time.
+        progress (function): if provided, called with the number of
+            hashes done after each chunk completes.
+
+    Returns:
+        MiningResult: the enonce2 and nonce of the share found, along with
+        the number of hashes computed and the time taken. enonce2 and
+        nonce are None if the whole space was exhausted.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    jobs = _jobs(enonce2_size, chunk_size)
+    start_time = time.perf_counter()
+    hashes = 0
+    found = None
+
+    if processes == 1:
+        _init_worker(params, enonce1, enonce2_size, None)
+        for job in jobs:
+            job, nonce = _scan(job)
+            if nonce is not None:
+                hashes += nonce - job[1] + 1
+                found = (job[0], nonce)
+                break
+            hashes += job[2] - job[1]
+            if progress is not None:
+                progress(hashes)
+    else:
+        cancel = multiprocessing.Event()
+        results = queue.Queue()
+        pool = multiprocessing.Pool(processes, _init_worker, (params, enonce1, enonce2_size, cancel))
+
+        def submit():
+            job = next(jobs, None)
+            if job is None:
+                return 0
+            pool.apply_async(_scan, (job,), callback=results.put, error_callback=results.put)
+            return 1
+
+        try:
+            # Keep two chunks queued per worker so none of them go idle
+            in_flight = sum(submit() for i in range(2 * processes))
+            while in_flight:
+                r = results.get()
+                in_flight -= 1
+                if isinstance(r, Exception):
+                    raise r
+
+                job, nonce = r
+                if nonce is not None:
+                    hashes += nonce - job[1] + 1
+                    found = (job[0], nonce)
+                    cancel.set()
+                    break
+
+                hashes += job[2] - job[1]
+                if progress is not None:
+                    progress(hashes)
+                in_flight += submit()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    elapsed = time.perf_counter() - start_time
+    if found is None:
+        return MiningResult(None, None, hashes, elapsed)
+
+    enonce2_num, nonce = found
+    return MiningResult(enonce2_num.to_bytes(enonce2_size, byteorder="big"), nonce, hashes, elapsed)
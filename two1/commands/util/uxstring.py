@@ -325,6 +325,7 @@ class UxString:
     mining_dashboard_no_chip = "Without a 21 mining chip, we can't show you a mining dashboard.\n"\
         "If you want to see this dashboard, run this command on a 21 Bitcoin Computer."
     mining_success = "\n{}, you mined {} satoshis in {:.1f} seconds!"
+    mining_hashrate = "Computed {:,} hashes at {:.1f} kH/s"
     mining_status = "\nHere's the new status of your balance after mining:\n"
     mining_finish = "\nView your balance with {}, or spend with {}."
 
@@ -63,6 +63,24 @@ class EllipticCurveBase(object):
         """
         raise NotImplementedError
 
+    def add_base_multiples(self, point, scalars):
+        """ Computes point + k*G for each k in scalars.
+
+            This is the operation used to derive BIP32 child public
+            keys. Implementations should override this to share work
+            across the whole batch. The default computes each sum
+            separately.
+
+        Args:
+            point (ECPointAffine): The point to offset.
+            scalars (list(int)): The multiples of G to add to point.
+
+        Returns:
+            list(ECPointAffine): The resulting points, in the same
+               order as scalars.
+        """
+        return [self.public_key(k) + point for k in scalars]
+
     def recover_public_key(self, message, signature, recovery_id=None):
         """ Recovers possibilities for the public key associated with the
             private key used to sign message and generate signature.
@@ -121,6 +139,26 @@ class EllipticCurveBase(object):
         """
         raise NotImplementedError
 
+    def verify_batch(self, items, do_hash=True):
+        """ Verifies a number of signatures at once.
+
+            Implementations should override this to share work (contexts,
+            parsed keys, modular inversions) across the whole batch. The
+            default simply calls `verify` for each item.
+
+        Args:
+            items (list(tuple)): (public_key, message, signature) tuples,
+               with the same types as the respective arguments to `verify`.
+            do_hash (bool): True if the messages should be hashed prior
+               to verifying, False if not.
+
+        Returns:
+            list(bool): Whether each signature is verified, in the same
+               order as items.
+        """
+        return [self.verify(message, signature, public_key, do_hash)
+                for public_key, message, signature in items]
+
     def _nonce_random(self):
         return random.SystemRandom().randrange(1, self.n - 1)
 
@@ -434,6 +434,52 @@ class EllipticCurve(EllipticCurveBase):
 
         return bool(verified)
 
+    def verify_batch(self, items, do_hash=True):
+        """ Verifies a number of signatures at once.
+
+        Each distinct public key is only converted to an EC_KEY once per
+        batch and a single signature structure is reused for every item,
+        rather than allocating both for each verification.
+
+        Args:
+            items (list(tuple)): (public_key, message, signature) tuples,
+               with the same types as the respective arguments to `verify`.
+            do_hash (bool): True if the messages should be hashed prior
+               to verifying, False if not.
+
+        Returns:
+            list(bool): Whether each signature is verified, in the same
+               order as items.
+        """
+        rv = []
+        keys = {}
+        sig = ossl.lc.ECDSA_SIG_new()
+        try:
+            for public_key, message, signature in items:
+                k = (public_key.x, public_key.y, public_key.infinity)
+                key = keys.get(k)
+                if key is None:
+                    key = c_void_p(ossl.lc.EC_KEY_new_by_curve_name(self.curve_name))
+                    ossl.set_public_key_from_ints(key=key,
+                                                  x=public_key.x,
+                                                  y=public_key.y,
+                                                  infinity=public_key.infinity)
+                    keys[k] = key
+
+                ossl.int_to_bn(signature.x, sig.contents.r)
+                ossl.int_to_bn(signature.y, sig.contents.s)
+
+                hashed = self.hash_function(message).digest() if do_hash else message
+                dig_buf = create_string_buffer(hashed)
+                verified = ossl.lc.ECDSA_do_verify(dig_buf, len(hashed), sig, key)
+                rv.append(bool(verified))
+        finally:
+            ossl.lc.ECDSA_SIG_free(sig)
+            for key in keys.values():
+                ossl.lc.EC_KEY_free(key)
+
+        return rv
+
 
 class p256(EllipticCurve):
     curve_name = ossl.lc.OBJ_sn2nid(c_char_p(b"prime256v1"))
@@ -3,6 +3,7 @@ import math
 import random
 
 from collections import namedtuple
+from collections import OrderedDict
 
 from two1.crypto.ecdsa_base import EllipticCurveBase
 
@@ -19,6 +20,11 @@ from two1.crypto.ecdsa_base import EllipticCurveBase
     makes use of constant- time operations to prevent against (simple)
     side-channel attacks.
 
+    The Montgomery ladder is used to multiply by signing nonces.
+    Multiplications by public scalars (e.g. when verifying) use
+    windowed-NAF and multiples of the base point are looked up in a
+    table that is precomputed on first use.
+
     It does not make use of blinding techniques, prevent against
     certain kinds of cache attacks, differential side-channel attacks,
     etc. For those requiring a more secure implementation, use:
@@ -62,6 +68,92 @@ def montgomery_ladder(k, p):
     return r[0]
 
 
+def wnaf(k, w):
+    """ Computes the width-w non-adjacent form (wNAF) of k.
+
+    Every non-zero digit is odd, lies in (-2^(w-1), 2^(w-1)) and is
+    followed by at least w - 1 zero digits, so multiplying by k needs
+    only about 1/(w + 1) as many point additions as there are bits.
+
+    Args:
+        k (int): A non-negative integer.
+        w (int): The window width (>= 2).
+
+    Returns:
+        list(int): The digits of k, least significant first.
+    """
+    rv = []
+    full = 1 << w
+    half = full >> 1
+    while k:
+        if k & 0x1:
+            d = k & (full - 1)
+            if d >= half:
+                d -= full
+            k -= d
+        else:
+            d = 0
+        rv.append(d)
+        k >>= 1
+
+    return rv
+
+
+def wnaf_precompute(p, w):
+    """ Computes the odd multiples of p needed by wnaf_multiply().
+
+    Args:
+        p (ECPointJacobian): The point to multiply.
+        w (int): The window width that will be used.
+
+    Returns:
+        list(tuple): (i*p, -i*p) for i in 1, 3, 5, ..., 2^(w-1) - 1.
+            All points are normalized to z = 1 where possible.
+    """
+    multiples = [p]
+    p2 = p.double()
+    for i in range((1 << (w - 2)) - 1):
+        multiples.append(multiples[-1] + p2)
+
+    multiples = p.curve.normalize(multiples)
+
+    return [(m, m.negate()) for m in multiples]
+
+
+def wnaf_multiply(terms):
+    """ Computes the sum of k*p for several (k, p) pairs at once using
+    interleaved windowed-NAF (Strauss' algorithm).
+
+    All scalars are scanned in a single pass so that the doublings are
+    shared between them. This is NOT constant-time and so must only be
+    used with public scalars (e.g. when verifying signatures).
+
+    Args:
+        terms (list(tuple)): (k, w, precomp) tuples where k is the
+            scalar, w is the window width and precomp is the output of
+            wnaf_precompute(p, w) for the point p.
+
+    Returns:
+        ECPointJacobian: The sum of all k*p.
+    """
+    nafs = [(wnaf(k, w), precomp) for k, w, precomp in terms]
+    curve = terms[0][2][0][0].curve
+
+    r = ECPointJacobian(curve, 0, 0, 0, True)
+    for i in reversed(range(max(len(naf) for naf, _ in nafs))):
+        if not r.infinity:
+            r = r.double()
+        for naf, precomp in nafs:
+            if i < len(naf) and naf[i]:
+                d = naf[i]
+                if d > 0:
+                    r = r + precomp[d >> 1][0]
+                else:
+                    r = r + precomp[-d >> 1][1]
+
+    return r
+
+
 class ECPoint(object):
     """ Base class for any elliptic curve point implementations.
 
@@ -222,9 +314,14 @@ class ECPointJacobian(ECPoint):
         if b.infinity:
             return self
 
-        u1 = (self.x * b.z2) % self.curve.p
+        if b.z == 1:
+            # Mixed addition: b is already normalized.
+            u1 = self.x
+            s1 = self.y
+        else:
+            u1 = (self.x * b.z2) % self.curve.p
+            s1 = (self.y * b.z3) % self.curve.p
         u2 = (b.x * self.z2) % self.curve.p
-        s1 = (self.y * b.z3) % self.curve.p
         s2 = (b.y * self.z3) % self.curve.p
 
         if u1 == u2:
@@ -251,8 +348,7 @@ class ECPointJacobian(ECPoint):
         if not isinstance(b, ECPointJacobian):
             raise TypeError("b must be an ECPointJacobian object")
 
-        # b.curve.p - b.y is effectively -b.y % b.curve.p
-        return self + ECPointJacobian(b.curve, b.x, b.curve.p - b.y, b.z)
+        return self + b.negate()
 
     def __mul__(self, k):
         if not isinstance(k, int):
@@ -264,6 +360,18 @@ class ECPointJacobian(ECPoint):
                                                  self.y,
                                                  self.z))
 
+    def negate(self):
+        """ Returns the inverse of this point (i.e. -P).
+
+        Returns:
+            ECPointJacobian: The point corresponding to `-self`.
+        """
+        if self.infinity:
+            return self
+
+        # p - y is effectively -y % p
+        return ECPointJacobian(self.curve, self.x, self.curve.p - self.y, self.z)
+
     def double(self):
         """ Optimized point doubling operation that results in `2*self`.
 
@@ -503,6 +611,15 @@ class EllipticCurve(EllipticCurveBase):
         h (int): The curve co-factor.
         hash_function (function): The function to use for hashing messages.
     """
+    KEY_CACHE_SIZE = 1024
+
+    # Window widths for the fixed-base table of G used by public_key(),
+    # the wNAF multiples of G used when verifying and the wNAF
+    # multiples of arbitrary points.
+    BASE_WINDOW = 4
+    BASE_WNAF_WIDTH = 8
+    WNAF_WIDTH = 5
+
     @staticmethod
     def _extended_gcd(aa, bb):
         # https://en.wikipedia.org/wiki/Extended_Euclidean_algorithm
@@ -531,6 +648,36 @@ class EllipticCurve(EllipticCurveBase):
             raise ValueError("in EllipticCurve.modinv: g (%d) != 1, x = %d, y = %d" % (g, x, y))
         return x % n
 
+    @staticmethod
+    def batch_modinv(values, n):
+        """ Provides the modular inverses of all of values wrt n.
+
+        This uses Montgomery's trick so that only a single modular
+        inversion is computed, at the cost of 3 multiplications per
+        value.
+
+        Args:
+            values (list(int)): numbers to find modular inverses of. None
+                of them may be 0 mod n.
+            n (int): modulus
+
+        Returns:
+            list(int): The modular inverses, in the same order as values.
+        """
+        prefix = []
+        acc = 1
+        for v in values:
+            prefix.append(acc)
+            acc = (acc * v) % n
+
+        inv = EllipticCurve.modinv(acc, n)
+        rv = [0] * len(values)
+        for i in reversed(range(len(values))):
+            rv[i] = (inv * prefix[i]) % n
+            inv = (inv * values[i]) % n
+
+        return rv
+
     @staticmethod
     def modsqrt(a, n):
         if a == 0:
@@ -555,6 +702,15 @@ class EllipticCurve(EllipticCurveBase):
         self.nlen = self.n.bit_length()
         self.plen = self.p.bit_length()
 
+        # Maps (x, y) of recently verified public keys to their wNAF
+        # multiples. See _public_key_multiples().
+        self._key_cache = OrderedDict()
+
+        # Precomputed multiples of G, built on first use. See
+        # _base_tables().
+        self._base_window_table = None
+        self._base_wnaf_table = None
+
     def __eq__(self, other_curve):
         return (self.a == other_curve.a) and (self.b == other_curve.b) and \
             (self.p == other_curve.p) and (self.n == other_curve.n) and (self.G == other_curve.G)
@@ -570,6 +726,88 @@ class EllipticCurve(EllipticCurveBase):
         """
         return (pow(p.y, 2, self.p) - pow(p.x, 3, self.p) - self.a * p.x - self.b) % self.p == 0
 
+    def normalize(self, points):
+        """ Converts Jacobian points to have z = 1 using a single modular
+        inversion for all of them.
+
+        Args:
+            points (list(ECPointJacobian)): The points to convert.
+
+        Returns:
+            list(ECPointJacobian): Equivalent points with z = 1 (or the
+                point at infinity).
+        """
+        finite = [i for i, pt in enumerate(points) if not pt.infinity]
+        zinvs = self.batch_modinv([points[i].z for i in finite], self.p)
+
+        rv = list(points)
+        for i, zinv in zip(finite, zinvs):
+            zinv2 = (zinv * zinv) % self.p
+            rv[i] = ECPointJacobian(self,
+                                    (points[i].x * zinv2) % self.p,
+                                    (points[i].y * zinv2 * zinv) % self.p,
+                                    1)
+
+        return rv
+
+    def _base_tables(self):
+        """ Returns the precomputed multiples of G, building them on the
+        first call.
+
+        Returns:
+            tuple: A fixed-window table, where entry [i][d - 1] is
+                d * 2^(BASE_WINDOW * i) * G, and the wNAF multiples of G
+                (see wnaf_precompute()) for width BASE_WNAF_WIDTH.
+        """
+        if self._base_window_table is None:
+            w = self.BASE_WINDOW
+            rows = []
+            base = self.base_point
+            for i in range((self.nlen + w - 1) // w):
+                row = [base]
+                for d in range((1 << w) - 2):
+                    row.append(row[-1] + base)
+                rows.append(row)
+                base = row[-1] + base
+
+            flat = self.normalize([pt for row in rows for pt in row])
+            size = (1 << w) - 1
+            table = [flat[i:i + size] for i in range(0, len(flat), size)]
+
+            self._base_wnaf_table = wnaf_precompute(self.base_point,
+                                                    self.BASE_WNAF_WIDTH)
+            self._base_window_table = table
+
+        return self._base_window_table, self._base_wnaf_table
+
+    def base_point_multiply(self, k):
+        """ Computes k*G using a precomputed fixed-window table.
+
+        Each window of BASE_WINDOW bits of k selects one precomputed
+        point so that no doublings are needed at all. This is not
+        constant-time; signing nonces are multiplied with the Montgomery
+        ladder instead.
+
+        Args:
+            k (int): The scalar to multiply G by.
+
+        Returns:
+            ECPointJacobian: k*G
+        """
+        table, _ = self._base_tables()
+        w = self.BASE_WINDOW
+        mask = (1 << w) - 1
+        k %= self.n
+
+        r = ECPointJacobian(self, 0, 0, 0, True)
+        for row in table:
+            d = k & mask
+            if d:
+                r = r + row[d - 1]
+            k >>= w
+
+        return r
+
     @property
     def base_point(self):
         """ Returns the base point for this curve.
@@ -630,10 +868,66 @@ class EllipticCurve(EllipticCurveBase):
         Returns:
             ECPointAffine: The point representing the public key.
         """
-        public = (self.base_point * private_key).to_affine()
+        public = self.base_point_multiply(private_key).to_affine()
 
         return public
 
+    def add_base_multiples(self, point, scalars):
+        """ Computes point + k*G for each k in scalars.
+
+        Like base_point_multiply(), this walks the precomputed window
+        table, but the accumulator starts at point rather than at
+        infinity and the (always normalized) table entries are added
+        with inlined mixed additions on plain integers. All results are
+        converted back to affine coordinates with a single modular
+        inversion. The rare sums that hit a doubling or infinity fall
+        back to the generic point arithmetic.
+
+        Args:
+            point (ECPointAffine): The point to offset.
+            scalars (list(int)): The multiples of G to add to point.
+
+        Returns:
+            list(ECPointAffine): The resulting points, in the same
+               order as scalars.
+        """
+        table, _ = self._base_tables()
+        w = self.BASE_WINDOW
+        mask = (1 << w) - 1
+        p = self.p
+
+        sums = []
+        for k in scalars:
+            x, y, z = point.x, point.y, 1
+            e = k % self.n
+            for row in table:
+                d = e & mask
+                e >>= w
+                if not d:
+                    continue
+
+                q = row[d - 1]
+                z2 = (z * z) % p
+                h = (q.x * z2 - x) % p
+                r = (q.y * z2 * z - y) % p
+                if h == 0:
+                    break
+
+                h2 = (h * h) % p
+                h3 = (h2 * h) % p
+                u1h2 = x * h2
+                x = (r * r - h3 - 2 * u1h2) % p
+                y = (r * (u1h2 - x) - y * h3) % p
+                z = (z * h) % p
+            else:
+                sums.append(ECPointJacobian(self, x, y, z))
+                continue
+
+            sums.append(self.base_point_multiply(k) + point.to_jacobian())
+
+        return [ECPointAffine(self, s.x, s.y, s.infinity)
+                for s in self.normalize(sums)]
+
     def recover_public_key(self, message, signature, recovery_id=None):
         """ Recovers possibilities for the public key associated with the
         private key used to sign message and generate signature.
@@ -678,14 +972,18 @@ class EllipticCurve(EllipticCurveBase):
                 if y & 0x1 != k:
                     y = ys[k ^ 1]
                 R = ECPointJacobian(self, r, y, 1)
+                R_multiples = wnaf_precompute(R, self.WNAF_WIDTH)
 
-                if not (R * self.n).to_affine().infinity:
+                if not wnaf_multiply([(self.n, self.WNAF_WIDTH, R_multiples)]).infinity:
                     continue
 
                 z = int.from_bytes(self.hash_function(message).digest()[:num_bytes], 'big')
 
-                zG = self.base_point * z
-                pub_key = ((R * s - zG) * r_modinv).to_affine()
+                # Q = r^-1 * (s*R - z*G) = (r^-1 * s)*R + (-r^-1 * z)*G
+                _, g_multiples = self._base_tables()
+                pub_key = wnaf_multiply(
+                    [((r_modinv * s) % self.n, self.WNAF_WIDTH, R_multiples),
+                     ((-r_modinv * z) % self.n, self.BASE_WNAF_WIDTH, g_multiples)]).to_affine()
 
                 rv.append((pub_key, 2 * i + k))
 
@@ -703,7 +1001,9 @@ class EllipticCurve(EllipticCurveBase):
         while r == 0 or s == 0:
             k = self._nonce_rfc6979(private_key, hashed) if secret is None else secret
 
-            p = (G * k).to_affine()
+            # The nonce is secret, so this deliberately uses the
+            # Montgomery ladder rather than base_point_multiply().
+            p = montgomery_ladder(k, G).to_affine()
             assert self.h == 1
             recovery_id = 2 if p.x > self.n else 0
             recovery_id |= (p.y & 0x1)
@@ -731,24 +1031,104 @@ class EllipticCurve(EllipticCurveBase):
         Returns:
             bool: True if the signature is verified, False otherwise.
         """
-        r = signature.x
-        s = signature.y
-
         hashed = self.hash_function(message).digest() if do_hash else message
-        z = int.from_bytes(hashed, 'big')
-
-        G = self.base_point
 
         assert public_key.x >= 1 and public_key.x <= (self.n - 1)
         assert public_key.y >= 1 and public_key.y <= (self.n - 1)
 
-        w = self.modinv(s, self.n)
-        u = (z * w) % self.n
+        if not self._signature_in_range(signature):
+            return False
+
+        w = self.modinv(signature.y, self.n)
 
+        return self._verify_with_inverse(hashed, signature.x, w, public_key)
+
+    def verify_batch(self, items, do_hash=True):
+        """ Verifies a number of signatures at once.
+
+        The inverses of all the s values are computed with a single
+        modular inversion, each u*G + v*Q is evaluated with a combined
+        multi-scalar multiplication and the resulting x is compared
+        against r without converting the point back to affine
+        coordinates. Parsed public keys are cached across calls.
+
+        Args:
+            items (list(tuple)): (public_key, message, signature) tuples,
+               with the same types as the respective arguments to `verify`.
+            do_hash (bool): True if the messages should be hashed prior
+               to verifying, False if not.
+
+        Returns:
+            list(bool): Whether each signature is verified, in the same
+               order as items.
+        """
+        rv = [False] * len(items)
+
+        pending = []
+        for i, (public_key, message, signature) in enumerate(items):
+            assert public_key.x >= 1 and public_key.x <= (self.n - 1)
+            assert public_key.y >= 1 and public_key.y <= (self.n - 1)
+            if self._signature_in_range(signature):
+                pending.append(i)
+
+        ws = self.batch_modinv([items[i][2].y for i in pending], self.n)
+        for i, w in zip(pending, ws):
+            public_key, message, signature = items[i]
+            hashed = self.hash_function(message).digest() if do_hash else message
+            rv[i] = self._verify_with_inverse(hashed, signature.x, w, public_key)
+
+        return rv
+
+    def _signature_in_range(self, signature):
+        """ Checks that both r and s are in [1, n).
+        """
+        return 1 <= signature.x < self.n and 1 <= signature.y < self.n
+
+    def _verify_with_inverse(self, hashed, r, w, public_key):
+        """ Checks that r == x(u*G + v*Q) mod n, given w = s^-1 mod n
+        and 1 <= r < n.
+        """
+        z = int.from_bytes(hashed, 'big')
+        u = (z * w) % self.n
         v = (r * w) % self.n
-        pt = (G * u + ECPointJacobian.from_affine(public_key) * v).to_affine()
 
-        return r == (pt.x % self.n)
+        _, g_multiples = self._base_tables()
+        pt = wnaf_multiply([(u, self.BASE_WNAF_WIDTH, g_multiples),
+                            (v, self.WNAF_WIDTH, self._public_key_multiples(public_key))])
+        if pt.infinity:
+            return False
+
+        # x(pt) = pt.x / pt.z^2 (mod p), so rather than inverting z^2 we
+        # check whether any x' in [0, p) with x' = r (mod n) satisfies
+        # x' * pt.z^2 == pt.x (mod p).
+        x = r
+        while x < self.p:
+            if (x * pt.z2 - pt.x) % self.p == 0:
+                return True
+            x += self.n
+
+        return False
+
+    def _public_key_multiples(self, public_key):
+        """ Returns the wNAF multiples of public_key (see
+        wnaf_precompute()) for width WNAF_WIDTH.
+
+        Args:
+            public_key (ECPointAffine): The public key point.
+
+        Returns:
+            list(tuple): The precomputed multiples.
+        """
+        k = (public_key.x, public_key.y)
+        pts = self._key_cache.get(k)
+        if pts is None:
+            q = ECPointJacobian(self, public_key.x, public_key.y, 1)
+            pts = wnaf_precompute(q, self.WNAF_WIDTH)
+            if len(self._key_cache) >= self.KEY_CACHE_SIZE:
+                self._key_cache.popitem(last=False)
+            self._key_cache[k] = pts
+
+        return pts
 
 
 class p256(EllipticCurve):
@@ -1,3 +1,4 @@
+import bisect
 import json
 import os
 import time
@@ -16,6 +17,10 @@ from two1.wallet.wallet_txn import WalletTransaction
 class CacheManager(object):
     """ This is a glorified dict that provides relational methods
         for getting transactions for addresses, etc.
+
+        Transactions are keyed by their raw 32-byte (internal order)
+        txid rather than its hex string, so lookups need neither a
+        byte reversal nor a hex encode.
     """
     # Statuses
     UNCONFIRMED = 0x10
@@ -29,14 +34,33 @@ class CacheManager(object):
 
     def __init__(self, testnet=False):
         self._address_cache = {}
+        self._address_paths = {}
+        self._hash160_paths = {}
         self._txns_by_addr = {}
         self._deposits_for_addr = {}
         self._spends_for_addr = {}
         self._inputs_cache = {}
         self._outputs_cache = {}
         self._txn_cache = {}
+        # Sorted (network_time, txid) tuples
+        self._txids_by_time = []
+
+        # Live UTXO index, maintained by insert_txn() and _delete_txn():
+        # unspent outpoints by address, the (confirmed, total) balance
+        # contribution of each outpoint and the resulting per-address
+        # and per-account [confirmed, total] balances.
+        self._utxos_for_addr = {}
+        self._outpoint_balances = {}
+        self._balances_for_addr = {}
+        self._balances_for_acct = {}
+
+        # Raw txids of unconfirmed or provisional transactions
+        self._pending_txids = set()
 
         self._dirty = False
+        self._new_addresses = []
+        self._dirty_txns = {}
+        self._deleted_txids = set()
 
         self._last_block = None
 
@@ -57,12 +81,31 @@ class CacheManager(object):
             self._last_block = b
             self._dirty = True
 
+    @staticmethod
+    def _txid_key(txid):
+        """ Returns the key used for txid in the transaction caches.
+
+        Args:
+            txid (Hash or str or bytes): A txid, either as a Hash, a hex
+                string in RPC order or raw bytes in internal order.
+
+        Returns:
+            bytes: The raw 32-byte txid.
+        """
+        if isinstance(txid, bytes):
+            return txid
+        elif isinstance(txid, str):
+            txid = Hash(txid)
+        return bytes(txid)
+
     def _serialize_cache(self, cache):
         """ Serializes a cache into a dict capable of being used
             as an arg to json.dumps().
         """
         newd = {}
         for k, v in cache.items():
+            if isinstance(k, bytes):
+                k = str(Hash(k))
             if isinstance(v, dict):
                 newd[k] = self._serialize_cache(v)
             elif isinstance(v, WalletTransaction):
@@ -110,6 +153,84 @@ class CacheManager(object):
 
         self._dirty = False
 
+    def save(self, store, force=False):
+        """ Persists the changes made to the cache since the last save()
+            to a cache store. Unlike to_file(), only the addresses and
+            transactions that were inserted, updated or removed are
+            written.
+
+        Args:
+            store (CacheStoreBase): The store to write to.
+            force (bool): Writes the entire cache rather than only what
+                changed.
+        """
+        if not self._dirty and not force:
+            return
+
+        if force:
+            hash160s = {path: h for h, path in self._hash160_paths.items()}
+            addresses = [(acct_index, chain, index, address,
+                          hash160s.get((acct_index, chain, index), None))
+                         for acct_index, chains in self._address_cache.items()
+                         for chain, addrs in chains.items()
+                         for index, address in addrs.items()]
+            txids = self._txn_cache.keys()
+        else:
+            addresses = self._new_addresses
+            txids = self._dirty_txns.keys()
+
+        txns = []
+        for txid in txids:
+            wt = self._txn_cache[txid]
+            addrs = self._dirty_txns.get(txid, None)
+            if addrs is None:
+                addrs = wt.get_addresses(self.testnet)
+            txns.append((wt, addrs))
+
+        store.save(last_block=self.last_block,
+                   addresses=addresses,
+                   txns=txns,
+                   deleted_txids=list(self._deleted_txids))
+
+        self._new_addresses = []
+        self._dirty_txns = {}
+        self._deleted_txids = set()
+        self._dirty = False
+
+    def load_from_store(self, store, prune_provisional=True):
+        """ Loads the cache manager from a cache store
+
+        Args:
+            store (CacheStoreBase): The store to read from.
+            prune_provisional (bool): If True, does not insert
+                provisionally-marked txns that have expired.
+        """
+        d = store.load()
+
+        if d['last_block'] is not None:
+            self.last_block = d['last_block']
+
+        for acct_index, chain, index, address, hash160 in d['addresses']:
+            self.insert_address(acct_index, chain, index, address, hash160)
+
+        now = time.time()
+        for t, addrs in d['txns']:
+            if t.provisional:
+                if not prune_provisional or t.provisional > now:
+                    self.insert_txn(t,
+                                    mark_provisional=True,
+                                    expiration=t.provisional,
+                                    addresses=addrs)
+                else:
+                    self._deleted_txids.add(bytes(t.hash))
+            else:
+                self.insert_txn(t, mark_provisional=False, addresses=addrs)
+
+        # Everything else is already in the store.
+        self._new_addresses = []
+        self._dirty_txns = {}
+        self._dirty = bool(self._deleted_txids)
+
     def load_from_dict(self, d, prune_provisional=True):
         """ Loads the cache manager from a dict
 
@@ -131,6 +252,15 @@ class CacheManager(object):
                                                        for k3, v3 in v2.items()}
                                              for k2, v2 in v1.items()}
                                    for k1, v1 in d['addresses'].items()}
+            self._address_paths = {
+                addr: (acct_index, chain, index)
+                for acct_index, chains in self._address_cache.items()
+                for chain, addrs in chains.items()
+                for index, addr in addrs.items()}
+            self._hash160_paths = {}
+            self._balances_for_acct = {}
+            for addr, bal in self._balances_for_addr.items():
+                self._add_to_account_balance(addr, bal[0], bal[1])
 
         if "txns" in d:
             now = time.time()
@@ -160,7 +290,7 @@ class CacheManager(object):
 
         self.load_from_dict(cache)
 
-    def insert_address(self, acct_index, chain, index, address):
+    def insert_address(self, acct_index, chain, index, address, hash160=None):
         """ Inserts an address into the cache
 
         Args:
@@ -169,6 +299,9 @@ class CacheManager(object):
                 HDAccount.PAYOUT_CHAIN
             index (int): The index in the chain
             address (str): The address to insert
+            hash160 (bytes): The HASH160 of the public key for address,
+                if known. This allows get_hash160_path() to find the
+                address without Base58Check encoding.
         """
         if chain not in [0, 1]:
             raise ValueError("chain must be either 0 or 1")
@@ -181,6 +314,13 @@ class CacheManager(object):
             self._address_cache[acct_index] = {0: {}, 1: {}}
 
         self._address_cache[acct_index][chain][index] = address
+        self._address_paths[address] = (acct_index, chain, index)
+        if hash160 is not None:
+            self._hash160_paths[hash160] = (acct_index, chain, index)
+        if address in self._balances_for_addr:
+            bal = self._balances_for_addr[address]
+            self._add_to_account_balance(address, bal[0], bal[1])
+        self._new_addresses.append((acct_index, chain, index, address, hash160))
 
         self._dirty = True
 
@@ -206,6 +346,51 @@ class CacheManager(object):
 
         return rv
 
+    @property
+    def num_addresses(self):
+        """ Returns the number of addresses in the cache. Addresses are
+            only ever added, so it changes whenever the set of addresses
+            does.
+
+        Returns:
+            int: The number of addresses.
+        """
+        return len(self._address_paths)
+
+    def get_address_path(self, address):
+        """ Returns the derivation path of an address in the cache
+
+        Args:
+            address (str): The address to look up.
+
+        Returns:
+            tuple or None: (account index, chain, index) or None if
+                the address is not in the cache.
+        """
+        return self._address_paths.get(address, None)
+
+    def get_hash160_path(self, hash160):
+        """ Returns the derivation path of the P2PKH address in the
+            cache with the given public key hash.
+
+        Args:
+            hash160 (bytes): The HASH160 of the public key.
+
+        Returns:
+            tuple or None: (account index, chain, index) or None if
+                the address is not in the cache.
+        """
+        rv = self._hash160_paths.get(hash160, None)
+        if rv is None:
+            version = Script.P2PKH_TESTNET_VERSION if self.testnet \
+                else Script.P2PKH_MAINNET_VERSION
+            rv = self._address_paths.get(
+                key_hash_to_address(hash160, version), None)
+            if rv is not None:
+                self._hash160_paths[hash160] = rv
+
+        return rv
+
     def get_addresses_for_chain(self, acct_index, chain):
         """ Returns all addresses for a particular chain, in order by
             their index in the chain.
@@ -250,7 +435,8 @@ class CacheManager(object):
 
         return rv
 
-    def insert_txn(self, wallet_txn, mark_provisional=False, expiration=0):
+    def insert_txn(self, wallet_txn, mark_provisional=False, expiration=0,
+                   addresses=None):
         """ Inserts a transaction into the cache and updates the
             relevant dicts based on the addresses found in the
             transaction.
@@ -268,8 +454,11 @@ class CacheManager(object):
                 unless mark_provisional=True. If expiration == 0, it is set
                 to time.time() + PROVISIONAL_MAX_DURATION. This cannot be
                 greater than PROVISIONAL_MAX_DURATION seconds in the future.
+            addresses (dict): The result of
+                wallet_txn.get_addresses(self.testnet), if it is already
+                known. It may be modified.
         """
-        txid = str(wallet_txn.hash)
+        txid = bytes(wallet_txn.hash)
 
         # Check if it's already in with no change in status
         if txid in self._txn_cache and \
@@ -289,7 +478,11 @@ class CacheManager(object):
         if not mark_provisional and wallet_txn.provisional:
             wallet_txn.provisional = False
 
+        if txid in self._txn_cache:
+            self._remove_txn_time(txid)
         self._txn_cache[txid] = wallet_txn
+        bisect.insort(self._txids_by_time, self._txn_time_key(txid))
+        self._deleted_txids.discard(txid)
 
         conf = wallet_txn.confirmations > 0
         status = self.SPENT
@@ -301,8 +494,20 @@ class CacheManager(object):
             status |= self.PROVISIONAL
             out_status |= self.PROVISIONAL
 
+        if conf and not mark_provisional:
+            self._pending_txids.discard(txid)
+        else:
+            self._pending_txids.add(txid)
+
         # Get all the addresses for the transaction
-        addrs = wallet_txn.get_addresses(self.testnet)
+        addrs = addresses
+        if addrs is None:
+            addrs = wallet_txn.get_addresses(self.testnet)
+
+        # Keep the addresses around until the next save() so they don't
+        # need to be recomputed to write out the transaction.
+        self._dirty_txns[txid] = dict(inputs=list(addrs['inputs']),
+                                      outputs=addrs['outputs'])
 
         if txid not in self._inputs_cache:
             self._inputs_cache[txid] = dict()
@@ -324,26 +529,31 @@ class CacheManager(object):
                 addrs['inputs'][i] = [a]
 
             # Update the status of any outputs
-            out_txid = str(inp.outpoint)
+            out_txid = bytes(inp.outpoint)
             if out_txid not in self._outputs_cache:
                 self._outputs_cache[out_txid] = {}
 
             if inp.outpoint_index not in self._outputs_cache[out_txid]:
                 d = dict(output=None,
+                         addresses=[],
                          status=status,
                          spend_txid=txid,
-                         spend_index=i)
+                         spend_index=i,
+                         spend_addresses=addrs['inputs'][i])
                 self._outputs_cache[out_txid][inp.outpoint_index] = d
             else:
                 x = self._outputs_cache[out_txid][inp.outpoint_index]
                 x['status'] = status
                 x['spend_txid'] = txid
                 x['spend_index'] = i
+                x['spend_addresses'] = addrs['inputs'][i]
+            self._update_outpoint_balance(out_txid, inp.outpoint_index)
 
         for i, out in enumerate(wallet_txn.outputs):
             if i in self._outputs_cache[txid]:
                 o = self._outputs_cache[txid][i]
                 o['output'] = out
+                o['addresses'] = addrs['outputs'][i]
                 # Only update the status if it is unconfirmed unspent going
                 # to confirmed unspent as it is possible that an input has
                 # already marked it as spent.
@@ -351,9 +561,14 @@ class CacheManager(object):
                     o['status'] = out_status
             else:
                 self._outputs_cache[txid][i] = dict(output=out,
+                                                    addresses=addrs['outputs'][i],
                                                     status=out_status,
                                                     spend_txid=None,
-                                                    spend_index=None)
+                                                    spend_index=None,
+                                                    spend_addresses=[])
+            # This also picks up a change in the number of confirmations
+            # of this transaction.
+            self._update_outpoint_balance(txid, i)
 
         self._insert_txid(txid, addrs['inputs'], 'input')
         self._insert_txid(txid, addrs['outputs'], 'output')
@@ -367,7 +582,7 @@ class CacheManager(object):
             THIS IS NOT A PUBLIC API.
 
         Args:
-            txid (Hash): The txid to associate with the addresses.
+            txid (bytes): The raw txid to associate with the addresses.
             addresses (list): List of addresses associated with the input.
             inout (str): "input" if the txid is an input to the list of addresses,
                 "output" if the txid is an output.
@@ -379,20 +594,183 @@ class CacheManager(object):
         else:
             raise TypeError("inout must either be 'input' or 'output'")
 
-        _txid = str(txid) if isinstance(txid, Hash) else txid
-
         for i, addrs in enumerate(addresses):
             for a in addrs:
                 if a not in cache:
                     cache[a] = {}
                 if txid not in cache[a]:
-                    cache[a][_txid] = set()
+                    cache[a][txid] = set()
 
-                cache[a][_txid].add(i)
+                cache[a][txid].add(i)
 
                 if a not in self._txns_by_addr:
                     self._txns_by_addr[a] = set()
-                self._txns_by_addr[a].add(_txid)
+                self._txns_by_addr[a].add(txid)
+
+    def _txn_time_key(self, txid):
+        """ Returns the key of a cached transaction in _txids_by_time.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (bytes): The raw txid.
+
+        Returns:
+            tuple: (network_time, txid)
+        """
+        return (self._txn_cache[txid].network_time or 0, txid)
+
+    def _remove_txn_time(self, txid):
+        """ Removes a cached transaction from _txids_by_time.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (bytes): The raw txid.
+        """
+        key = self._txn_time_key(txid)
+        i = bisect.bisect_left(self._txids_by_time, key)
+        if i < len(self._txids_by_time) and self._txids_by_time[i] == key:
+            del self._txids_by_time[i]
+
+    def _outpoint_balance(self, txid, index):
+        """ Computes what an outpoint contributes to address balances.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (bytes): The raw txid of the outpoint.
+            index (int): The output index of the outpoint.
+
+        Returns:
+            tuple: (addresses, confirmed, total, spend_addresses,
+                spend_confirmed): the output's addresses with the amounts
+                to add to their confirmed and total balances, and the
+                addresses of the input spending it with the amount to add
+                to their confirmed balances.
+        """
+        o = self._outputs_cache[txid][index]
+        out = o['output']
+        status = o['status']
+        if out is None:
+            return ([], 0, 0, [], 0)
+
+        confirmed = total = spend_confirmed = 0
+        if status & self.UNSPENT:
+            total = out.value
+            if status == self.UNSPENT:
+                confirmed = out.value
+        elif status & (self.UNCONFIRMED | self.PROVISIONAL) and \
+                self._txn_cache[txid].confirmations != 0:
+            # An unconfirmed spend of a confirmed output still counts
+            # towards the confirmed balance of the spending address so
+            # that it isn't unnecessarily shown lower. Chained unconfirmed
+            # spends don't.
+            spend_confirmed = out.value
+
+        return (o['addresses'], confirmed, total,
+                o['spend_addresses'], spend_confirmed)
+
+    def _update_outpoint_balance(self, txid, index):
+        """ Updates the UTXO index and the address and account balances
+            after the status of an outpoint (or the number of
+            confirmations of its transaction) changed.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (bytes): The raw txid of the outpoint.
+            index (int): The output index of the outpoint.
+        """
+        self._remove_outpoint_balance(txid, index)
+
+        bal = self._outpoint_balance(txid, index)
+        addresses, confirmed, total, spend_addresses, spend_confirmed = bal
+        if not (total or spend_confirmed):
+            return
+
+        self._outpoint_balances[(txid, index)] = bal
+        for a in addresses:
+            self._add_to_balance(a, confirmed, total)
+            if total:
+                if a not in self._utxos_for_addr:
+                    self._utxos_for_addr[a] = {}
+                self._utxos_for_addr[a][(txid, index)] = None
+        for a in spend_addresses:
+            self._add_to_balance(a, spend_confirmed, 0)
+
+    def _remove_outpoint_balance(self, txid, index):
+        """ Removes an outpoint from the UTXO index and takes its
+            contribution out of the address and account balances.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (bytes): The raw txid of the outpoint.
+            index (int): The output index of the outpoint.
+        """
+        bal = self._outpoint_balances.pop((txid, index), None)
+        if bal is None:
+            return
+
+        addresses, confirmed, total, spend_addresses, spend_confirmed = bal
+        for a in addresses:
+            self._add_to_balance(a, -confirmed, -total)
+            utxos = self._utxos_for_addr.get(a)
+            if utxos is not None:
+                utxos.pop((txid, index), None)
+                if not utxos:
+                    del self._utxos_for_addr[a]
+        for a in spend_addresses:
+            self._add_to_balance(a, -spend_confirmed, 0)
+
+    def _add_to_balance(self, address, confirmed, total):
+        """ Adds amounts to the balances of an address and its account.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            address (str): The address.
+            confirmed (int): Amount to add to the confirmed balance.
+            total (int): Amount to add to the total balance.
+        """
+        if address not in self._balances_for_addr:
+            self._balances_for_addr[address] = [0, 0]
+        bal = self._balances_for_addr[address]
+        bal[0] += confirmed
+        bal[1] += total
+        if not (bal[0] or bal[1]):
+            del self._balances_for_addr[address]
+
+        self._add_to_account_balance(address, confirmed, total)
+
+    def _add_to_account_balance(self, address, confirmed, total):
+        """ Adds amounts to the balances of the account an address
+            belongs to, if it is in the cache.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            address (str): The address.
+            confirmed (int): Amount to add to the confirmed balance.
+            total (int): Amount to add to the total balance.
+        """
+        path = self._address_paths.get(address, None)
+        if path is None:
+            return
+
+        if path[0] not in self._balances_for_acct:
+            self._balances_for_acct[path[0]] = [0, 0]
+        bal = self._balances_for_acct[path[0]]
+        bal[0] += confirmed
+        bal[1] += total
 
     def _delete_txn(self, txid):
         """ Removes a transaction from the cache and updates any
@@ -405,9 +783,9 @@ class CacheManager(object):
             have "expired".
 
         Args:
-            txid (Hash or str): The ID of the transaction to remove.
+            txid (Hash or str or bytes): The ID of the transaction to remove.
         """
-        _txid = str(txid)
+        _txid = self._txid_key(txid)
         if _txid not in self._txn_cache:
             return
 
@@ -417,7 +795,7 @@ class CacheManager(object):
 
         for i, inp in enumerate(txn.inputs):
             # Update the status of any outpoints
-            out_txid = str(inp.outpoint)
+            out_txid = bytes(inp.outpoint)
 
             x = self._outputs_cache[out_txid][inp.outpoint_index]
             x['status'] = self.UNSPENT
@@ -428,6 +806,8 @@ class CacheManager(object):
                 x['status'] |= self.UNCONFIRMED
             x['spend_txid'] = None
             x['spend_index'] = None
+            x['spend_addresses'] = []
+            self._update_outpoint_balance(out_txid, inp.outpoint_index)
 
         addresses = set()
         for addr_list in addrs['inputs'] + addrs['outputs']:
@@ -449,9 +829,15 @@ class CacheManager(object):
             del self._inputs_cache[_txid]
 
         if _txid in self._outputs_cache:
+            for i in self._outputs_cache[_txid]:
+                self._remove_outpoint_balance(_txid, i)
             del self._outputs_cache[_txid]
 
+        self._remove_txn_time(_txid)
         del self._txn_cache[_txid]
+        self._pending_txids.discard(_txid)
+        self._dirty_txns.pop(_txid, None)
+        self._deleted_txids.add(_txid)
 
         self._dirty = True
 
@@ -490,29 +876,73 @@ class CacheManager(object):
         """ Returns the transaction object and metadata for txid
 
         Args:
-            txid (Hash): The txid to retrieve.
+            txid (Hash or str or bytes): The txid to retrieve.
 
         Returns:
             dict: A dict containing 'metadata' and 'transaction' keys or
                 None if the transaction is not in the cache.
         """
-        _txid = str(txid) if isinstance(txid, Hash) else txid
-        return self._txn_cache.get(_txid, None)
+        return self._txn_cache.get(self._txid_key(txid), None)
 
     def have_transaction(self, txid):
         """ Returns whether or not a txid (and associated transaction)
             is in the cache.
 
         Args:
-            txid (Hash): The txid to retrieve.
+            txid (Hash or str or bytes): The txid to retrieve.
 
         Returns:
             dict: A dict containing 'metadata' and 'transaction' keys or
                 None if the transaction is not in the cache.
         """
-        _txid = str(txid) if isinstance(txid, Hash) else txid
+        _txid = self._txid_key(txid)
         return _txid in self._txn_cache and self._txn_cache[_txid]
 
+    def get_pending_txids(self):
+        """ Returns the IDs of transactions that are either unconfirmed
+            or provisional.
+
+        Returns:
+            list(bytes): Raw txids.
+        """
+        return list(self._pending_txids)
+
+    def get_txids_by_time(self, since=None, cursor=None, reverse=False):
+        """ Iterates over the cached transactions in order of network
+            time, without sorting them.
+
+        Args:
+            since (int): If given, only transactions with a network time
+                at or after this (in seconds from epoch) are returned.
+            cursor (Hash or str or bytes): If given, starts right after
+                (or, with reverse=True, right before) this transaction.
+            reverse (bool): If True, returns the most recent transactions
+                first.
+
+        Returns:
+            generator: Raw txids (bytes). Transactions inserted or removed
+                while iterating may or may not be returned.
+
+        Raises:
+            ValueError: If cursor is not in the cache.
+        """
+        index = self._txids_by_time
+        lo, hi = 0, len(index)
+        if since is not None:
+            lo = bisect.bisect_left(index, (since,))
+        if cursor is not None:
+            _txid = self._txid_key(cursor)
+            if _txid not in self._txn_cache:
+                raise ValueError("Transaction %s is not in the cache." % Hash(_txid))
+            key = self._txn_time_key(_txid)
+            if reverse:
+                hi = bisect.bisect_left(index, key)
+            else:
+                lo = max(lo, bisect.bisect_right(index, key))
+
+        positions = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+        return (index[i][1] for i in positions if i < len(index))
+
     def get_txns_for_address(self, address):
         """ Returns a list of transactions for the address
 
@@ -520,10 +950,9 @@ class CacheManager(object):
             address (str): The address to retrieve transactions for.
 
         Returns:
-            list: A list of dicts containing transaction metadata and
-               the Transaction object.
+            list: A list of Hash objects, one per txid.
         """
-        return list(self._txns_by_addr.get(address, set()))
+        return [Hash(txid) for txid in self._txns_by_addr.get(address, ())]
 
     def address_has_txns(self, address):
         """ Returns whether or not an address has any transactions
@@ -536,7 +965,7 @@ class CacheManager(object):
             bool: True if there are transactions for the address,
                 False otherwise.
         """
-        return bool(self.get_txns_for_address(address))
+        return bool(self._txns_by_addr.get(address))
 
     def get_utxos(self, addresses, include_unconfirmed=False):
         """ Returns a dict containing the UTXOs for the desired
@@ -551,36 +980,28 @@ class CacheManager(object):
             dict: Keys are addresses, values are lists of
                 UnspentTransactionOutput objects for the address.
         """
-        unconfirmed_mask = self.UNSPENT | self.UNCONFIRMED | self.PROVISIONAL
         rv = {}
         for addr in addresses:
-            # Get the list of unspent deposits.
-            if addr not in self._deposits_for_addr:
+            if addr not in self._utxos_for_addr:
                 continue
 
-            for txid in self._deposits_for_addr[addr]:
-                for i in self._deposits_for_addr[addr][txid]:
-                    # Look up the status in the outputs cache
-                    if txid not in self._outputs_cache or \
-                       i not in self._outputs_cache[txid]:
-                        raise Exception("Don't have information for %r:%r" %
-                                        (txid, i))
-
-                    status = self._outputs_cache[txid][i]['status']
-                    if status & self.UNSPENT:
-                        if (status & unconfirmed_mask and include_unconfirmed) or \
-                           (status == self.UNSPENT and not include_unconfirmed):
-                            out = self._outputs_cache[txid][i]['output']
-                            utxo = UnspentTransactionOutput(
-                                transaction_hash=Hash(txid),
-                                outpoint_index=i,
-                                value=out.value,
-                                scr=out.script,
-                                confirmations=self._txn_cache[txid].confirmations)
-
-                            if addr not in rv:
-                                rv[addr] = []
-                            rv[addr].append(utxo)
+            utxos = []
+            for txid, i in self._utxos_for_addr[addr]:
+                o = self._outputs_cache[txid][i]
+                if not include_unconfirmed and o['status'] != self.UNSPENT:
+                    continue
+
+                out = o['output']
+                txn = self._txn_cache[txid]
+                utxos.append(UnspentTransactionOutput(
+                    transaction_hash=txn.hash,
+                    outpoint_index=i,
+                    value=out.value,
+                    scr=out.script,
+                    confirmations=txn.confirmations))
+
+            if utxos:
+                rv[addr] = utxos
 
         return rv
 
@@ -597,40 +1018,39 @@ class CacheManager(object):
             dict: Keys are addresses, values are balances for the address.
         """
         # Confirmed Balance = sum(all confirmed utxos) + unconfirmed spends
-        utxos_by_addr = self.get_utxos(addresses, include_unconfirmed)
+        k = 1 if include_unconfirmed else 0
+        no_balance = (0, 0)
+        return {addr: self._balances_for_addr.get(addr, no_balance)[k]
+                for addr in addresses}
 
-        balances = {}
+    def get_address_balances(self, addresses):
+        """ Returns both the confirmed and total balances of the desired
+            addresses.
 
-        for addr, utxo_list in utxos_by_addr.items():
-            balances[addr] = sum([u.value for u in utxo_list])
+        Args:
+            addresses (list): List of addresses to get balances for
 
+        Returns:
+            dict: Keys are addresses, values are dicts with 'confirmed'
+                and 'total' keys.
+        """
+        no_balance = (0, 0)
+        rv = {}
         for addr in addresses:
-            if addr in self._spends_for_addr and not include_unconfirmed:
-                # If we're doing confirmed balances, we need to add in
-                # unconfirmed spends so that we're not unnecessarily
-                # showing a lower confirmed balance
-                for txid, indices in self._spends_for_addr[addr].items():
-                    for i in indices:
-                        inp = self._inputs_cache[txid][i]
-                        out_txid = str(inp.outpoint)
-                        out_index = inp.outpoint_index
-
-                        # Don't add in chained unconfirmed spends
-                        if self._txn_cache[out_txid].confirmations == 0:
-                            continue
-
-                        # Look up the outpoint index and see what
-                        # the status is
-                        out = self._outputs_cache[out_txid][out_index]
-                        if (out['status'] & self.SPENT) and \
-                           (out['status'] & self.UNCONFIRMED or out['status'] & self.PROVISIONAL):
-                            if addr not in balances:
-                                balances[addr] = 0
-                            balances[addr] += out['output'].value
-
-            # For any addresses that don't have UTXOs, set their
-            # balance to 0
-            if addr not in balances:
-                balances[addr] = 0
-
-        return balances
+            bal = self._balances_for_addr.get(addr, no_balance)
+            rv[addr] = {'confirmed': bal[0], 'total': bal[1]}
+
+        return rv
+
+    def get_account_balance(self, acct_index):
+        """ Returns the balance of all the addresses of an account
+            that are in the cache.
+
+        Args:
+            acct_index (int): Account index within wallet
+
+        Returns:
+            dict: A dict with 'confirmed' and 'total' keys.
+        """
+        bal = self._balances_for_acct.get(acct_index, (0, 0))
+        return {'confirmed': bal[0], 'total': bal[1]}
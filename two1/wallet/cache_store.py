@@ -0,0 +1,222 @@
+"""Provides persistent storage of the wallet's address and transaction cache."""
+import json
+import os
+import sqlite3
+
+from two1.bitcoin.hash import Hash
+from two1.bitcoin.txn import Transaction
+from two1.wallet.cache_manager import CacheManager
+from two1.wallet.wallet_txn import WalletTransaction
+
+
+class CacheStoreBase(object):
+    """ Base class for a wallet cache store.
+
+        A store holds the addresses and transactions known to a
+        CacheManager and is written incrementally: each save() only
+        carries what changed since the last one.
+    """
+
+    def load(self):
+        """ Reads the whole cache from the store.
+
+        Returns:
+            dict: A dict containing 'last_block' (int or None),
+                'addresses' (list of (acct_index, chain, index, address,
+                hash160) tuples) and 'txns' (iterable of
+                (WalletTransaction, addresses) tuples, which may be read
+                from the store as they are iterated over).
+        """
+        raise NotImplementedError
+
+    def save(self, last_block, addresses, txns, deleted_txids):
+        """ Persists changes to the cache.
+
+        Args:
+            last_block (int): The last block the cache knows about.
+            addresses (list): (acct_index, chain, index, address, hash160)
+                tuples of addresses that were inserted.
+            txns (list(tuple)): (WalletTransaction, addresses) tuples of
+                transactions that were inserted or updated, where
+                addresses is the result of get_addresses() for the
+                transaction. Storing it avoids recomputing it (which
+                involves parsing every script) on load.
+            deleted_txids (list(bytes)): Raw txids of transactions that
+                were removed.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Removes everything from the store.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ Closes the store.
+        """
+        pass
+
+
+class Sqlite3CacheStore(CacheStoreBase):
+    """ Sqlite3 implementation of the cache store.
+
+        The database is kept in WAL mode so that a save() only appends
+        the rows that changed instead of rewriting the whole cache.
+
+    Args:
+        db_path (str): Database path.
+    """
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+
+        if db_path != ":memory:":
+            # Create the file private before SQLite opens it: SQLite
+            # gives the -wal and -shm files the database's permissions.
+            os.close(os.open(db_path, os.O_RDWR | os.O_CREAT, 0o600))
+            for path in (db_path, db_path + "-wal", db_path + "-shm"):
+                if os.path.exists(path):
+                    os.chmod(path, 0o600)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        if db_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "meta ("
+                               "key VARCHAR NOT NULL PRIMARY KEY, "
+                               "value VARCHAR"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "addresses ("
+                               "acct_index INTEGER NOT NULL, "
+                               "chain INTEGER NOT NULL, "
+                               "idx INTEGER NOT NULL, "
+                               "address VARCHAR NOT NULL, "
+                               "hash160 BLOB, "
+                               "PRIMARY KEY (acct_index, chain, idx)"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "txns ("
+                               "txid BLOB NOT NULL PRIMARY KEY, "
+                               "txn BLOB NOT NULL, "
+                               "block INTEGER, "
+                               "block_hash VARCHAR, "
+                               "confirmations INTEGER, "
+                               "network_time INTEGER, "
+                               "value INTEGER, "
+                               "fees INTEGER, "
+                               "provisional FLOAT, "
+                               "addresses VARCHAR"
+                               ");")
+            self._conn.execute("INSERT OR IGNORE INTO meta VALUES (?,?)",
+                               ("version", str(self.SCHEMA_VERSION)))
+
+    @staticmethod
+    def _txn_to_sqlite(wt, addresses):
+        """ Converts a WalletTransaction into a tuple of SQLite values.
+
+        Args:
+            wt (WalletTransaction): The transaction.
+            addresses (dict): The addresses in the transaction.
+
+        Returns:
+            tuple: Tuple of SQLite values representing the transaction.
+        """
+        block_hash = None if wt.block_hash is None else str(wt.block_hash)
+        return (bytes(wt.hash), bytes(wt), wt.block, block_hash,
+                wt.confirmations, wt.network_time, wt.value, wt.fees,
+                wt.provisional or None, json.dumps(addresses))
+
+    @staticmethod
+    def _sqlite_to_txn(values):
+        """ Converts a tuple of SQLite values into a WalletTransaction.
+
+        Args:
+            values (tuple): Tuple of SQLite values representing a
+                transaction.
+
+        Returns:
+            tuple: The WalletTransaction and its addresses.
+        """
+        # The parsed transaction isn't shared with anything, so there's
+        # no need for the copy WalletTransaction.from_transaction() makes.
+        t, _ = Transaction.from_bytes(values[1])
+        wt = WalletTransaction(version=t.version,
+                               inputs=t.inputs,
+                               outputs=t.outputs,
+                               lock_time=t.lock_time,
+                               block=values[2],
+                               block_hash=None if values[3] is None else Hash.intern(values[3]),
+                               confirmations=values[4],
+                               network_time=values[5],
+                               value=values[6],
+                               fees=values[7])
+        wt.provisional = values[8] or False
+
+        return wt, json.loads(values[9])
+
+    def load(self):
+        cur = self._conn.execute("SELECT value FROM meta WHERE key='last_block'")
+        row = cur.fetchone()
+        last_block = None if row is None else int(row[0])
+
+        cur = self._conn.execute("SELECT acct_index, chain, idx, address, hash160 FROM addresses")
+        addresses = cur.fetchall()
+
+        cur = self._conn.execute("SELECT * FROM txns")
+        txns = (self._sqlite_to_txn(row) for row in cur)
+
+        return dict(last_block=last_block, addresses=addresses, txns=txns)
+
+    def save(self, last_block, addresses, txns, deleted_txids):
+        with self._conn:
+            if last_block is not None:
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?,?)",
+                                   ("last_block", str(last_block)))
+            self._conn.executemany("INSERT OR REPLACE INTO addresses VALUES (?,?,?,?,?)",
+                                   addresses)
+            self._conn.executemany("DELETE FROM txns WHERE txid=?",
+                                   [(txid,) for txid in deleted_txids])
+            self._conn.executemany("INSERT OR REPLACE INTO txns VALUES (?,?,?,?,?,?,?,?,?,?)",
+                                   [self._txn_to_sqlite(wt, addrs) for wt, addrs in txns])
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM meta WHERE key='last_block'")
+            self._conn.execute("DELETE FROM addresses")
+            self._conn.execute("DELETE FROM txns")
+
+    def close(self):
+        self._conn.close()
+
+
+def migrate_json_cache(json_file, store, testnet=False):
+    """ Copies a JSON cache file written by CacheManager.to_file() into
+        a cache store.
+
+    Args:
+        json_file (str): Path of the JSON cache file.
+        store (CacheStoreBase): The store to populate. Any existing
+            contents are replaced.
+        testnet (bool): Whether the cache belongs to a testnet wallet.
+            The addresses of each transaction are stored with it, so
+            they must be computed for the right network.
+
+    Returns:
+        bool: True if the file was migrated, False if it is not a cache
+            version that can be migrated.
+    """
+    with open(json_file) as f:
+        d = json.load(f)
+
+    if d.get("version", None) != CacheManager.CACHE_VERSION:
+        return False
+
+    cm = CacheManager(testnet)
+    cm.load_from_dict(d, prune_provisional=False)
+    store.clear()
+    cm.save(store, force=True)
+
+    return True
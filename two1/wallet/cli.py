@@ -794,15 +794,9 @@ def history(ctx, n, reverse, json_output, account):
     """ Print the wallet's history
     """
     w = ctx.obj['wallet']
-    history = w.transaction_history(accounts=list(account))
-
-    if reverse:
-        h = list(reversed(history))
-    else:
-        h = history
-
-    if n > 0:
-        h = h[:n]
+    h = w.transaction_history(accounts=list(account),
+                              limit=n if n > 0 else None,
+                              reverse=reverse)
 
     if json_output:
         click.echo(json.dumps(h))
@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import functools
 import logging
 import logging.handlers
@@ -12,7 +14,12 @@ from jsonrpcserver import Methods
 from jsonrpcserver.exceptions import ServerError
 from path import Path
 from two1.wallet import daemonizable
-from two1.wallet.socket_rpc_server import UnixSocketJSONRPCServer
+from two1.wallet import fees as txn_fees
+from two1.wallet.rwlock import ReadWriteLock
+from two1.wallet import socket_rpc_server
+from two1.wallet.socket_rpc_server import AsyncUnixSocketJSONRPCServer
+from two1.wallet.sync_scheduler import NotificationFeed
+from two1.wallet.sync_scheduler import SyncScheduler
 from two1.wallet.exceptions import DaemonRunningError
 from two1.wallet.exceptions import WalletLockedError
 from two1.wallet.exceptions import WalletNotLoadedError
@@ -24,19 +31,24 @@ import two1
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 DEF_WALLET_UPDATE_INTERVAL = 25   # seconds
 MAX_WALLET_UPDATE_INTERVAL = 300  # seconds
+LOCK_TIMEOUT = 10  # seconds
+MAX_NOTIFICATION_WAIT = 60  # seconds
 
 logger = logging.getLogger('walletd')
 methods = Methods()
+# Methods that wait, run on the RPC server's event loop
+async_methods = {}
 wallet = dict(obj=None,
               locked=False,
               path=None,
               data_provider=None,
               update_info=dict(interval=DEF_WALLET_UPDATE_INTERVAL,
                                last_update=time.time(),
-                               last_connection=time.time(),
-                               in_need=False))
+                               last_connection=time.time()))
 wallet_dict_lock = threading.Lock()
-client_lock = threading.Lock()
+# Daemon methods marked as readers share the wallet, the others
+# (and applying updates) have it to themselves.
+wallet_lock = ReadWriteLock()
 
 
 def track_connections_cb(data):
@@ -48,10 +60,8 @@ def track_connections_cb(data):
     since_last = now - wallet['update_info']['last_update']
     wallet['update_info']['last_connection'] = now
 
-    if since_last > DEF_WALLET_UPDATE_INTERVAL:
-        if wallet_dict_lock.acquire(True, 0.01):
-            wallet['update_info']['in_need'] = True
-            wallet_dict_lock.release()
+    if since_last > DEF_WALLET_UPDATE_INTERVAL and not sync_scheduler.syncing:
+        sync_scheduler.request_sync()
 
     curr_interval = wallet['update_info']['interval']
     if curr_interval > DEF_WALLET_UPDATE_INTERVAL:
@@ -60,6 +70,7 @@ def track_connections_cb(data):
                         DEF_WALLET_UPDATE_INTERVAL)
             wallet['update_info']['interval'] = DEF_WALLET_UPDATE_INTERVAL
             wallet_dict_lock.release()
+            sync_scheduler.reschedule()
 
 
 def sig_handler(sig_num, stack_frame):
@@ -73,7 +84,6 @@ def sig_handler(sig_num, stack_frame):
         stack_frame (str): Current stack frame.
     """
     logger.info("Shutting down...")
-    rpc_server.STOP_EVENT.set()
     rpc_server.shutdown()
 
 
@@ -84,60 +94,69 @@ def _handle_exception(e):
     raise ServerError(data=json.dumps(data))
 
 
-def do_update(block_on_acquire=True):
-    """ Updates the wallet info.
+@contextlib.contextmanager
+def _wallet_locked(reader):
+    """ Holds wallet_lock for reading or writing.
+
+    Args:
+        reader (bool): Whether to acquire the lock for reading.
+    """
+    if reader:
+        acquire, release = wallet_lock.acquire_read, wallet_lock.release_read
+    else:
+        acquire, release = wallet_lock.acquire_write, wallet_lock.release_write
+
+    if not acquire(LOCK_TIMEOUT):
+        logger.debug("Timed out waiting for %s lock" % ("read" if reader else "write"))
+        _handle_exception(TimeoutError("Timed out waiting for lock"))
+    try:
+        yield
+    finally:
+        release()
+
+
+def do_update():
+    """ Updates the wallet info and publishes what changed.
+
+        This is run by sync_scheduler.
     """
     if wallet['obj']:
-        lock_acquired = False
         try:
-            if wallet_dict_lock.acquire(block_on_acquire):
-                lock_acquired = True
-                logger.debug("Starting wallet update ...")
-                wallet['obj'].sync_accounts()
-                wallet['update_info']['last_update'] = time.time()
-                logger.debug("Completed update.")
-
-                if wallet['update_info']['in_need']:
-                    wallet['update_info']['in_need'] = False
+            logger.debug("Starting wallet update ...")
+            # Fetching only looks things up in the wallet, so it
+            # doesn't need wallet_lock: requests keep being served
+            # from the wallet as it was before the update, which is
+            # then applied all at once.
+            updates = wallet['obj'].fetch_updates()
+            with wallet_lock.writing():
+                changes = wallet['obj'].apply_updates(updates)
+            wallet['update_info']['last_update'] = time.time()
+            notifications.publish(changes)
+            logger.debug("Completed update.")
 
         except Exception as e:
             logger.error("Couldn't update balances: %s" % e)
         finally:
-
-            # Check if we should update the interval
-            curr_interval = wallet['update_info']['interval']
-            since_last_conn = int(
-                time.time() - wallet['update_info']['last_connection'])
-            if since_last_conn > curr_interval and \
-               curr_interval < MAX_WALLET_UPDATE_INTERVAL:
-                new_interval = 2 * curr_interval
-                # Clamp to max
-                if new_interval > MAX_WALLET_UPDATE_INTERVAL:
-                    new_interval = MAX_WALLET_UPDATE_INTERVAL
-                wallet['update_info']['interval'] = new_interval
-                logger.info("No connections in %ds. Setting interval to %ds." %
-                            (since_last_conn,
-                             new_interval))
-            if lock_acquired:
-                wallet_dict_lock.release()
-
-
-def data_updater():
-    """ Update thread target.
-
-        This function updates the account balances based on the
-        interval (default of 25 secons).
-    """
-    # This is a daemon thread so no need to explicitly
-    # poll for any shutdown events.
-    sleep_time = 0
-    while True:
-        interval = wallet['update_info']['interval']
-        if time.time() > sleep_time + interval or \
-           wallet['update_info']['in_need']:
-            do_update()
-            sleep_time = time.time()
-        time.sleep(1)
+            with wallet_dict_lock:
+                # Check if we should update the interval
+                curr_interval = wallet['update_info']['interval']
+                since_last_conn = int(
+                    time.time() - wallet['update_info']['last_connection'])
+                if since_last_conn > curr_interval and \
+                   curr_interval < MAX_WALLET_UPDATE_INTERVAL:
+                    new_interval = 2 * curr_interval
+                    # Clamp to max
+                    if new_interval > MAX_WALLET_UPDATE_INTERVAL:
+                        new_interval = MAX_WALLET_UPDATE_INTERVAL
+                    wallet['update_info']['interval'] = new_interval
+                    logger.info("No connections in %ds. Setting interval to %ds." %
+                                (since_last_conn,
+                                 new_interval))
+
+
+sync_scheduler = SyncScheduler(do_update,
+                               lambda: wallet['update_info']['interval'])
+notifications = NotificationFeed()
 
 
 def load_wallet(wallet_path, data_provider, passphrase):
@@ -200,25 +219,45 @@ def local_daemon_method(f):
     return wrapper
 
 
+def local_async_daemon_method(f):
+    """ Decorator function to create a daemon method from a coroutine
+        function, which the RPC server runs on its event loop instead
+        of a worker thread. It must not block.
+
+    Args:
+        f (function): The coroutine function to make a daemon method
+
+    Returns:
+        function: A wrapper coroutine function
+    """
+    async def wrapper(params):
+        return await f(*params['args'], **params['kwargs'])
+
+    async_methods[f.__name__] = wrapper
+
+    return wrapper
+
+
 def _call_daemon_method(method_name, is_property, params):
     _check_wallet_loaded()
     logger.debug("%s(%r, %r)" % (method_name,
                                  params['args'],
                                  params['kwargs']))
-    try:
-        attr = getattr(wallet['obj'], method_name)
-        if is_property:
-            return attr
-        else:
-            args, kwargs = daemonizable.serdes_args(
-                False, Two1Wallet, method_name,
-                *params['args'], **params['kwargs'])
-
-            return daemonizable.serdes_return_value(
-                True, Two1Wallet, method_name,
-                attr(*args, **kwargs))
-    except Exception as e:
-        _handle_exception(e)
+    with _wallet_locked(daemonizable.is_reader(Two1Wallet, method_name)):
+        try:
+            attr = getattr(wallet['obj'], method_name)
+            if is_property:
+                return attr
+            else:
+                args, kwargs = daemonizable.serdes_args(
+                    False, Two1Wallet, method_name,
+                    *params['args'], **params['kwargs'])
+
+                return daemonizable.serdes_return_value(
+                    True, Two1Wallet, method_name,
+                    attr(*args, **kwargs))
+        except Exception as e:
+            _handle_exception(e)
 
 
 def create_daemon_methods():
@@ -245,9 +284,10 @@ def unlock(passphrase):
         _handle_exception("Wallet is already unlocked or does not use a passphrase.")
 
     logger.info("Wallet unlocked. Loading ...")
-    load_wallet(wallet_path=wallet['path'],
-                data_provider=wallet['data_provider'],
-                passphrase=passphrase)
+    with _wallet_locked(reader=False):
+        load_wallet(wallet_path=wallet['path'],
+                    data_provider=wallet['data_provider'],
+                    passphrase=passphrase)
     logger.info("... loading complete.")
 
 
@@ -271,12 +311,33 @@ def wallet_path():
     return wallet['path']
 
 
-@local_daemon_method
-def sync_accounts():
-    """ RPC method to trigger an update
+@local_async_daemon_method
+async def sync_accounts():
+    """ RPC method to trigger an update and wait for it to complete.
     """
-    _check_wallet_loaded()
-    do_update()
+    # Checking may load the wallet, which blocks
+    await asyncio.get_event_loop().run_in_executor(None, _check_wallet_loaded)
+    await sync_scheduler.request_sync_async()
+
+
+@local_async_daemon_method
+async def get_notifications(since=0, timeout=0):
+    """ RPC method to get what wallet updates changed, so clients can
+        wait for changes instead of polling balances.
+
+    Args:
+        since (int): The 'seq' of the last notification the client has
+            seen, or 0.
+        timeout (float): If there are no newer notifications, the
+            maximum number of seconds (up to MAX_NOTIFICATION_WAIT) to
+            wait for one. On a newline-delimited connection, the wait
+            ends early when another request is sent.
+
+    Returns:
+        dict: See NotificationFeed.get().
+    """
+    return await notifications.get_async(since, min(timeout, MAX_NOTIFICATION_WAIT),
+                                         socket_rpc_server.interrupted.get())
 
 
 @click.command(context_settings=CONTEXT_SETTINGS)
@@ -306,6 +367,11 @@ def sync_accounts():
               default=DEF_WALLET_UPDATE_INTERVAL,
               show_default=True,
               help='How often to update wallet data (seconds)')
+@click.option('--fee-cache-ttl',
+              type=click.IntRange(min=60),
+              default=txn_fees.FEE_CACHE_TTL,
+              show_default=True,
+              help='How often to refresh the recommended fee rate (seconds)')
 @click.option('--debug', '-d',
               is_flag=True,
               help='Sets the logging level to debug')
@@ -313,7 +379,7 @@ def sync_accounts():
 @click.pass_context
 def main(ctx, wallet_path, blockchain_data_provider,
          insight_url, insight_api_path,
-         data_update_interval, debug):
+         data_update_interval, fee_cache_ttl, debug):
     """ Two1 Wallet daemon
     """
     global DEF_WALLET_UPDATE_INTERVAL
@@ -352,6 +418,9 @@ def main(ctx, wallet_path, blockchain_data_provider,
                 ctx.obj['data_provider'].__class__.__name__)
     logger.info("Update interval: %ds" % data_update_interval)
 
+    txn_fees.fee_oracle.ttl = fee_cache_ttl
+    txn_fees.fee_oracle.start_refresher()
+
     # Check whether the wallet is locked
     if Two1Wallet.is_locked(wallet_path):
         wallet['locked'] = True
@@ -375,7 +444,7 @@ def main(ctx, wallet_path, blockchain_data_provider,
     signal.signal(signal.SIGTERM, sig_handler)
     server_thread = threading.Thread(target=rpc_server.serve_forever,
                                      daemon=True)
-    update_thread = threading.Thread(target=data_updater,
+    update_thread = threading.Thread(target=sync_scheduler.run,
                                      daemon=True)
     server_thread.start()
     update_thread.start()
@@ -394,11 +463,11 @@ def main(ctx, wallet_path, blockchain_data_provider,
 
 
 try:
-    rpc_server = UnixSocketJSONRPCServer(
+    rpc_server = AsyncUnixSocketJSONRPCServer(
         socket_file_name=Wallet.SOCKET_FILE_NAME,
         dispatcher_methods=methods,
-        client_lock=client_lock,
         request_cb=track_connections_cb,
+        async_methods=async_methods,
         logger=logger)
 except DaemonRunningError as e:
     click.echo(str(e))
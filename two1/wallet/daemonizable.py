@@ -4,6 +4,7 @@ import inspect
 _funcs = {}
 _inst_methods = {}
 _inst_properties = {}
+_inst_readers = {}
 
 
 def property(p):
@@ -69,6 +70,25 @@ def return_value(serializer, deserializer):
     return decorator
 
 
+def reader(f):
+    """ Marks a daemonizable method or property as only reading the
+        instance, so that the daemon may run it concurrently with other
+        readers. Anything not marked is assumed to modify the instance.
+    """
+    global _inst_readers
+    fn = f.fget if isinstance(f, builtins.property) else f
+    cls_name = fn.__qualname__.split('.<locals>', 1)[0].rsplit('.', 1)[0]
+    if cls_name not in _inst_readers:
+        _inst_readers[cls_name] = set()
+    _inst_readers[cls_name].add(fn.__name__)
+
+    return f
+
+
+def is_reader(cls, name):
+    return name in _inst_readers.get(cls.__name__, ())
+
+
 def _get_method_dict(cls, method_name):
     class_name = cls.__name__
     if class_name not in _inst_methods:
@@ -1,4 +1,6 @@
 import logging
+import threading
+import time
 
 
 DEFAULT_FEE_PER_KB = 10000  # Satoshis
@@ -14,22 +16,127 @@ DEFAULT_INPUT_SIZE_KB = 0.15
 # Each txn output is ~40 bytes, thus 0.04
 DEFAULT_OUTPUT_SIZE_KB = 0.04
 
+# Serialized sizes (in bytes) used to compute fees from the actual
+# shape of a transaction:
+# version (4) + input count (1) + output count (1) + lock time (4)
+TXN_OVERHEAD_SIZE = 10
+# outpoint (36) + script length (1) + signature push (1 + 72) +
+# public key push (1 + 33 or 1 + 65) + sequence num (4)
+P2PKH_INPUT_SIZE = 148
+P2PKH_UNCOMPRESSED_INPUT_SIZE = 180
+# value (8) + script length (1) + script (25 for P2PKH, 23 for P2SH)
+P2PKH_OUTPUT_SIZE = 34
+P2SH_OUTPUT_SIZE = 32
+# Used for P2SH inputs when the redeem script isn't known
+DEFAULT_MULTISIG_M_N = (2, 3)
+
 DUST_LIMIT_PER_KB = 5000  # satoshis
 # Dust limit is Min fee for 180 bytes * 3
 # The 3 is a magic number in Bitcoin Core
 # cf. https://github.com/bitcoin/bitcoin/blob/28ad4d9fc2be102786a8c6c32ebecb466b2a03dd/src/primitives/transaction.h#L175
 DUST_LIMIT = int(DUST_LIMIT_PER_KB * 0.18 * 3)
 
+# How long a fetched fee rate is used before it is fetched again
+FEE_CACHE_TTL = 10 * 60  # seconds
+
 _fee_session = None
 _fee_host = "http://api.cointape.com/"
 
 logger = logging.getLogger('wallet')
 
 
-def get_fees():
-    global _fee_session
+def _push_size(n):
+    """ Returns the size of the opcode(s) pushing n bytes onto the stack.
+    """
+    if n < 0x4c:
+        return 1
+    elif n <= 0xff:
+        return 2
+    else:
+        return 3
+
+
+def _var_int_size(n):
+    """ Returns the size of n serialized as a variable-length integer.
+    """
+    if n < 0xfd:
+        return 1
+    elif n <= 0xffff:
+        return 3
+    else:
+        return 5
+
+
+def multisig_input_size(m, n):
+    """ Returns the size of an input spending an m-of-n P2SH multisig
+        output.
+
+    Args:
+        m (int): Number of signatures required.
+        n (int): Number of public keys in the redeem script.
+
+    Returns:
+        int: The size of the input in bytes.
+    """
+    # OP_m, n compressed public key pushes, OP_n, OP_CHECKMULTISIG
+    return _p2sh_multisig_input_size(m, 3 + n * 34)
+
+
+def _p2sh_multisig_input_size(m, redeem_size):
+    """ Returns the size of an input spending a P2SH multisig output
+        with m signatures and a redeem script of redeem_size bytes.
+    """
+    # OP_0, m signature pushes, redeem script push
+    script_size = 1 + m * 73 + _push_size(redeem_size) + redeem_size
+    return 36 + _var_int_size(script_size) + script_size + 4
+
+
+def input_size(script, compressed=True, redeem_script=None):
+    """ Returns the size of an input spending an output, based on the
+        output's script.
 
-    fee_per_kb = DEFAULT_FEE_PER_KB
+    Args:
+        script (Script): The scriptPubKey of the output being spent.
+        compressed (bool): Whether P2PKH outputs are spent with a
+            compressed public key.
+        redeem_script (Script): For P2SH outputs, the multisig redeem
+            script, if known. Otherwise DEFAULT_MULTISIG_M_N is assumed.
+
+    Returns:
+        int: The size of the input in bytes. Scripts of any other type
+            are assumed to be P2PKH.
+    """
+    raw = bytes(script)
+    if len(raw) == 23 and raw[:2] == b"\xa9\x14" and raw[-1:] == b"\x87":
+        if redeem_script is not None:
+            info = redeem_script.extract_multisig_redeem_info()
+            return _p2sh_multisig_input_size(info['m'], len(bytes(redeem_script)))
+        return multisig_input_size(*DEFAULT_MULTISIG_M_N)
+
+    return P2PKH_INPUT_SIZE if compressed else P2PKH_UNCOMPRESSED_INPUT_SIZE
+
+
+def fee_for_size(size, fee_per_kb):
+    """ Returns the fee for a given size at a given rate.
+
+    Args:
+        size (int): Size in bytes.
+        fee_per_kb (int): Fee rate in satoshis/kB.
+
+    Returns:
+        int: The fee in satoshis, rounded up.
+    """
+    return -(-size * fee_per_kb // 1000)
+
+
+def _fetch_fee_per_kb():
+    """ Gets the recommended fee rate from the fee server.
+
+    Returns:
+        int: The fee rate in satoshis/kB, or None if it couldn't be
+            retrieved.
+    """
+    global _fee_session
 
     if _fee_session is None:
         import requests
@@ -39,12 +146,147 @@ def get_fees():
         r = _fee_session.request("GET",
                                  _fee_host + "v1/fees/recommended")
         if r.status_code == 200:
-            fee_per_kb = r.json()['halfHourFee'] * 1000
+            return r.json()['halfHourFee'] * 1000
     except Exception as e:
         logger.error(
             "Error getting recommended fees from server: %s. Using defaults." %
             e)
 
+    return None
+
+
+class FeeOracle(object):
+    """ Caches the recommended fee rate so that building a transaction
+        doesn't need a round-trip to the fee server.
+
+        get_fee_per_kb() never waits on the network. Once
+        start_refresher() has been called, the rate is refreshed every ttl
+        seconds in the background; otherwise a one-shot refresh is started
+        in a daemon thread when the rate is older than ttl. A fetched rate
+        is used for twice the ttl so that it doesn't expire while the next
+        refresh is in flight.
+
+        When there is no fresh rate, the estimator (if any) is used, then
+        the last fetched rate and finally DEFAULT_FEE_PER_KB.
+
+    Args:
+        ttl (int): Number of seconds a fetched rate is used for.
+        estimator (callable): A function taking no arguments that
+            returns a locally estimated fee rate in satoshis/kB, or None
+            if it has no estimate.
+    """
+
+    def __init__(self, ttl=FEE_CACHE_TTL, estimator=None):
+        self.ttl = ttl
+        self.estimator = estimator
+
+        self._lock = threading.Lock()
+        self._fee_per_kb = None
+        self._updated = None
+        self._attempted = None
+        self._refresher = None
+        self._stop_refresher = threading.Event()
+        self._refresh_thread = None
+
+    def refresh(self):
+        """ Fetches the recommended fee rate from the fee server.
+
+        Returns:
+            int: The fee rate in satoshis/kB, or None if it couldn't be
+                retrieved, in which case the previous rate is kept.
+        """
+        fee_per_kb = _fetch_fee_per_kb()
+        with self._lock:
+            self._attempted = time.time()
+            if fee_per_kb is not None:
+                self._fee_per_kb = fee_per_kb
+                self._updated = self._attempted
+
+        return fee_per_kb
+
+    def invalidate(self):
+        """ Drops the cached fee rate.
+        """
+        with self._lock:
+            self._fee_per_kb = None
+            self._updated = None
+            self._attempted = None
+
+    def start_refresher(self):
+        """ Starts a daemon thread that refreshes the fee rate every ttl
+            seconds.
+        """
+        if self._refresher is not None:
+            return
+
+        def refresher():
+            while not self._stop_refresher.is_set():
+                self.refresh()
+                self._stop_refresher.wait(self.ttl)
+
+        self._stop_refresher.clear()
+        self._refresher = threading.Thread(target=refresher, daemon=True)
+        self._refresher.start()
+
+    def _refresh_in_background(self):
+        """ Starts a one-shot refresh in a daemon thread, unless one is
+            already in flight.
+        """
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self.refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def stop_refresher(self):
+        """ Stops the thread started by start_refresher().
+        """
+        if self._refresher is None:
+            return
+
+        self._stop_refresher.set()
+        self._refresher.join()
+        self._refresher = None
+
+    def get_fee_per_kb(self):
+        """ Returns the fee rate to use.
+
+        Returns:
+            int: The fee rate in satoshis/kB.
+        """
+        now = time.time()
+        if self._refresher is None and \
+           (self._attempted is None or now - self._attempted >= self.ttl):
+            self._refresh_in_background()
+
+        with self._lock:
+            fee_per_kb = self._fee_per_kb
+            updated = self._updated
+
+        if fee_per_kb is not None and now - updated < 2 * self.ttl:
+            return fee_per_kb
+
+        if self.estimator is not None:
+            try:
+                estimate = self.estimator()
+            except Exception as e:
+                logger.error("Error estimating fees: %s" % e)
+                estimate = None
+            if estimate:
+                return int(estimate)
+
+        if fee_per_kb is not None:
+            return fee_per_kb
+
+        return DEFAULT_FEE_PER_KB
+
+
+fee_oracle = FeeOracle()
+
+
+def get_fees():
+    fee_per_kb = fee_oracle.get_fee_per_kb()
+
     return dict(per_kb=fee_per_kb,
                 per_input=int(DEFAULT_INPUT_SIZE_KB * fee_per_kb),
                 per_output=int(DEFAULT_OUTPUT_SIZE_KB * fee_per_kb))
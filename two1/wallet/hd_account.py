@@ -69,25 +69,92 @@ class HDAccount(object):
                     self.last_indices[change] = -1
                     break
 
+        # Chain keys are derived when first needed: an account whose
+        # addresses are all in the cache may never need them.
         self._chain_priv_keys = [None, None]
         self._chain_pub_keys = [None, None]
-
-        for change in [0, 1]:
-            if isinstance(self.key, HDPrivateKey):
-                self._chain_priv_keys[change] = HDPrivateKey.from_parent(self.key, change)
-                self._chain_pub_keys[change] = self._chain_priv_keys[change].public_key
-            else:
-                self._chain_pub_keys[change] = HDPublicKey.from_parent(self.key, change)
+        self._last_derived = [-1, -1]
 
         if not skip_discovery:
             self._sync_txns(check_all=True)
             self._update_balance()
 
+    def _chain_pub_key(self, change):
+        c = int(change)
+        if self._chain_pub_keys[c] is None:
+            if isinstance(self.key, HDPrivateKey):
+                self._chain_pub_keys[c] = self._chain_priv_key(c).public_key
+            else:
+                self._chain_pub_keys[c] = HDPublicKey.from_parent(self.key, c)
+
+        return self._chain_pub_keys[c]
+
+    def _chain_priv_key(self, change):
+        c = int(change)
+        if self._chain_priv_keys[c] is None:
+            if not isinstance(self.key, HDPrivateKey):
+                raise ValueError("No private key provided for account.")
+            self._chain_priv_keys[c] = HDPrivateKey.from_parent(self.key, c)
+
+        return self._chain_priv_keys[c]
+
+    def set_private_key(self, hd_key):
+        """ Gives an account created with only its public key the
+        corresponding private key, so that it can be used for signing.
+
+        Args:
+            hd_key (HDPrivateKey): The private key of the account.
+
+        Raises:
+            ValueError: If hd_key isn't the private key for the
+               account's public key.
+        """
+        if not isinstance(hd_key, HDPrivateKey):
+            raise TypeError("hd_key must be a HDPrivateKey object")
+        if isinstance(self.key, HDPrivateKey):
+            return
+
+        if hd_key.public_key.to_b58check(self.testnet) != self.key.to_b58check(self.testnet):
+            raise ValueError("Private key does not match the account's public key.")
+
+        self.key = hd_key
+
     def _sync_txns(self, max_index=0, check_all=False):
+        self._apply_txns(self._fetch_txns(check_all))
+
+    def _fetch_txns(self, check_all=False, pending_only=False):
+        """ Discovers the account's addresses and fetches their
+        transactions from the data provider.
+
+        Neither the account nor the cache is modified, so this can run
+        while the account is being read elsewhere; the result is passed
+        to _apply_txns() to update them.
+
+        Args:
+            check_all (bool): If True, fetches all transactions instead
+               of only those since the last block the cache knows about.
+            pending_only (bool): If True, only fetches transactions for
+               the addresses returned by _pending_addresses(), unless a
+               full update is due. This is enough when no block has been
+               found since the last update.
+
+        Returns:
+            dict: The newly derived addresses, the fetched transactions
+                and the last used index of each chain before and after
+                the fetch.
+        """
         now = time.time()
         if now - self._last_full_update > 20 * 60:
             check_all = True
+            pending_only = False
+
+        if pending_only:
+            return self._fetch_pending_txns()
 
+        derived = [{}, {}]
+        derived_ends = [0, 0]
+        fetched_txns = {}
+        last_indices = [-1, -1]
         for change in [0, 1]:
             found_last = False
             current_last = self.last_indices[change]
@@ -96,7 +163,10 @@ class HDAccount(object):
             while not found_last:
                 # Try a 2 * GAP_LIMIT at a go
                 end = addr_range + self.DISCOVERY_INCREMENT
-                addresses = {i: self.get_address(change, i)
+                derived[change].update(self._derive_missing(change, addr_range, end))
+                derived_ends[change] = end
+                addresses = {i: (derived[change][i][0] if i in derived[change] else
+                                 self._cache_manager.get_address(self.index, change, i))
                              for i in range(addr_range, end)}
 
                 if self.data_provider.can_limit_by_height:
@@ -110,12 +180,9 @@ class HDAccount(object):
                         list(addresses.values()),
                         limit=10000)
 
-                inserted_txns = set()
                 for i in sorted(addresses.keys()):
                     addr = addresses[i]
 
-                    self._cache_manager.insert_address(self.index, change, i, addr)
-
                     addr_has_txns = self._cache_manager.address_has_txns(addr)
 
                     if not addr_has_txns or addr not in txns or \
@@ -128,44 +195,192 @@ class HDAccount(object):
                         current_last = i
                         for t in txns[addr]:
                             txid = str(t['transaction'].hash)
-                            if txid not in inserted_txns:
-                                wt = WalletTransaction.from_transaction(
-                                    t['transaction'])
-                                wt.block = t['metadata']['block']
-                                wt.block_hash = t['metadata']['block_hash']
-                                wt.confirmations = t['metadata']['confirmations']
-                                if 'network_time' in t['metadata']:
-                                    wt.network_time = t['metadata']['network_time']
-                                self._cache_manager.insert_txn(wt)
-                                inserted_txns.add(txid)
+                            if txid not in fetched_txns:
+                                fetched_txns[txid] = self._to_wallet_txn(t)
 
                     if addr_has_txns:
                         current_last = i
 
                 addr_range += self.DISCOVERY_INCREMENT
 
-            self.last_indices[change] = current_last
+            last_indices[change] = current_last
+
+        return dict(addresses=derived,
+                    derived_ends=derived_ends,
+                    txns=list(fetched_txns.values()),
+                    start_indices=list(self.last_indices),
+                    last_indices=last_indices,
+                    check_all=check_all)
+
+    @staticmethod
+    def _to_wallet_txn(t):
+        """ Makes a WalletTransaction out of a transaction returned by
+        the data provider.
+        """
+        wt = WalletTransaction.from_transaction(t['transaction'])
+        wt.block = t['metadata']['block']
+        wt.block_hash = t['metadata']['block_hash']
+        wt.confirmations = t['metadata']['confirmations']
+        if 'network_time' in t['metadata']:
+            wt.network_time = t['metadata']['network_time']
+
+        return wt
+
+    def _next_addresses(self):
+        """ Returns the address following the last used one on each
+        chain, which is the one _new_key_or_address() hands out once the
+        last used address has transactions.
+
+        Returns:
+            list(str): The payout and change addresses.
+        """
+        return [self.get_address(change, self.last_indices[change] + 1)
+                for change in [self.PAYOUT_CHAIN, self.CHANGE_CHAIN]]
+
+    def _pending_addresses(self):
+        """ Returns the addresses in the account whose transactions can
+        change without a new block: those in unconfirmed or provisional
+        transactions, where the transactions may be seen or replaced,
+        and the last used and next address of each chain, which are the
+        ones handed out for payments.
+
+        Returns:
+            list(str): The addresses.
+        """
+        addresses = set(self._next_addresses())
+        for change in [self.PAYOUT_CHAIN, self.CHANGE_CHAIN]:
+            if self.last_indices[change] >= 0:
+                addresses.add(self._cache_manager.get_address(
+                    self.index, change, self.last_indices[change]))
+
+        for txid in self._cache_manager.get_pending_txids():
+            wt = self._cache_manager.get_transaction(txid)
+            addrs = wt.get_addresses(self.testnet)
+            for addr_list in addrs['inputs'] + addrs['outputs']:
+                for a in addr_list:
+                    path = self._cache_manager.get_address_path(a)
+                    if path is not None and path[0] == self.index:
+                        addresses.add(a)
+
+        addresses.discard(None)
+        return sorted(addresses)
+
+    def _fetch_pending_txns(self):
+        """ Fetches transactions for _pending_addresses() only.
+
+        Returns:
+            dict: Like _fetch_txns().
+        """
+        next_addresses = self._next_addresses()
+        addresses = self._pending_addresses()
+        txns = {}
+        if addresses:
+            if self.data_provider.can_limit_by_height:
+                txns = self.data_provider.get_transactions(
+                    addresses,
+                    limit=10000,
+                    min_block=self._cache_manager.last_block)
+            else:
+                txns = self.data_provider.get_transactions(
+                    addresses,
+                    limit=10000)
+
+        fetched_txns = {}
+        for addr in addresses:
+            for t in txns.get(addr) or []:
+                txid = str(t['transaction'].hash)
+                if txid not in fetched_txns:
+                    fetched_txns[txid] = self._to_wallet_txn(t)
+
+        # A payment to the next address makes it the last used one
+        last_indices = list(self.last_indices)
+        for change, addr in enumerate(next_addresses):
+            if txns.get(addr):
+                last_indices[change] += 1
+
+        return dict(addresses=[{}, {}],
+                    derived_ends=[0, 0],
+                    txns=list(fetched_txns.values()),
+                    start_indices=list(self.last_indices),
+                    last_indices=last_indices,
+                    check_all=False)
+
+    def _apply_txns(self, fetched):
+        """ Updates the account and the cache with the result of
+        _fetch_txns().
+
+        Args:
+            fetched (dict): The return value of _fetch_txns().
+        """
+        for change in [0, 1]:
+            for i, (address, hash160) in sorted(fetched['addresses'][change].items()):
+                if self._cache_manager.get_address(self.index, change, i) is None:
+                    self._cache_manager.insert_address(self.index, change, i,
+                                                       address, hash160)
+            self._last_derived[change] = max(self._last_derived[change],
+                                             fetched['derived_ends'][change] - 1)
+
+        for wt in fetched['txns']:
+            self._cache_manager.insert_txn(wt)
+
+        for change in [0, 1]:
+            if self.last_indices[change] == fetched['start_indices'][change]:
+                self.last_indices[change] = fetched['last_indices'][change]
+            else:
+                # Addresses were handed out since the fetch
+                self.last_indices[change] = max(self.last_indices[change],
+                                                fetched['last_indices'][change])
 
         self._last_update = time.time()
-        if check_all:
+        if fetched['check_all']:
             self._last_full_update = self._last_update
 
+    def _derive_missing(self, change, start, end):
+        """ Derives the addresses with indices in [start, end) that are
+        not in the address cache yet, in one batch.
+
+        Args:
+            change (bool): If True, derives change addresses, otherwise
+               payout addresses.
+            start (int): The first index to derive.
+            end (int): One past the last index to derive.
+
+        Returns:
+            dict: (address, hash160) tuples keyed by index.
+        """
+        c = int(change)
+        missing = [i for i in range(max(start, self._last_derived[c] + 1), end)
+                   if self._cache_manager.get_address(self.index, c, i) is None]
+        if not missing:
+            return {}
+
+        keys = HDPublicKey.from_parent_batch(self._chain_pub_key(c), missing)
+        return {i: (k.address(True, self.testnet), k.hash160())
+                for i, k in zip(missing, keys)}
+
+    def _derive_addresses(self, change, end):
+        """ Makes sure the addresses with indices below end in the chain
+        are in the address cache, deriving any missing ones in one batch.
+
+        Args:
+            change (bool): If True, derives change addresses, otherwise
+               payout addresses.
+            end (int): One past the last index to derive.
+        """
+        c = int(change)
+        if end <= self._last_derived[c] + 1:
+            return
+
+        for i, (address, hash160) in sorted(self._derive_missing(c, 0, end).items()):
+            self._cache_manager.insert_address(self.index, c, i, address, hash160)
+
+        self._last_derived[c] = end - 1
+
     def _update_balance(self):
-        balance = {'confirmed': 0, 'total': 0}
-        self._address_balances = {}
-        for unconfirmed in [True, False]:
-            addr_balances = self._cache_manager.get_balances(
-                addresses=self.all_used_addresses,
-                include_unconfirmed=unconfirmed)
-
-            key = 'total' if unconfirmed else 'confirmed'
-            for k, v in addr_balances.items():
-                if k not in self._address_balances:
-                    self._address_balances[k] = {'confirmed': 0, 'total': 0}
-                self._address_balances[k][key] = v
-                balance[key] += v
-
-        self._balance_cache = balance
+        self._address_balances = self._cache_manager.get_address_balances(
+            self.all_used_addresses)
+        self._balance_cache = self._cache_manager.get_account_balance(
+            self.index)
 
     def has_txns(self):
         """ Returns whether or not there are any discovered transactions
@@ -189,13 +404,15 @@ class HDAccount(object):
                 containing the chain (0 or 1) and child index in the chain.
                 Only found addresses are included in the dict.
         """
-        found = {}
         for change in [0, 1]:
-            for i in range(self.last_indices[change] + self.GAP_LIMIT + 1):
-                addr = self.get_address(change, i)
+            self._derive_addresses(change, self.last_indices[change] + self.GAP_LIMIT + 1)
 
-                if addr in addresses:
-                    found[addr] = (self.index, change, i)
+        found = {}
+        for addr in addresses:
+            path = self._cache_manager.get_address_path(addr)
+            if path is not None and path[0] == self.index and \
+               path[2] <= self.last_indices[path[1]] + self.GAP_LIMIT:
+                found[addr] = path
 
         return found
 
@@ -213,13 +430,14 @@ class HDAccount(object):
         """
         # We only use public key derivation per BIP44
         c = int(change)
-        k = self._chain_pub_keys[c]
+        k = self._chain_pub_key(c)
         if n < 0:
             self.last_indices[c] += 1
             i = self.last_indices[c]
             pub_key = HDPublicKey.from_parent(k, i)
             addr = pub_key.address(True, self.testnet)
-            self._cache_manager.insert_address(self.index, change, i, addr)
+            self._cache_manager.insert_address(self.index, change, i, addr,
+                                               pub_key.hash160())
         else:
             pub_key = HDPublicKey.from_parent(k, n)
 
@@ -238,10 +456,7 @@ class HDAccount(object):
             HDPrivateKey: A private key in this account's chain.
         """
         # We only use public key derivation per BIP44
-        k = self._chain_priv_keys[change]
-        if k is None:
-            raise ValueError("No private key provided for account.")
-        return HDPrivateKey.from_parent(k, n)
+        return HDPrivateKey.from_parent(self._chain_priv_key(change), n)
 
     def get_address(self, change, n=-1):
         """ Returns a public address
@@ -0,0 +1,110 @@
+"""Provides a readers-writer lock for the wallet daemon."""
+import contextlib
+import threading
+import time
+
+
+class ReadWriteLock(object):
+    """ A lock that can be held by any number of readers or by a single
+        writer.
+
+        Writers are preferred: once a writer is waiting, new readers
+        wait until it is done, so a stream of reads can't starve it.
+        The lock is not reentrant.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def _wait_for(self, predicate, timeout):
+        if timeout is None or timeout < 0:
+            while not predicate():
+                self._cond.wait()
+            return True
+
+        end = time.monotonic() + timeout
+        while not predicate():
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._cond.wait(remaining)
+        return True
+
+    def acquire_read(self, timeout=None):
+        """ Acquires the lock for reading.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait. If None,
+                waits forever.
+
+        Returns:
+            bool: True if the lock was acquired, False if it timed out.
+        """
+        with self._cond:
+            if not self._wait_for(lambda: not (self._writer or self._writers_waiting),
+                                  timeout):
+                return False
+            self._readers += 1
+            return True
+
+    def release_read(self):
+        """ Releases the lock after acquire_read().
+        """
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self, timeout=None):
+        """ Acquires the lock for writing.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait. If None,
+                waits forever.
+
+        Returns:
+            bool: True if the lock was acquired, False if it timed out.
+        """
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                if not self._wait_for(lambda: not (self._writer or self._readers),
+                                      timeout):
+                    return False
+            finally:
+                self._writers_waiting -= 1
+                if not self._writers_waiting:
+                    # Readers may have been waiting on this writer only
+                    self._cond.notify_all()
+            self._writer = True
+            return True
+
+    def release_write(self):
+        """ Releases the lock after acquire_write().
+        """
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        """ Context manager holding the lock for reading.
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def writing(self):
+        """ Context manager holding the lock for writing.
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
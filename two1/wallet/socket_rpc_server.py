@@ -1,18 +1,59 @@
+import asyncio
+import concurrent.futures
+import contextvars
 import json
+import logging
 import os
 import select
 import socket
 import socketserver
+import struct
 import threading
 
 from jsonrpcserver import dispatcher
+from jsonrpcserver.exceptions import JsonRpcServerError
+from jsonrpcserver.exceptions import ServerError
 from jsonrpcserver.request import Request
 from jsonrpcserver.response import ErrorResponse
+from jsonrpcserver.response import RequestResponse
 from jsonrpcserver.status import HTTP_STATUS_CODES
 from jsonrpcclient.server import Server
 from two1.wallet.exceptions import DaemonRunningError
 from two1.wallet.exceptions import DaemonNotRunningError
 
+# A client may ask to switch a connection from newline-delimited JSON to
+# length-prefixed frames by sending this request as its first line, with
+# the framings it supports, in order of preference, as params. The result
+# is the framing the server picked; the switch happens right after it.
+FRAMING_METHOD = "rpc.framing"
+FRAMING_NEWLINE = "newline"
+FRAMING_LENGTH_PREFIXED = "length-prefixed"
+# A frame is the length of the UTF-8 encoded JSON that follows it
+FRAME_HEADER = struct.Struct(">I")
+
+# In coroutine methods (see AsyncUnixSocketJSONRPCServer), an
+# asyncio.Event that is set once the response to the request holds up
+# the responses to later requests on the same connection. Methods that
+# wait for something, such as long polls, should then return early.
+interrupted = contextvars.ContextVar('interrupted', default=None)
+
+
+def _remove_stale_socket(socket_file_name):
+    """ Removes a socket file left behind by a daemon that is no longer
+        running.
+
+    Raises:
+        DaemonRunningError: If a daemon is listening on the socket.
+    """
+    if os.path.exists(socket_file_name):
+        # Try connecting to it
+        try:
+            sock = socket.socket(family=socket.AF_UNIX)
+            sock.connect(socket_file_name)
+            raise DaemonRunningError("A daemon is already running.")
+        except ConnectionRefusedError:
+            os.remove(socket_file_name)
+
 
 class UnixSocketJSONRPCServer(socketserver.ThreadingMixIn,
                               socketserver.UnixStreamServer):
@@ -88,14 +129,7 @@ class UnixSocketJSONRPCServer(socketserver.ThreadingMixIn,
     def __init__(self, socket_file_name, dispatcher_methods, client_lock,
                  request_cb=None, logger=None):
         self.socket_file_name = socket_file_name
-        if os.path.exists(self.socket_file_name):
-            # Try connecting to it
-            try:
-                sock = socket.socket(family=socket.AF_UNIX)
-                sock.connect(self.socket_file_name)
-                raise DaemonRunningError("A daemon is already running.")
-            except ConnectionRefusedError:
-                os.remove(self.socket_file_name)
+        _remove_stale_socket(self.socket_file_name)
 
         self._methods = dispatcher_methods
         self._client_lock = client_lock
@@ -106,11 +140,343 @@ class UnixSocketJSONRPCServer(socketserver.ThreadingMixIn,
                          UnixSocketJSONRPCServer.JSONRPCHandler)
 
 
+class AsyncUnixSocketJSONRPCServer(object):
+    """ JSON-RPC server on a unix socket, built on asyncio.
+
+        Each message a client sends is either a request or a batch (a
+        JSON array of requests). Messages are newline-delimited unless
+        the client switched the connection to length-prefixed frames
+        (see FRAMING_METHOD). Requests are handed to a thread pool as
+        soon as they are read, so a client can pipeline several of them
+        on one connection and they run concurrently. With newlines,
+        responses are written back in the order the requests were
+        received; with frames, as soon as they are ready, so clients
+        match them to requests by id. The methods are responsible for
+        any locking they need.
+
+        Methods that spend their time waiting rather than working can
+        instead be coroutines, given in async_methods. They are run on
+        the event loop, so any number of them can wait without tying up
+        the thread pool, and must not block.
+
+    Args:
+        socket_file_name (str): Path of the socket to listen on.
+        dispatcher_methods (Methods): The methods to dispatch to.
+        request_cb (function): If given, called with every request.
+        logger (Logger): Logger to use.
+        max_workers (int): Maximum number of requests run at once.
+        async_methods (dict): Coroutine functions, by method name.
+    """
+    STREAM_LIMIT = 16 * 1024 * 1024  # Longest message accepted, in bytes
+    MAX_PIPELINED = 64  # Requests read ahead of their responses per connection
+
+    def __init__(self, socket_file_name, dispatcher_methods, request_cb=None,
+                 logger=None, max_workers=8, async_methods=None):
+        self.socket_file_name = socket_file_name
+        _remove_stale_socket(self.socket_file_name)
+
+        self._methods = dispatcher_methods
+        self._async_methods = async_methods or {}
+        self._request_cb = request_cb
+        self.logger = logger
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+        self._loop = None
+        self._stop = None
+        self._stopped = threading.Event()
+        self._connections = {}
+
+    def _dispatch(self, request):
+        """ Runs a single request. Called in the thread pool.
+        """
+        try:
+            if self._request_cb is not None:
+                self._request_cb(request)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.exception(e)
+
+        if self.logger is not None:
+            self.logger.debug("Dispatching %s" % (request,))
+        response = dispatcher.dispatch(self._methods, request)
+        if self.logger is not None:
+            self.logger.debug("Responding with: %s" % response.json_debug)
+
+        # None for notifications
+        return response.json_debug
+
+    async def _dispatch_async(self, request, interrupt):
+        """ Runs a single request for a coroutine method, on the event
+            loop. Mirrors dispatcher.dispatch().
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            if self._request_cb is not None:
+                await loop.run_in_executor(self._executor, self._request_cb, request)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.exception(e)
+
+        if self.logger is not None:
+            self.logger.debug("Dispatching %s" % (request,))
+        interrupted.set(interrupt)
+        r = None
+        try:
+            r = Request(request)
+            method = self._async_methods[r.method_name]
+            result = await method(*(r.args or []), **(r.kwargs or {}))
+            response = RequestResponse(r.request_id, result)
+        except Exception as e:
+            if r is not None and r.is_notification:
+                return None
+            if not isinstance(e, JsonRpcServerError):
+                if self.logger is not None:
+                    self.logger.exception(e)
+                e = ServerError(str(e))
+            response = ErrorResponse(e.http_status, r.request_id if r else None,
+                                     e.code, e.message, e.data)
+        if self.logger is not None:
+            self.logger.debug("Responding with: %s" % response.json_debug)
+
+        return None if r is not None and r.is_notification else response.json_debug
+
+    def _run(self, request, interrupt):
+        """ Returns an awaitable with the response to a single request.
+        """
+        if isinstance(request, dict) and request.get("method") in self._async_methods:
+            return self._dispatch_async(request, interrupt)
+        return asyncio.get_event_loop().run_in_executor(self._executor, self._dispatch, request)
+
+    async def _handle_request(self, data, interrupt=None):
+        try:
+            request = json.loads(data)
+        except ValueError:
+            # Let the dispatcher respond with a parse error
+            request = data
+
+        if isinstance(request, list) and request:
+            responses = await asyncio.gather(*[self._run(r, interrupt) for r in request])
+            return [r for r in responses if r is not None] or None
+
+        return await self._run(request, interrupt)
+
+    @staticmethod
+    def _negotiate_framing(data):
+        """ Returns the response to a FRAMING_METHOD request, or None if
+            data is something else.
+        """
+        if FRAMING_METHOD not in data:
+            return None
+        try:
+            request = json.loads(data)
+        except ValueError:
+            return None
+        if not isinstance(request, dict) or request.get("method") != FRAMING_METHOD:
+            return None
+
+        params = request.get("params")
+        framing = FRAMING_NEWLINE
+        if isinstance(params, list) and FRAMING_LENGTH_PREFIXED in params:
+            framing = FRAMING_LENGTH_PREFIXED
+
+        return dict(jsonrpc="2.0", result=framing, id=request.get("id"))
+
+    async def _read_message(self, reader, framed):
+        """ Returns the next message on a connection, or None once the
+            client is done.
+        """
+        if not framed:
+            line = await reader.readline()
+            return line.strip().decode() if line else None
+
+        try:
+            header = await reader.readexactly(FRAME_HEADER.size)
+        except asyncio.IncompleteReadError:
+            return None
+        length, = FRAME_HEADER.unpack(header)
+        if length > self.STREAM_LIMIT:
+            raise ValueError("Frame of %d bytes is too long" % length)
+
+        return (await reader.readexactly(length)).decode()
+
+    async def _send_responses(self, pending, writer):
+        broken = False
+        while True:
+            f = await pending.get()
+            if f is None:
+                break
+
+            try:
+                response = await f
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.exception(e)
+                continue
+
+            # Keep waiting on the requests after the client goes away so
+            # the reader is never blocked on a full queue.
+            if response is None or broken:
+                continue
+
+            try:
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+            except Exception:
+                broken = True
+
+    async def _respond_framed(self, data, writer, write_lock, slots):
+        try:
+            response = await self._handle_request(data)
+            if response is not None:
+                payload = json.dumps(response).encode()
+                async with write_lock:
+                    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+                    await writer.drain()
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.debug("Couldn't respond: %s" % e)
+        finally:
+            slots.release()
+
+    async def _handle_connection(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        closed = loop.create_future()
+        self._connections[writer] = (reader, closed)
+
+        # Responses in newline mode go through a queue to keep them in
+        # order; in framed mode each is written when it's ready.
+        framed = False
+        pending = asyncio.Queue(self.MAX_PIPELINED)
+        # Set for the requests whose responses have yet to be written
+        # once another request is read, as those hold it up
+        interrupt = asyncio.Event()
+        sender = asyncio.ensure_future(self._send_responses(pending, writer))
+        slots = asyncio.Semaphore(self.MAX_PIPELINED)
+        write_lock = asyncio.Lock()
+        responding = set()
+        try:
+            while True:
+                try:
+                    data = await self._read_message(reader, framed)
+                except (ValueError, ConnectionError, asyncio.IncompleteReadError) as e:
+                    # ValueError means the message was longer than STREAM_LIMIT
+                    if self.logger is not None:
+                        self.logger.debug("Closing connection: %s" % e)
+                    break
+
+                if data is None:
+                    break
+                if not data:
+                    continue
+
+                if framed:
+                    await slots.acquire()
+                    f = asyncio.ensure_future(self._respond_framed(data, writer, write_lock, slots))
+                    responding.add(f)
+                    f.add_done_callback(responding.discard)
+                    continue
+
+                interrupt.set()
+                interrupt = asyncio.Event()
+                response = self._negotiate_framing(data)
+                if response is None:
+                    await pending.put(asyncio.ensure_future(self._handle_request(data, interrupt)))
+                    continue
+
+                f = loop.create_future()
+                f.set_result(response)
+                await pending.put(f)
+                if response['result'] == FRAMING_LENGTH_PREFIXED:
+                    # Everything before the switch is answered with lines
+                    await pending.put(None)
+                    await sender
+                    framed = True
+        finally:
+            if not framed:
+                await pending.put(None)
+                await sender
+            if responding:
+                await asyncio.wait(responding)
+            writer.close()
+            del self._connections[writer]
+            closed.set_result(None)
+
+    def _on_stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        if self._stopped.is_set():
+            return
+
+        server = await asyncio.start_unix_server(self._handle_connection,
+                                                 path=self.socket_file_name,
+                                                 limit=self.STREAM_LIMIT)
+        await self._stop.wait()
+
+        server.close()
+        await server.wait_closed()
+
+        # Stop reading new requests, but let the ones already read finish
+        # and get their responses before the connections are closed.
+        for writer, (reader, _) in list(self._connections.items()):
+            writer.transport.pause_reading()
+            reader.feed_eof()
+        await asyncio.gather(*[c for _, c in self._connections.values()])
+
+    def serve_forever(self):
+        """ Handles requests until shutdown() is called.
+        """
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    def shutdown(self):
+        """ Stops serve_forever(). Can be called from any thread or from
+            a signal handler.
+        """
+        self._stopped.set()
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._on_stop)
+
+    def server_close(self):
+        """ Cleans up the server after serve_forever() has returned.
+        """
+        self._executor.shutdown(wait=True)
+        if os.path.exists(self.socket_file_name):
+            os.remove(self.socket_file_name)
+
+
 class UnixSocketServerProxy(Server):
+    """ Client for the wallet daemon.
+
+        Keeps one connection open to the daemon and, if the daemon
+        supports it, switches it to length-prefixed frames. Framed
+        replies are read straight into a buffer of the right size, and
+        several threads can share the proxy: their requests are
+        pipelined on the connection and each reply is handed to the
+        thread that sent the request with its id. Otherwise requests
+        are sent one at a time as newline-delimited JSON.
+
+    Args:
+        socket_file_name (str): Path of the daemon's socket.
+        framing (str): The framing to ask the daemon for.
+    """
     not_running_msg = "walletd is not running, or the socket is not readable."
 
-    def __init__(self, socket_file_name):
+    def __init__(self, socket_file_name, framing=FRAMING_LENGTH_PREFIXED):
         self.socket_file_name = socket_file_name
+        self.framing = FRAMING_NEWLINE
+
+        # Only one thread reads from the socket at a time. Replies it
+        # reads for other threads are left in _replies, keyed by id.
+        self._send_lock = threading.Lock()
+        self._replies_cond = threading.Condition()
+        self._replies = {}
+        self._reading = False
 
         # Try connecting to the socket
         self.sock = socket.socket(family=socket.AF_UNIX)
@@ -124,6 +490,9 @@ class UnixSocketServerProxy(Server):
 
         super().__init__(socket_file_name)
 
+        if framing != FRAMING_NEWLINE:
+            self._set_framing(framing)
+
     def __getattr__(self, name):
         # Override the getattr to have 'response' default to True
 
@@ -135,6 +504,94 @@ class UnixSocketServerProxy(Server):
                 return self.notify(name, *args, **kwargs)
         return attr_handler
 
+    def log_(self, message, extra, log, level, fmt):
+        # jsonrpcclient logs every request and reply at INFO (to stderr
+        # if logging isn't set up), and replies can be megabytes long.
+        if log.isEnabledFor(logging.DEBUG):
+            super().log_(message, extra, log, 'debug', fmt)
+
+    def _set_framing(self, framing):
+        # Daemons that don't know about framing respond with an error,
+        # so the connection stays newline-delimited.
+        request = dict(jsonrpc="2.0", method=FRAMING_METHOD, params=[framing], id=0)
+        reply = json.loads(self.send_message(json.dumps(request)))
+        if reply.get("result") == framing:
+            self.framing = framing
+
+    def _recv_into(self, buf):
+        view = memoryview(buf)
+        while view:
+            n = self.sock.recv_into(view)
+            if not n:
+                raise DaemonNotRunningError(self.not_running_msg)
+            view = view[n:]
+
+    def _read_frame(self):
+        header = bytearray(FRAME_HEADER.size)
+        self._recv_into(header)
+        length, = FRAME_HEADER.unpack(header)
+        buf = bytearray(length)
+        self._recv_into(buf)
+
+        return json.loads(buf.decode())
+
+    @staticmethod
+    def _reply_id(reply):
+        if isinstance(reply, list):
+            # Batches are matched by the id of their first reply
+            return reply[0].get('id') if reply else None
+        return reply.get('id')
+
+    def _wait_for_reply(self, request_id):
+        with self._replies_cond:
+            while True:
+                if request_id in self._replies:
+                    return self._replies.pop(request_id)
+                if not self._reading:
+                    self._reading = True
+                    break
+                self._replies_cond.wait()
+
+        try:
+            while True:
+                reply = self._read_frame()
+                reply_id = self._reply_id(reply)
+                if reply_id == request_id:
+                    return reply
+                with self._replies_cond:
+                    self._replies[reply_id] = reply
+                    self._replies_cond.notify_all()
+        finally:
+            with self._replies_cond:
+                self._reading = False
+                self._replies_cond.notify_all()
+
+    def _send_frame(self, message, request_id):
+        if isinstance(message, str):
+            message = message.encode()
+
+        try:
+            with self._send_lock:
+                self.sock.sendall(FRAME_HEADER.pack(len(message)) + message)
+        except ConnectionError:
+            raise DaemonNotRunningError(self.not_running_msg)
+
+        if request_id is None:
+            return None
+        return self._wait_for_reply(request_id)
+
+    def _send_message(self, request, **kwargs):
+        parsed = json.loads(request)
+        request_id = self._reply_id(parsed)
+        if self.framing == FRAMING_LENGTH_PREFIXED:
+            reply = self._send_frame(request, request_id)
+        else:
+            with self._send_lock:
+                reply = self.send_message(request, request_id is not None)
+            reply = json.loads(reply) if reply else None
+
+        return self._process_response(reply)
+
     def send_message(self, message, expect_reply=True):
         if isinstance(message, str):
             message = message.encode()
@@ -144,16 +601,15 @@ class UnixSocketServerProxy(Server):
         except ConnectionError:
             raise DaemonNotRunningError(self.not_running_msg)
 
-        rv = ""
+        rv = bytearray()
         if expect_reply:
             while True:
                 reply = self.sock.recv(8192)
-                if isinstance(reply, bytes):
-                    rv += reply.decode()
-                else:
-                    rv += reply
+                if not reply:
+                    raise DaemonNotRunningError(self.not_running_msg)
+                rv += reply
 
-                if reply[-1] == 10:
+                if rv[-1] == 10:
                     break
 
-        return rv
+        return rv.decode()
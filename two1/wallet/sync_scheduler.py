@@ -0,0 +1,270 @@
+"""Schedules wallet syncs in the daemon and publishes what they change."""
+import asyncio
+import collections
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('walletd')
+
+
+def _wake(loop, future):
+    """ Completes a future that a coroutine on loop is waiting on. Can
+        be called from any thread.
+    """
+    def set_result():
+        if not future.done():
+            future.set_result(None)
+
+    try:
+        loop.call_soon_threadsafe(set_result)
+    except RuntimeError:
+        # The loop was closed
+        pass
+
+
+class SyncScheduler(object):
+    """ Runs a sync function on its own thread, every interval seconds
+        and whenever a sync is requested.
+
+        Requests don't pile up: any number of requests made while a
+        sync is running are served by a single sync right after it,
+        the first one that can see whatever prompted them.
+
+    Args:
+        sync (function): Function that does the sync.
+        interval (function): Returns the number of seconds to wait
+            after a sync before the next one. It is called again after
+            reschedule().
+    """
+
+    def __init__(self, sync, interval):
+        self._sync = sync
+        self._interval = interval
+
+        self._cond = threading.Condition()
+        self._requested = False
+        self._running = False
+        self._stopped = False
+        # Number of syncs completed
+        self._completed = 0
+        # (loop, future, target) for coroutines in request_sync_async()
+        self._waiters = set()
+
+    @property
+    def syncing(self):
+        """ Whether a sync is running.
+        """
+        return self._running
+
+    def request_sync(self, wait=False, timeout=None):
+        """ Asks for a sync to start as soon as possible.
+
+        Args:
+            wait (bool): If True, waits until a sync that started after
+                this call has completed.
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: False if waiting timed out, True otherwise.
+        """
+        with self._cond:
+            target = self._request()
+            if not wait:
+                return True
+            return self._cond.wait_for(
+                lambda: self._completed >= target or self._stopped, timeout)
+
+    async def request_sync_async(self, timeout=None):
+        """ Asks for a sync to start as soon as possible and waits until
+            a sync that started after this call has completed, on the
+            event loop rather than by blocking a thread.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: False if waiting timed out, True otherwise.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self._cond:
+            target = self._request()
+            if self._stopped:
+                return True
+            waiter = (loop, future, target)
+            self._waiters.add(waiter)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+
+    def _request(self):
+        """ Requests a sync and returns the number of completed syncs
+            that serves it. Called with _cond held.
+        """
+        # A sync in progress may have fetched everything already
+        target = self._completed + (2 if self._running else 1)
+        self._requested = True
+        self._cond.notify_all()
+        return target
+
+    def _wake_waiters(self):
+        """ Wakes the coroutines whose sync is done. Called with _cond
+            held.
+        """
+        for waiter in list(self._waiters):
+            loop, future, target = waiter
+            if self._completed >= target or self._stopped:
+                self._waiters.discard(waiter)
+                _wake(loop, future)
+
+    def reschedule(self):
+        """ Makes the scheduler re-read the interval, e.g. after it
+            was shortened.
+        """
+        with self._cond:
+            self._cond.notify_all()
+
+    def stop(self):
+        """ Makes run() return once the sync in progress, if any, is
+            done.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            self._wake_waiters()
+
+    def run(self):
+        """ Runs syncs until stop() is called.
+        """
+        last_sync = 0
+        while True:
+            with self._cond:
+                while not (self._requested or self._stopped):
+                    remaining = last_sync + self._interval() - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                if self._stopped:
+                    break
+                self._requested = False
+                self._running = True
+
+            try:
+                self._sync()
+            except Exception as e:
+                logger.error("Sync failed: %s" % e)
+            finally:
+                last_sync = time.time()
+                with self._cond:
+                    self._running = False
+                    self._completed += 1
+                    self._cond.notify_all()
+                    self._wake_waiters()
+
+
+class NotificationFeed(object):
+    """ Keeps the most recent notifications for clients to poll.
+
+        Notifications are dicts, and each is given a 'seq' key with
+        its position in the feed. A client passes the largest 'seq' it
+        has seen to get() to receive only newer notifications.
+
+    Args:
+        max_len (int): Number of notifications kept. Clients that fall
+            further behind than this miss the older ones.
+    """
+
+    def __init__(self, max_len=1000):
+        self._cond = threading.Condition()
+        self._notifications = collections.deque(maxlen=max_len)
+        self._last_seq = 0
+        # (loop, future) for coroutines in get_async()
+        self._waiters = set()
+
+    def publish(self, notifications):
+        """ Adds notifications to the feed and wakes up waiting clients.
+
+        Args:
+            notifications (list(dict)): The notifications to add.
+        """
+        if not notifications:
+            return
+
+        with self._cond:
+            for n in notifications:
+                self._last_seq += 1
+                self._notifications.append(dict(n, seq=self._last_seq))
+            self._cond.notify_all()
+            for loop, future in self._waiters:
+                _wake(loop, future)
+            self._waiters.clear()
+
+    def get(self, since=0, timeout=0):
+        """ Returns the notifications published after a given one.
+
+        Args:
+            since (int): The 'seq' of the last notification the client
+                has seen, or 0.
+            timeout (float): If there are no newer notifications, the
+                maximum number of seconds to wait for one.
+
+        Returns:
+            dict: 'notifications', the list of newer notifications, and
+                'last_seq', the 'seq' of the last notification published.
+                If it's below since, the feed was restarted and the
+                client should start over from 0.
+        """
+        with self._cond:
+            if since <= self._last_seq:
+                self._cond.wait_for(lambda: self._last_seq > since, timeout)
+
+            return dict(notifications=[n for n in self._notifications
+                                       if n['seq'] > since],
+                        last_seq=self._last_seq)
+
+    async def get_async(self, since=0, timeout=0, interrupt=None):
+        """ Like get(), but waits on the event loop rather than by
+            blocking a thread, so that any number of clients can wait.
+
+        Args:
+            since (int): The 'seq' of the last notification the client
+                has seen, or 0.
+            timeout (float): If there are no newer notifications, the
+                maximum number of seconds to wait for one.
+            interrupt (asyncio.Event): If given, stops waiting once
+                it is set.
+
+        Returns:
+            dict: See get().
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self._cond:
+            waiting = since == self._last_seq
+            if waiting:
+                self._waiters.add((loop, future))
+
+        if waiting and timeout > 0:
+            waits = [future]
+            if interrupt is not None:
+                waits.append(asyncio.ensure_future(interrupt.wait()))
+            try:
+                await asyncio.wait(waits, timeout=timeout,
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for w in waits[1:]:
+                    w.cancel()
+        if waiting:
+            with self._cond:
+                self._waiters.discard((loop, future))
+
+        return self.get(since)
@@ -1,5 +1,7 @@
 import builtins
 import getpass
+import hashlib
+import hmac
 import json
 import logging
 import random
@@ -27,6 +29,7 @@ from two1.wallet.account_types import account_types
 from two1.wallet.hd_account import HDAccount
 from two1.wallet.base_wallet import BaseWallet
 from two1.wallet.cache_manager import CacheManager
+from two1.wallet.cache_store import Sqlite3CacheStore
 from two1.wallet.wallet_txn import WalletTransaction
 from two1.wallet import fees as txn_fees
 from two1.wallet.socket_rpc_server import UnixSocketServerProxy
@@ -147,6 +150,10 @@ class Two1Wallet(BaseWallet):
                                        "default_wallet.json")
     WALLET_FILE_VERSION = "0.1.0"
     WALLET_CACHE_VERSION = "0.1.0"
+    CACHE_STORE = Sqlite3CacheStore
+    CACHE_FILE_TEMPLATE = "wallet_%s_cache.db"
+    FEE_ESTIMATE_NUM_TXNS = 6
+    PARALLEL_SIGNING_MIN_INPUTS = 32
 
     """ The configuration options available for creating the wallet.
 
@@ -304,9 +311,22 @@ class Two1Wallet(BaseWallet):
         dec += decrypter.feed()
         return dec.decode('ascii')
 
+    @staticmethod
+    def _derive_key(passphrase, key_salt):
+        return PBKDF2(passphrase, key_salt).read(Two1Wallet.AES_BLOCK_SIZE)
+
+    @staticmethod
+    def _accounts_mac(mac_key, account_params):
+        """ Returns a MAC of the accounts' public keys, stored in the
+        wallet file so that they can be checked at open without
+        deriving them from the master key.
+        """
+        msg = "\n".join(a["public_key"] for a in account_params).encode('ascii')
+        return hmac.new(mac_key, msg, hashlib.sha256).hexdigest()
+
     @staticmethod
     def encrypt(master_key, master_seed, passphrase, key_salt):
-        key = PBKDF2(passphrase, key_salt).read(Two1Wallet.AES_BLOCK_SIZE)
+        key = Two1Wallet._derive_key(passphrase, key_salt)
 
         master_key_enc = Two1Wallet._encrypt_str(master_key, key)
         master_seed_enc = Two1Wallet._encrypt_str(master_seed, key)
@@ -315,8 +335,12 @@ class Two1Wallet(BaseWallet):
 
     @staticmethod
     def decrypt(master_key_enc, master_seed_enc, passphrase, key_salt):
-        key = PBKDF2(passphrase, key_salt).read(Two1Wallet.AES_BLOCK_SIZE)
+        key = Two1Wallet._derive_key(passphrase, key_salt)
+
+        return Two1Wallet._decrypt_with_key(master_key_enc, master_seed_enc, key)
 
+    @staticmethod
+    def _decrypt_with_key(master_key_enc, master_seed_enc, key):
         master_key = Two1Wallet._decrypt_str(master_key_enc, key)
         master_seed = Two1Wallet._decrypt_str(master_seed_enc, key)
 
@@ -457,6 +481,12 @@ class Two1Wallet(BaseWallet):
         self.utxo_selector = utxo_selector
         self._testnet = False
         self._filename = ""
+        self._cache_store = None
+        self._cache_file = None
+        self._txn_history_records = {}
+        # Set to a concurrent.futures.ProcessPoolExecutor to sign
+        # transactions with many inputs in parallel.
+        self.signing_executor = None
 
         params = {}
         if isinstance(params_or_file, dict):
@@ -481,28 +511,31 @@ class Two1Wallet(BaseWallet):
             if params['passphrase_hash'] != PBKDF2.crypt(passphrase, params['passphrase_hash']):
                 raise exceptions.PassphraseError("Given passphrase is incorrect.")
 
-        if params['locked']:
-            mkey, self._master_seed = self.decrypt(master_key_enc=params['master_key'],
-                                                   master_seed_enc=params['master_seed'],
-                                                   passphrase=passphrase,
-                                                   key_salt=bytes.fromhex(params['key_salt']))
-
-            self._master_key = HDKey.from_b58check(mkey)
-
-        else:
-            self._master_key = HDKey.from_b58check(params['master_key'])
-            self._master_seed = params['master_seed']
-
-        assert isinstance(self._master_key, HDPrivateKey)
-        assert self._master_key.master
-
         acct_type = params.get('account_type', None)
         self.account_type = account_types[acct_type]
         self._testnet = self.account_type == account_types['BIP44Testnet']
         self.data_provider.testnet = self._testnet
 
-        self._root_keys = HDKey.from_path(self._master_key,
-                                          self.account_type.account_derivation_prefix)
+        # The master key is only decrypted once a private key is needed,
+        # see _load_private_keys(). Only the AES key derived from the
+        # passphrase is kept for that, not the passphrase itself.
+        self._key = None
+        if passphrase and params['locked']:
+            self._key = self._derive_key(passphrase, bytes.fromhex(params['key_salt']))
+
+        # The account public keys in the wallet file are checked with
+        # _accounts_mac() whenever the master key is available, i.e.
+        # unless the wallet is locked and no passphrase was given.
+        self._mac_key = None
+        if not params['locked']:
+            self._mac_key = hashlib.sha256(params['master_key'].encode('ascii')).digest()
+        elif self._key is not None:
+            self._mac_key = hmac.new(self._key, b"accounts", hashlib.sha256).digest()
+        self._accounts_verified = False
+
+        self._master_key = None
+        self._master_seed = None
+        self._root_keys = None
         self._cache_manager = CacheManager(self._testnet)
 
         self._accounts = []
@@ -512,12 +545,18 @@ class Two1Wallet(BaseWallet):
         cache_file = params.get("cache_file", None)
         if account_params is None:
             # Create default account
+            self._load_private_keys()
             self._init_account(index=0, name="default",
                                skip_discovery=skip_discovery)
         else:
             # Setup the account map first
             self._account_map = params.get("account_map", {})
             self._load_accounts(account_params, cache_file)
+            self._verify_accounts(account_params)
+
+        # Fall back to the fee rates of the wallet's own transactions
+        # while the recommended rate is being fetched.
+        txn_fees.fee_oracle.estimator = self.estimate_fee_per_kb
 
         if self.logger.level == logging.DEBUG:
             for a in self._accounts:
@@ -530,6 +569,96 @@ class Two1Wallet(BaseWallet):
                 self.logger.debug("Account %d (%s) public key: %s" %
                                   (a.index & 0x7fffffff, a.name, kser))
 
+    def _load_private_keys(self):
+        """ Decrypts the master key and gives the accounts their private
+        keys.
+
+        A wallet loaded from a file only has its accounts' public keys,
+        which is all that's needed to sync and read it. The key derived
+        from the passphrase is dropped once the master key is decrypted.
+
+        Raises:
+            PassphraseError: If the wallet is locked and was created
+               without a passphrase.
+            ValueError: If an account's public key in the wallet file
+               doesn't match the one derived from the master key.
+        """
+        if self._master_key is not None:
+            return
+
+        params = self._orig_params
+        if params['locked']:
+            if self._key is None:
+                raise exceptions.PassphraseError(
+                    "Wallet is locked. A passphrase is required to use its private keys.")
+            mkey, master_seed = self._decrypt_with_key(master_key_enc=params['master_key'],
+                                                       master_seed_enc=params['master_seed'],
+                                                       key=self._key)
+
+            master_key = HDKey.from_b58check(mkey)
+
+        else:
+            master_key = HDKey.from_b58check(params['master_key'])
+            master_seed = params['master_seed']
+
+        assert isinstance(master_key, HDPrivateKey)
+        assert master_key.master
+
+        root_keys = HDKey.from_path(master_key,
+                                    self.account_type.account_derivation_prefix)
+        for acct in self._accounts:
+            acct_priv_key = HDPrivateKey.from_parent(root_keys[-1], acct.index)
+            try:
+                acct.set_private_key(acct_priv_key)
+            except ValueError:
+                raise ValueError(
+                    "Account params inconsistency detected: pub key for account %d (%s) does not match expected." % (
+                        acct.index & 0x7fffffff, acct.name))
+
+        self._master_key = master_key
+        self._master_seed = master_seed
+        self._root_keys = root_keys
+        self._key = None
+        self._accounts_verified = True
+
+    def _verify_accounts(self, account_params):
+        """ Checks the account public keys read from the wallet file
+        against the MAC stored with them, or against the master key for
+        a wallet file written before the MAC was. A locked wallet opened
+        without its passphrase can't be checked until its private keys
+        are loaded.
+
+        Args:
+            account_params (list(dict)): The accounts in the wallet file.
+
+        Raises:
+            ValueError: If the public keys don't match.
+        """
+        if self._mac_key is None:
+            return
+
+        mac = self._orig_params.get("accounts_mac")
+        if mac is None:
+            self._load_private_keys()
+        elif not hmac.compare_digest(mac, self._accounts_mac(self._mac_key, account_params)):
+            raise ValueError(
+                "Account params inconsistency detected: account public keys do not match the wallet's keys.")
+
+        self._accounts_verified = True
+
+    def _check_accounts_verified(self):
+        """ Makes sure the accounts' public keys have been checked before
+        handing out addresses or public keys derived from them.
+
+        Raises:
+            PassphraseError: If the wallet is locked and was opened
+               without a passphrase.
+        """
+        if not self._accounts_verified:
+            raise exceptions.PassphraseError(
+                "Wallet is locked. A passphrase is required to verify its account keys.")
+
+    @daemonizable.reader
     @daemonizable.property
     @property
     def testnet(self):
@@ -605,6 +734,7 @@ class Two1Wallet(BaseWallet):
         # Account keys use hardened deriviation, so make sure the MSB is set
         acct_index = index | 0x80000000
 
+        self._load_private_keys()
         acct_priv_key = HDPrivateKey.from_parent(self._root_keys[-1],
                                                  acct_index)
         acct = HDAccount(hd_key=acct_priv_key,
@@ -619,30 +749,44 @@ class Two1Wallet(BaseWallet):
         self._account_map[name] = index
 
     def _load_accounts(self, account_params, cache_file=None):
-        cache = {}
         if cache_file is not None and os.path.exists(cache_file):
-            with open(cache_file) as cf:
-                cache = json.load(cf)
-
-        if cache:
-            self._cache_manager.load_from_dict(cache)
+            if cache_file.endswith(".json"):
+                # A cache written by an older version as a single JSON
+                # file. It is copied into a cache store on the next
+                # to_file().
+                with open(cache_file) as cf:
+                    cache = json.load(cf)
+
+                if cache:
+                    self._cache_manager.load_from_dict(cache)
+            else:
+                self._cache_store = self.CACHE_STORE(cache_file)
+                self._cache_file = cache_file
+                self._cache_manager.load_from_store(self._cache_store)
 
         for i, a in enumerate(account_params):
             # Determine account name
             state = {"last_payout_index": a["last_payout_index"],
                      "last_change_index": a["last_change_index"]}
 
-            name = self.get_account_name(i)
-            self._init_account(index=i,
-                               name=name,
-                               account_state=state)
-
-            # Make sure that the key serialization in the params matches
-            # that from our init
-            if a["public_key"] != self.accounts[i].key.public_key.to_b58check(self._testnet):
+            # Accounts start out with only their public keys, which
+            # are checked against the master key in
+            # _load_private_keys().
+            acct_pub_key = HDKey.from_b58check(a["public_key"])
+            if not isinstance(acct_pub_key, HDPublicKey) or \
+               acct_pub_key.index != (i | 0x80000000):
                 raise ValueError(
                     "Account params inconsistency detected: pub key for account %d (%s) does not match expected." % (
-                        i, name))
+                        i, self.get_account_name(i)))
+
+            acct = HDAccount(hd_key=acct_pub_key,
+                             name=self.get_account_name(i),
+                             index=i | 0x80000000,
+                             data_provider=self.data_provider,
+                             cache_manager=self._cache_manager,
+                             testnet=self._testnet,
+                             last_state=state)
+            self._accounts.insert(i, acct)
 
     def _check_and_get_accounts(self, accounts):
         accts = []
@@ -672,19 +816,83 @@ class Two1Wallet(BaseWallet):
         """ Syncs all accounts with the blockchain and prunes all
         expired provisional transactions.
         """
-        for a in self._accounts:
-            a._sync_txns()
+        self.apply_updates(self.fetch_updates())
+
+    def fetch_updates(self):
+        """ Fetches what sync_accounts() needs from the blockchain
+        without modifying the wallet.
+
+        The wallet can keep serving reads while this runs; the result
+        is then passed to apply_updates(), which only touches memory
+        and the wallet files. If no block has been found since the
+        last update, only the addresses whose transactions can still
+        change are queried.
+
+        Returns:
+            dict: The fetched updates.
+        """
+        last_block = self.data_provider.get_block_height()
+        pending_only = last_block == self._cache_manager.last_block
+
+        return dict(accounts=[(a, a._fetch_txns(pending_only=pending_only))
+                              for a in self._accounts],
+                    last_block=last_block)
+
+    def apply_updates(self, updates):
+        """ Updates the accounts with the result of fetch_updates() and
+        prunes all expired provisional transactions.
+
+        Args:
+            updates (dict): The return value of fetch_updates().
+
+        Returns:
+            list(dict): What changed. Each dict has a 'type' key:
+                'txn' for a transaction the wallet didn't know about
+                ('txid' and 'confirmations' keys), 'confirmation' for a
+                transaction that got its first confirmation ('txid' and
+                'block' keys) and 'balance' for an account whose balance
+                changed ('account', 'confirmed' and 'total' keys).
+        """
+        cm = self._cache_manager
+        accounts = [a for a, _ in updates['accounts']]
+        balances = {a.index: cm.get_account_balance(a.index) for a in accounts}
+
+        changes = []
+        for a, fetched in updates['accounts']:
+            for wt in fetched['txns']:
+                old = cm.get_transaction(wt.hash)
+                if old is None:
+                    changes.append(dict(type='txn',
+                                        txid=str(wt.hash),
+                                        confirmations=wt.confirmations))
+                elif old.confirmations <= 0 and wt.confirmations > 0:
+                    changes.append(dict(type='confirmation',
+                                        txid=str(wt.hash),
+                                        block=wt.block))
+
+            a._apply_txns(fetched)
             a._update_balance()
 
-        self._cache_manager.prune_provisional_txns()
+        cm.prune_provisional_txns()
 
-        self._cache_manager.last_block = self.data_provider.get_block_height()
+        cm.last_block = updates['last_block']
         self.sync_wallet_file()
 
+        for a in accounts:
+            balance = cm.get_account_balance(a.index)
+            if balance != balances[a.index]:
+                changes.append(dict(type='balance',
+                                    account=a.name,
+                                    confirmed=balance['confirmed'],
+                                    total=balance['total']))
+
+        return changes
+
     def get_private_keys(self, addresses):
         """ Returns private keys for a list of addresses, if they
             are a part of this wallet.
         """
+        self._load_private_keys()
         address_paths = self.find_addresses(addresses)
         private_keys = {}
         for addr, path in address_paths.items():
@@ -729,7 +937,13 @@ class Two1Wallet(BaseWallet):
         Returns:
             PrivateKey: A private key object or None.
         """
-        return self.get_private_key(public_key.address(testnet=self._testnet))
+        self._load_private_keys()
+        path = self._cache_manager.get_hash160_path(public_key.hash160())
+        if path is None or (path[0] & 0x7fffffff) >= len(self._accounts):
+            return self.get_private_key(public_key.address(testnet=self._testnet))
+
+        acct = self._accounts[path[0] & 0x7fffffff]
+        return acct.get_private_key(path[1], path[2])
 
     def find_addresses(self, addresses):
         """ Returns the paths to the address, if found.
@@ -835,6 +1049,8 @@ class Two1Wallet(BaseWallet):
         params["version"] = self.WALLET_FILE_VERSION
         params["account_map"] = self._account_map
         params["accounts"] = [acct.to_dict() for acct in self._accounts]
+        if self._mac_key is not None:
+            params["accounts_mac"] = self._accounts_mac(self._mac_key, params["accounts"])
 
         return params
 
@@ -851,7 +1067,7 @@ class Two1Wallet(BaseWallet):
         # Convert to hex str to make sure we don't get weird
         # characters.
         cf_id = utils.bytes_to_str(p['passphrase_hash'][-4:].encode('utf-8'))
-        cache_file = os.path.join(dirname, "wallet_%s_cache.json" % (cf_id))
+        cache_file = os.path.join(dirname, self.CACHE_FILE_TEMPLATE % (cf_id))
         p['cache_file'] = cache_file
 
         d = json.dumps(p).encode('utf-8')
@@ -870,7 +1086,17 @@ class Two1Wallet(BaseWallet):
             self._filename = file_or_filename.name
             file_or_filename.write(d)
 
-        self._cache_manager.to_file(cache_file, force_cache_write)
+        if cache_file != self._cache_file:
+            # Starting a new store (or migrating a JSON cache), so
+            # everything needs to be written out.
+            if self._cache_store is not None:
+                self._cache_store.close()
+            self._cache_store = self.CACHE_STORE(cache_file)
+            self._cache_store.clear()
+            self._cache_file = cache_file
+            force_cache_write = True
+
+        self._cache_manager.save(self._cache_store, force_cache_write)
 
     @daemonizable.method
     def sync_wallet_file(self, force_cache_write=False):
@@ -883,6 +1109,7 @@ class Two1Wallet(BaseWallet):
             self.to_file(self._filename, force_cache_write)
             self.logger.debug("Sync'ed file %s" % self._filename)
 
+    @daemonizable.reader
     @daemonizable.method
     def addresses(self, accounts=[]):
         """ Gets the address list for the current wallet.
@@ -928,6 +1155,7 @@ class Two1Wallet(BaseWallet):
         else:
             acct = self._check_and_get_accounts([account_name_or_index])[0]
 
+        self._check_accounts_verified()
         return acct.get_next_address(False)
 
     @daemonizable.method
@@ -947,6 +1175,7 @@ class Two1Wallet(BaseWallet):
         else:
             acct = self._check_and_get_accounts([account_name_or_index])[0]
 
+        self._check_accounts_verified()
         return acct.get_next_address(True)
 
     @daemonizable.method
@@ -968,6 +1197,7 @@ class Two1Wallet(BaseWallet):
         else:
             acct = self._check_and_get_accounts([account_name_or_index])[0]
 
+        self._check_accounts_verified()
         return acct.get_next_public_key(False)
 
     @daemonizable.method
@@ -989,6 +1219,7 @@ class Two1Wallet(BaseWallet):
         else:
             acct = self._check_and_get_accounts([account_name_or_index])[0]
 
+        self._check_accounts_verified()
         return acct.get_next_public_key(True)
 
     @daemonizable.method
@@ -1023,6 +1254,7 @@ class Two1Wallet(BaseWallet):
         else:
             acct = self._check_and_get_accounts([account_name_or_index])[0]
 
+        self._load_private_keys()
         priv_key = acct.get_private_key(change=False, n=key_index)
 
         return base64.b64encode(bytes(priv_key.sign(message))).decode()
@@ -1062,6 +1294,7 @@ class Two1Wallet(BaseWallet):
 
         return priv_key.sign_bitcoin(message, True).decode()
 
+    @daemonizable.reader
     @daemonizable.method
     def verify_bitcoin_message(self, message, signature, address):
         """ Verifies a bitcoin signed message
@@ -1109,6 +1342,7 @@ class Two1Wallet(BaseWallet):
         else:
             acct = self._check_and_get_accounts([account_name_or_index])[0]
 
+        self._check_accounts_verified()
         # Return the PrivateKey object, not the HDPrivateKey object
         return acct.get_public_key(change=False, n=key_index)._key
 
@@ -1278,7 +1512,7 @@ class Two1Wallet(BaseWallet):
                                 fees=fees)
 
         # Now sign all the inputs
-        i = 0
+        to_sign = []
         for addr, utxo_list in selected_utxos.items():
             # Need to get the private key
             private_key = private_keys.get(addr, None)
@@ -1287,16 +1521,16 @@ class Two1Wallet(BaseWallet):
                     "Couldn't find address %s or unable to generate private key for it." % addr)
 
             for utxo in utxo_list:
-                signed = txn.sign_input(input_index=i,
-                                        hash_type=Transaction.SIG_HASH_ALL,
-                                        private_key=private_key,
-                                        sub_script=utxo.script)
-
-                if not signed:
-                    raise exceptions.WalletSigningError(
-                        "Unable to sign input %d." % i)
+                to_sign.append((len(to_sign), private_key, utxo.script))
 
-                i += 1
+        executor = None
+        if len(to_sign) >= self.PARALLEL_SIGNING_MIN_INPUTS:
+            executor = self.signing_executor
+        signed = txn.sign_inputs(to_sign,
+                                 hash_type=Transaction.SIG_HASH_ALL,
+                                 executor=executor)
+        if not signed:
+            raise exceptions.WalletSigningError("Unable to sign inputs.")
 
         if insert_into_cache:
             self._cache_manager.insert_txn(txn,
@@ -1659,6 +1893,7 @@ class Two1Wallet(BaseWallet):
 
         return balances
 
+    @daemonizable.reader
     @daemonizable.method
     def balances_by_address(self, account_name_or_index):
         """ Returns a dict of balances by address
@@ -1674,6 +1909,7 @@ class Two1Wallet(BaseWallet):
 
         return acct.balances_by_address()
 
+    @daemonizable.reader
     @daemonizable.method
     def confirmed_balance(self, account_name_or_index=None):
         """ Gets the current confirmed balance of the wallet in Satoshi.
@@ -1695,6 +1931,7 @@ class Two1Wallet(BaseWallet):
 
         return rv
 
+    @daemonizable.reader
     @daemonizable.method
     def unconfirmed_balance(self, account_name_or_index=None):
         """ Gets the current total balance of the wallet in Satoshi,
@@ -1717,7 +1954,54 @@ class Two1Wallet(BaseWallet):
 
         return rv
 
-    def _create_txn_history_record(self, txid, acct_addrs):
+    def estimate_fee_per_kb(self):
+        """ Estimates a fee rate from the most recent confirmed
+            transactions in the cache whose inputs are all known (i.e.
+            those spending from this wallet).
+
+            This can be used as the estimator of a fees.FeeOracle.
+
+        Returns:
+            int: The median fee rate of those transactions in
+                satoshis/kB, or None if there are none.
+        """
+        txc = self._cache_manager._txn_cache
+        outputs_cache = self._cache_manager._outputs_cache
+        rates = []
+        for txid in self._cache_manager.get_txids_by_time(reverse=True):
+            if len(rates) >= self.FEE_ESTIMATE_NUM_TXNS:
+                break
+
+            wt = txc[txid]
+            if wt.confirmations <= 0 or not wt.inputs:
+                continue
+
+            in_value = 0
+            for inp in wt.inputs:
+                o = outputs_cache.get(bytes(inp.outpoint), {}).get(inp.outpoint_index)
+                if o is None or o['output'] is None:
+                    break
+                in_value += o['output'].value
+            else:
+                fees = in_value - sum(out.value for out in wt.outputs)
+                if fees > 0:
+                    rates.append(fees * 1000 // len(bytes(wt)))
+
+        if not rates:
+            return None
+
+        return sorted(rates)[len(rates) // 2]
+
+    def _txn_history_address(self, address, accts):
+        """ Returns the account and chain of an address if it belongs to
+            one of accts (dict of accounts by index), or None.
+        """
+        path = self._cache_manager.get_address_path(address)
+        if path is None or path[0] not in accts:
+            return None
+        return accts[path[0]], path[1]
+
+    def _create_txn_history_record(self, txid, accts):
         txc = self._cache_manager._txn_cache
         include = False
         wt = txc[txid]
@@ -1725,7 +2009,7 @@ class Two1Wallet(BaseWallet):
 
         values = dict(inputs=0, outputs=0,
                       internal_inputs=0, internal_outputs=0)
-        txid_dict = dict(txid=txid,
+        txid_dict = dict(txid=str(wt.hash),
                          time=wt.network_time,
                          block=wt.block,
                          block_hash=str(wt.block_hash),
@@ -1733,13 +2017,14 @@ class Two1Wallet(BaseWallet):
                          spends=[])
         for i, inp_addrs in enumerate(wt_addrs['inputs']):
             for in_addr in inp_addrs:
-                if in_addr in acct_addrs:
-                    acct = acct_addrs[in_addr][0].name
-                    addr_type = 'change' if acct_addrs[in_addr][1] == 1 else 'payout'
+                acct_chain = self._txn_history_address(in_addr, accts)
+                if acct_chain is not None:
+                    acct = acct_chain[0].name
+                    addr_type = 'change' if acct_chain[1] == 1 else 'payout'
                     # Lookup the value for the corresponding output
                     o = wt.inputs[i].outpoint
                     o_index = wt.inputs[i].outpoint_index
-                    value = self._cache_manager._outputs_cache[str(o)][o_index]['output'].value
+                    value = self._cache_manager._outputs_cache[bytes(o)][o_index]['output'].value
                     values["inputs"] += value
 
                     txid_dict['spends'].append(
@@ -1753,9 +2038,10 @@ class Two1Wallet(BaseWallet):
         for o, out_addrs in enumerate(wt_addrs['outputs']):
             for out_addr in out_addrs:
                 values["outputs"] += wt.outputs[o].value
-                if out_addr in acct_addrs:
-                    acct = acct_addrs[out_addr][0].name
-                    addr_type = 'change' if acct_addrs[out_addr][1] == 1 else 'payout'
+                acct_chain = self._txn_history_address(out_addr, accts)
+                if acct_chain is not None:
+                    acct = acct_chain[0].name
+                    addr_type = 'change' if acct_chain[1] == 1 else 'payout'
 
                     txid_dict['deposits'].append(
                         dict(address=out_addr,
@@ -1794,29 +2080,56 @@ class Two1Wallet(BaseWallet):
 
         return record
 
+    @daemonizable.reader
     @daemonizable.method
-    def transaction_history(self, accounts=[]):
+    def transaction_history(self, accounts=[], since=None, limit=None,
+                            cursor=None, reverse=False):
         """ Returns a list containing all transactions associated with
             this wallet. Transactions are ordered from oldest to most
             recent.
-        """
-        # First get address to account/chain mapping
-        accts = self._check_and_get_accounts(accounts)
 
-        acct_addrs = {}
-        for a in accts:
-            for i in [0, 1]:
-                ia = self._cache_manager.get_addresses_for_chain(
-                    acct_index=a.index, chain=i)
-                for addr in ia:
-                    acct_addrs[addr] = (a, i)
+        Args:
+            accounts (list): List of accounts (names or indices) to
+                return the history for. If empty, all accounts are used.
+            since (int): If given, only transactions with a network time
+                at or after this (in seconds from epoch) are returned.
+            limit (int): Maximum number of records to return. If None,
+                all of them are returned.
+            cursor (str): The txid of the last record of the previous
+                page. If given, the records following it are returned.
+            reverse (bool): If True, records are ordered from most recent
+                to oldest.
+
+        Returns:
+            list(dict): History records.
+        """
+        # Addresses are looked up as records are built, so only the
+        # transactions in the page are touched
+        accts = {a.index: a for a in self._check_and_get_accounts(accounts)}
+
+        # Records are kept until the transaction in the cache is replaced
+        # (e.g. it gets confirmed) or new addresses are known.
+        accts_key = tuple(accts)
+        num_addresses = self._cache_manager.num_addresses
+        records = self._txn_history_records.get(accts_key)
+        if records is None or records[0] != num_addresses:
+            records = (num_addresses, {})
+            self._txn_history_records[accts_key] = records
+        records = records[1]
 
         history = []
         txc = self._cache_manager._txn_cache
-        ordered_txids = sorted(list(txc.keys()),
-                               key=lambda txid: txc[txid].network_time)
-        for txid in ordered_txids:
-            record = self._create_txn_history_record(txid, acct_addrs)
+        for txid in self._cache_manager.get_txids_by_time(since=since,
+                                                          cursor=cursor,
+                                                          reverse=reverse):
+            if limit is not None and len(history) >= limit:
+                break
+
+            wt = txc[txid]
+            if txid not in records or records[txid][0] is not wt:
+                records[txid] = (wt, self._create_txn_history_record(txid, accts))
+
+            record = records[txid][1]
             if record is not None:
                 history.append(record)
         return history
@@ -1830,6 +2143,7 @@ class Two1Wallet(BaseWallet):
         """
         return self._accounts
 
+    @daemonizable.reader
     @daemonizable.property
     @property
     def account_names(self):
@@ -1840,6 +2154,7 @@ class Two1Wallet(BaseWallet):
         """
         return [a.name for a in self._accounts]
 
+    @daemonizable.reader
     @daemonizable.property
     @property
     def account_map(self):
@@ -1,4 +1,10 @@
+from two1.wallet.fees import DUST_LIMIT
+from two1.wallet.fees import P2PKH_INPUT_SIZE
+from two1.wallet.fees import P2PKH_OUTPUT_SIZE
+from two1.wallet.fees import TXN_OVERHEAD_SIZE
+from two1.wallet.fees import fee_for_size
 from two1.wallet.fees import get_fees
+from two1.wallet.fees import input_size
 
 
 def _get_utxos_addr_tuple_list(utxos_by_addr):
@@ -49,3 +55,284 @@ def utxo_selector_smallest_first(utxos_by_addr, amount,
 
 def _fee_calc(num_utxos, total_value, fee_amounts):
     return num_utxos * fee_amounts['per_input'] + fee_amounts['per_output']
+
+
+# Maximum number of steps the branch and bound search takes before
+# falling back to another strategy
+BNB_MAX_TRIES = 100000
+
+
+class _Candidate(object):
+    """ A UTXO along with what it costs to spend it.
+    """
+    __slots__ = ('addr', 'utxo', 'fee', 'effective_value')
+
+    def __init__(self, addr, utxo, fee):
+        self.addr = addr
+        self.utxo = utxo
+        self.fee = fee
+        self.effective_value = utxo.value - fee
+
+
+class _FeeModel(object):
+    """ Computes fees from the serialized sizes of the parts of a
+        transaction at the current fee rate, or charges a fixed fee
+        if one was given.
+
+    Args:
+        num_outputs (int): Number of outputs, not including change.
+        fees (int): Fixed fee for the transaction, or None.
+    """
+
+    def __init__(self, num_outputs, fees=None):
+        self.fixed = fees is not None
+        if self.fixed:
+            self.fee_per_kb = 0
+            self.base_fee = fees
+            self.change_fee = 0
+            self.cost_of_change = 0
+        else:
+            self.fee_per_kb = get_fees()['per_kb']
+            self.base_fee = fee_for_size(
+                TXN_OVERHEAD_SIZE + num_outputs * P2PKH_OUTPUT_SIZE,
+                self.fee_per_kb)
+            # Adding a change output now and spending it later
+            self.change_fee = fee_for_size(P2PKH_OUTPUT_SIZE, self.fee_per_kb)
+            self.cost_of_change = self.change_fee + \
+                fee_for_size(P2PKH_INPUT_SIZE, self.fee_per_kb)
+
+    def candidates(self, utxos_by_addr):
+        """ Returns the UTXOs that are worth spending as _Candidates.
+        """
+        rv = []
+        input_fees = {}
+        for addr, utxo in _get_utxos_addr_tuple_list(utxos_by_addr):
+            if self.fixed:
+                fee = 0
+            else:
+                # Cache by script type rather than parsing every script
+                raw = bytes(utxo.script)
+                key = raw[:2] + raw[-1:] if len(raw) in (23, 25) else b""
+                fee = input_fees.get(key)
+                if fee is None:
+                    fee = fee_for_size(input_size(utxo.script), self.fee_per_kb)
+                    input_fees[key] = fee
+            c = _Candidate(addr, utxo, fee)
+            if c.effective_value > 0:
+                rv.append(c)
+
+        return rv
+
+    def selection_fee(self, selected, amount):
+        """ Returns the fee for a transaction spending the selected
+            candidates, and whether it has a change output.
+        """
+        fee = self.base_fee + sum(c.fee for c in selected)
+        excess = sum(c.utxo.value for c in selected) - amount - fee
+        if excess > DUST_LIMIT:
+            # The wallet adds a change output, which needs paying for.
+            return fee + self.change_fee, True
+
+        return fee, False
+
+    def waste(self, selected, amount):
+        """ Returns the waste of a selection: what is paid to spend its
+            inputs plus either the cost of its change output or, if it
+            has none, the excess given to the miners.
+        """
+        fee, change = self.selection_fee(selected, amount)
+        input_fees = sum(c.fee for c in selected)
+        if change:
+            return input_fees + self.cost_of_change
+
+        return input_fees + sum(c.utxo.value for c in selected) - amount - fee
+
+
+def _to_utxos_by_addr(selected):
+    rv = {}
+    for c in selected:
+        if c.addr in rv:
+            rv[c.addr].append(c.utxo)
+        else:
+            rv[c.addr] = [c.utxo]
+
+    return rv
+
+
+def _accumulate(candidates, amount, fee_model):
+    """ Adds candidates in order until they cover amount and fees.
+    """
+    selected = []
+    total = 0
+    fee = fee_model.base_fee
+    for c in candidates:
+        if total >= amount + fee:
+            break
+        selected.append(c)
+        total += c.utxo.value
+        fee += c.fee
+
+    if total < amount + fee:
+        return None
+
+    return selected
+
+
+def _branch_and_bound(candidates, target, cost_of_change, max_tries=BNB_MAX_TRIES):
+    """ Searches for a set of candidates whose effective values add up
+        to between target and target + cost_of_change, so that no change
+        output is needed. This is the algorithm used by Bitcoin Core
+        (Murch, "An Evaluation of Coin Selection Strategies", 2016).
+
+    Args:
+        candidates (list(_Candidate)): Candidates sorted by effective
+            value, largest first.
+        target (int): The amount plus the fee of a transaction with no
+            inputs.
+        cost_of_change (int): Largest excess that is preferable to
+            creating a change output.
+        max_tries (int): Limit on the number of search steps.
+
+    Returns:
+        list(_Candidate): The selection with the least excess, or None
+            if none was found.
+    """
+    values = [c.effective_value for c in candidates]
+    available = sum(values)
+    if available < target:
+        return None
+
+    best = None
+    best_excess = None
+    selection = []
+    value = 0
+    for _ in range(max_tries):
+        backtrack = False
+        if value + available < target or value > target + cost_of_change:
+            backtrack = True
+        elif value >= target:
+            excess = value - target
+            if best is None or excess < best_excess:
+                best = [i for i, included in enumerate(selection) if included]
+                best_excess = excess
+                if excess == 0:
+                    break
+            backtrack = True
+
+        if backtrack:
+            # Go back to the last included candidate and try omitting it
+            while selection and not selection[-1]:
+                selection.pop()
+                available += values[len(selection)]
+            if not selection:
+                break
+            selection[-1] = False
+            value -= values[len(selection) - 1]
+        else:
+            i = len(selection)
+            available -= values[i]
+            if selection and not selection[-1] and values[i] == values[i - 1]:
+                # Including this one would repeat an omitted branch
+                selection.append(False)
+            else:
+                selection.append(True)
+                value += values[i]
+
+    if best is None:
+        return None
+
+    return [candidates[i] for i in best]
+
+
+def _select(selected, amount, fee_model):
+    if selected is None:
+        return {}, fee_model.base_fee
+
+    fee, _ = fee_model.selection_fee(selected, amount)
+    return _to_utxos_by_addr(selected), fee
+
+
+def _min_waste(candidates, amount, fee_model, selections=None):
+    """ Adds the largest first, smallest first and single coin
+        selections to selections and returns the one with the least
+        waste (and then the fewest inputs).
+
+    Args:
+        candidates (list(_Candidate)): Candidates sorted by effective
+            value, largest first.
+        amount (int): The amount to pay.
+        fee_model (_FeeModel): The fee model.
+        selections (list): Selections already found.
+    """
+    selections = list(selections or [])
+    selections.append(_accumulate(candidates, amount, fee_model))
+    selections.append(_accumulate(reversed(candidates), amount, fee_model))
+
+    # The smallest single candidate that covers everything
+    single = None
+    for c in candidates:
+        if c.effective_value < amount + fee_model.base_fee:
+            break
+        single = c
+    if single is not None:
+        selections.append([single])
+
+    selections = [s for s in selections if s is not None]
+    if not selections:
+        return {}, fee_model.base_fee
+
+    best = min(selections,
+               key=lambda s: (fee_model.waste(s, amount), len(s)))
+    return _select(best, amount, fee_model)
+
+
+def utxo_selector_largest_first(utxos_by_addr, amount,
+                                num_outputs, fees=None):
+    """ Selects the UTXOs with the largest effective value (value less
+        the fee to spend it) first, which minimizes the number of inputs.
+    """
+    fee_model = _FeeModel(num_outputs, fees)
+    candidates = sorted(fee_model.candidates(utxos_by_addr),
+                        key=lambda c: c.effective_value,
+                        reverse=True)
+
+    return _select(_accumulate(candidates, amount, fee_model),
+                   amount, fee_model)
+
+
+def utxo_selector_branch_and_bound(utxos_by_addr, amount,
+                                   num_outputs, fees=None):
+    """ Looks for a set of UTXOs that pays amount and fees without
+        needing a change output, falling back to
+        utxo_selector_min_waste if there is none.
+    """
+    fee_model = _FeeModel(num_outputs, fees)
+    candidates = sorted(fee_model.candidates(utxos_by_addr),
+                        key=lambda c: c.effective_value,
+                        reverse=True)
+
+    selected = _branch_and_bound(candidates,
+                                 amount + fee_model.base_fee,
+                                 min(fee_model.cost_of_change, DUST_LIMIT))
+    if selected is not None:
+        return _select(selected, amount, fee_model)
+
+    return _min_waste(candidates, amount, fee_model)
+
+
+def utxo_selector_min_waste(utxos_by_addr, amount,
+                            num_outputs, fees=None):
+    """ Picks, out of an exact match found by branch and bound and the
+        largest first, smallest first and single coin strategies, the
+        selection that wastes the least in fees and change.
+    """
+    fee_model = _FeeModel(num_outputs, fees)
+    candidates = sorted(fee_model.candidates(utxos_by_addr),
+                        key=lambda c: c.effective_value,
+                        reverse=True)
+
+    selected = _branch_and_bound(candidates,
+                                 amount + fee_model.base_fee,
+                                 min(fee_model.cost_of_change, DUST_LIMIT))
+    return _min_waste(candidates, amount, fee_model,
+                      [] if selected is None else [selected])